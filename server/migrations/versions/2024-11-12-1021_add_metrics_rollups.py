@@ -0,0 +1,218 @@
+"""Add metrics rollups
+
+Revision ID: 3f1a6c9d2b7e
+Revises: ec0834c42223
+Create Date: 2024-11-12 10:21:43.118402
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+
+# revision identifiers, used by Alembic.
+revision = "3f1a6c9d2b7e"
+down_revision = "ec0834c42223"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+INTERVALS = ("year", "month", "week", "day", "hour")
+KEY_COLUMNS = ("organization_id", "product_id", "product_price_type", '"timestamp"')
+VALUE_COLUMNS = (
+    "orders",
+    "revenue",
+    "one_time_products",
+    "one_time_products_revenue",
+    "new_subscriptions",
+    "ended_subscriptions",
+    "new_monthly_recurring_revenue",
+    "ended_monthly_recurring_revenue",
+    *(f"new_subscriptions_revenue_{interval}" for interval in INTERVALS),
+    *(f"renewed_subscriptions_{interval}" for interval in INTERVALS),
+    *(f"renewed_subscriptions_revenue_{interval}" for interval in INTERVALS),
+)
+
+
+def _select_rollups(product_id: str, timestamp: str, values: dict[str, str]) -> str:
+    """Select the value columns in a fixed order, zero for the missing ones."""
+    columns = ", ".join(
+        f"{values.get(column, '0')} AS {column}" for column in VALUE_COLUMNS
+    )
+    return f"""
+        SELECT
+            products.organization_id AS organization_id,
+            {product_id} AS product_id,
+            product_prices.type AS product_price_type,
+            date_trunc('hour', {timestamp}) AS "timestamp",
+            {columns}
+    """
+
+
+def _get_backfill_statement() -> str:
+    order_values = {
+        "orders": "count(orders.id)",
+        "revenue": "sum(orders.amount)",
+        "one_time_products": (
+            "count(orders.id) FILTER (WHERE orders.subscription_id IS NULL)"
+        ),
+        "one_time_products_revenue": (
+            "sum(orders.amount) FILTER (WHERE orders.subscription_id IS NULL)"
+        ),
+    }
+    for interval in INTERVALS:
+        started_at = f"date_trunc('{interval}', subscriptions.started_at)"
+        created_at = f"date_trunc('{interval}', orders.created_at)"
+        # Renewed subscriptions are counted once per bucket, on their first order
+        is_first_order = f"""
+            NOT EXISTS (
+                SELECT 1 FROM orders AS previous_orders
+                WHERE previous_orders.subscription_id = orders.subscription_id
+                AND previous_orders.created_at >= {created_at}
+                AND previous_orders.created_at < orders.created_at
+            )
+        """
+        order_values[f"new_subscriptions_revenue_{interval}"] = (
+            f"sum(orders.amount) FILTER (WHERE {started_at} = {created_at})"
+        )
+        order_values[f"renewed_subscriptions_{interval}"] = (
+            "count(DISTINCT subscriptions.id) "
+            f"FILTER (WHERE {started_at} != {created_at} AND {is_first_order})"
+        )
+        order_values[f"renewed_subscriptions_revenue_{interval}"] = (
+            f"sum(orders.amount) FILTER (WHERE {started_at} != {created_at})"
+        )
+
+    orders = (
+        _select_rollups("orders.product_id", "orders.created_at", order_values)
+        + """
+        FROM orders
+        JOIN products ON orders.product_id = products.id
+        JOIN organizations ON products.organization_id = organizations.id
+        JOIN product_prices ON orders.product_price_id = product_prices.id
+        LEFT OUTER JOIN subscriptions ON orders.subscription_id = subscriptions.id
+        WHERE organizations.deleted_at IS NULL
+        GROUP BY 1, 2, 3, 4
+    """
+    )
+
+    monthly_recurring_revenue = """
+        CASE
+            WHEN subscriptions.recurring_interval = 'year'
+            THEN round(subscriptions.amount / CAST(12 AS NUMERIC))
+            WHEN subscriptions.recurring_interval = 'month'
+            THEN subscriptions.amount
+        END
+    """
+    subscriptions: list[str] = []
+    for prefix, column in (("new", "started_at"), ("ended", "ended_at")):
+        subscription_values = {
+            f"{prefix}_subscriptions": "count(subscriptions.id)",
+            f"{prefix}_monthly_recurring_revenue": (
+                f"sum({monthly_recurring_revenue})"
+            ),
+        }
+        subscriptions.append(
+            _select_rollups(
+                "subscriptions.product_id",
+                f"subscriptions.{column}",
+                subscription_values,
+            )
+            + f"""
+            FROM subscriptions
+            JOIN products ON subscriptions.product_id = products.id
+            JOIN organizations ON products.organization_id = organizations.id
+            JOIN product_prices ON subscriptions.price_id = product_prices.id
+            WHERE organizations.deleted_at IS NULL
+            AND subscriptions.started_at IS NOT NULL
+            AND subscriptions.{column} IS NOT NULL
+            GROUP BY 1, 2, 3, 4
+            """
+        )
+
+    rows = " UNION ALL ".join([orders, *subscriptions])
+    columns = ", ".join((*KEY_COLUMNS, *VALUE_COLUMNS))
+    sums = ", ".join(f"coalesce(sum({column}), 0)" for column in VALUE_COLUMNS)
+    keys = ", ".join(KEY_COLUMNS)
+    return f"""
+        INSERT INTO metrics_rollups ({columns})
+        SELECT {keys}, {sums}
+        FROM ({rows}) AS rows
+        GROUP BY {keys}
+    """
+
+
+def upgrade() -> None:
+    op.create_table(
+        "metrics_rollups",
+        sa.Column("organization_id", sa.Uuid(), nullable=False),
+        sa.Column("timestamp", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("product_id", sa.Uuid(), nullable=False),
+        sa.Column("product_price_type", sa.String(), nullable=False),
+        sa.Column("orders", sa.BigInteger(), nullable=False),
+        sa.Column("revenue", sa.BigInteger(), nullable=False),
+        sa.Column("one_time_products", sa.BigInteger(), nullable=False),
+        sa.Column("one_time_products_revenue", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions", sa.BigInteger(), nullable=False),
+        sa.Column("ended_subscriptions", sa.BigInteger(), nullable=False),
+        sa.Column("new_monthly_recurring_revenue", sa.BigInteger(), nullable=False),
+        sa.Column("ended_monthly_recurring_revenue", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions_revenue_hour", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions_revenue_day", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions_revenue_week", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions_revenue_month", sa.BigInteger(), nullable=False),
+        sa.Column("new_subscriptions_revenue_year", sa.BigInteger(), nullable=False),
+        sa.Column("renewed_subscriptions_hour", sa.BigInteger(), nullable=False),
+        sa.Column("renewed_subscriptions_day", sa.BigInteger(), nullable=False),
+        sa.Column("renewed_subscriptions_week", sa.BigInteger(), nullable=False),
+        sa.Column("renewed_subscriptions_month", sa.BigInteger(), nullable=False),
+        sa.Column("renewed_subscriptions_year", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "renewed_subscriptions_revenue_hour", sa.BigInteger(), nullable=False
+        ),
+        sa.Column("renewed_subscriptions_revenue_day", sa.BigInteger(), nullable=False),
+        sa.Column(
+            "renewed_subscriptions_revenue_week", sa.BigInteger(), nullable=False
+        ),
+        sa.Column(
+            "renewed_subscriptions_revenue_month", sa.BigInteger(), nullable=False
+        ),
+        sa.Column(
+            "renewed_subscriptions_revenue_year", sa.BigInteger(), nullable=False
+        ),
+        sa.ForeignKeyConstraint(
+            ["organization_id"],
+            ["organizations.id"],
+            name=op.f("metrics_rollups_organization_id_fkey"),
+            ondelete="cascade",
+        ),
+        sa.ForeignKeyConstraint(
+            ["product_id"],
+            ["products.id"],
+            name=op.f("metrics_rollups_product_id_fkey"),
+            ondelete="cascade",
+        ),
+        sa.PrimaryKeyConstraint(
+            "organization_id",
+            "timestamp",
+            "product_id",
+            "product_price_type",
+            name=op.f("metrics_rollups_pkey"),
+        ),
+    )
+    op.create_index(
+        op.f("ix_metrics_rollups_product_id"),
+        "metrics_rollups",
+        ["product_id"],
+        unique=False,
+    )
+
+    # Backfill the rollups from the existing orders and subscriptions,
+    # like the `metrics.rebuild_rollups` task does for every organization.
+    op.execute(_get_backfill_statement())
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_metrics_rollups_product_id"), table_name="metrics_rollups")
+    op.drop_table("metrics_rollups")
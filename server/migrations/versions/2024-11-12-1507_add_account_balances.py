@@ -0,0 +1,51 @@
+"""Add account balances
+
+Revision ID: 8b52e1d7c4a0
+Revises: 3f1a6c9d2b7e
+Create Date: 2024-11-12 15:07:12.402519
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+
+# Polar Custom Imports
+
+# revision identifiers, used by Alembic.
+revision = "8b52e1d7c4a0"
+down_revision = "3f1a6c9d2b7e"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "account_balances",
+        sa.Column("account_id", sa.Uuid(), nullable=False),
+        sa.Column("transaction_type", sa.String(), nullable=False),
+        sa.Column("amount", sa.BigInteger(), nullable=False),
+        sa.Column("account_amount", sa.BigInteger(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ["account_id"],
+            ["accounts.id"],
+            name=op.f("account_balances_account_id_fkey"),
+            ondelete="cascade",
+        ),
+        sa.PrimaryKeyConstraint(
+            "account_id", "transaction_type", name=op.f("account_balances_pkey")
+        ),
+    )
+
+    op.execute(
+        """
+        INSERT INTO account_balances (account_id, transaction_type, amount, account_amount)
+        SELECT account_id, type, SUM(amount), SUM(account_amount)
+        FROM transactions
+        WHERE account_id IS NOT NULL
+        GROUP BY account_id, type
+        """
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("account_balances")
@@ -0,0 +1,71 @@
+"""Add stripe_events
+
+Revision ID: 5d2e8a4f1c93
+Revises: 8b52e1d7c4a0
+Create Date: 2024-11-13 10:43:27.118204
+
+"""
+
+import sqlalchemy as sa
+from alembic import op
+from sqlalchemy.dialects import postgresql
+
+# Polar Custom Imports
+
+# revision identifiers, used by Alembic.
+revision = "5d2e8a4f1c93"
+down_revision = "8b52e1d7c4a0"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "stripe_events",
+        sa.Column("stripe_id", sa.String(), nullable=False),
+        sa.Column("type", sa.String(), nullable=False),
+        sa.Column("object_id", sa.String(), nullable=True),
+        sa.Column("stripe_created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("data", postgresql.JSONB(astext_type=sa.Text()), nullable=False),
+        sa.Column("processed_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("id", sa.Uuid(), nullable=False),
+        sa.Column("created_at", sa.TIMESTAMP(timezone=True), nullable=False),
+        sa.Column("modified_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.Column("deleted_at", sa.TIMESTAMP(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id", name=op.f("stripe_events_pkey")),
+        sa.UniqueConstraint("stripe_id", name=op.f("stripe_events_stripe_id_key")),
+    )
+    op.create_index(
+        op.f("ix_stripe_events_created_at"),
+        "stripe_events",
+        ["created_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_stripe_events_deleted_at"),
+        "stripe_events",
+        ["deleted_at"],
+        unique=False,
+    )
+    op.create_index(
+        op.f("ix_stripe_events_modified_at"),
+        "stripe_events",
+        ["modified_at"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_stripe_events_object_id_stripe_created_at",
+        "stripe_events",
+        ["object_id", "stripe_created_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(
+        "ix_stripe_events_object_id_stripe_created_at", table_name="stripe_events"
+    )
+    op.drop_index(op.f("ix_stripe_events_modified_at"), table_name="stripe_events")
+    op.drop_index(op.f("ix_stripe_events_deleted_at"), table_name="stripe_events")
+    op.drop_index(op.f("ix_stripe_events_created_at"), table_name="stripe_events")
+    op.drop_table("stripe_events")
@@ -0,0 +1,43 @@
+"""Add trigram search indexes
+
+Revision ID: 3f7c9a1e5b28
+Revises: 5d2e8a4f1c93
+Create Date: 2024-11-14 10:12:41.507318
+
+"""
+
+from alembic import op
+
+# Polar Custom Imports
+
+# revision identifiers, used by Alembic.
+revision = "3f7c9a1e5b28"
+down_revision = "5d2e8a4f1c93"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+TRIGRAM_INDEXES = [
+    ("ix_products_name_trgm", "products", "name"),
+    ("ix_organizations_slug_trgm", "organizations", "slug"),
+    ("ix_custom_fields_slug_trgm", "custom_fields", "slug"),
+    ("ix_custom_fields_name_trgm", "custom_fields", "name"),
+]
+
+
+def upgrade() -> None:
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    for index_name, table_name, column_name in TRIGRAM_INDEXES:
+        op.create_index(
+            index_name,
+            table_name,
+            [column_name],
+            unique=False,
+            postgresql_using="gin",
+            postgresql_ops={column_name: "gin_trgm_ops"},
+        )
+
+
+def downgrade() -> None:
+    for index_name, table_name, _ in TRIGRAM_INDEXES:
+        op.drop_index(index_name, table_name=table_name, postgresql_using="gin")
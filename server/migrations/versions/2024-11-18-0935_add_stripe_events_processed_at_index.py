@@ -0,0 +1,30 @@
+"""Add stripe_events.processed_at index
+
+Revision ID: 9e4b7d2a6c15
+Revises: 3f7c9a1e5b28
+Create Date: 2024-11-18 09:35:12.482093
+
+"""
+
+from alembic import op
+
+# Polar Custom Imports
+
+# revision identifiers, used by Alembic.
+revision = "9e4b7d2a6c15"
+down_revision = "3f7c9a1e5b28"
+branch_labels: tuple[str] | None = None
+depends_on: tuple[str] | None = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        op.f("ix_stripe_events_processed_at"),
+        "stripe_events",
+        ["processed_at"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_stripe_events_processed_at"), table_name="stripe_events")
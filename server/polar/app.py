@@ -6,10 +6,11 @@ import structlog
 from fastapi import FastAPI
 from fastapi.routing import APIRoute
 
-from polar import receivers, worker  # noqa
+from polar import receivers, tasks, worker  # noqa
 from polar.api import router
 from polar.checkout import ip_geolocation
 from polar.config import settings
+from polar.eventstream.broker import EventStreamBroker
 from polar.exception_handlers import add_exception_handlers
 from polar.health.endpoints import router as health_router
 from polar.kit.cors import CORSConfig, CORSMatcherMiddleware, Scope
@@ -33,6 +34,7 @@ from polar.middlewares import (
     FlushEnqueuedWorkerJobsMiddleware,
     LogCorrelationIdMiddleware,
     PathRewriteMiddleware,
+    QueryStatsMiddleware,
     SandboxResponseHeaderMiddleware,
 )
 from polar.oauth2.endpoints.well_known import router as well_known_router
@@ -40,8 +42,10 @@ from polar.oauth2.exception_handlers import OAuth2Error, oauth2_error_exception_
 from polar.openapi import OPENAPI_PARAMETERS, APITag, set_openapi_generator
 from polar.postgres import create_async_engine, create_sync_engine
 from polar.posthog import configure_posthog
+from polar.query_stats import instrument_query_stats
 from polar.redis import Redis, create_redis
 from polar.sentry import configure_sentry
+from polar.webhook.cache import endpoints_cache as webhook_endpoints_cache
 from polar.webhook.webhooks import document_webhooks
 from polar.worker import ArqRedis
 from polar.worker import lifespan as worker_lifespan
@@ -92,6 +96,7 @@ class State(TypedDict):
     sync_sessionmaker: SyncSessionMaker
     arq_pool: ArqRedis
     redis: Redis
+    eventstream_broker: EventStreamBroker
     ip_geolocation_client: ip_geolocation.IPGeolocationClient | None
 
 
@@ -104,20 +109,25 @@ async def lifespan(app: FastAPI) -> AsyncIterator[State]:
             async_engine = create_async_engine("app")
             async_sessionmaker = create_async_sessionmaker(async_engine)
             instrument_sqlalchemy(async_engine.sync_engine)
+            instrument_query_stats(async_engine.sync_engine)
 
             sync_engine = create_sync_engine("app")
             sync_sessionmaker = create_sync_sessionmaker(sync_engine)
             instrument_sqlalchemy(sync_engine)
+            instrument_query_stats(sync_engine)
 
             try:
                 ip_geolocation_client = ip_geolocation.get_client()
             except FileNotFoundError:
                 log.info(
-                    "IP geolocation database not found. "
-                    "Checkout won't automatically geolocate IPs."
+                    "IP geolocation index not found. "
+                    "Checkout won't automatically geolocate IPs. "
+                    "Build it with `python -m polar.checkout.ip_geolocation`."
                 )
                 ip_geolocation_client = None
 
+            eventstream_broker = EventStreamBroker(redis)
+
             log.info("Polar API started")
 
             yield {
@@ -127,9 +137,12 @@ async def lifespan(app: FastAPI) -> AsyncIterator[State]:
                 "sync_sessionmaker": sync_sessionmaker,
                 "arq_pool": arq_pool,
                 "redis": redis,
+                "eventstream_broker": eventstream_broker,
                 "ip_geolocation_client": ip_geolocation_client,
             }
 
+            await eventstream_broker.close()
+            await webhook_endpoints_cache.close()
             await async_engine.dispose()
             sync_engine.dispose()
             if ip_geolocation_client is not None:
@@ -148,6 +161,7 @@ def create_app() -> FastAPI:
 
     app.add_middleware(PathRewriteMiddleware, pattern=r"^/api/v1", replacement="/v1")
     app.add_middleware(FlushEnqueuedWorkerJobsMiddleware)
+    app.add_middleware(QueryStatsMiddleware)
     app.add_middleware(LogCorrelationIdMiddleware)
     if settings.is_sandbox():
         app.add_middleware(SandboxResponseHeaderMiddleware)
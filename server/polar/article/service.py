@@ -4,7 +4,7 @@ import re
 import tempfile
 import uuid
 import zipfile
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Sequence
 from datetime import datetime
 from operator import and_, or_
 from uuid import UUID
@@ -46,6 +46,9 @@ from polar.worker import enqueue_job
 
 from .schemas import ArticleCreate, ArticlePreview, ArticleUpdate
 
+RECEIVERS_CHUNK_SIZE = 100
+"""Number of receivers handled by a single `articles.send_batch` job."""
+
 
 def polar_slugify(input: str) -> str:
     return slugify(
@@ -316,20 +319,19 @@ class ArticleService(ResourceServiceReader[Article]):
         article.notifications_sent_at = utc_now()
         session.add(article)
 
-        receivers = await article_service.list_receivers(
+        email_sent_to_count = 0
+        async for receivers in self.stream_receivers(
             session, article.organization_id, article.paid_subscribers_only
-        )
-
-        for receiver_user_id, _, _ in receivers:
+        ):
             enqueue_job(
-                "articles.send_to_user",
+                "articles.send_batch",
                 article_id=article.id,
-                user_id=receiver_user_id,
-                is_test=False,
+                user_ids=[receiver_user_id for receiver_user_id, _, _ in receivers],
             )
+            email_sent_to_count += len(receivers)
 
         # after scheduling is complete
-        article.email_sent_to_count = len(receivers)
+        article.email_sent_to_count = email_sent_to_count
         session.add(article)
 
         return article
@@ -404,13 +406,65 @@ class ArticleService(ResourceServiceReader[Article]):
     async def list_receivers(
         self, session: AsyncSession, organization_id: UUID, paid_subscribers_only: bool
     ) -> Sequence[tuple[UUID, bool, bool]]:
+        statement = self._get_receivers_statement(
+            organization_id, paid_subscribers_only
+        )
+        result = await session.execute(statement)
+        return result.tuples().all()
+
+    async def stream_receivers(
+        self,
+        session: AsyncSession,
+        organization_id: UUID,
+        paid_subscribers_only: bool,
+        chunk_size: int = RECEIVERS_CHUNK_SIZE,
+    ) -> AsyncIterator[Sequence[tuple[UUID, bool, bool]]]:
+        """
+        Same as `list_receivers`, but yields the receivers by chunks
+        from a server-side cursor, so they're never all loaded in memory.
+        """
+        statement = self._get_receivers_statement(
+            organization_id, paid_subscribers_only
+        ).execution_options(yield_per=chunk_size)
+        result = await session.stream(statement)
+        async for partition in result.partitions(chunk_size):
+            yield [row._tuple() for row in partition]
+
+    async def list_batch_receivers(
+        self, session: AsyncSession, article: Article, user_ids: Sequence[UUID]
+    ) -> Sequence[tuple[User, UUID | None, bool, bool]]:
+        """
+        Load the receivers of an article among the given users.
+
+        Returns tuples of the user, the ID of its subscription to the organization
+        if any, whether it's a paid subscriber and whether it's an organization member.
+        Users who are no longer receivers are skipped.
+        """
+        statement = (
+            self._get_receivers_statement(
+                article.organization_id, article.paid_subscribers_only
+            )
+            .with_only_columns(
+                User,
+                ArticlesSubscription.id,
+                func.coalesce(ArticlesSubscription.paid_subscriber, False),
+                UserOrganization.user_id.is_not(None),
+            )
+            .where(User.id.in_(user_ids), User.deleted_at.is_(None))
+        )
+        result = await session.execute(statement)
+        return result.unique().tuples().all()
+
+    def _get_receivers_statement(
+        self, organization_id: UUID, paid_subscribers_only: bool
+    ) -> Select[tuple[UUID, bool, bool]]:
         user_subscription_clause = (
             ArticlesSubscription.organization_id == organization_id
         )
         if paid_subscribers_only:
             user_subscription_clause &= ArticlesSubscription.paid_subscriber.is_(True)
 
-        statement = (
+        return (
             select(
                 User.id,
                 func.coalesce(ArticlesSubscription.paid_subscriber, False),
@@ -436,9 +490,6 @@ class ArticleService(ResourceServiceReader[Article]):
             )
         )
 
-        result = await session.execute(statement)
-        return result.tuples().all()
-
     async def release_paid_subscribers_only(self, session: AsyncSession) -> None:
         statement = (
             update(Article)
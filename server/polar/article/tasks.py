@@ -6,16 +6,20 @@ from sqlalchemy.orm import joinedload
 
 from polar.auth.service import AuthService
 from polar.config import settings
-from polar.email.sender import get_email_sender
+from polar.email.sender import BATCH_MAX_SIZE, EmailMessage, get_email_sender
+from polar.kit import rate_limit
 from polar.logging import Logger
-from polar.models import Article
+from polar.models import Article, User
 from polar.models.article import ArticleByline
+from polar.redis import Redis
 from polar.user.service.user import user as user_service
 from polar.worker import (
     AsyncSessionMaker,
     CronTrigger,
     JobContext,
     PolarWorkerContext,
+    QueueName,
+    get_worker_redis,
     task,
 )
 
@@ -24,7 +28,111 @@ from .service import article_service
 log: Logger = structlog.get_logger()
 
 
-@task("articles.send_to_user")
+RENDER_TIMEOUT = 60
+"""Increase the default timeout because it can be slow to render."""
+
+RENDER_CACHE_TTL = 60 * 60 * 24
+"""How long a rendered article is reused by the batches of the same send."""
+
+UNSUBSCRIBE_ID_PLACEHOLDER = "__polar_subscriber_id__"
+"""Rendered in place of the subscriber ID, and replaced for each receiver."""
+
+SEND_RATE_LIMIT_KEY = "articles.send"
+SEND_RATE_LIMIT = 2
+"""Maximum number of calls to the email provider per second, shared by all workers."""
+
+
+def _get_unsubscribe_link(article: Article, subscriber_id: str) -> str:
+    return f"https://polar.sh/unsubscribe?org={article.organization.slug}&id={subscriber_id}"
+
+
+def _get_sender(article: Article) -> tuple[str, dict[str, str]]:
+    email_headers: dict[str, str] = {}
+    from_name = ""
+    if article.byline == ArticleByline.user and article.user is not None:
+        from_name = article.user.public_name
+        if article.user.email:
+            email_headers["Reply-To"] = f"{from_name} <{article.user.email}>"
+    else:
+        from_name = article.organization.name or article.organization.slug
+        if article.organization.email:
+            email_headers["Reply-To"] = f"{from_name} <{article.organization.email}>"
+    return from_name, email_headers
+
+
+async def _render(
+    client: httpx.AsyncClient,
+    article: Article,
+    user: User,
+    unsubscribe_link: str | None,
+) -> str | None:
+    (jwt, _) = AuthService.generate_token(user)
+
+    # _, magic_link_token = await magic_link_service.request(
+    #     session,
+    #     user.email,
+    #     source="article_links",
+    #     expires_at=utc_now() + timedelta(hours=24),
+    # )
+
+    render_data = {
+        # Add pre-authenticated tokens to the end of all links in the email
+        # "inject_magic_link_token": magic_link_token,
+    }
+    if unsubscribe_link is not None:
+        render_data["unsubscribe_link"] = unsubscribe_link
+
+    response = await client.post(
+        f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}",
+        json=render_data,
+        # Authenticating to the renderer as the user we're sending the email to
+        headers={"Cookie": f"polar_session={jwt};"},
+        timeout=RENDER_TIMEOUT,
+    )
+
+    if not response.is_success:
+        log.error(f"failed to get rendered article: code={response.status_code}")
+        return None
+
+    return response.text
+
+
+async def _render_variant(
+    redis: Redis,
+    client: httpx.AsyncClient,
+    article: Article,
+    user: User,
+    variant: tuple[bool, bool, bool],
+) -> str | None:
+    """
+    Render the article for an audience variant, i.e. receivers who see
+    the same content: paid subscribers, organization members and
+    whether they have an unsubscribe link.
+
+    The article is rendered once for the first receiver of the variant
+    and cached, with a placeholder instead of the subscriber ID.
+    """
+    paid_subscriber, organization_member, has_subscription = variant
+    cache_key = (
+        f"articles:email:{article.id}:"
+        f"{int(paid_subscriber)}{int(organization_member)}{int(has_subscription)}"
+    )
+    cached = await redis.get(cache_key)
+    if cached is not None:
+        return cached
+
+    unsubscribe_link = (
+        _get_unsubscribe_link(article, UNSUBSCRIBE_ID_PLACEHOLDER)
+        if has_subscription
+        else None
+    )
+    html_content = await _render(client, article, user, unsubscribe_link)
+    if html_content is not None:
+        await redis.set(cache_key, html_content, ex=RENDER_CACHE_TTL)
+    return html_content
+
+
+@task("articles.send_to_user", queue_name=QueueName.bulk)
 async def articles_send_to_user(
     ctx: JobContext,
     article_id: UUID,
@@ -52,69 +160,105 @@ async def articles_send_to_user(
         subject = "[TEST] " if is_test else ""
         subject += article.title
 
-        (jwt, _) = AuthService.generate_token(user)
-
-        # _, magic_link_token = await magic_link_service.request(
-        #     session,
-        #     user.email,
-        #     source="article_links",
-        #     expires_at=utc_now() + timedelta(hours=24),
-        # )
-
-        email_headers: dict[str, str] = {}
-
-        render_data = {
-            # Add pre-authenticated tokens to the end of all links in the email
-            # "inject_magic_link_token": magic_link_token,
-        }
+        from_name, email_headers = _get_sender(article)
 
         # Get subscriber ID (if exists)
+        unsubscribe_link: str | None = None
         subscriber = await article_service.get_subscriber(
             session, user_id, article.organization_id
         )
         if subscriber:
-            unsubscribe_link = f"https://polar.sh/unsubscribe?org={article.organization.slug}&id={subscriber.id}"
-            render_data["unsubscribe_link"] = unsubscribe_link
+            unsubscribe_link = _get_unsubscribe_link(article, str(subscriber.id))
             email_headers["List-Unsubscribe"] = f"<{unsubscribe_link}>"
 
         async with httpx.AsyncClient() as client:
-            response = await client.post(
-                f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}",
-                json=render_data,
-                # Authenticating to the renderer as the user we're sending the email to
-                headers={"Cookie": f"polar_session={jwt};"},
-                # Increase the default timeout because it can be slow to render
-                timeout=60,
-            )
-
-        if not response.is_success:
-            log.error(f"failed to get rendered article: code={response.status_code}")
-            return None
+            html_content = await _render(client, article, user, unsubscribe_link)
 
-        from_name = ""
-        if article.byline == ArticleByline.user and article.user is not None:
-            from_name = article.user.public_name
-            if article.user.email:
-                email_headers["Reply-To"] = f"{from_name} <{article.user.email}>"
-        else:
-            from_name = article.organization.name or article.organization.slug
-            if article.organization.email:
-                email_headers["Reply-To"] = (
-                    f"{from_name} <{article.organization.email}>"
-                )
+        if html_content is None:
+            return None
 
         email_sender = get_email_sender()
 
         email_sender.send_to_user(
             to_email_addr=user.email,
             subject=subject,
-            html_content=response.text,
+            html_content=html_content,
             from_name=from_name,
             from_email_addr=f"{article.organization.slug}@posts.polar.sh",
             email_headers=email_headers,
         )
 
 
+@task("articles.send_batch", queue_name=QueueName.bulk, max_concurrency=4)
+async def articles_send_batch(
+    ctx: JobContext,
+    article_id: UUID,
+    user_ids: list[UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        article = await article_service.get(
+            session,
+            article_id,
+            options=(
+                joinedload(Article.user),
+                joinedload(Article.organization),
+            ),
+        )
+        if not article:
+            return
+
+        receivers = await article_service.list_batch_receivers(
+            session, article, user_ids
+        )
+
+        redis = get_worker_redis(ctx)
+        from_name, sender_headers = _get_sender(article)
+        rendered: dict[tuple[bool, bool, bool], str | None] = {}
+        messages: list[EmailMessage] = []
+
+        async with httpx.AsyncClient() as client:
+            for user, subscriber_id, paid_subscriber, organization_member in receivers:
+                variant = (
+                    paid_subscriber,
+                    organization_member,
+                    subscriber_id is not None,
+                )
+                if variant not in rendered:
+                    rendered[variant] = await _render_variant(
+                        redis, client, article, user, variant
+                    )
+                html_content = rendered[variant]
+                if html_content is None:
+                    continue
+
+                email_headers = {**sender_headers}
+                if subscriber_id is not None:
+                    html_content = html_content.replace(
+                        UNSUBSCRIBE_ID_PLACEHOLDER, str(subscriber_id)
+                    )
+                    unsubscribe_link = _get_unsubscribe_link(
+                        article, str(subscriber_id)
+                    )
+                    email_headers["List-Unsubscribe"] = f"<{unsubscribe_link}>"
+
+                messages.append(
+                    {
+                        "to_email_addr": user.email,
+                        "subject": article.title,
+                        "html_content": html_content,
+                        "from_name": from_name,
+                        "from_email_addr": f"{article.organization.slug}@posts.polar.sh",
+                        "email_headers": email_headers,
+                    }
+                )
+
+        email_sender = get_email_sender()
+        for i in range(0, len(messages), BATCH_MAX_SIZE):
+            await rate_limit.acquire(redis, SEND_RATE_LIMIT_KEY, SEND_RATE_LIMIT)
+            email_sender.send_batch_to_users(messages[i : i + BATCH_MAX_SIZE])
+
+
 @task("articles.send_scheduled", cron_trigger=CronTrigger(second=0))
 async def articles_send_scheduled(
     ctx: JobContext,
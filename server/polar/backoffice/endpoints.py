@@ -20,18 +20,21 @@ from polar.models.pledge_transaction import PledgeTransaction as PledgeTransacti
 from polar.openapi import APITag
 from polar.pledge.service import pledge as pledge_service
 from polar.postgres import AsyncSession, get_db_session
+from polar.query_stats import get_query_stats
 from polar.redis import Redis, get_redis
 from polar.repository.service import repository as repository_service
 from polar.reward.endpoints import to_resource as reward_to_resource
 from polar.reward.service import reward_service
 from polar.routing import APIRouter
-from polar.worker import enqueue_job
+from polar.worker import enqueue_job, get_queue_stats
 
 from .pledge_service import bo_pledges_service
 from .schemas import (
     BackofficeBadge,
     BackofficeBadgeResponse,
     BackofficePledge,
+    BackofficeQueryStats,
+    BackofficeQueueStats,
     BackofficeReward,
 )
 
@@ -306,3 +309,41 @@ async def update_badge_contents(
         "status": True,
         "queued": queued,
     }
+
+
+@router.get("/query-stats", response_model=list[BackofficeQueryStats])
+async def query_stats(
+    auth_subject: AdminUser,
+    redis: Redis = Depends(get_redis),
+) -> list[BackofficeQueryStats]:
+    """Queries run by API requests and worker jobs, by route or task."""
+    aggregates = await get_query_stats(redis)
+    stats = [
+        BackofficeQueryStats(
+            unit=unit,
+            units=aggregate.units,
+            queries=aggregate.queries,
+            duration_ms=aggregate.duration_ms,
+            repeated_statements=aggregate.repeated_statements,
+            queries_per_unit=aggregate.queries / aggregate.units
+            if aggregate.units
+            else 0.0,
+            duration_ms_per_unit=aggregate.duration_ms / aggregate.units
+            if aggregate.units
+            else 0.0,
+        )
+        for unit, aggregate in aggregates.items()
+    ]
+    return sorted(stats, key=lambda s: s.duration_ms, reverse=True)
+
+
+@router.get("/queue-stats", response_model=list[BackofficeQueueStats])
+async def queue_stats(
+    auth_subject: AdminUser,
+    redis: Redis = Depends(get_redis),
+) -> list[BackofficeQueueStats]:
+    """Depth of the worker queues and age of their oldest ready job."""
+    return [
+        BackofficeQueueStats.model_validate(stats._asdict())
+        for stats in await get_queue_stats(redis)
+    ]
@@ -71,3 +71,20 @@ class BackofficeBadge(Schema):
 
 class BackofficeBadgeResponse(BackofficeBadge):
     success: bool
+
+
+class BackofficeQueryStats(Schema):
+    unit: str
+    units: int
+    queries: int
+    duration_ms: float
+    repeated_statements: int
+    queries_per_unit: float
+    duration_ms_per_unit: float
+
+
+class BackofficeQueueStats(Schema):
+    queue_name: str
+    ready: int
+    deferred: int
+    oldest_age: float | None
@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from typing import Any, Protocol, TypeVar
 
 from polar.auth.models import AuthSubject
@@ -157,6 +158,76 @@ class BenefitServiceProtocol(Protocol[B, BP, BGP]):
         """
         ...
 
+    async def grant_many(
+        self,
+        benefit: B,
+        grants: Sequence[tuple[User, BGP]],
+        *,
+        update: bool = False,
+        attempt: int = 1,
+    ) -> list[BGP | BenefitServiceError]:
+        """
+        Executes the logic to grant a benefit to several backers.
+
+        By default, `grant` is called for each backer. Services able to do it
+        in bulk, e.g. with a single query or API call, should override it.
+
+        Args:
+            benefit: The Benefit to grant.
+            grants: The backer users and their stored properties for this benefit.
+            update: Whether we are updating already granted benefits.
+            attempt: Number of times we attempted to grant the benefit.
+
+        Returns:
+            For each backer, in the same order, the data to store
+            or the error raised while granting the benefit.
+        """
+        results: list[BGP | BenefitServiceError] = []
+        for user, grant_properties in grants:
+            try:
+                properties = await self.grant(
+                    benefit, user, grant_properties, update=update, attempt=attempt
+                )
+            except BenefitServiceError as e:
+                results.append(e)
+            else:
+                results.append(properties)
+        return results
+
+    async def revoke_many(
+        self,
+        benefit: B,
+        grants: Sequence[tuple[User, BGP]],
+        *,
+        attempt: int = 1,
+    ) -> list[BGP | BenefitServiceError]:
+        """
+        Executes the logic to revoke a benefit from several backers.
+
+        By default, `revoke` is called for each backer. Services able to do it
+        in bulk, e.g. with a single query or API call, should override it.
+
+        Args:
+            benefit: The Benefit to revoke.
+            grants: The backer users and their stored properties for this benefit.
+            attempt: Number of times we attempted to revoke the benefit.
+
+        Returns:
+            For each backer, in the same order, the data to store
+            or the error raised while revoking the benefit.
+        """
+        results: list[BGP | BenefitServiceError] = []
+        for user, grant_properties in grants:
+            try:
+                properties = await self.revoke(
+                    benefit, user, grant_properties, attempt=attempt
+                )
+            except BenefitServiceError as e:
+                results.append(e)
+            else:
+                results.append(properties)
+        return results
+
     async def requires_update(self, benefit: B, previous_properties: BP) -> bool:
         """
         Determines if a benefit update requires to trigger the granting logic again.
@@ -1,10 +1,12 @@
 from typing import Any, cast
 
-import httpx
 import structlog
 
 from polar.auth.models import AuthSubject
 from polar.config import settings
+from polar.integrations.discord.dispatch import (
+    discord_dispatch as discord_dispatch_service,
+)
 from polar.integrations.discord.service import DiscordAccountNotConnected
 from polar.integrations.discord.service import discord_bot as discord_bot_service
 from polar.integrations.discord.service import discord_user as discord_user_service
@@ -19,7 +21,6 @@ from polar.notifications.notification import (
 from .base import (
     BenefitPreconditionError,
     BenefitPropertiesValidationError,
-    BenefitRetriableError,
     BenefitServiceProtocol,
 )
 
@@ -108,16 +109,10 @@ class BenefitDiscordService(
                 ),
             ) from e
 
-        try:
-            await discord_bot_service.add_member(self.session, guild_id, role_id, user)
-        except httpx.HTTPError as e:
-            error_bound_logger = bound_logger.bind(error=str(e))
-            if isinstance(e, httpx.HTTPStatusError):
-                error_bound_logger = error_bound_logger.bind(
-                    status_code=e.response.status_code, body=e.response.text
-                )
-            error_bound_logger.warning("HTTP error while adding member")
-            raise BenefitRetriableError(5 * 2**attempt) from e
+        # Applied by the guild dispatch, at the rate Discord allows
+        await discord_dispatch_service.add_member_role(
+            guild_id, role_id, account.account_id, user.id
+        )
 
         bound_logger.debug("Benefit granted")
 
@@ -150,16 +145,8 @@ class BenefitDiscordService(
         if not (guild_id and role_id and account_id):
             return {}
 
-        try:
-            await discord_bot_service.remove_member_role(guild_id, role_id, account_id)
-        except httpx.HTTPError as e:
-            error_bound_logger = bound_logger.bind(error=str(e))
-            if isinstance(e, httpx.HTTPStatusError):
-                error_bound_logger = error_bound_logger.bind(
-                    status_code=e.response.status_code, body=e.response.text
-                )
-            error_bound_logger.warning("HTTP error while adding member")
-            raise BenefitRetriableError(5 * 2**attempt) from e
+        # Applied by the guild dispatch, at the rate Discord allows
+        await discord_dispatch_service.remove_member_role(guild_id, role_id, account_id)
 
         bound_logger.debug("Benefit revoked")
 
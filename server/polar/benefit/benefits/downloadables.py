@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+from collections.abc import Sequence
 from typing import Any, cast
 from uuid import UUID
 
@@ -14,6 +15,7 @@ from polar.models.benefit_grant import BenefitGrantDownloadablesProperties
 from polar.user.service.downloadables import downloadable as downloadable_service
 
 from .base import (
+    BenefitServiceError,
     BenefitServiceProtocol,
 )
 
@@ -75,6 +77,20 @@ class BenefitDownloadablesService(
         )
         return {}
 
+    async def revoke_many(
+        self,
+        benefit: BenefitDownloadables,
+        grants: Sequence[tuple[User, BenefitGrantDownloadablesProperties]],
+        *,
+        attempt: int = 1,
+    ) -> list[BenefitGrantDownloadablesProperties | BenefitServiceError]:
+        await downloadable_service.revoke_for_benefit_many(
+            self.session,
+            users=[user for user, _ in grants],
+            benefit_id=benefit.id,
+        )
+        return [{} for _ in grants]
+
     async def requires_update(
         self,
         benefit: BenefitDownloadables,
@@ -1,4 +1,4 @@
-from collections.abc import Sequence
+from collections.abc import AsyncIterator, Sequence
 from typing import Any, Literal, TypeVar, Unpack, overload
 from uuid import UUID
 
@@ -6,7 +6,12 @@ import structlog
 from sqlalchemy import select
 from sqlalchemy.orm import joinedload
 
-from polar.benefit.benefits import BenefitPreconditionError, get_benefit_service
+from polar.benefit.benefits import (
+    BenefitPreconditionError,
+    BenefitRetriableError,
+    BenefitServiceError,
+    get_benefit_service,
+)
 from polar.benefit.schemas import BenefitGrantWebhook
 from polar.eventstream.service import publish as eventstream_publish
 from polar.exceptions import PolarError
@@ -47,6 +52,9 @@ log: Logger = structlog.get_logger()
 
 BG = TypeVar("BG", bound=BenefitGrant)
 
+BENEFIT_GRANT_BATCH_SIZE = 100
+"""Number of grants updated or revoked by a single batch job."""
+
 
 class BenefitGrantError(PolarError): ...
 
@@ -313,9 +321,12 @@ class BenefitGrantService(ResourceServiceReader[BenefitGrant]):
         if not await benefit_service.requires_update(benefit, previous_properties):
             return
 
-        grants = await self._get_granted_by_benefit(session, benefit)
-        for grant in grants:
-            enqueue_job("benefit.update", benefit_grant_id=grant.id)
+        async for grant_ids in self._stream_granted_ids_by_benefit(session, benefit):
+            enqueue_job(
+                "benefit.update_batch",
+                benefit_id=benefit.id,
+                benefit_grant_ids=grant_ids,
+            )
 
     async def update_benefit_grant(
         self,
@@ -363,12 +374,84 @@ class BenefitGrantService(ResourceServiceReader[BenefitGrant]):
         )
         return grant
 
+    async def update_benefit_grants(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        benefit: Benefit,
+        grant_ids: Sequence[UUID],
+        *,
+        attempt: int = 1,
+    ) -> Sequence[tuple[BenefitGrant, BenefitRetriableError]]:
+        """
+        Update a batch of grants of a benefit.
+
+        Users and scopes are loaded for the whole batch, and the benefit service
+        grants it to all of them through `grant_many`.
+
+        Returns:
+            The grants which failed with a retriable error, to be retried individually.
+        """
+        grants = [
+            grant
+            for grant in await self._get_batch(session, benefit, grant_ids)
+            if not grant.is_revoked
+        ]
+        if not grants:
+            return []
+
+        benefit_service = get_benefit_service(benefit.type, session, redis)
+        results = await benefit_service.grant_many(
+            benefit,
+            [(grant.user, grant.properties) for grant in grants],
+            update=True,
+            attempt=attempt,
+        )
+
+        retriable_errors: list[tuple[BenefitGrant, BenefitRetriableError]] = []
+        for grant, result in zip(grants, results):
+            previous_properties = grant.properties
+            if isinstance(result, BenefitRetriableError):
+                retriable_errors.append((grant, result))
+                continue
+            elif isinstance(result, BenefitPreconditionError):
+                await self.handle_precondition_error(
+                    session, result, grant.user, benefit, **self._get_scope(grant)
+                )
+                grant.granted_at = None
+            elif isinstance(result, BenefitServiceError):
+                raise result
+            else:
+                grant.properties = result
+                grant.set_granted()
+
+            session.add(grant)
+            await self._send_webhook(
+                session,
+                benefit,
+                grant,
+                event_type=WebhookEventType.benefit_grant_updated,
+                previous_grant_properties=previous_properties,
+                loaded=True,
+            )
+
+        log.info(
+            "Benefit grants updated",
+            benefit_id=str(benefit.id),
+            count=len(grants) - len(retriable_errors),
+            retriable_errors=len(retriable_errors),
+        )
+        return retriable_errors
+
     async def enqueue_benefit_grant_deletions(
         self, session: AsyncSession, benefit: Benefit
     ) -> None:
-        grants = await self._get_granted_by_benefit(session, benefit)
-        for grant in grants:
-            enqueue_job("benefit.delete", benefit_grant_id=grant.id)
+        async for grant_ids in self._stream_granted_ids_by_benefit(session, benefit):
+            enqueue_job(
+                "benefit.delete_batch",
+                benefit_id=benefit.id,
+                benefit_grant_ids=grant_ids,
+            )
 
     async def delete_benefit_grant(
         self,
@@ -410,6 +493,69 @@ class BenefitGrantService(ResourceServiceReader[BenefitGrant]):
         )
         return grant
 
+    async def delete_benefit_grants(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        benefit: Benefit,
+        grant_ids: Sequence[UUID],
+        *,
+        attempt: int = 1,
+    ) -> Sequence[tuple[BenefitGrant, BenefitRetriableError]]:
+        """
+        Revoke a batch of grants of a deleted benefit.
+
+        Users are loaded for the whole batch, and the benefit service
+        revokes it from all of them through `revoke_many`.
+
+        Returns:
+            The grants which failed with a retriable error, to be retried individually.
+        """
+        grants = [
+            grant
+            for grant in await self._get_batch(session, benefit, grant_ids)
+            if not grant.is_revoked
+        ]
+        if not grants:
+            return []
+
+        benefit_service = get_benefit_service(benefit.type, session, redis)
+        results = await benefit_service.revoke_many(
+            benefit,
+            [(grant.user, grant.properties) for grant in grants],
+            attempt=attempt,
+        )
+
+        retriable_errors: list[tuple[BenefitGrant, BenefitRetriableError]] = []
+        for grant, result in zip(grants, results):
+            previous_properties = grant.properties
+            if isinstance(result, BenefitRetriableError):
+                retriable_errors.append((grant, result))
+                continue
+            elif isinstance(result, BenefitServiceError):
+                raise result
+
+            grant.properties = result
+            grant.set_revoked()
+
+            session.add(grant)
+            await self._send_webhook(
+                session,
+                benefit,
+                grant,
+                event_type=WebhookEventType.benefit_grant_revoked,
+                previous_grant_properties=previous_properties,
+                loaded=True,
+            )
+
+        log.info(
+            "Benefit grants revoked",
+            benefit_id=str(benefit.id),
+            count=len(grants) - len(retriable_errors),
+            retriable_errors=len(retriable_errors),
+        )
+        return retriable_errors
+
     async def handle_precondition_error(
         self,
         session: AsyncSession,
@@ -502,17 +648,53 @@ class BenefitGrantService(ResourceServiceReader[BenefitGrant]):
         result = await session.execute(statement)
         return result.scalar_one_or_none()
 
-    async def _get_granted_by_benefit(
+    async def _stream_granted_ids_by_benefit(
         self, session: AsyncSession, benefit: Benefit
+    ) -> AsyncIterator[Sequence[UUID]]:
+        statement = (
+            select(BenefitGrant.id)
+            .where(
+                BenefitGrant.benefit_id == benefit.id,
+                BenefitGrant.is_granted.is_(True),
+                BenefitGrant.deleted_at.is_(None),
+            )
+            .order_by(BenefitGrant.id)
+            .execution_options(yield_per=BENEFIT_GRANT_BATCH_SIZE)
+        )
+
+        result = await session.stream_scalars(statement)
+        async for grant_ids in result.partitions():
+            yield grant_ids
+
+    async def _get_batch(
+        self, session: AsyncSession, benefit: Benefit, grant_ids: Sequence[UUID]
     ) -> Sequence[BenefitGrant]:
-        statement = select(BenefitGrant).where(
-            BenefitGrant.benefit_id == benefit.id,
-            BenefitGrant.is_granted.is_(True),
-            BenefitGrant.deleted_at.is_(None),
+        statement = (
+            select(BenefitGrant)
+            .where(
+                BenefitGrant.id.in_(grant_ids),
+                BenefitGrant.benefit_id == benefit.id,
+                BenefitGrant.deleted_at.is_(None),
+            )
+            .order_by(BenefitGrant.id)
+            .options(
+                joinedload(BenefitGrant.user),
+                joinedload(BenefitGrant.benefit).joinedload(Benefit.organization),
+                joinedload(BenefitGrant.subscription),
+                joinedload(BenefitGrant.order),
+            )
         )
 
         result = await session.execute(statement)
-        return result.scalars().all()
+        return result.unique().scalars().all()
+
+    def _get_scope(self, grant: BenefitGrant) -> BenefitGrantScope:
+        scope: BenefitGrantScope = {}
+        if grant.subscription is not None:
+            scope["subscription"] = grant.subscription
+        if grant.order is not None:
+            scope["order"] = grant.order
+        return scope
 
     async def _get_granted_by_benefit_and_user(
         self,
@@ -581,9 +763,14 @@ class BenefitGrantService(ResourceServiceReader[BenefitGrant]):
             | Literal[WebhookEventType.benefit_grant_revoked]
         ),
         previous_grant_properties: BenefitGrantPropertiesBase,
+        *,
+        loaded: bool = False,
     ) -> None:
-        loaded = await self.get(session, grant.id, loaded=True)
-        data = BenefitGrantWebhook.model_validate(loaded)
+        if not loaded:
+            loaded_grant = await self.get(session, grant.id, loaded=True)
+            assert loaded_grant is not None
+            grant = loaded_grant
+        data = BenefitGrantWebhook.model_validate(grant)
         data.previous_properties = previous_grant_properties
         await webhook_service.send_payload(
             session,
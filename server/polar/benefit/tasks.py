@@ -14,6 +14,8 @@ from polar.worker import (
     AsyncSessionMaker,
     JobContext,
     PolarWorkerContext,
+    QueueName,
+    enqueue_job,
     get_worker_redis,
     task,
 )
@@ -64,7 +66,7 @@ class OrganizationDoesNotExist(BenefitTaskError):
         super().__init__(message)
 
 
-@task("benefit.enqueue_benefits_grants")
+@task("benefit.enqueue_benefits_grants", queue_name=QueueName.critical)
 async def enqueue_benefits_grants(
     ctx: JobContext,
     task: Literal["grant", "revoke"],
@@ -89,7 +91,7 @@ async def enqueue_benefits_grants(
         )
 
 
-@task("benefit.grant")
+@task("benefit.grant", queue_name=QueueName.critical)
 async def benefit_grant(
     ctx: JobContext,
     user_id: uuid.UUID,
@@ -128,7 +130,7 @@ async def benefit_grant(
             raise Retry(e.defer_seconds) from e
 
 
-@task("benefit.revoke")
+@task("benefit.revoke", queue_name=QueueName.critical)
 async def benefit_revoke(
     ctx: JobContext,
     user_id: uuid.UUID,
@@ -194,6 +196,41 @@ async def benefit_update(
             raise Retry(e.defer_seconds) from e
 
 
+@task("benefit.update_batch")
+async def benefit_update_batch(
+    ctx: JobContext,
+    benefit_id: uuid.UUID,
+    benefit_grant_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        benefit = await benefit_service.get(session, benefit_id, loaded=True)
+        if benefit is None:
+            raise BenefitDoesNotExist(benefit_id)
+
+        retriable_errors = await benefit_grant_service.update_benefit_grants(
+            session,
+            get_worker_redis(ctx),
+            benefit,
+            benefit_grant_ids,
+            attempt=ctx["job_try"],
+        )
+
+        # Retry failed grants individually, so the others are not updated again
+        for grant, error in retriable_errors:
+            log.warning(
+                "Retriable error encountered while updating benefit",
+                error=str(error),
+                defer_seconds=error.defer_seconds,
+                benefit_grant_id=str(grant.id),
+            )
+            enqueue_job(
+                "benefit.update",
+                benefit_grant_id=grant.id,
+                _defer_by=error.defer_seconds,
+            )
+
+
 @task("benefit.delete")
 async def benefit_delete(
     ctx: JobContext,
@@ -219,7 +256,44 @@ async def benefit_delete(
             raise Retry(e.defer_seconds) from e
 
 
-@task("benefit.precondition_fulfilled")
+@task("benefit.delete_batch")
+async def benefit_delete_batch(
+    ctx: JobContext,
+    benefit_id: uuid.UUID,
+    benefit_grant_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        benefit = await benefit_service.get(
+            session, benefit_id, allow_deleted=True, loaded=True
+        )
+        if benefit is None:
+            raise BenefitDoesNotExist(benefit_id)
+
+        retriable_errors = await benefit_grant_service.delete_benefit_grants(
+            session,
+            get_worker_redis(ctx),
+            benefit,
+            benefit_grant_ids,
+            attempt=ctx["job_try"],
+        )
+
+        # Retry failed grants individually, so the others are not revoked again
+        for grant, error in retriable_errors:
+            log.warning(
+                "Retriable error encountered while deleting benefit",
+                error=str(error),
+                defer_seconds=error.defer_seconds,
+                benefit_grant_id=str(grant.id),
+            )
+            enqueue_job(
+                "benefit.delete",
+                benefit_grant_id=grant.id,
+                _defer_by=error.defer_seconds,
+            )
+
+
+@task("benefit.precondition_fulfilled", queue_name=QueueName.critical)
 async def benefit_precondition_fulfilled(
     ctx: JobContext,
     user_id: uuid.UUID,
@@ -4,6 +4,7 @@ from fastapi import Depends, Path, Query, Request
 from pydantic import UUID4
 from sse_starlette.sse import EventSourceResponse
 
+from polar.eventstream.broker import EventStreamBroker, get_eventstream_broker
 from polar.eventstream.endpoints import subscribe
 from polar.eventstream.service import Receivers
 from polar.exceptions import ResourceNotFound
@@ -109,10 +110,11 @@ async def create(
     auth_subject: auth.CheckoutWrite,
     ip_geolocation_client: ip_geolocation.IPGeolocationClient,
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> Checkout:
     """Create a checkout session."""
     return await checkout_service.create(
-        session, checkout_create, auth_subject, ip_geolocation_client
+        session, redis, checkout_create, auth_subject, ip_geolocation_client
     )
 
 
@@ -131,6 +133,7 @@ async def update(
     auth_subject: auth.CheckoutWrite,
     ip_geolocation_client: ip_geolocation.IPGeolocationClient,
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> Checkout:
     """Update a checkout session."""
     checkout = await checkout_service.get_by_id(session, auth_subject, id)
@@ -139,7 +142,7 @@ async def update(
         raise ResourceNotFound()
 
     return await checkout_service.update(
-        session, checkout, checkout_update, ip_geolocation_client
+        session, redis, checkout, checkout_update, ip_geolocation_client
     )
 
 
@@ -175,11 +178,12 @@ async def client_create(
     auth_subject: auth.CheckoutWeb,
     ip_geolocation_client: ip_geolocation.IPGeolocationClient,
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> Checkout:
     """Create a checkout session from a client. Suitable to build checkout links."""
     ip_address = request.client.host if request.client else None
     return await checkout_service.client_create(
-        session, checkout_create, auth_subject, ip_geolocation_client, ip_address
+        session, redis, checkout_create, auth_subject, ip_geolocation_client, ip_address
     )
 
 
@@ -197,6 +201,7 @@ async def client_update(
     checkout_update: CheckoutUpdatePublic,
     ip_geolocation_client: ip_geolocation.IPGeolocationClient,
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> Checkout:
     """Update a checkout session by client secret."""
     checkout = await checkout_service.get_by_client_secret(session, client_secret)
@@ -205,7 +210,7 @@ async def client_update(
         raise ResourceNotFound()
 
     return await checkout_service.update(
-        session, checkout, checkout_update, ip_geolocation_client
+        session, redis, checkout, checkout_update, ip_geolocation_client
     )
 
 
@@ -222,6 +227,7 @@ async def client_confirm(
     client_secret: CheckoutClientSecret,
     checkout_confirm: CheckoutConfirm,
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> Checkout:
     """
     Confirm a checkout session by client secret.
@@ -233,7 +239,7 @@ async def client_confirm(
     if checkout is None:
         raise ResourceNotFound()
 
-    return await checkout_service.confirm(session, checkout, checkout_confirm)
+    return await checkout_service.confirm(session, redis, checkout, checkout_confirm)
 
 
 @router.get("/client/{client_secret}/stream", include_in_schema=False)
@@ -242,6 +248,7 @@ async def client_stream(
     client_secret: CheckoutClientSecret,
     session: AsyncSession = Depends(get_db_session),
     redis: Redis = Depends(get_redis),
+    broker: EventStreamBroker = Depends(get_eventstream_broker),
 ) -> EventSourceResponse:
     checkout = await checkout_service.get_by_client_secret(session, client_secret)
 
@@ -249,4 +256,6 @@ async def client_stream(
         raise ResourceNotFound()
 
     receivers = Receivers(checkout_client_secret=checkout.client_secret)
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(
+        subscribe(redis, broker, receivers.get_channels(), request)
+    )
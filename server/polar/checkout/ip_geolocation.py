@@ -1,9 +1,17 @@
 import argparse
+import bisect
+import ipaddress
+import mmap
+import os
+import socket
+import struct
 import sys
-from typing import Annotated, cast
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Annotated
 
 import ipinfo_db
-import ipinfo_db.reader
+import maxminddb
 from fastapi import Depends, Request
 
 from polar.config import settings
@@ -12,16 +20,196 @@ DATABASE_PATH = (
     settings.IP_GEOLOCATION_DATABASE_DIRECTORY_PATH
     / settings.IP_GEOLOCATION_DATABASE_NAME
 )
+INDEX_PATH = (
+    settings.IP_GEOLOCATION_DATABASE_DIRECTORY_PATH / settings.IP_GEOLOCATION_INDEX_NAME
+)
+
+Network = ipaddress.IPv4Network | ipaddress.IPv6Network
+
+_INDEX_MAGIC = b"POLARGEO"
+_INDEX_BYTE_ORDER_MARK = 0x01020304
+_INDEX_HEADER = struct.Struct("=8sIIII")
+"""Magic, byte order mark, number of countries, of IPv4 ranges and of IPv6 ranges."""
+_NO_COUNTRY = 0xFFFF
+_IPV4_MAX = 2**32 - 1
+_IPV6_MAX = 2**128 - 1
+_IPV4_MAPPED_PREFIX = b"\x00" * 10 + b"\xff\xff"
+
+
+class IPGeolocationIndex:
+    """
+    Sorted ranges of IP addresses and their country, memory-mapped from a file.
 
+    The index is built from the IP to Country ASN database at deploy time,
+    by `build_index`. Each range is stored by its first address:
+    the country of an address is the one of the last range starting before it,
+    found by binary search directly on the mapped file.
 
-async def _get_client_dependency(request: Request) -> "IPGeolocationClient | None":
+    Since the file is only read, its pages are shared by every process mapping it,
+    e.g. all the workers of the API.
     """
-    Retrieve the IPInfo database client from the FastAPI request state.
+
+    def __init__(self, path: Path) -> None:
+        with path.open("rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, byte_order_mark, countries_count, ipv4_count, ipv6_count = (
+            _INDEX_HEADER.unpack_from(self._mmap)
+        )
+        if magic != _INDEX_MAGIC or byte_order_mark != _INDEX_BYTE_ORDER_MARK:
+            self._mmap.close()
+            raise ValueError(f"{path} is not an IP geolocation index.")
+
+        view = memoryview(self._mmap)
+        offset = _INDEX_HEADER.size
+        self._ipv4_starts = view[offset : offset + ipv4_count * 4].cast("I")
+        offset += ipv4_count * 4
+        self._ipv6_starts = _PackedAddresses(self._mmap, offset, ipv6_count)
+        offset += ipv6_count * 16
+        self._ipv4_countries = view[offset : offset + ipv4_count * 2].cast("H")
+        offset += ipv4_count * 2
+        self._ipv6_countries = view[offset : offset + ipv6_count * 2].cast("H")
+        offset += ipv6_count * 2
+        self._countries = [
+            self._mmap[i : i + 2].decode()
+            for i in range(offset, offset + countries_count * 2, 2)
+        ]
+        view.release()
+
+    def get_country(self, ip: str) -> str | None:
+        try:
+            packed = socket.inet_pton(socket.AF_INET, ip)
+        except OSError:
+            try:
+                packed = socket.inet_pton(socket.AF_INET6, ip)
+            except OSError as e:
+                raise ValueError(f"{ip} is not a valid IP address.") from e
+            if packed.startswith(_IPV4_MAPPED_PREFIX):
+                packed = packed[len(_IPV4_MAPPED_PREFIX) :]
+
+        if len(packed) == 4:
+            i = bisect.bisect_right(self._ipv4_starts, int.from_bytes(packed)) - 1
+            country = self._ipv4_countries[i] if i >= 0 else _NO_COUNTRY
+        else:
+            i = bisect.bisect_right(self._ipv6_starts, packed) - 1
+            country = self._ipv6_countries[i] if i >= 0 else _NO_COUNTRY
+
+        if country == _NO_COUNTRY:
+            return None
+        return self._countries[country]
+
+    def close(self) -> None:
+        # The mapping can't be closed while views on it are still exported
+        self._ipv4_starts.release()
+        self._ipv4_countries.release()
+        self._ipv6_countries.release()
+        self._mmap.close()
+
+
+class _PackedAddresses:
+    """Sequence of 16-byte IPv6 addresses in the index, comparable as bytes."""
+
+    def __init__(self, buffer: mmap.mmap, offset: int, count: int) -> None:
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __getitem__(self, i: int) -> bytes:
+        start = self._offset + i * 16
+        return self._buffer[start : start + 16]
+
+
+def _get_ranges(
+    networks: Iterable[tuple[Network, int]], max_address: int
+) -> Iterator[tuple[int, int]]:
+    """
+    Turn sorted, disjoint networks into the first address of each range.
+
+    Adjacent networks of the same country are merged,
+    and gaps between networks are filled with ranges without country.
+    """
+    next_address = 0
+    current_country: int | None = None
+    for network, country in networks:
+        first_address = int(network.network_address)
+        if first_address > next_address and current_country != _NO_COUNTRY:
+            yield next_address, _NO_COUNTRY
+            current_country = _NO_COUNTRY
+        if country != current_country:
+            yield first_address, country
+            current_country = country
+        next_address = int(network.broadcast_address) + 1
+    if next_address <= max_address and current_country != _NO_COUNTRY:
+        yield next_address, _NO_COUNTRY
+
+
+def build_index(networks: Iterable[tuple[Network, str | None]], path: Path) -> None:
+    """
+    Build an IP geolocation index.
+
+    The index is written next to its destination and moved in place,
+    so processes still mapping the previous one are unaffected.
+
+    Args:
+        networks: Networks and their country alpha-2 code, sorted and disjoint.
+        path: Path of the index.
+    """
+    countries: dict[str, int] = {}
+    ipv4_networks: list[tuple[Network, int]] = []
+    ipv6_networks: list[tuple[Network, int]] = []
+    for network, country in networks:
+        country_index = (
+            countries.setdefault(country, len(countries))
+            if country is not None
+            else _NO_COUNTRY
+        )
+        if network.version == 4:
+            ipv4_networks.append((network, country_index))
+        else:
+            ipv6_networks.append((network, country_index))
+
+    ipv4_ranges = list(_get_ranges(ipv4_networks, _IPV4_MAX))
+    ipv6_ranges = list(_get_ranges(ipv6_networks, _IPV6_MAX))
+
+    temporary_path = path.with_suffix(f"{path.suffix}.tmp")
+    with temporary_path.open("wb") as f:
+        f.write(
+            _INDEX_HEADER.pack(
+                _INDEX_MAGIC,
+                _INDEX_BYTE_ORDER_MARK,
+                len(countries),
+                len(ipv4_ranges),
+                len(ipv6_ranges),
+            )
+        )
+        f.write(struct.pack(f"={len(ipv4_ranges)}I", *(s for s, _ in ipv4_ranges)))
+        f.write(b"".join(s.to_bytes(16, "big") for s, _ in ipv6_ranges))
+        f.write(struct.pack(f"={len(ipv4_ranges)}H", *(c for _, c in ipv4_ranges)))
+        f.write(struct.pack(f"={len(ipv6_ranges)}H", *(c for _, c in ipv6_ranges)))
+        f.write("".join(countries).encode())
+    os.replace(temporary_path, path)
+
+
+def _get_database_networks(
+    database_path: Path,
+) -> Iterator[tuple[Network, str | None]]:
+    with maxminddb.open_database(database_path) as reader:
+        for network, record in reader:
+            country = record.get("country") if isinstance(record, dict) else None
+            yield network, country if isinstance(country, str) else None
+
+
+async def _get_client_dependency(request: Request) -> "IPGeolocationIndex | None":
+    """
+    Retrieve the IP geolocation index from the FastAPI request state.
     """
     return request.state.ip_geolocation_client
 
 
-IPGeolocationClient = Annotated[ipinfo_db.Client, Depends(_get_client_dependency)]
+IPGeolocationClient = Annotated[IPGeolocationIndex, Depends(_get_client_dependency)]
 
 
 def _download_database(access_token: str) -> None:
@@ -40,17 +228,17 @@ def _download_database(access_token: str) -> None:
 
 def get_client() -> IPGeolocationClient:
     """
-    Open the IP to Country ASN database.
+    Open the IP geolocation index.
 
     Returns:
-        IPInfo database client.
+        IP geolocation index.
     """
-    if not DATABASE_PATH.exists():
+    if not INDEX_PATH.exists():
         raise FileNotFoundError(
-            f"Database not found at {DATABASE_PATH}. "
-            "Please run `python -m polar.checkout.ip_geolocation ACCESS_TOKEN`."
+            f"Index not found at {INDEX_PATH}. "
+            "Please run `python -m polar.checkout.ip_geolocation [ACCESS_TOKEN]`."
         )
-    return ipinfo_db.Client(path=DATABASE_PATH)
+    return IPGeolocationIndex(INDEX_PATH)
 
 
 def get_ip_country(client: IPGeolocationClient, ip: str) -> str | None:
@@ -58,23 +246,44 @@ def get_ip_country(client: IPGeolocationClient, ip: str) -> str | None:
     Get the country alpha-2 code for the given IP address, if available.
 
     Args:
-        client: IPInfo database client.
+        client: IP geolocation index.
         ip: IP address.
 
     Returns:
         Country alpha-2 code.
     """
-    return cast(str | None, client.getCountry(ip))
+    return client.get_country(ip)
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(
-        description="Download the IP to Country ASN database."
+        description=(
+            "Download the IP to Country ASN database, "
+            "and build the IP geolocation index from it."
+        )
+    )
+    parser.add_argument(
+        "access_token",
+        type=str,
+        nargs="?",
+        help=(
+            "IPInfo access token. "
+            "If omitted, the index is built from the already downloaded database."
+        ),
     )
-    parser.add_argument("access_token", type=str, help="IPInfo access token")
     args = parser.parse_args()
 
-    _download_database(args.access_token)
-    sys.stdout.write(f"Database downloaded to {DATABASE_PATH}\n")
+    if args.access_token is not None:
+        _download_database(args.access_token)
+        sys.stdout.write(f"Database downloaded to {DATABASE_PATH}\n")
+
+    build_index(_get_database_networks(DATABASE_PATH), INDEX_PATH)
+    sys.stdout.write(f"Index built at {INDEX_PATH}\n")
 
-__all__ = ["get_client", "get_ip_country", "IPGeolocationClient"]
+__all__ = [
+    "build_index",
+    "get_client",
+    "get_ip_country",
+    "IPGeolocationClient",
+    "IPGeolocationIndex",
+]
@@ -1,9 +1,11 @@
+import asyncio
 import uuid
 from collections.abc import Sequence
-from typing import Any
+from typing import Any, Literal
 
 import stripe as stripe_lib
 import structlog
+from redis.exceptions import WatchError
 from sqlalchemy import Select, UnaryExpression, asc, desc, select, update
 from sqlalchemy.orm import contains_eager, joinedload, selectinload
 
@@ -54,11 +56,13 @@ from polar.models.webhook_endpoint import WebhookEventType
 from polar.organization.service import organization as organization_service
 from polar.postgres import AsyncSession
 from polar.product.service.product_price import product_price as product_price_service
+from polar.redis import Redis
 from polar.user.service.user import user as user_service
 from polar.user_organization.service import (
     user_organization as user_organization_service,
 )
 from polar.webhook.service import webhook as webhook_service
+from polar.webhook.webhooks import WebhookPayload, WebhookPayloadTypeAdapter
 from polar.worker import enqueue_job
 
 from . import ip_geolocation
@@ -67,6 +71,17 @@ from .tax import TaxCalculationError, calculate_tax
 
 log: Logger = structlog.get_logger()
 
+WEBHOOK_SEQUENCE_TTL = 7 * 86400
+"""How long the webhook sequence of a checkout is kept in Redis, in seconds."""
+
+
+def _webhook_sequence_key(checkout_id: uuid.UUID) -> str:
+    return f"checkout:webhook:{checkout_id}:sequence"
+
+
+def _webhook_sent_key(checkout_id: uuid.UUID) -> str:
+    return f"checkout:webhook:{checkout_id}:sent"
+
 
 class CheckoutError(PolarError): ...
 
@@ -108,6 +123,18 @@ class NotConfirmedCheckout(CheckoutError):
         super().__init__(message)
 
 
+class WebhookOutOfSequence(CheckoutError):
+    def __init__(self, checkout_id: uuid.UUID, sequence: int, last_sent: int) -> None:
+        self.checkout_id = checkout_id
+        self.sequence = sequence
+        self.last_sent = last_sent
+        message = (
+            f"Webhook {sequence} of checkout {checkout_id} "
+            f"is waiting for webhook {last_sent + 1}."
+        )
+        super().__init__(message)
+
+
 class PaymentIntentNotSucceeded(CheckoutError):
     def __init__(self, checkout: Checkout, payment_intent_id: str) -> None:
         self.checkout = checkout
@@ -204,6 +231,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
     async def create(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_create: CheckoutCreate,
         auth_subject: AuthSubject[User | Organization],
         ip_geolocation_client: ip_geolocation.IPGeolocationClient | None = None,
@@ -392,20 +420,17 @@ class CheckoutService(ResourceServiceReader[Checkout]):
             session, checkout, ip_geolocation_client
         )
 
-        try:
-            checkout = await self._update_checkout_tax(session, checkout)
-        # Swallow incomplete tax calculation error: require it only on confirm
-        except TaxCalculationError:
-            pass
+        await self._update_checkout_tax_silently(session, redis, checkout)
 
         await session.flush()
-        await self._after_checkout_created(session, checkout)
+        await self._after_checkout_created(redis, checkout)
 
         return checkout
 
     async def client_create(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_create: CheckoutCreatePublic,
         auth_subject: AuthSubject[User | Anonymous],
         ip_geolocation_client: ip_geolocation.IPGeolocationClient | None = None,
@@ -481,31 +506,21 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         elif checkout_create.customer_email is not None:
             checkout.customer_email = checkout_create.customer_email
 
-        if checkout.payment_processor == PaymentProcessor.stripe:
-            if checkout.customer and checkout.customer.stripe_customer_id is not None:
-                stripe_customer_session = await stripe_service.create_customer_session(
-                    checkout.customer.stripe_customer_id
-                )
-                checkout.payment_processor_metadata = {
-                    **(checkout.payment_processor_metadata or {}),
-                    "customer_session_client_secret": stripe_customer_session.client_secret,
-                }
-
         checkout.customer_ip_address = ip_address
         checkout = await self._update_checkout_ip_geolocation(
             session, checkout, ip_geolocation_client
         )
 
-        try:
-            checkout = await self._update_checkout_tax(session, checkout)
-        # Swallow incomplete tax calculation error: require it only on confirm
-        except TaxCalculationError:
-            pass
+        # Both are independent calls to Stripe, don't wait for one to start the other
+        await asyncio.gather(
+            self._update_checkout_customer_session(checkout),
+            self._update_checkout_tax_silently(session, redis, checkout),
+        )
 
         session.add(checkout)
 
         await session.flush()
-        await self._after_checkout_created(session, checkout)
+        await self._after_checkout_created(redis, checkout)
 
         # Send a depreciation event to the organization's members
         if checkout_create.from_legacy_checkout_link:
@@ -529,6 +544,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
     async def checkout_link_create(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_link: CheckoutLink,
         embed_origin: str | None = None,
         ip_geolocation_client: ip_geolocation.IPGeolocationClient | None = None,
@@ -594,20 +610,17 @@ class CheckoutService(ResourceServiceReader[Checkout]):
             session, checkout, ip_geolocation_client
         )
 
-        try:
-            checkout = await self._update_checkout_tax(session, checkout)
-        # Swallow incomplete tax calculation error: require it only on confirm
-        except TaxCalculationError:
-            pass
+        await self._update_checkout_tax_silently(session, redis, checkout)
 
         await session.flush()
-        await self._after_checkout_created(session, checkout)
+        await self._after_checkout_created(redis, checkout)
 
         return checkout
 
     async def update(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout: Checkout,
         checkout_update: CheckoutUpdate | CheckoutUpdatePublic,
         ip_geolocation_client: ip_geolocation.IPGeolocationClient | None = None,
@@ -615,18 +628,15 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         checkout = await self._update_checkout(
             session, checkout, checkout_update, ip_geolocation_client
         )
-        try:
-            checkout = await self._update_checkout_tax(session, checkout)
-        # Swallow incomplete tax calculation error: require it only on confirm
-        except TaxCalculationError:
-            pass
+        await self._update_checkout_tax_silently(session, redis, checkout)
 
-        await self._after_checkout_updated(session, checkout)
+        await self._after_checkout_updated(redis, checkout)
         return checkout
 
     async def confirm(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout: Checkout,
         checkout_confirm: CheckoutConfirm,
     ) -> Checkout:
@@ -634,7 +644,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
 
         errors: list[ValidationError] = []
         try:
-            checkout = await self._update_checkout_tax(session, checkout)
+            checkout = await self._update_checkout_tax(session, redis, checkout)
         except TaxCalculationError as e:
             errors.append(
                 {
@@ -742,13 +752,14 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         checkout.status = CheckoutStatus.confirmed
         session.add(checkout)
 
-        await self._after_checkout_updated(session, checkout)
+        await self._after_checkout_updated(redis, checkout)
 
         return checkout
 
     async def handle_stripe_success(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_id: uuid.UUID,
         payment_intent: stripe_lib.PaymentIntent,
     ) -> Checkout:
@@ -873,13 +884,14 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         checkout.status = CheckoutStatus.succeeded
         session.add(checkout)
 
-        await self._after_checkout_updated(session, checkout)
+        await self._after_checkout_updated(redis, checkout)
 
         return checkout
 
     async def handle_stripe_failure(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_id: uuid.UUID,
         payment_intent: stripe_lib.PaymentIntent,
     ) -> Checkout:
@@ -897,12 +909,12 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         checkout.status = CheckoutStatus.failed
         session.add(checkout)
 
-        await self._after_checkout_updated(session, checkout)
+        await self._after_checkout_updated(redis, checkout)
 
         return checkout
 
     async def handle_free_success(
-        self, session: AsyncSession, checkout_id: uuid.UUID
+        self, session: AsyncSession, redis: Redis, checkout_id: uuid.UUID
     ) -> Checkout:
         checkout = await self._get_eager_loaded_checkout(session, checkout_id)
 
@@ -959,7 +971,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         checkout.status = CheckoutStatus.succeeded
         session.add(checkout)
 
-        await self._after_checkout_updated(session, checkout)
+        await self._after_checkout_updated(redis, checkout)
 
         return checkout
 
@@ -985,6 +997,54 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         result = await session.execute(statement)
         return result.unique().scalar_one_or_none()
 
+    async def send_webhook(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        checkout_id: uuid.UUID,
+        organization_id: uuid.UUID,
+        payload: WebhookPayload,
+        sequence: int,
+        *,
+        force: bool = False,
+    ) -> None:
+        """
+        Send a checkout webhook enqueued by `_enqueue_webhook`.
+
+        Raises:
+            WebhookOutOfSequence: A previous webhook of the checkout wasn't sent yet,
+            unless `force` is set.
+        """
+        last_sent = int(await redis.get(_webhook_sent_key(checkout_id)) or 0)
+        if not force and sequence > last_sent + 1:
+            raise WebhookOutOfSequence(checkout_id, sequence, last_sent)
+
+        organization = await organization_service.get(session, organization_id)
+        if organization is None:
+            return
+        await webhook_service.send_payload(session, organization, payload)
+
+    async def mark_webhook_sent(
+        self, redis: Redis, checkout_id: uuid.UUID, sequence: int
+    ) -> None:
+        sent_key = _webhook_sent_key(checkout_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(sent_key)
+                    last_sent = int(await pipe.get(sent_key) or 0)
+                    if sequence <= last_sent:
+                        return
+                    pipe.multi()
+                    pipe.set(sent_key, sequence, ex=WEBHOOK_SEQUENCE_TTL)
+                    await pipe.execute()
+                    return
+                # Another job stored its sequence in the meantime: compare again.
+                # Each retry follows a successful write, so they're bounded by the
+                # number of jobs of the checkout.
+                except WatchError:
+                    continue
+
     async def expire_open_checkouts(self, session: AsyncSession) -> None:
         statement = (
             update(Checkout)
@@ -1189,7 +1249,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         return checkout
 
     async def _update_checkout_tax(
-        self, session: AsyncSession, checkout: Checkout
+        self, session: AsyncSession, redis: Redis, checkout: Checkout
     ) -> Checkout:
         if not checkout.product.is_tax_applicable:
             checkout.tax_amount = 0
@@ -1203,6 +1263,7 @@ class CheckoutService(ResourceServiceReader[Checkout]):
         ):
             try:
                 tax_amount = await calculate_tax(
+                    redis,
                     checkout.currency,
                     checkout.amount,
                     checkout.product.stripe_product_id,
@@ -1220,6 +1281,30 @@ class CheckoutService(ResourceServiceReader[Checkout]):
 
         return checkout
 
+    async def _update_checkout_tax_silently(
+        self, session: AsyncSession, redis: Redis, checkout: Checkout
+    ) -> None:
+        try:
+            await self._update_checkout_tax(session, redis, checkout)
+        # Swallow incomplete tax calculation error: require it only on confirm
+        except TaxCalculationError:
+            pass
+
+    async def _update_checkout_customer_session(self, checkout: Checkout) -> None:
+        if checkout.payment_processor != PaymentProcessor.stripe:
+            return
+
+        if checkout.customer is None or checkout.customer.stripe_customer_id is None:
+            return
+
+        stripe_customer_session = await stripe_service.create_customer_session(
+            checkout.customer.stripe_customer_id
+        )
+        checkout.payment_processor_metadata = {
+            **(checkout.payment_processor_metadata or {}),
+            "customer_session_client_secret": stripe_customer_session.client_secret,
+        }
+
     async def _update_checkout_ip_geolocation(
         self,
         session: AsyncSession,
@@ -1310,29 +1395,41 @@ class CheckoutService(ResourceServiceReader[Checkout]):
             ),
         )
 
-    async def _after_checkout_created(
-        self, session: AsyncSession, checkout: Checkout
-    ) -> None:
-        organization = await organization_service.get(
-            session, checkout.product.organization_id
-        )
-        assert organization is not None
-        await webhook_service.send(
-            session, organization, (WebhookEventType.checkout_created, checkout)
-        )
+    async def _after_checkout_created(self, redis: Redis, checkout: Checkout) -> None:
+        await self._enqueue_webhook(redis, checkout, WebhookEventType.checkout_created)
 
-    async def _after_checkout_updated(
-        self, session: AsyncSession, checkout: Checkout
-    ) -> None:
+    async def _after_checkout_updated(self, redis: Redis, checkout: Checkout) -> None:
         await publish(
             "checkout.updated", {}, checkout_client_secret=checkout.client_secret
         )
-        organization = await organization_service.get(
-            session, checkout.product.organization_id
+        await self._enqueue_webhook(redis, checkout, WebhookEventType.checkout_updated)
+
+    async def _enqueue_webhook(
+        self,
+        redis: Redis,
+        checkout: Checkout,
+        event_type: Literal[
+            WebhookEventType.checkout_created, WebhookEventType.checkout_updated
+        ],
+    ) -> None:
+        # Build the payload now, so it reflects the checkout at this point,
+        # but let the worker look up the endpoints and store the events.
+        payload = WebhookPayloadTypeAdapter.validate_python(
+            {"type": event_type, "data": checkout}
         )
-        assert organization is not None
-        await webhook_service.send(
-            session, organization, (WebhookEventType.checkout_updated, checkout)
+        # Jobs can run concurrently or be retried, so number them:
+        # the worker sends the webhooks of a checkout in this order.
+        sequence_key = _webhook_sequence_key(checkout.id)
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.incr(sequence_key)
+            pipe.expire(sequence_key, WEBHOOK_SEQUENCE_TTL)
+            sequence, _ = await pipe.execute()
+        enqueue_job(
+            "checkout.send_webhook",
+            checkout_id=checkout.id,
+            organization_id=checkout.product.organization_id,
+            payload=payload,
+            sequence=sequence,
         )
 
     async def _eager_load_product(
@@ -1,26 +1,80 @@
 import uuid
 
+import structlog
+from arq import Retry
+
 from polar.exceptions import PolarTaskError
+from polar.logging import Logger
+from polar.webhook.webhooks import WebhookPayload
 from polar.worker import (
     AsyncSessionMaker,
     CronTrigger,
     JobContext,
     PolarWorkerContext,
+    QueueName,
+    compute_backoff,
+    get_worker_redis,
     task,
 )
 
+from .service import WebhookOutOfSequence
 from .service import checkout as checkout_service
 
+log: Logger = structlog.get_logger()
+
+SEND_WEBHOOK_MAX_TRIES = 5
+"""
+Number of tries a checkout webhook waits for the previous ones.
+
+After that, it's sent anyway: the previous one may have been lost.
+"""
+
 
 class CheckoutTaskError(PolarTaskError): ...
 
 
-@task("checkout.handle_free_success")
+@task("checkout.handle_free_success", queue_name=QueueName.critical)
 async def handle_free_success(
     ctx: JobContext, checkout_id: uuid.UUID, polar_context: PolarWorkerContext
 ) -> None:
     async with AsyncSessionMaker(ctx) as session:
-        await checkout_service.handle_free_success(session, checkout_id)
+        await checkout_service.handle_free_success(
+            session, get_worker_redis(ctx), checkout_id
+        )
+
+
+@task("checkout.send_webhook")
+async def send_webhook(
+    ctx: JobContext,
+    checkout_id: uuid.UUID,
+    organization_id: uuid.UUID,
+    payload: WebhookPayload,
+    sequence: int,
+    polar_context: PolarWorkerContext,
+) -> None:
+    redis = get_worker_redis(ctx)
+    try:
+        async with AsyncSessionMaker(ctx) as session:
+            await checkout_service.send_webhook(
+                session,
+                redis,
+                checkout_id,
+                organization_id,
+                payload,
+                sequence,
+                force=ctx["job_try"] >= SEND_WEBHOOK_MAX_TRIES,
+            )
+    except WebhookOutOfSequence as e:
+        log.info(
+            "checkout.send_webhook.out_of_sequence",
+            checkout_id=checkout_id,
+            sequence=sequence,
+            last_sent=e.last_sent,
+        )
+        raise Retry(compute_backoff(ctx["job_try"])) from e
+
+    # Only once the webhook events are committed
+    await checkout_service.mark_webhook_sent(redis, checkout_id, sequence)
 
 
 @task(
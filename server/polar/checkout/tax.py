@@ -14,6 +14,7 @@ from stdnum import get_cc_module
 from polar.exceptions import PolarError
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.kit.address import Address
+from polar.redis import Redis
 
 
 class TaxIDFormat(StrEnum):
@@ -284,7 +285,21 @@ class InvalidTaxLocation(TaxCalculationError):
         )
 
 
+TAX_CALCULATION_CACHE_TTL = 24 * 3600
+"""
+How long tax calculations are cached, in seconds.
+
+It matches how long Stripe keeps idempotency keys: a cached result is the one
+Stripe would have returned for the same parameters anyway.
+"""
+
+
+def _get_tax_calculation_cache_key(idempotency_key: str) -> str:
+    return f"checkout:tax_calculation:{idempotency_key}"
+
+
 async def calculate_tax(
+    redis: Redis,
     currency: str,
     amount: int,
     stripe_product_id: str,
@@ -299,6 +314,11 @@ async def calculate_tax(
     )
     idempotency_key = hashlib.sha256(idempotency_key_str.encode()).hexdigest()
 
+    cache_key = _get_tax_calculation_cache_key(idempotency_key)
+    cached_tax_amount = await redis.get(cache_key)
+    if cached_tax_amount is not None:
+        return int(cached_tax_amount)
+
     try:
         calculation = await stripe_service.create_tax_calculation(
             currency=currency,
@@ -329,5 +349,7 @@ async def calculate_tax(
         if e.error is None or e.error.code != "customer_tax_location_invalid":
             raise
         raise InvalidTaxLocation(e) from e
-    else:
-        return calculation.tax_amount_exclusive
+
+    tax_amount = calculation.tax_amount_exclusive
+    await redis.set(cache_key, tax_amount, ex=TAX_CALCULATION_CACHE_TTL)
+    return tax_amount
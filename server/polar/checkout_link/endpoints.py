@@ -15,6 +15,7 @@ from polar.openapi import APITag
 from polar.organization.schemas import OrganizationID
 from polar.postgres import AsyncSession, get_db_session
 from polar.product.schemas import ProductID
+from polar.redis import Redis, get_redis
 from polar.routing import APIRouter
 
 from . import auth, sorting
@@ -161,6 +162,7 @@ async def redirect(
     ip_geolocation_client: ip_geolocation.IPGeolocationClient,
     embed_origin: str | None = Query(None),
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> RedirectResponse:
     """Use a checkout link to create a checkout session and redirect to it."""
     checkout_link = await checkout_link_service.get_by_client_secret(
@@ -172,7 +174,7 @@ async def redirect(
 
     ip_address = request.client.host if request.client else None
     checkout = await checkout_service.checkout_link_create(
-        session, checkout_link, embed_origin, ip_geolocation_client, ip_address
+        session, redis, checkout_link, embed_origin, ip_geolocation_client, ip_address
     )
 
     # Add the query parameters from the request to the URL
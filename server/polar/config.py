@@ -67,6 +67,7 @@ class Settings(BaseSettings):
     CHECKOUT_TTL_SECONDS: int = 60 * 60  # 1 hour
     IP_GEOLOCATION_DATABASE_DIRECTORY_PATH: DirectoryPath = Path(__file__).parent.parent
     IP_GEOLOCATION_DATABASE_NAME: str = "ip-geolocation.mmdb"
+    IP_GEOLOCATION_INDEX_NAME: str = "ip-geolocation.index"
     USE_TEST_CLOCK: bool = False
 
     # Database
@@ -78,6 +79,8 @@ class Settings(BaseSettings):
     DATABASE_POOL_SIZE: int = 5
     DATABASE_SYNC_POOL_SIZE: int = 1  # Specific pool size for sync connection: since we only use it in OAuth2 router, don't waste resources.
     DATABASE_POOL_RECYCLE_SECONDS: int = 600  # 10 minutes
+    # Warn when the same statement runs more often in a request or a job
+    DATABASE_REPEATED_STATEMENT_THRESHOLD: int = 10
 
     # Redis
     REDIS_HOST: str = "127.0.0.1"
@@ -149,6 +152,7 @@ class Settings(BaseSettings):
     AWS_SECRET_ACCESS_KEY: str = "polar123456789"
     AWS_REGION: str = "us-east-2"
     AWS_SIGNATURE_VERSION: str = "v4"
+    AWS_MAX_POOL_CONNECTIONS: int = 20
 
     # Downloadable files
     S3_FILES_BUCKET_NAME: str = "polar-s3"
@@ -9,7 +9,6 @@ from sqlalchemy import (
     delete,
     desc,
     func,
-    or_,
     select,
     update,
 )
@@ -20,6 +19,7 @@ from polar.authz.service import AccessType, Authz
 from polar.custom_field.sorting import CustomFieldSortProperty
 from polar.exceptions import PolarError, PolarRequestValidationError
 from polar.kit.pagination import PaginationParams, paginate
+from polar.kit.search import search_filter, search_order_by
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.models import CustomField, Organization, User, UserOrganization
@@ -58,16 +58,15 @@ class CustomFieldService(ResourceServiceReader[CustomField]):
 
         if query is not None:
             statement = statement.where(
-                or_(
-                    CustomField.name.ilike(f"%{query}%"),
-                    CustomField.slug.ilike(f"%{query}%"),
-                )
+                search_filter(query, CustomField.name, CustomField.slug)
             )
 
         if type is not None:
             statement = statement.where(CustomField.type.in_(type))
 
-        order_by_clauses: list[UnaryExpression[Any]] = []
+        order_by_clauses: list[UnaryExpression[Any]] = search_order_by(
+            query, CustomField.name, CustomField.slug
+        )
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
             if criterion == CustomFieldSortProperty.created_at:
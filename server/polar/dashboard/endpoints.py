@@ -27,6 +27,7 @@ from polar.models.user_organization import UserOrganization
 from polar.openapi import APITag
 from polar.organization.schemas import OrganizationID
 from polar.organization.service import organization as organization_service
+from polar.pledge.endpoints import prime_memberships
 from polar.pledge.endpoints import to_schema as pledge_to_schema
 from polar.pledge.schemas import Pledge as PledgeSchema
 from polar.pledge.service import pledge as pledge_service
@@ -204,6 +205,14 @@ async def dashboard(
     user_memberships: Sequence[UserOrganization] = []
     user_memberships = await user_organization_service.list_by_user_id(session, user.id)
 
+    # batch the per-pledge lookups
+    memberships = user_organization_service.get_loader(session)
+    prime_memberships(memberships, user, (p for i in issues for p in i.pledges))
+    linked_external_organizations = external_organization_service.get_linked_loader(
+        session
+    )
+    linked_external_organizations.prime(i.organization_id for i in issues)
+
     # add pledges to included
     issue_pledges: dict[UUID, list[PledgeSchema]] = {}
     for i in issues:
@@ -212,7 +221,9 @@ async def dashboard(
             if pled.state not in pledge_statuses:
                 continue
 
-            pledge_schema = await pledge_to_schema(session, user, pled)
+            pledge_schema = await pledge_to_schema(
+                session, user, pled, memberships=memberships
+            )
 
             # Add user-specific metadata
             pledge_schema.authed_can_admin_sender = (
@@ -221,8 +232,8 @@ async def dashboard(
                 )
             )
 
-            external_organization = await external_organization_service.get_linked(
-                session, i.organization_id
+            external_organization = await linked_external_organizations.load(
+                i.organization_id
             )
             pledge_schema.authed_can_admin_received = (
                 external_organization is not None
@@ -1,4 +1,6 @@
 from abc import ABC, abstractmethod
+from collections.abc import Sequence
+from typing import NotRequired, TypedDict
 
 import resend
 import structlog
@@ -14,6 +16,18 @@ DEFAULT_FROM_EMAIL_ADDRESS = settings.EMAIL_FROM_EMAIL_ADDRESS
 DEFAULT_REPLY_TO_NAME = "Polar Support"
 DEFAULT_REPLY_TO_EMAIL_ADDRESS = "support@polar.sh"
 
+BATCH_MAX_SIZE = 100
+"""Maximum number of emails sent in a single batch call."""
+
+
+class EmailMessage(TypedDict):
+    to_email_addr: str
+    subject: str
+    html_content: str
+    from_name: str
+    from_email_addr: str
+    email_headers: NotRequired[dict[str, str]]
+
 
 class EmailSender(ABC):
     @abstractmethod
@@ -31,6 +45,16 @@ class EmailSender(ABC):
     ) -> None:
         pass
 
+    @abstractmethod
+    def send_batch_to_users(self, messages: Sequence[EmailMessage]) -> None:
+        """
+        Send up to `BATCH_MAX_SIZE` emails at once.
+
+        Replies go to the default reply-to address, unless overridden
+        by a `Reply-To` header.
+        """
+        pass
+
 
 class LoggingEmailSender(EmailSender):
     def send_to_user(
@@ -55,6 +79,10 @@ class LoggingEmailSender(EmailSender):
             email_headers=email_headers,
         )
 
+    def send_batch_to_users(self, messages: Sequence[EmailMessage]) -> None:
+        for message in messages:
+            self.send_to_user(**message)
+
 
 class ResendEmailSender(EmailSender):
     def __init__(self) -> None:
@@ -93,6 +121,31 @@ class ResendEmailSender(EmailSender):
             email_id=email["id"],
         )
 
+    def send_batch_to_users(self, messages: Sequence[EmailMessage]) -> None:
+        if len(messages) == 0:
+            return
+        assert len(messages) <= BATCH_MAX_SIZE
+
+        params: list[resend.Emails.SendParams] = [
+            {
+                "from": f"{message['from_name']} <{message['from_email_addr']}>",
+                "to": [message["to_email_addr"]],
+                "subject": message["subject"],
+                "html": message["html_content"],
+                "headers": message.get("email_headers", {}),
+                "reply_to": f"{DEFAULT_REPLY_TO_NAME} <{DEFAULT_REPLY_TO_EMAIL_ADDRESS}>",
+            }
+            for message in messages
+        ]
+
+        response = resend.Batch.send(params)
+
+        log.info(
+            "resend.send_batch",
+            count=len(messages),
+            email_ids=[email["id"] for email in response["data"]],
+        )
+
 
 def get_email_sender() -> EmailSender:
     if settings.EMAIL_SENDER == EmailSenderType.resend:
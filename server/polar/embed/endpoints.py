@@ -1,12 +1,20 @@
-from fastapi import Depends, Request
+from fastapi import Depends, Request, Response
 from pydantic import UUID4
 
-from polar.exceptions import ResourceNotFound, ResourceNotModified
+from polar.exceptions import ResourceNotFound
 from polar.openapi import APITag
 from polar.postgres import AsyncSession, get_db_session
 from polar.product.schemas import ProductID
 from polar.product.service.product import product as product_service
+from polar.redis import Redis, get_redis
 from polar.routing import APIRouter
+from polar.storefront.cache import (
+    StorefrontCache,
+    get_cached_response,
+    get_etag,
+    get_product_embed_cache_name,
+)
+from polar.storefront.service import storefront as storefront_service
 
 from . import auth
 from .schemas import ProductEmbed
@@ -14,24 +22,32 @@ from .schemas import ProductEmbed
 router = APIRouter(prefix="/embed", tags=["embeds", APITag.private])
 
 
-@router.get("/product/{id}", summary="Product Embed")
+@router.get("/product/{id}", summary="Product Embed", response_model=ProductEmbed)
 async def get_product(
     request: Request,
     auth_subject: auth.EmbedsRead,
     id: ProductID,
     price_id: UUID4 | None = None,
     session: AsyncSession = Depends(get_db_session),
-) -> ProductEmbed:
+    redis: Redis = Depends(get_redis),
+) -> Response:
     """Get product card."""
+    cache = StorefrontCache(redis)
+    cache_name = get_product_embed_cache_name(id, price_id)
+    cached = await cache.get_payload(cache_name)
+    if cached is not None:
+        return get_cached_response(request, cached)
+
+    # Get the version before loading the data to render, see `set_payload`
+    organization_id = await storefront_service.get_product_organization_id(session, id)
+    if organization_id is None:
+        raise ResourceNotFound()
+    version = await cache.get_version(organization_id)
+
     product = await product_service.get_embed(session, id)
     if product is None:
         raise ResourceNotFound()
 
-    cached_etag = request.headers.get("If-None-Match")
-    etag = product.etag
-    if cached_etag and etag == cached_etag:
-        raise ResourceNotModified()
-
     cover = None
     if product.medias:
         cover = product.medias[0]
@@ -43,7 +59,7 @@ async def get_product(
                 price = p
                 break
 
-    return ProductEmbed.model_validate(
+    embed = ProductEmbed.model_validate(
         dict(
             id=product.id,
             name=product.name,
@@ -54,6 +70,13 @@ async def get_product(
             cover=cover,
             price=price,
             benefits=product.benefits,
-            etag=etag,
+            etag=get_etag(cache_name, version),
         )
     )
+    cached = await cache.set_payload(
+        cache_name,
+        product.organization_id,
+        version,
+        embed.model_dump_json(by_alias=True),
+    )
+    return get_cached_response(request, cached)
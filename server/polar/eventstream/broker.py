@@ -0,0 +1,131 @@
+import asyncio
+import contextlib
+import json
+from collections.abc import AsyncIterator
+
+import structlog
+from fastapi import Request
+from redis.asyncio.client import PubSub
+from redis.exceptions import ConnectionError
+
+from polar.logging import Logger
+from polar.redis import Redis
+
+log: Logger = structlog.get_logger()
+
+QUEUE_MAX_SIZE = 100
+"""Maximum number of pending events per client. Further events are dropped."""
+
+
+class EventStreamBroker:
+    """
+    Dispatch the events published on Redis to the clients connected to this process.
+
+    A single pub/sub connection is shared by all the clients. It's subscribed to
+    the channels of the connected clients, and each received event is put in
+    the queue of the clients listening to its channel.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+        self._pubsub: PubSub = redis.pubsub()
+        self._queues: dict[str, set[asyncio.Queue[tuple[str, str]]]] = {}
+        self._lock = asyncio.Lock()
+        self._subscribed = asyncio.Event()
+        self._reader: asyncio.Task[None] | None = None
+
+    @contextlib.asynccontextmanager
+    async def listen(
+        self, channels: list[str]
+    ) -> AsyncIterator[asyncio.Queue[tuple[str, str]]]:
+        """
+        Listen to the events of the channels.
+
+        Yields a queue receiving the events as `(id, data)` tuples.
+        """
+        queue: asyncio.Queue[tuple[str, str]] = asyncio.Queue(QUEUE_MAX_SIZE)
+
+        async with self._lock:
+            new_channels: list[str] = []
+            for channel in channels:
+                if channel not in self._queues:
+                    self._queues[channel] = set()
+                    new_channels.append(channel)
+                self._queues[channel].add(queue)
+            if new_channels:
+                await self._pubsub.subscribe(*new_channels)
+            self._subscribed.set()
+            if self._reader is None or self._reader.done():
+                self._reader = asyncio.create_task(self._read())
+
+        try:
+            yield queue
+        finally:
+            async with self._lock:
+                stale_channels: list[str] = []
+                for channel in channels:
+                    queues = self._queues.get(channel)
+                    if queues is None:
+                        continue
+                    queues.discard(queue)
+                    if len(queues) == 0:
+                        del self._queues[channel]
+                        stale_channels.append(channel)
+                if stale_channels:
+                    await self._pubsub.unsubscribe(*stale_channels)
+                if not self._queues:
+                    self._subscribed.clear()
+
+    async def close(self) -> None:
+        if self._reader is not None:
+            self._reader.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._reader
+            self._reader = None
+        await self._pubsub.close()
+
+    async def _read(self) -> None:
+        while True:
+            if not self._pubsub.subscribed:
+                await self._subscribed.wait()
+                continue
+
+            try:
+                message = await self._pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except ConnectionError as e:
+                # The connection is re-established and the channels re-subscribed
+                # on the next command.
+                log.warning("eventstream.broker.connection_error", error=str(e))
+                await asyncio.sleep(1.0)
+                continue
+            except Exception as e:
+                # Keep reading: a dead reader would silently stop all the streams
+                log.exception("eventstream.broker.read_error", error=str(e))
+                await asyncio.sleep(1.0)
+                continue
+
+            if message is not None:
+                self._dispatch(message["channel"], message["data"])
+
+    def _dispatch(self, channel: str, message: str) -> None:
+        try:
+            decoded = json.loads(message)
+            event = (decoded["id"], decoded["data"])
+        except (ValueError, KeyError, TypeError):
+            log.warning("eventstream.broker.invalid_message", channel=channel)
+            return
+
+        for queue in self._queues.get(channel, ()):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                log.warning("eventstream.broker.queue_full", channel=channel)
+
+
+async def get_eventstream_broker(request: Request) -> EventStreamBroker:
+    return request.state.eventstream_broker
+
+
+__all__ = ["EventStreamBroker", "get_eventstream_broker"]
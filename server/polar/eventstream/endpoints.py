@@ -4,7 +4,6 @@ from typing import Any
 
 import structlog
 from fastapi import Depends, Request
-from redis.exceptions import ConnectionError
 from sse_starlette.sse import EventSourceResponse
 from uvicorn import Server
 
@@ -19,7 +18,8 @@ from polar.user_organization.service import (
     user_organization as user_organization_service,
 )
 
-from .service import Receivers
+from .broker import EventStreamBroker, get_eventstream_broker
+from .service import Receivers, get_events_after, parse_event_id
 
 router = APIRouter(prefix="/stream", tags=["stream"], include_in_schema=False)
 
@@ -52,33 +52,41 @@ def _uvicorn_should_exit() -> bool:
 
 async def subscribe(
     redis: Redis,
+    broker: EventStreamBroker,
     channels: list[str],
     request: Request,
 ) -> AsyncGenerator[Any, Any]:
-    async with redis.pubsub() as pubsub:
-        await pubsub.subscribe(*channels)
+    last_event_id = request.headers.get("last-event-id")
+
+    async with broker.listen(channels) as queue:
+        # Replay the events missed since the last one received by the client,
+        # after we started to listen, so we don't miss any in-between.
+        last_event_key: int | None = None
+        if last_event_id is not None:
+            for id, data in await get_events_after(redis, channels, last_event_id):
+                last_event_key = parse_event_id(id)
+                yield {"id": id, "data": data}
 
         while not _uvicorn_should_exit():
             if await request.is_disconnected():
-                await pubsub.close()
                 break
 
             try:
-                message = await pubsub.get_message(
-                    ignore_subscribe_messages=True,
-                    # Waits for up to 10s for a new message
-                    timeout=10.0,
-                )
-
-                if message is not None:
-                    log.info("redis.pubsub", message=message["data"])
-                    yield message["data"]
-            except asyncio.CancelledError as e:
-                await pubsub.close()
-                raise e
-            except ConnectionError as e:
-                await pubsub.close()
-                raise e
+                # Waits for up to 10s for a new message
+                id, data = await asyncio.wait_for(queue.get(), timeout=10.0)
+            except TimeoutError:
+                continue
+
+            event_key = parse_event_id(id)
+            if (
+                last_event_key is not None
+                and event_key is not None
+                and event_key <= last_event_key
+            ):
+                continue
+
+            log.info("redis.pubsub", message=data)
+            yield {"id": id, "data": data}
 
 
 @router.get("/user")
@@ -86,9 +94,12 @@ async def user_stream(
     request: Request,
     auth_subject: WebUser,
     redis: Redis = Depends(get_redis),
+    broker: EventStreamBroker = Depends(get_eventstream_broker),
 ) -> EventSourceResponse:
     receivers = Receivers(user_id=auth_subject.subject.id)
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(
+        subscribe(redis, broker, receivers.get_channels(), request)
+    )
 
 
 @router.get("/organizations/{id}")
@@ -97,6 +108,7 @@ async def org_stream(
     request: Request,
     auth_subject: WebUser,
     redis: Redis = Depends(get_redis),
+    broker: EventStreamBroker = Depends(get_eventstream_broker),
     session: AsyncSession = Depends(get_db_session),
 ) -> EventSourceResponse:
     if not auth_subject.subject:
@@ -115,4 +127,6 @@ async def org_stream(
         raise Unauthorized()
 
     receivers = Receivers(user_id=auth_subject.subject.id, organization_id=org.id)
-    return EventSourceResponse(subscribe(redis, receivers.get_channels(), request))
+    return EventSourceResponse(
+        subscribe(redis, broker, receivers.get_channels(), request)
+    )
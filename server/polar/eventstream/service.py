@@ -1,3 +1,4 @@
+import json
 from typing import Any
 from uuid import UUID
 
@@ -15,6 +16,11 @@ from polar.worker import enqueue_job
 
 log: Logger = structlog.get_logger()
 
+STREAM_MAX_LENGTH = 100
+"""Approximate number of events kept in each channel stream."""
+STREAM_TTL = 3600
+"""Time in seconds before an inactive channel stream is discarded."""
+
 
 class Receivers(BaseModel):
     user_id: UUID | None = None
@@ -46,14 +52,78 @@ class Event(BaseModel):
     payload: dict[str, Any]
 
 
+def get_stream_key(channel: str) -> str:
+    return f"eventstream:{channel}"
+
+
+SEQUENCE_KEY = "eventstream:sequence"
+"""Counter generating the event IDs, global to all the channels."""
+
+
 async def send_event(redis: Redis, event_json: str, channels: list[str]) -> None:
-    for channel in channels:
-        await redis.publish(channel, event_json)
+    """
+    Send an event to the channels.
+
+    The event gets an ID from a global sequence, so IDs can be compared across
+    channels. It's appended to the stream of each channel, so clients can resume
+    from their last received event after a reconnection. It's then published
+    on the channel, along with its ID, for the connected clients.
+    """
+    event_id = str(await redis.incr(SEQUENCE_KEY))
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for channel in channels:
+            stream_key = get_stream_key(channel)
+            pipe.xadd(
+                stream_key,
+                {"id": event_id, "data": event_json},
+                maxlen=STREAM_MAX_LENGTH,
+                approximate=True,
+            )
+            pipe.expire(stream_key, STREAM_TTL)
+        for channel in channels:
+            pipe.publish(channel, json.dumps({"id": event_id, "data": event_json}))
+        await pipe.execute()
+
     log.debug(
         "Published event to eventstream", event_json=event_json, channels=channels
     )
 
 
+def parse_event_id(event_id: str) -> int | None:
+    if not event_id.isdigit():
+        return None
+    return int(event_id)
+
+
+async def get_events_after(
+    redis: Redis, channels: list[str], last_event_id: str
+) -> list[tuple[str, str]]:
+    """
+    Return the events sent to the channels after the given event ID.
+
+    Events are returned as `(id, data)` tuples, ordered by ID.
+    An event sent to several of the channels is returned once.
+    If the event ID is not valid, no event is returned.
+    """
+    last_event_key = parse_event_id(last_event_id)
+    if last_event_key is None:
+        return []
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for channel in channels:
+            pipe.xrange(get_stream_key(channel), min="-", max="+")
+        results: list[list[tuple[str, dict[str, str]]]] = await pipe.execute()
+
+    events: dict[int, str] = {}
+    for messages in results:
+        for _, fields in messages:
+            event_key = parse_event_id(fields.get("id", ""))
+            if event_key is not None and event_key > last_event_key:
+                events[event_key] = fields["data"]
+    return [(str(key), events[key]) for key in sorted(events)]
+
+
 async def publish(
     key: str,
     payload: dict[str, Any],
@@ -97,20 +167,23 @@ async def publish_members(
         session, org_id=organization_id
     )
 
+    channels: list[str] = []
     for m in members:
         receivers = Receivers(user_id=m.user_id)
-        channels = receivers.get_channels()
-        event = Event(
-            id=generate_uuid(),
-            key=key,
-            payload=payload,
-        ).model_dump_json()
-
-        if run_in_worker:
-            enqueue_job("eventstream.publish", event, channels)
-        else:
-            if redis is None:
-                raise RuntimeError(
-                    "Redis instance is required when run_in_worker is False"
-                )
-            await send_event(redis, event, channels)
+        channels += receivers.get_channels()
+
+    if len(channels) == 0:
+        return
+
+    event = Event(
+        id=generate_uuid(),
+        key=key,
+        payload=payload,
+    ).model_dump_json()
+
+    if run_in_worker:
+        enqueue_job("eventstream.publish", event, channels)
+    else:
+        if redis is None:
+            raise RuntimeError("Redis instance is required when run_in_worker is False")
+        await send_event(redis, event, channels)
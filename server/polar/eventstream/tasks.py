@@ -1,14 +1,20 @@
 import structlog
 
 from polar.logging import Logger
-from polar.worker import JobContext, PolarWorkerContext, get_worker_redis, task
+from polar.worker import (
+    JobContext,
+    PolarWorkerContext,
+    QueueName,
+    get_worker_redis,
+    task,
+)
 
 from .service import send_event
 
 log: Logger = structlog.get_logger()
 
 
-@task("eventstream.publish")
+@task("eventstream.publish", queue_name=QueueName.critical)
 async def eventstream_publish(
     ctx: JobContext,
     event: str,
@@ -1,3 +1,4 @@
+import functools
 import uuid
 from collections.abc import Sequence
 from typing import Any
@@ -7,6 +8,7 @@ from sqlalchemy.orm import joinedload
 
 from polar.auth.models import Anonymous, AuthSubject, is_organization
 from polar.enums import Platforms
+from polar.kit.loader import Loader
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
@@ -83,6 +85,31 @@ class ExternalOrganizationService(ResourceServiceReader[ExternalOrganization]):
         result = await session.execute(statement)
         return result.scalar_one_or_none()
 
+    async def get_linked_many(
+        self, session: AsyncSession, ids: Sequence[uuid.UUID]
+    ) -> dict[uuid.UUID, ExternalOrganization]:
+        """Get ExternalOrganizations by IDs that are linked to an Organization."""
+        statement = (
+            select(ExternalOrganization)
+            .where(
+                ExternalOrganization.id.in_(ids),
+                ExternalOrganization.deleted_at.is_(None),
+                ExternalOrganization.organization_id.isnot(None),
+            )
+            .options(joinedload(ExternalOrganization.organization))
+        )
+
+        result = await session.execute(statement)
+        return {
+            external_organization.id: external_organization
+            for external_organization in result.scalars().unique().all()
+        }
+
+    def get_linked_loader(
+        self, session: AsyncSession
+    ) -> Loader[uuid.UUID, ExternalOrganization]:
+        return Loader(functools.partial(self.get_linked_many, session))
+
     def _get_readable_external_organization_statement(
         self, auth_subject: AuthSubject[Anonymous | User | Organization]
     ) -> Select[tuple[ExternalOrganization]]:
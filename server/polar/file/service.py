@@ -83,7 +83,7 @@ class FileService(ResourceServiceReader[File]):
         create_schema: FileCreate,
     ) -> FileUpload:
         s3_service = S3_SERVICES[create_schema.service]
-        upload = s3_service.create_multipart_upload(
+        upload = await s3_service.create_multipart_upload(
             create_schema, namespace=create_schema.service.value
         )
 
@@ -113,7 +113,7 @@ class FileService(ResourceServiceReader[File]):
         completed_schema: FileUploadCompleted,
     ) -> File:
         s3_service = S3_SERVICES[file.service]
-        s3file = s3_service.complete_multipart_upload(completed_schema)
+        s3file = await s3_service.complete_multipart_upload(completed_schema)
 
         file.is_uploaded = True
 
@@ -152,7 +152,7 @@ class FileService(ResourceServiceReader[File]):
         await session.execute(statement)
 
         s3_service = S3_SERVICES[file.service]
-        deleted = s3_service.delete_file(file.path)
+        deleted = await s3_service.delete_file(file.path)
         log.info("file.delete", file_id=file.id, s3_deleted=deleted)
         return True
 
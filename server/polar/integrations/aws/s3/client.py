@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from typing import TYPE_CHECKING
 
 import boto3
@@ -18,11 +19,23 @@ def get_client(
         aws_access_key_id=settings.AWS_ACCESS_KEY_ID,
         aws_secret_access_key=settings.AWS_SECRET_ACCESS_KEY,
         config=Config(
-            region_name=settings.AWS_REGION, signature_version=signature_version
+            region_name=settings.AWS_REGION,
+            signature_version=signature_version,
+            max_pool_connections=settings.AWS_MAX_POOL_CONNECTIONS,
         ),
     )
 
 
 client = get_client()
 
-__all__ = ("client", "get_client")
+executor = ThreadPoolExecutor(
+    max_workers=settings.AWS_MAX_POOL_CONNECTIONS, thread_name_prefix="s3"
+)
+"""
+Runs the blocking boto3 calls outside of the event loop.
+
+It's bounded by the size of the connection pool, so calls don't wait on each other
+for a connection while holding a thread.
+"""
+
+__all__ = ("client", "executor", "get_client")
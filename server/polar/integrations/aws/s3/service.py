@@ -1,6 +1,11 @@
+import asyncio
 import base64
+import functools
+from collections import OrderedDict
+from collections.abc import Callable
+from concurrent.futures import Executor
 from datetime import datetime, timedelta
-from typing import TYPE_CHECKING, Any, cast
+from typing import TYPE_CHECKING, Any, ParamSpec, TypeVar, cast
 
 import botocore
 import structlog
@@ -8,7 +13,7 @@ from botocore.client import ClientError
 
 from polar.kit.utils import generate_uuid, utc_now
 
-from .client import client, get_client
+from .client import client, executor, get_client
 from .exceptions import S3FileError
 from .schemas import (
     S3File,
@@ -26,6 +31,11 @@ if TYPE_CHECKING:
 
 log = structlog.get_logger()
 
+PRESIGNED_DOWNLOAD_CACHE_SIZE = 1024
+
+Params = ParamSpec("Params")
+ReturnValue = TypeVar("ReturnValue")
+
 
 class S3Service:
     def __init__(
@@ -33,12 +43,28 @@ class S3Service:
         bucket: str,
         presign_ttl: int = 600,
         client: "S3Client" = client,
+        executor: Executor = executor,
     ):
         self.bucket = bucket
         self.presign_ttl = presign_ttl
         self.client = client
+        self.executor = executor
+        self._presigned_downloads: OrderedDict[
+            tuple[str, str, str], tuple[str, datetime]
+        ] = OrderedDict()
+
+    async def _run(
+        self,
+        func: Callable[Params, ReturnValue],
+        *args: Params.args,
+        **kwargs: Params.kwargs,
+    ) -> ReturnValue:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.executor, functools.partial(func, *args, **kwargs)
+        )
 
-    def create_multipart_upload(
+    async def create_multipart_upload(
         self, data: S3FileCreate, namespace: str = ""
     ) -> S3FileUpload:
         if not data.organization_id:
@@ -69,7 +95,8 @@ class S3Service:
             file.checksum_sha256_base64 = sha256_base64
             file.checksum_sha256_hex = base64.b64decode(sha256_base64).hex()
 
-        multipart_upload = self.client.create_multipart_upload(
+        multipart_upload = await self._run(
+            self.client.create_multipart_upload,
             Bucket=self.bucket,
             Key=file.path,
             ContentType=file.mime_type,
@@ -88,7 +115,8 @@ class S3Service:
             )
             raise S3FileError("No upload ID returned from S3")
 
-        parts = self.generate_presigned_upload_parts(
+        parts = await self._run(
+            self.generate_presigned_upload_parts,
             path=file.path,
             parts=data.upload.parts,
             upload_id=multipart_upload_id,
@@ -140,9 +168,12 @@ class S3Service:
             )
         return ret
 
-    def get_object_or_raise(self, path: str, s3_version_id: str = "") -> dict[str, Any]:
+    async def get_object_or_raise(
+        self, path: str, s3_version_id: str = ""
+    ) -> dict[str, Any]:
         try:
-            obj = self.client.get_object(
+            obj = await self._run(
+                self.client.get_object,
                 Bucket=self.bucket,
                 Key=path,
                 VersionId=s3_version_id,
@@ -153,26 +184,34 @@ class S3Service:
 
         return cast(dict[str, Any], obj)
 
-    def get_head_or_raise(self, path: str, s3_version_id: str = "") -> dict[str, Any]:
+    async def get_head_or_raise(
+        self, path: str, s3_version_id: str = ""
+    ) -> dict[str, Any]:
         try:
-            head = self.client.head_object(
-                Bucket=self.bucket, Key=path, VersionId=s3_version_id
+            head = await self._run(
+                self.client.head_object,
+                Bucket=self.bucket,
+                Key=path,
+                VersionId=s3_version_id,
             )
         except ClientError:
             raise S3FileError("No metadata from S3")
 
         return cast(dict[str, Any], head)
 
-    def complete_multipart_upload(self, data: S3FileUploadCompleted) -> S3File:
+    async def complete_multipart_upload(self, data: S3FileUploadCompleted) -> S3File:
         boto_arguments = data.get_boto3_arguments()
-        response = self.client.complete_multipart_upload(
-            Bucket=self.bucket, Key=data.path, **boto_arguments
+        response = await self._run(
+            self.client.complete_multipart_upload,
+            Bucket=self.bucket,
+            Key=data.path,
+            **boto_arguments,
         )
         if not response:
             raise S3FileError("No response from S3")
 
         version_id = response.get("VersionId", "")
-        head = self.get_head_or_raise(data.path, s3_version_id=version_id)
+        head = await self.get_head_or_raise(data.path, s3_version_id=version_id)
         file = S3File.from_head(data.path, head)
         return file
 
@@ -183,8 +222,25 @@ class S3Service:
         filename: str,
         mime_type: str,
     ) -> tuple[str, datetime]:
-        expires_in = self.presign_ttl
+        """
+        Generate a presigned URL to download a file.
+
+        URLs are cached and reused while they're valid for at least half
+        of their lifetime, so listing the same files doesn't sign them each time.
+        The path is unique to an upload, so it identifies the file version.
+        """
+        key = (path, filename, mime_type)
         presign_from = utc_now()
+        cached = self._presigned_downloads.get(key)
+        if cached is not None:
+            _, cached_expires_at = cached
+            if cached_expires_at - presign_from > timedelta(
+                seconds=self.presign_ttl / 2
+            ):
+                self._presigned_downloads.move_to_end(key)
+                return cached
+
+        expires_in = self.presign_ttl
         signed_download_url = self.client.generate_presigned_url(
             "get_object",
             Params=dict(
@@ -199,6 +255,12 @@ class S3Service:
         )
 
         presign_expires_at = presign_from + timedelta(seconds=expires_in)
+
+        self._presigned_downloads[key] = (signed_download_url, presign_expires_at)
+        self._presigned_downloads.move_to_end(key)
+        if len(self._presigned_downloads) > PRESIGNED_DOWNLOAD_CACHE_SIZE:
+            self._presigned_downloads.popitem(last=False)
+
         return (signed_download_url, presign_expires_at)
 
     def get_public_url(self, path: str) -> str:
@@ -210,6 +272,8 @@ class S3Service:
             "get_object", ExpiresIn=0, Params=dict(Bucket=self.bucket, Key=path)
         )
 
-    def delete_file(self, path: str) -> bool:
-        deleted = self.client.delete_object(Bucket=self.bucket, Key=path)
+    async def delete_file(self, path: str) -> bool:
+        deleted = await self._run(
+            self.client.delete_object, Bucket=self.bucket, Key=path
+        )
         return deleted.get("DeleteMarker", False)
@@ -5,17 +5,29 @@ import structlog
 
 from polar.config import settings
 
+from .rate_limit import DiscordRateLimiter
+
 log = structlog.get_logger()
 
 BASE_URL = "https://discord.com/api/v10"
 
 
+MAX_RATE_LIMITED_ATTEMPTS = 3
+
+
 class DiscordClient:
-    def __init__(self, scheme: Literal["Bot", "Bearer"], token: str) -> None:
+    def __init__(
+        self,
+        scheme: Literal["Bot", "Bearer"],
+        token: str,
+        *,
+        rate_limiter: DiscordRateLimiter | None = None,
+    ) -> None:
         self.client = httpx.AsyncClient(
             base_url=BASE_URL,
             headers={"Authorization": f"{scheme} {token}"},
         )
+        self.rate_limiter = rate_limiter
 
     async def get_me(self) -> dict[str, Any]:
         response = await self.client.get("/users/@me")
@@ -44,7 +56,13 @@ class DiscordClient:
         if nick:
             data["nick"] = nick
 
-        response = await self.client.put(endpoint, json=data)
+        response = await self._request(
+            "PUT",
+            "/guilds/{guild_id}/members/{user_id}",
+            guild_id,
+            endpoint,
+            json=data,
+        )
         self._handle_response(response)
 
         if response.status_code == 201:
@@ -74,7 +92,12 @@ class DiscordClient:
     ) -> None:
         endpoint = f"/guilds/{guild_id}/members/{discord_user_id}/roles/{role_id}"
 
-        response = await self.client.put(endpoint)
+        response = await self._request(
+            "PUT",
+            "/guilds/{guild_id}/members/{user_id}/roles/{role_id}",
+            guild_id,
+            endpoint,
+        )
         self._handle_response(response)
 
         log.info(
@@ -93,7 +116,12 @@ class DiscordClient:
     ) -> None:
         endpoint = f"/guilds/{guild_id}/members/{discord_user_id}/roles/{role_id}"
 
-        response = await self.client.delete(endpoint)
+        response = await self._request(
+            "DELETE",
+            "/guilds/{guild_id}/members/{user_id}/roles/{role_id}",
+            guild_id,
+            endpoint,
+        )
         self._handle_response(response)
 
         log.info(
@@ -104,6 +132,27 @@ class DiscordClient:
         )
         return None
 
+    async def _request(
+        self, method: str, route: str, major: str, url: str, **kwargs: Any
+    ) -> httpx.Response:
+        """
+        Send a request, respecting the rate limits if a rate limiter is set.
+
+        Requests hitting a rate limit anyway, e.g. because of another client,
+        are retried once it's reset.
+        """
+        if self.rate_limiter is None:
+            return await self.client.request(method, url, **kwargs)
+
+        route = f"{method} {route}"
+        for _ in range(MAX_RATE_LIMITED_ATTEMPTS):
+            await self.rate_limiter.wait(route, major)
+            response = await self.client.request(method, url, **kwargs)
+            await self.rate_limiter.update(route, major, response)
+            if response.status_code != 429:
+                break
+        return response
+
     def _handle_response(self, response: httpx.Response) -> httpx.Response:
         response.raise_for_status()
         return response
@@ -0,0 +1,314 @@
+import json
+import time
+import uuid
+from typing import Literal, TypedDict
+
+import httpx
+import structlog
+from redis.exceptions import WatchError
+from sqlalchemy import update
+
+from polar.config import settings
+from polar.logging import Logger
+from polar.models import BenefitGrant
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from polar.user.service.user import user as user_service
+from polar.worker import compute_backoff, enqueue_job
+
+from .client import DiscordClient
+from .rate_limit import DiscordRateLimiter
+from .service import DiscordError
+from .service import discord_user as discord_user_service
+
+log: Logger = structlog.get_logger()
+
+KEY_PREFIX = "discord:dispatch"
+BATCH_SIZE = 50
+"""Number of operations read from the queue at once."""
+TIME_BUDGET = 60.0
+"""Maximum time spent by a dispatch job, in seconds, before it hands over."""
+MAX_ATTEMPTS = 10
+
+
+class DiscordOperation(TypedDict):
+    action: Literal["add", "remove"]
+    role_id: str
+    account_id: str
+    user_id: str | None
+    attempt: int
+
+
+def _queue_key(guild_id: str) -> str:
+    return f"{KEY_PREFIX}:{guild_id}:queue"
+
+
+def _operations_key(guild_id: str) -> str:
+    return f"{KEY_PREFIX}:{guild_id}:operations"
+
+
+def _lock_key(guild_id: str) -> str:
+    return f"{KEY_PREFIX}:{guild_id}:lock"
+
+
+def _member_key(operation: DiscordOperation) -> str:
+    return f"{operation['account_id']}:{operation['role_id']}"
+
+
+class DiscordDispatchService:
+    """
+    Queue member role operations per guild, and apply them at the rate Discord allows.
+
+    Operations on the same member and role are coalesced while they're queued:
+    only the last one is applied, e.g. a grant followed by a revoke
+    results in a single role removal.
+
+    Operations are queued by the `discord.enqueue` job, so they're only pushed
+    once the transaction granting or revoking the benefit is committed.
+    """
+
+    async def add_member_role(
+        self, guild_id: str, role_id: str, account_id: str, user_id: uuid.UUID
+    ) -> None:
+        operation: DiscordOperation = {
+            "action": "add",
+            "role_id": role_id,
+            "account_id": account_id,
+            "user_id": str(user_id),
+            "attempt": 0,
+        }
+        enqueue_job("discord.enqueue", guild_id=guild_id, operation=operation)
+
+    async def remove_member_role(
+        self, guild_id: str, role_id: str, account_id: str
+    ) -> None:
+        operation: DiscordOperation = {
+            "action": "remove",
+            "role_id": role_id,
+            "account_id": account_id,
+            "user_id": None,
+            "attempt": 0,
+        }
+        enqueue_job("discord.enqueue", guild_id=guild_id, operation=operation)
+
+    async def dispatch(
+        self, session: AsyncSession, redis: Redis, guild_id: str
+    ) -> None:
+        """
+        Apply the queued operations of a guild.
+
+        Only one dispatch runs per guild at a time. It stops when the queue is empty
+        or after `TIME_BUDGET`, in which case it enqueues the next one.
+        """
+        lock_token = uuid.uuid4().hex
+        if not await redis.set(
+            _lock_key(guild_id), lock_token, nx=True, ex=int(TIME_BUDGET * 2)
+        ):
+            return
+
+        client = DiscordClient(
+            "Bot",
+            settings.DISCORD_BOT_TOKEN,
+            rate_limiter=DiscordRateLimiter(redis),
+        )
+        start = time.monotonic()
+        dispatched = 0
+        try:
+            while time.monotonic() - start < TIME_BUDGET:
+                operations = await self._get_due_operations(redis, guild_id)
+                if not operations:
+                    break
+                for member_key, raw_operation in operations:
+                    operation: DiscordOperation = json.loads(raw_operation)
+                    retry_after = await self._apply(
+                        session, client, guild_id, operation
+                    )
+                    await self._complete(
+                        redis, guild_id, member_key, raw_operation, retry_after
+                    )
+                    dispatched += 1
+        finally:
+            await self._release_lock(redis, guild_id, lock_token)
+
+        log.info("discord.dispatch", guild_id=guild_id, dispatched=dispatched)
+
+        # Operations queued while we were releasing the lock would be left behind
+        next_score = await redis.zrange(_queue_key(guild_id), 0, 0, withscores=True)
+        if next_score:
+            _, score = next_score[0]
+            enqueue_job(
+                "discord.dispatch",
+                guild_id=guild_id,
+                _defer_by=max(score - time.time(), 0),
+            )
+
+    async def _release_lock(self, redis: Redis, guild_id: str, token: str) -> None:
+        lock_key = _lock_key(guild_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(lock_key)
+                if await pipe.get(lock_key) != token:
+                    return
+                pipe.multi()
+                pipe.delete(lock_key)
+                await pipe.execute()
+            except WatchError:
+                return
+
+    async def enqueue(
+        self, redis: Redis, guild_id: str, operation: DiscordOperation
+    ) -> None:
+        """Queue an operation in the guild queue, and schedule its dispatch."""
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hset(
+                _operations_key(guild_id), _member_key(operation), json.dumps(operation)
+            )
+            # Keep the position of a queued operation, unless it's waiting for a retry
+            pipe.zadd(
+                _queue_key(guild_id), {_member_key(operation): time.time()}, lt=True
+            )
+            await pipe.execute()
+
+        # Not deduplicated: a job id shared with a dispatch that already ran would
+        # leave the operation behind. Dispatches exit early if another one runs
+        # for the guild, and it picks up the operation.
+        enqueue_job("discord.dispatch", guild_id=guild_id)
+
+    async def _get_due_operations(
+        self, redis: Redis, guild_id: str
+    ) -> list[tuple[str, str]]:
+        member_keys: list[str] = await redis.zrangebyscore(
+            _queue_key(guild_id), "-inf", time.time(), start=0, num=BATCH_SIZE
+        )
+        if not member_keys:
+            return []
+        raw_operations = await redis.hmget(_operations_key(guild_id), member_keys)
+
+        operations: list[tuple[str, str]] = []
+        for member_key, raw_operation in zip(member_keys, raw_operations):
+            if raw_operation is None:
+                await redis.zrem(_queue_key(guild_id), member_key)
+            else:
+                operations.append((member_key, raw_operation))
+        return operations
+
+    async def _apply(
+        self,
+        session: AsyncSession,
+        client: DiscordClient,
+        guild_id: str,
+        operation: DiscordOperation,
+    ) -> float | None:
+        """
+        Apply an operation.
+
+        Returns:
+            The number of seconds to wait before retrying the operation,
+            or `None` if it's done.
+        """
+        bound_logger = log.bind(guild_id=guild_id, **operation)
+        try:
+            if operation["action"] == "add":
+                assert operation["user_id"] is not None
+                user = await user_service.get(session, uuid.UUID(operation["user_id"]))
+                if user is None:
+                    bound_logger.info("discord.dispatch.user_not_found")
+                    return None
+                try:
+                    account = await discord_user_service.get_oauth_account(
+                        session, user
+                    )
+                except DiscordError:
+                    bound_logger.info("discord.dispatch.account_not_connected")
+                    await self._ungrant(session, guild_id, operation)
+                    return None
+                await client.add_member(
+                    guild_id=guild_id,
+                    discord_user_id=account.account_id,
+                    discord_user_access_token=account.access_token,
+                    role_id=operation["role_id"],
+                )
+            else:
+                await client.remove_member_role(
+                    guild_id=guild_id,
+                    discord_user_id=operation["account_id"],
+                    role_id=operation["role_id"],
+                )
+        except httpx.HTTPError as e:
+            error_bound_logger = bound_logger.bind(error=str(e))
+            if isinstance(e, httpx.HTTPStatusError):
+                error_bound_logger = error_bound_logger.bind(
+                    status_code=e.response.status_code, body=e.response.text
+                )
+            if operation["attempt"] + 1 >= MAX_ATTEMPTS:
+                error_bound_logger.error("discord.dispatch.failed")
+                if operation["action"] == "add":
+                    await self._ungrant(session, guild_id, operation)
+                return None
+            error_bound_logger.warning("discord.dispatch.http_error")
+            return compute_backoff(operation["attempt"] + 1)
+
+        return None
+
+    async def _ungrant(
+        self, session: AsyncSession, guild_id: str, operation: DiscordOperation
+    ) -> None:
+        """
+        Mark the grants of a role which couldn't be added as not granted.
+
+        Like grants failing on a precondition, they're granted again
+        when the user connects their Discord account.
+        """
+        assert operation["user_id"] is not None
+        statement = (
+            update(BenefitGrant)
+            .where(
+                BenefitGrant.user_id == uuid.UUID(operation["user_id"]),
+                BenefitGrant.is_granted,
+                BenefitGrant.deleted_at.is_(None),
+                BenefitGrant.properties["guild_id"].astext == guild_id,
+                BenefitGrant.properties["role_id"].astext == operation["role_id"],
+                BenefitGrant.properties["account_id"].astext == operation["account_id"],
+            )
+            .values(granted_at=None)
+        )
+        await session.execute(statement)
+
+    async def _complete(
+        self,
+        redis: Redis,
+        guild_id: str,
+        member_key: str,
+        raw_operation: str,
+        retry_after: float | None,
+    ) -> None:
+        """
+        Remove the operation from the queue, or schedule its retry.
+
+        Nothing is done if the operation was replaced in the meantime,
+        so the new one is applied.
+        """
+        operations_key = _operations_key(guild_id)
+        async with redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(operations_key)
+                if await pipe.hget(operations_key, member_key) != raw_operation:
+                    return
+                pipe.multi()
+                if retry_after is None:
+                    pipe.hdel(operations_key, member_key)
+                    pipe.zrem(_queue_key(guild_id), member_key)
+                else:
+                    operation: DiscordOperation = json.loads(raw_operation)
+                    operation["attempt"] += 1
+                    pipe.hset(operations_key, member_key, json.dumps(operation))
+                    pipe.zadd(
+                        _queue_key(guild_id), {member_key: time.time() + retry_after}
+                    )
+                await pipe.execute()
+            except WatchError:
+                # The operation was replaced while we were applying it
+                return
+
+
+discord_dispatch = DiscordDispatchService()
@@ -0,0 +1,120 @@
+import asyncio
+import math
+import time
+
+import httpx
+import structlog
+
+from polar.logging import Logger
+from polar.redis import Redis
+
+log: Logger = structlog.get_logger()
+
+KEY_PREFIX = "discord:rate_limit"
+GLOBAL_KEY = f"{KEY_PREFIX}:global"
+ROUTE_BUCKET_TTL = 86400
+"""How long we remember which bucket a route belongs to, in seconds."""
+
+
+class DiscordRateLimiter:
+    """
+    Track Discord rate limit buckets in Redis, so they're shared by every worker.
+
+    Discord groups routes into buckets, identified by the `X-RateLimit-Bucket`
+    header, and limits them per major parameter, i.e. the guild.
+    Before each request, we wait until its bucket has requests remaining.
+    After each request, we update the bucket from the `X-RateLimit-*` headers.
+
+    Reference: https://discord.com/developers/docs/topics/rate-limits
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    async def wait(self, route: str, major: str) -> None:
+        """
+        Wait until a request can be sent to the route, and consume it.
+
+        Args:
+            route: The route, with its parameters as placeholders,
+            e.g. `PUT /guilds/{guild_id}/members/{user_id}`.
+            major: The major parameter of the route, e.g. the guild ID.
+        """
+        while True:
+            global_ttl = await self.redis.pttl(GLOBAL_KEY)
+            if global_ttl > 0:
+                await asyncio.sleep(global_ttl / 1000)
+                continue
+
+            bucket_key = await self._get_bucket_key(route, major)
+            reset_at = await self.redis.hget(bucket_key, "reset_at")
+            if reset_at is None:
+                return
+
+            # If the bucket expired in the meantime, HINCRBY recreates it:
+            # expire it at the reset time again, so it doesn't live forever.
+            async with self.redis.pipeline(transaction=True) as pipe:
+                pipe.hincrby(bucket_key, "remaining", -1)
+                pipe.pexpireat(bucket_key, math.ceil((float(reset_at) + 1) * 1000))
+                remaining, _ = await pipe.execute()
+            wait = float(reset_at) - time.time()
+            if remaining >= 0 or wait <= 0:
+                return
+
+            log.debug("discord.rate_limit.wait", route=route, major=major, wait=wait)
+            await asyncio.sleep(wait)
+
+    async def update(self, route: str, major: str, response: httpx.Response) -> None:
+        """Update the bucket of the route from the response headers."""
+        headers = response.headers
+
+        if response.status_code == 429:
+            retry_after = float(headers.get("retry-after", 1))
+            log.warning(
+                "discord.rate_limit.exceeded",
+                route=route,
+                major=major,
+                retry_after=retry_after,
+                scope=headers.get("x-ratelimit-scope"),
+            )
+            if headers.get("x-ratelimit-global") == "true":
+                await self.redis.set(
+                    GLOBAL_KEY, 1, px=max(math.ceil(retry_after * 1000), 1)
+                )
+                return
+
+        bucket = headers.get("x-ratelimit-bucket")
+        remaining = headers.get("x-ratelimit-remaining")
+        reset_after = headers.get("x-ratelimit-reset-after")
+        if response.status_code == 429:
+            remaining = "0"
+            reset_after = headers.get("retry-after", reset_after)
+        if bucket is None or remaining is None or reset_after is None:
+            return
+
+        route_key = self._get_route_key(route)
+        bucket_key = self._get_key(bucket, major)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.set(route_key, bucket, ex=ROUTE_BUCKET_TTL)
+            pipe.hset(
+                bucket_key,
+                mapping={
+                    "remaining": int(remaining),
+                    "reset_at": time.time() + float(reset_after),
+                },
+            )
+            pipe.expire(bucket_key, math.ceil(float(reset_after)) + 1)
+            await pipe.execute()
+
+    async def _get_bucket_key(self, route: str, major: str) -> str:
+        bucket = await self.redis.get(self._get_route_key(route))
+        return self._get_key(bucket or route, major)
+
+    def _get_route_key(self, route: str) -> str:
+        return f"{KEY_PREFIX}:route:{route}"
+
+    def _get_key(self, bucket: str, major: str) -> str:
+        return f"{KEY_PREFIX}:bucket:{bucket}:{major}"
+
+
+__all__ = ["DiscordRateLimiter"]
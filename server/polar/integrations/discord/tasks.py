@@ -0,0 +1,27 @@
+from polar.worker import (
+    AsyncSessionMaker,
+    JobContext,
+    PolarWorkerContext,
+    get_worker_redis,
+    task,
+)
+
+from .dispatch import DiscordOperation, discord_dispatch
+
+
+@task("discord.enqueue")
+async def discord_enqueue_task(
+    ctx: JobContext,
+    guild_id: str,
+    operation: DiscordOperation,
+    polar_context: PolarWorkerContext,
+) -> None:
+    await discord_dispatch.enqueue(get_worker_redis(ctx), guild_id, operation)
+
+
+@task("discord.dispatch")
+async def discord_dispatch_task(
+    ctx: JobContext, guild_id: str, polar_context: PolarWorkerContext
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await discord_dispatch.dispatch(session, get_worker_redis(ctx), guild_id)
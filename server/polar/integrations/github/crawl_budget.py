@@ -0,0 +1,120 @@
+from collections.abc import Mapping
+
+import structlog
+
+from polar.kit import rate_limit
+from polar.kit.utils import utc_now
+from polar.logging import Logger
+from polar.redis import Redis
+
+log: Logger = structlog.get_logger()
+
+CRAWL_BUDGET_PER_HOUR = 3000
+"""
+Requests per hour the crawl may spend on an installation.
+
+Installations get at least 5,000 requests per hour. The rest is left to
+webhooks and user-triggered requests.
+"""
+
+MINIMUM_REMAINING = 1000
+"""Pause the crawl of an installation when GitHub reports less remaining requests."""
+
+
+class CrawlBudgetExhausted(Exception):
+    def __init__(self, installation_id: int, retry_after: float) -> None:
+        self.installation_id = installation_id
+        self.retry_after = retry_after
+        super().__init__(
+            f"Crawl budget of installation {installation_id} is exhausted, "
+            f"retry in {retry_after:.0f} seconds"
+        )
+
+
+def _bucket_key(installation_id: int) -> str:
+    return f"github_crawl:{installation_id}"
+
+
+def _paused_key(installation_id: int) -> str:
+    return f"github_crawl:paused:{installation_id}"
+
+
+async def get_paused_for(redis: Redis, installation_id: int) -> float:
+    """Seconds until the crawl of the installation resumes, 0 if it's not paused."""
+    ttl = await redis.pttl(_paused_key(installation_id))
+    return max(ttl, 0) / 1000
+
+
+async def acquire(redis: Redis, installation_id: int) -> None:
+    """
+    Consume one request from the crawl budget of the installation.
+
+    The budget is a token bucket stored in Redis, so it's shared by every
+    worker of the `github_crawl` queue.
+
+    Raises:
+        CrawlBudgetExhausted: The budget is exhausted or the crawl is paused.
+    """
+    paused_for = await get_paused_for(redis, installation_id)
+    if paused_for > 0:
+        raise CrawlBudgetExhausted(installation_id, paused_for)
+
+    retry_after = await rate_limit.take_tokens(
+        redis,
+        _bucket_key(installation_id),
+        capacity=CRAWL_BUDGET_PER_HOUR,
+        refill_rate=CRAWL_BUDGET_PER_HOUR / 3600,
+    )
+    if retry_after > 0:
+        raise CrawlBudgetExhausted(installation_id, retry_after)
+
+
+async def refund(redis: Redis, installation_id: int) -> None:
+    """
+    Give back a request to the crawl budget of the installation.
+
+    Conditional requests answered with a 304 don't count against
+    the GitHub rate limit, so they shouldn't count against the budget either.
+    """
+    await rate_limit.take_tokens(
+        redis,
+        _bucket_key(installation_id),
+        capacity=CRAWL_BUDGET_PER_HOUR,
+        refill_rate=CRAWL_BUDGET_PER_HOUR / 3600,
+        cost=-1,
+    )
+
+
+async def record_rate_limit(
+    redis: Redis, installation_id: int, headers: Mapping[str, str]
+) -> None:
+    """
+    Pause the crawl of the installation until the rate limit resets
+    if GitHub reports it's almost exhausted.
+    """
+    remaining = headers.get("x-ratelimit-remaining")
+    reset = headers.get("x-ratelimit-reset")
+    if remaining is None or reset is None or int(remaining) >= MINIMUM_REMAINING:
+        return
+
+    paused_for = int(reset) - int(utc_now().timestamp())
+    if paused_for <= 0:
+        return
+
+    log.info(
+        "github.crawl_budget.paused",
+        installation_id=installation_id,
+        rate_limit_remaining=int(remaining),
+        paused_for=paused_for,
+    )
+    await redis.set(_paused_key(installation_id), 1, ex=paused_for)
+
+
+__all__ = [
+    "CRAWL_BUDGET_PER_HOUR",
+    "CrawlBudgetExhausted",
+    "get_paused_for",
+    "acquire",
+    "refund",
+    "record_rate_limit",
+]
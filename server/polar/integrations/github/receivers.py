@@ -1,9 +1,12 @@
+from uuid import UUID
+
 import structlog
 
 from polar.external_organization.service import (
     external_organization as external_organization_service,
 )
-from polar.issue.hooks import IssueHook, issue_upserted
+from polar.issue.hooks import IssuesHook, issues_upserted
+from polar.models import ExternalOrganization, Repository
 from polar.repository.service import repository as repository_service
 from polar.worker import enqueue_job
 
@@ -13,28 +16,41 @@ log = structlog.get_logger()
 
 
 async def schedule_embed_badge_task(
-    hook: IssueHook,
+    hook: IssuesHook,
 ) -> None:
     session = hook.session
 
-    external_organization = await external_organization_service.get_linked(
-        session, hook.issue.organization_id
-    )
-    if not external_organization:
-        return
-
-    repository = await repository_service.get(session, hook.issue.repository_id)
-    if not repository:
-        return
-
-    should_embed, _ = GithubBadge.should_add_badge(
-        external_organization, repository, hook.issue, triggered_from_label=False
-    )
-    if not should_embed:
-        return
-
-    log.info("github.badge.embed_on_issue:scheduled", issue_id=hook.issue.id)
-    enqueue_job("github.badge.embed_on_issue", hook.issue.id)
-
-
-issue_upserted.add(schedule_embed_badge_task)
+    # Issues are usually upserted by batches of the same repository
+    external_organizations: dict[UUID, ExternalOrganization | None] = {}
+    repositories: dict[UUID, Repository | None] = {}
+
+    for issue in hook.issues:
+        if issue.organization_id not in external_organizations:
+            external_organizations[
+                issue.organization_id
+            ] = await external_organization_service.get_linked(
+                session, issue.organization_id
+            )
+        external_organization = external_organizations[issue.organization_id]
+        if not external_organization:
+            continue
+
+        if issue.repository_id not in repositories:
+            repositories[issue.repository_id] = await repository_service.get(
+                session, issue.repository_id
+            )
+        repository = repositories[issue.repository_id]
+        if not repository:
+            continue
+
+        should_embed, _ = GithubBadge.should_add_badge(
+            external_organization, repository, issue, triggered_from_label=False
+        )
+        if not should_embed:
+            continue
+
+        log.info("github.badge.embed_on_issue:scheduled", issue_id=issue.id)
+        enqueue_job("github.badge.embed_on_issue", issue.id)
+
+
+issues_upserted.add(schedule_embed_badge_task)
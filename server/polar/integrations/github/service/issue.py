@@ -7,16 +7,16 @@ from typing import Any, Literal
 from uuid import UUID
 
 import structlog
-from githubkit import GitHub, Paginator
+from githubkit import GitHub, Paginator, Response
 from githubkit.exception import RequestFailed
-from sqlalchemy import asc, or_
+from sqlalchemy import asc, func, or_
 from sqlalchemy.orm import contains_eager
 
 from polar.dashboard.schemas import IssueSortBy
 from polar.enums import Platforms
 from polar.exceptions import ResourceNotFound
 from polar.external_organization.schemas import ExternalOrganizationCreateFromGitHubUser
-from polar.issue.hooks import IssueHook, issue_upserted
+from polar.issue.hooks import IssuesHook, issues_upserted
 from polar.issue.schemas import IssueCreate, IssueUpdate
 from polar.issue.service import IssueService
 from polar.kit.db.postgres import (
@@ -31,19 +31,24 @@ from polar.models import ExternalOrganization, Issue, Organization, Repository
 from polar.models.user import User
 from polar.redis import Redis
 from polar.repository.hooks import (
-    repository_issue_synced,
     repository_issues_sync_completed,
+    repository_issues_synced,
 )
 
 from .. import client as github
-from .. import types
+from .. import crawl_budget, types
 from ..badge import GithubBadge
 from .organization import github_organization
-from .paginated import ErrorCount, SyncedCount, github_paginated_service
+from .paginated import PAGE_SIZE, ErrorCount, SyncedCount, github_paginated_service
 from .repository import github_repository
 
 log: Logger = structlog.get_logger()
 
+CRAWL_LIMIT = 100
+"""Maximum number of issues of an organization crawled per run."""
+CRAWL_STALEST_LIMIT = 25
+"""Part of `CRAWL_LIMIT` reserved to the issues fetched the longest ago."""
+
 
 class GithubIssueService(IssueService):
     async def get_by_external_id(
@@ -153,8 +158,7 @@ class GithubIssueService(IssueService):
         #
         # TODO: migrate away from this hook!
         if autocommit:
-            for record in records:
-                await issue_upserted.call(IssueHook(session, redis, record))
+            await issues_upserted.call(IssuesHook(session, redis, records))
 
         return records
 
@@ -363,6 +367,7 @@ class GithubIssueService(IssueService):
         )
 
         client = github.get_app_installation_client(installation_id, redis=redis)
+        await crawl_budget.acquire(redis, installation_id)
 
         log.info("github.sync_issue", issue_id=issue.id)
 
@@ -376,6 +381,9 @@ class GithubIssueService(IssueService):
                 else {},
             )
         except RequestFailed as e:
+            await crawl_budget.record_rate_limit(
+                redis, installation_id, e.response.headers
+            )
             if e.response.status_code == 404:
                 log.info("github.sync_issue.404.marking_as_crawled")
                 issue.github_issue_fetched_at = utc_now()
@@ -388,9 +396,14 @@ class GithubIssueService(IssueService):
             else:
                 raise e
 
-        # Cache hit, nothing new
+        await crawl_budget.record_rate_limit(redis, installation_id, res.headers)
+
+        # Cache hit, nothing new. It didn't count against the rate limit.
         if res.status_code == 304:
             log.info("github.sync_issue.etag_cache_hit", issue_id=issue.id)
+            await crawl_budget.refund(redis, installation_id)
+            issue.github_issue_fetched_at = utc_now()
+            session.add(issue)
             return
 
         if res.status_code == 200:
@@ -464,13 +477,33 @@ class GithubIssueService(IssueService):
                 ExternalOrganization.installation_id.is_not(None),
                 ExternalOrganization.id == organization.id,
             )
-            .order_by(asc(Issue.github_issue_fetched_at))
-            .limit(100)
         )
 
-        res = await session.execute(stmt)
+        # Reserve a share of the batch to the issues fetched the longest ago,
+        # so the issues of inactive repositories are still crawled.
+        res = await session.execute(
+            stmt.order_by(asc(Issue.github_issue_fetched_at).nulls_first()).limit(
+                CRAWL_STALEST_LIMIT
+            )
+        )
+        stalest = res.scalars().unique().all()
+
+        # Then, crawl the repositories with recent activity first,
+        # their issues are the most likely to have changed.
+        res = await session.execute(
+            stmt.where(Issue.id.not_in([issue.id for issue in stalest]))
+            .order_by(
+                func.greatest(
+                    Repository.repository_pushed_at, Repository.repository_modified_at
+                )
+                .desc()
+                .nulls_last(),
+                asc(Issue.github_issue_fetched_at).nulls_first(),
+            )
+            .limit(CRAWL_LIMIT - len(stalest))
+        )
 
-        return res.scalars().unique().all()
+        return [*stalest, *res.scalars().unique().all()]
 
     async def list_issues_to_add_badge_to_auto(
         self,
@@ -692,7 +725,7 @@ class GithubIssueService(IssueService):
         state: Literal["open", "closed", "all"] = "open",
         sort: Literal["created", "updated", "comments"] = "updated",
         direction: Literal["asc", "desc"] = "desc",
-        per_page: int = 30,
+        per_page: int = PAGE_SIZE,
         crawl_with_installation_id: int
         | None = None,  # Override which installation to use when crawling
     ) -> tuple[SyncedCount, ErrorCount]:
@@ -715,8 +748,23 @@ class GithubIssueService(IssueService):
 
         client = github.get_app_installation_client(installation_id, redis=redis)
 
+        # Each page counts against the crawl budget of the installation
+        async def list_for_repo(**kwargs: Any) -> Response[list[types.Issue]]:
+            await crawl_budget.acquire(redis, installation_id)
+            try:
+                response = await client.rest.issues.async_list_for_repo(**kwargs)
+            except RequestFailed as e:
+                await crawl_budget.record_rate_limit(
+                    redis, installation_id, e.response.headers
+                )
+                raise
+            await crawl_budget.record_rate_limit(
+                redis, installation_id, response.headers
+            )
+            return response
+
         paginator: Paginator[types.Issue] = client.paginate(
-            client.rest.issues.async_list_for_repo,
+            list_for_repo,
             owner=organization.name,
             repo=repository.name,
             state=state,
@@ -728,13 +776,14 @@ class GithubIssueService(IssueService):
             session,
             redis,
             paginator=paginator,
-            store_resource_method=github_issue.store,
+            store_resources_method=github_issue.store_many,
             organization=organization,
             repository=repository,
             skip_condition=skip_if_pr,
-            on_sync_signal=repository_issue_synced,
+            on_sync_signal=repository_issues_synced,
             on_completed_signal=repository_issues_sync_completed,
             resource_type="issue",
+            batch_size=per_page,
         )
         return (synced, errors)
 
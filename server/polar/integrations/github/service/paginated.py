@@ -1,7 +1,9 @@
 from __future__ import annotations
 
-from collections.abc import Callable, Coroutine
-from typing import Any, Literal
+import asyncio
+import contextlib
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Coroutine, Sequence
+from typing import Any, Literal, TypeVar
 
 import structlog
 from githubkit import Paginator
@@ -20,6 +22,51 @@ log = structlog.get_logger()
 SyncedCount = int
 ErrorCount = int
 
+PAGE_SIZE = 100
+"""Maximum page size allowed by GitHub's REST API."""
+
+T = TypeVar("T")
+
+
+async def iter_batches(
+    paginator: Paginator[T], batch_size: int = PAGE_SIZE
+) -> AsyncGenerator[list[T], None]:
+    """
+    Iterate a paginator by batches.
+
+    The items are read in a background task, so the next page is fetched
+    from GitHub while the current batch is being processed.
+    """
+    queue: asyncio.Queue[list[T] | BaseException | None] = asyncio.Queue(maxsize=1)
+
+    async def _produce() -> None:
+        try:
+            batch: list[T] = []
+            async for item in paginator:
+                batch.append(item)
+                if len(batch) == batch_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    producer = asyncio.create_task(_produce())
+    try:
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, BaseException):
+                raise batch
+            yield batch
+    finally:
+        producer.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await producer
+
 
 class GitHubPaginatedService:
     async def store_paginated_resource(
@@ -28,7 +75,7 @@ class GitHubPaginatedService:
         redis: Redis,
         *,
         paginator: Paginator[types.Issue] | Paginator[types.PullRequestSimple],
-        store_resource_method: Callable[..., Coroutine[Any, Any, Issue | None]],
+        store_resources_method: Callable[..., Coroutine[Any, Any, Sequence[Issue]]],
         organization: ExternalOrganization,
         repository: Repository,
         resource_type: Literal["issue", "pull_request"],
@@ -36,15 +83,26 @@ class GitHubPaginatedService:
         | None = None,
         on_sync_signal: Hook[SyncedHook] | None = None,
         on_completed_signal: Hook[SyncCompletedHook] | None = None,
+        batch_size: int = PAGE_SIZE,
     ) -> tuple[SyncedCount, ErrorCount]:
+        """
+        Store the resources of a paginator, batch by batch.
+
+        Each batch is upserted with a single statement, and signals are called
+        once per batch, while the next page is fetched from GitHub.
+        """
         synced, errors = 0, 0
-        async for data in paginator:
-            synced += 1
+        batches: AsyncIterator[list[types.Issue | types.PullRequestSimple]] = (
+            iter_batches(paginator, batch_size)  # type: ignore[arg-type]
+        )
+        async for batch in batches:
+            synced += len(batch)
 
-            if skip_condition and skip_condition(data):
+            data = [d for d in batch if not (skip_condition and skip_condition(d))]
+            if not data:
                 continue
 
-            record = await store_resource_method(
+            records = await store_resources_method(
                 session,
                 redis,
                 data=data,
@@ -52,29 +110,31 @@ class GitHubPaginatedService:
                 repository=repository,
             )
 
-            if not record:
-                log.warning(
-                    f"{resource_type}.sync.failed",
-                    error="save was unsuccessful",
-                    received=data.model_dump(mode="json"),
-                )
-                errors += 1
-                continue
+            if len(records) < len(data):
+                stored_ids = {record.external_id for record in records}
+                for d in data:
+                    if d.id in stored_ids:
+                        continue
+                    log.warning(
+                        f"{resource_type}.sync.failed",
+                        error="save was unsuccessful",
+                        received=d.model_dump(mode="json"),
+                    )
+                    errors += 1
 
             log.debug(
                 f"{resource_type}.synced",
                 organization_id=organization.id,
                 repository_id=repository.id,
-                id=record.id,
-                title=record.title,
+                count=len(records),
             )
 
-            if on_sync_signal:
+            if on_sync_signal and records:
                 await on_sync_signal.call(
                     SyncedHook(
                         repository=repository,
                         organization=organization,
-                        record=record,
+                        records=records,
                         synced=synced,
                         redis=redis,
                     )
@@ -3,7 +3,6 @@ from uuid import UUID
 
 import structlog
 
-from polar.integrations.github.client import get_app_installation_client
 from polar.worker import (
     AsyncSessionMaker,
     CronTrigger,
@@ -15,7 +14,7 @@ from polar.worker import (
     task,
 )
 
-from ..service.api import github_api
+from .. import crawl_budget
 from ..service.issue import github_issue
 from ..service.organization import github_organization as github_organization_service
 from .utils import get_external_organization_and_repo, github_rate_limit_retry
@@ -76,24 +75,16 @@ async def cron_refresh_issues(ctx: JobContext) -> None:
                 )
                 continue
 
-            client = get_app_installation_client(
-                org.safe_installation_id, redis=get_worker_redis(ctx)
+            # The crawl budget is shared with the `github.issue.sync` jobs,
+            # which check it before each request.
+            paused_for = await crawl_budget.get_paused_for(
+                get_worker_redis(ctx), org.safe_installation_id
             )
-            try:
-                rate_limit = await github_api.get_rate_limit(client)
-            except Exception as e:
-                log.info(
-                    "failed to get rate limit, treating it as no remaining",
-                    org_name=org.name,
-                    err=e,
-                )
-                continue
-
-            if rate_limit.remaining < 1000:
+            if paused_for > 0:
                 log.info(
                     "github.issue.sync.cron_refresh_issues.rate_limit_almost_exhausted",
                     org_name=org.name,
-                    rate_limit_remaining=rate_limit.remaining,
+                    paused_for=paused_for,
                 )
                 continue
 
@@ -101,7 +92,6 @@ async def cron_refresh_issues(ctx: JobContext) -> None:
                 "github.issue.sync.cron_refresh_issues",
                 org_name=org.name,
                 found_count=len(issues),
-                rate_limit_remaining=rate_limit.remaining,
             )
 
             for issue in issues:
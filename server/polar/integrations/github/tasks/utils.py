@@ -8,6 +8,7 @@ from arq import Retry
 from githubkit.exception import RateLimitExceeded
 
 from polar.integrations.github import service
+from polar.integrations.github.crawl_budget import CrawlBudgetExhausted
 from polar.models import ExternalOrganization, Repository
 from polar.postgres import AsyncSession
 
@@ -52,5 +53,7 @@ def github_rate_limit_retry(
             return await func(*args, **kwargs)
         except RateLimitExceeded as e:
             raise Retry(e.retry_after)
+        except CrawlBudgetExhausted as e:
+            raise Retry(e.retry_after)
 
     return wrapper
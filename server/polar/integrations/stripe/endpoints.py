@@ -4,9 +4,12 @@ from fastapi import Depends, HTTPException, Query, Request
 from starlette.responses import RedirectResponse
 
 from polar.config import settings
+from polar.postgres import AsyncSession, get_db_session
 from polar.routing import APIRouter
 from polar.worker import enqueue_job
 
+from .service_event import stripe_event as stripe_event_service
+
 log = structlog.get_logger()
 
 stripe.api_key = settings.STRIPE_SECRET_KEY
@@ -31,10 +34,15 @@ DIRECT_IMPLEMENTED_WEBHOOKS = {
 CONNECT_IMPLEMENTED_WEBHOOKS = {"account.updated", "payout.paid"}
 
 
-async def enqueue(event: stripe.Event) -> None:
+async def enqueue(session: AsyncSession, event: stripe.Event) -> None:
+    stripe_event = await stripe_event_service.create(session, event)
+    if stripe_event is None:
+        log.info("stripe.webhook.duplicate", event_id=event.id)
+        return
+
     event_type: str = event["type"]
     task_name = f"stripe.webhook.{event_type}"
-    enqueue_job(task_name, event)
+    enqueue_job(task_name, stripe_event.id)
     log.info("stripe.webhook.queued", task_name=task_name)
 
 
@@ -66,9 +74,10 @@ class WebhookEventGetter:
 @router.post("/webhook", status_code=202, name="integrations.stripe.webhook")
 async def webhook(
     event: stripe.Event = Depends(WebhookEventGetter(settings.STRIPE_WEBHOOK_SECRET)),
+    session: AsyncSession = Depends(get_db_session),
 ) -> None:
     if event["type"] in DIRECT_IMPLEMENTED_WEBHOOKS:
-        await enqueue(event)
+        await enqueue(session, event)
 
 
 @router.post(
@@ -78,6 +87,7 @@ async def webhook_connect(
     event: stripe.Event = Depends(
         WebhookEventGetter(settings.STRIPE_CONNECT_WEBHOOK_SECRET)
     ),
+    session: AsyncSession = Depends(get_db_session),
 ) -> None:
     if event["type"] in CONNECT_IMPLEMENTED_WEBHOOKS:
-        return await enqueue(event)
+        return await enqueue(session, event)
@@ -0,0 +1,192 @@
+import contextlib
+import json
+import uuid
+from collections.abc import AsyncIterator
+from datetime import UTC, datetime, timedelta
+
+import stripe as stripe_lib
+import structlog
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+from polar.kit.utils import generate_uuid, utc_now
+from polar.logging import Logger
+from polar.models import StripeEvent
+from polar.postgres import AsyncSession
+
+log: Logger = structlog.get_logger()
+
+SNAPSHOT_EVENT_TYPES = {
+    "account.updated",
+    "customer.subscription.updated",
+    "customer.subscription.deleted",
+}
+"""
+Events carrying the full state of their object.
+
+Only the latest one matters, so older ones received after it are skipped.
+"""
+
+RETENTION_PERIOD = timedelta(days=30)
+"""
+How long processed events are kept.
+
+Stripe stops retrying deliveries after three days, so retries of deleted events
+are never received, and neither are older snapshots than the deleted ones.
+"""
+DELETE_BATCH_SIZE = 1000
+
+
+class StripeEventService:
+    async def create(
+        self, session: AsyncSession, event: stripe_lib.Event
+    ) -> StripeEvent | None:
+        """
+        Store a received event.
+
+        Returns:
+            The stored event, or `None` if it was already received,
+            e.g. because Stripe retried the delivery.
+        """
+        data = json.loads(str(event))
+        statement = (
+            insert(StripeEvent)
+            .values(
+                id=generate_uuid(),
+                created_at=utc_now(),
+                stripe_id=event.id,
+                type=event.type,
+                object_id=data["data"]["object"].get("id"),
+                stripe_created_at=datetime.fromtimestamp(event.created, UTC),
+                data=data,
+            )
+            .on_conflict_do_nothing(index_elements=[StripeEvent.stripe_id])
+            .returning(StripeEvent)
+        )
+        result = await session.execute(statement)
+        return result.scalar_one_or_none()
+
+    async def get_or_create_id(
+        self, session: AsyncSession, event: stripe_lib.Event
+    ) -> uuid.UUID:
+        """Store a received event if it's not already, and return its ID."""
+        stripe_event = await self.create(session, event)
+        if stripe_event is not None:
+            return stripe_event.id
+        result = await session.execute(
+            select(StripeEvent.id).where(StripeEvent.stripe_id == event.id)
+        )
+        return result.scalar_one()
+
+    @contextlib.asynccontextmanager
+    async def lock_for_processing(
+        self, session: AsyncSession, engine: AsyncEngine, id: uuid.UUID
+    ) -> AsyncIterator[stripe_lib.Event | None]:
+        """
+        Get a stored event to process it.
+
+        Events of the same object are processed one at a time: a lock is held
+        on a dedicated connection until the context exits, so it survives
+        handlers committing along the way. The session is committed before
+        the lock is released, so the next worker sees the event as processed.
+
+        Yields:
+            The event, or `None` if it should be skipped because it was already
+            processed, or because a more recent snapshot of its object was.
+        """
+        stripe_event = await session.get(StripeEvent, id)
+        if stripe_event is None:
+            log.warning("stripe.event.not_found", id=id)
+            yield None
+            return
+
+        if stripe_event.object_id is None:
+            yield await self._get_processable_event(session, stripe_event)
+            return
+
+        lock_key = func.hashtext(f"stripe_event:{stripe_event.object_id}")
+        async with engine.connect() as connection:
+            connection = await connection.execution_options(
+                isolation_level="AUTOCOMMIT"
+            )
+            await connection.execute(select(func.pg_advisory_lock(lock_key)))
+            try:
+                # Another worker might have processed it while we waited for the lock
+                await session.refresh(stripe_event, {"processed_at"})
+                yield await self._get_processable_event(session, stripe_event)
+                await session.commit()
+            finally:
+                await connection.execute(select(func.pg_advisory_unlock(lock_key)))
+
+    async def mark_processed(self, session: AsyncSession, id: uuid.UUID) -> None:
+        statement = (
+            update(StripeEvent)
+            .where(StripeEvent.id == id)
+            .values(processed_at=utc_now())
+        )
+        await session.execute(statement)
+
+    async def delete_processed(self, session: AsyncSession) -> int:
+        """
+        Delete events processed before the retention period.
+
+        Rows are deleted in batches, each one committed,
+        so a large backlog doesn't hold locks for long.
+
+        Returns:
+            The number of deleted events.
+        """
+        processed_before = utc_now() - RETENTION_PERIOD
+        deleted = 0
+        while True:
+            statement = (
+                delete(StripeEvent)
+                .where(
+                    StripeEvent.id.in_(
+                        select(StripeEvent.id)
+                        .where(StripeEvent.processed_at < processed_before)
+                        .limit(DELETE_BATCH_SIZE)
+                    )
+                )
+                .returning(StripeEvent.id)
+            )
+            result = await session.execute(statement)
+            batch_deleted = len(result.all())
+            await session.commit()
+            deleted += batch_deleted
+            if batch_deleted < DELETE_BATCH_SIZE:
+                return deleted
+
+    async def _get_processable_event(
+        self, session: AsyncSession, stripe_event: StripeEvent
+    ) -> stripe_lib.Event | None:
+        if stripe_event.processed_at is not None:
+            log.info("stripe.event.already_processed", stripe_id=stripe_event.stripe_id)
+            return None
+
+        if stripe_event.type in SNAPSHOT_EVENT_TYPES and await self._is_stale(
+            session, stripe_event
+        ):
+            log.info("stripe.event.stale", stripe_id=stripe_event.stripe_id)
+            await self.mark_processed(session, stripe_event.id)
+            return None
+
+        return stripe_lib.Event.construct_from(stripe_event.data, None)
+
+    async def _is_stale(self, session: AsyncSession, stripe_event: StripeEvent) -> bool:
+        statement = select(
+            select(StripeEvent.id)
+            .where(
+                StripeEvent.object_id == stripe_event.object_id,
+                StripeEvent.type.in_(SNAPSHOT_EVENT_TYPES),
+                StripeEvent.stripe_created_at > stripe_event.stripe_created_at,
+                StripeEvent.processed_at.is_not(None),
+            )
+            .exists()
+        )
+        result = await session.execute(statement)
+        return result.scalar_one()
+
+
+stripe_event = StripeEventService()
@@ -1,7 +1,7 @@
 import functools
 import uuid
 from collections.abc import Awaitable, Callable
-from typing import Any, ParamSpec, TypeVar, cast
+from typing import ParamSpec, TypeVar, cast
 
 import stripe
 import stripe as stripe_lib
@@ -19,6 +19,7 @@ from polar.order.service import (
 )
 from polar.order.service import order as order_service
 from polar.pledge.service import pledge as pledge_service
+from polar.postgres import AsyncSession
 from polar.subscription.service import SubscriptionDoesNotExist
 from polar.subscription.service import subscription as subscription_service
 from polar.transaction.service.balance import PaymentTransactionForChargeDoesNotExist
@@ -42,13 +43,17 @@ from polar.transaction.service.refund import (
 )
 from polar.worker import (
     AsyncSessionMaker,
+    CronTrigger,
     JobContext,
     PolarWorkerContext,
+    QueueName,
     compute_backoff,
+    get_worker_redis,
     task,
 )
 
 from .service import stripe as stripe_service
+from .service_event import stripe_event as stripe_event_service
 
 log: Logger = structlog.get_logger()
 
@@ -76,6 +81,44 @@ def stripe_api_connection_error_retry(
     return wrapper
 
 
+def stripe_event_task(
+    func: Callable[
+        [JobContext, AsyncSession, stripe.Event, PolarWorkerContext], Awaitable[None]
+    ],
+) -> Callable[
+    [JobContext, uuid.UUID | stripe.Event, PolarWorkerContext], Awaitable[None]
+]:
+    """
+    Load the stored event and process it once.
+
+    Events of the same object are processed one at a time, and the event is marked
+    as processed before the next one of its object is handled.
+    """
+
+    @functools.wraps(func)
+    async def wrapper(
+        ctx: JobContext,
+        event_id: uuid.UUID | stripe.Event,
+        polar_context: PolarWorkerContext,
+    ) -> None:
+        async with AsyncSessionMaker(ctx) as session:
+            # Jobs enqueued before events were stored carry the event itself
+            if isinstance(event_id, stripe.Event):
+                event_id = await stripe_event_service.get_or_create_id(
+                    session, event_id
+                )
+
+            async with stripe_event_service.lock_for_processing(
+                session, ctx["async_engine"], event_id
+            ) as event:
+                if event is None:
+                    return
+                await func(ctx, session, event, polar_context)
+                await stripe_event_service.mark_processed(session, event_id)
+
+    return wrapper
+
+
 class StripeTaskError(PolarTaskError): ...
 
 
@@ -91,287 +134,313 @@ class UnsetAccountOnPayoutEvent(StripeTaskError):
 
 @task("stripe.webhook.account.updated")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def account_updated(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            stripe_account: stripe.Account = event["data"]["object"]
-            await account_service.update_account_from_stripe(
-                session, stripe_account=stripe_account
-            )
+        stripe_account: stripe.Account = event["data"]["object"]
+        await account_service.update_account_from_stripe(
+            session, stripe_account=stripe_account
+        )
 
 
-@task("stripe.webhook.payment_intent.succeeded")
+@task("stripe.webhook.payment_intent.succeeded", queue_name=QueueName.critical)
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def payment_intent_succeeded(
     ctx: JobContext,
-    event: dict[str, Any],
+    session: AsyncSession,
+    event: stripe.Event,
     polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            payment_intent = event["data"]["object"]
-            payload = PaymentIntentSuccessWebhook.model_validate(payment_intent)
-            metadata = payment_intent.get("metadata", {})
-
-            # Payment for Polar Checkout Session
-            if (
-                metadata.get("type") == ProductType.product
-                and (checkout_id := metadata.get("checkout_id")) is not None
-            ):
-                await checkout_service.handle_stripe_success(
-                    session, uuid.UUID(checkout_id), payment_intent
-                )
-                return
+        payment_intent = event["data"]["object"]
+        payload = PaymentIntentSuccessWebhook.model_validate(payment_intent)
+        metadata = payment_intent.get("metadata", {})
+
+        # Payment for Polar Checkout Session
+        if (
+            metadata.get("type") == ProductType.product
+            and (checkout_id := metadata.get("checkout_id")) is not None
+        ):
+            await checkout_service.handle_stripe_success(
+                session, get_worker_redis(ctx), uuid.UUID(checkout_id), payment_intent
+            )
+            return
 
-            # Check if there is a Stripe Checkout Session related,
-            # meaning it's a product or subscription purchase
-            checkout_session = (
-                await stripe_service.get_checkout_session_by_payment_intent(payload.id)
+        # Check if there is a Stripe Checkout Session related,
+        # meaning it's a product or subscription purchase
+        checkout_session = await stripe_service.get_checkout_session_by_payment_intent(
+            payload.id
+        )
+        if (
+            checkout_session is not None
+            and checkout_session.metadata is not None
+            and checkout_session.metadata.get("type") == ProductType.product
+        ):
+            return
+
+        # payments for pay_upfront (pi has metadata)
+        if metadata.get("type") == ProductType.pledge:
+            await pledge_service.handle_payment_intent_success(
+                session=session,
+                payload=payload,
             )
-            if (
-                checkout_session is not None
-                and checkout_session.metadata is not None
-                and checkout_session.metadata.get("type") == ProductType.product
-            ):
-                return
-
-            # payments for pay_upfront (pi has metadata)
-            if metadata.get("type") == ProductType.pledge:
+            return
+
+        # payment for pay_on_completion
+        # metadata is on the invoice, not the payment_intent
+        if payload.invoice:
+            invoice = await stripe_service.get_invoice(payload.invoice)
+            if invoice.metadata and invoice.metadata.get("type") == ProductType.pledge:
                 await pledge_service.handle_payment_intent_success(
                     session=session,
                     payload=payload,
                 )
-                return
-
-            # payment for pay_on_completion
-            # metadata is on the invoice, not the payment_intent
-            if payload.invoice:
-                invoice = await stripe_service.get_invoice(payload.invoice)
-                if (
-                    invoice.metadata
-                    and invoice.metadata.get("type") == ProductType.pledge
-                ):
-                    await pledge_service.handle_payment_intent_success(
-                        session=session,
-                        payload=payload,
-                    )
-                return
-
-            log.error(
-                "stripe.webhook.payment_intent.succeeded.not_handled",
-                pi=payload.id,
-            )
+            return
+
+        log.error(
+            "stripe.webhook.payment_intent.succeeded.not_handled",
+            pi=payload.id,
+        )
 
 
 @task("stripe.webhook.payment_intent.payment_failed")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def payment_intent_payment_failed(
     ctx: JobContext,
-    event: dict[str, Any],
+    session: AsyncSession,
+    event: stripe.Event,
     polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            payment_intent = event["data"]["object"]
-            metadata = payment_intent.metadata or {}
-
-            # Payment for Polar Checkout Session
-            if (
-                metadata.get("type") == ProductType.product
-                and (checkout_id := metadata.get("checkout_id")) is not None
-            ):
-                await checkout_service.handle_stripe_failure(
-                    session, uuid.UUID(checkout_id), payment_intent
-                )
+        payment_intent = event["data"]["object"]
+        metadata = payment_intent.metadata or {}
+
+        # Payment for Polar Checkout Session
+        if (
+            metadata.get("type") == ProductType.product
+            and (checkout_id := metadata.get("checkout_id")) is not None
+        ):
+            await checkout_service.handle_stripe_failure(
+                session, get_worker_redis(ctx), uuid.UUID(checkout_id), payment_intent
+            )
 
 
 @task("stripe.webhook.charge.succeeded")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def charge_succeeded(
     ctx: JobContext,
-    event: dict[str, Any],  # stripe.Event
+    session: AsyncSession,
+    event: stripe.Event,
     polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            charge = event["data"]["object"]
-            try:
-                await payment_transaction_service.create_payment(
-                    session=session, charge=charge
-                )
-            except PaymentTransactionPledgeDoesNotExist as e:
-                # Retry because we might not have been able to handle other events
-                # triggering the creation of Pledge and Subscription
-                if ctx["job_try"] <= MAX_RETRIES:
-                    raise Retry(compute_backoff(ctx["job_try"])) from e
-                else:
-                    raise
+        charge = event["data"]["object"]
+        try:
+            await payment_transaction_service.create_payment(
+                session=session, charge=charge
+            )
+        except PaymentTransactionPledgeDoesNotExist as e:
+            # Retry because we might not have been able to handle other events
+            # triggering the creation of Pledge and Subscription
+            if ctx["job_try"] <= MAX_RETRIES:
+                raise Retry(compute_backoff(ctx["job_try"])) from e
+            else:
+                raise
 
 
 @task("stripe.webhook.charge.refunded")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def charge_refunded(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            charge = event["data"]["object"]
+        charge = event["data"]["object"]
 
-            await refund_transaction_service.create_refunds(session, charge=charge)
+        await refund_transaction_service.create_refunds(session, charge=charge)
 
-            if charge.metadata.get("type") == ProductType.pledge:
-                await pledge_service.refund_by_payment_id(
-                    session=session,
-                    payment_id=charge["payment_intent"],
-                    amount=charge["amount_refunded"],
-                    transaction_id=charge["id"],
-                )
+        if charge.metadata.get("type") == ProductType.pledge:
+            await pledge_service.refund_by_payment_id(
+                session=session,
+                payment_id=charge["payment_intent"],
+                amount=charge["amount_refunded"],
+                transaction_id=charge["id"],
+            )
 
 
 @task("stripe.webhook.charge.dispute.created")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def charge_dispute_created(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            dispute = event["data"]["object"]
+        dispute = event["data"]["object"]
 
-            try:
-                await dispute_transaction_service.create_dispute(
-                    session, dispute=dispute
-                )
-            except DisputeUnknownPaymentTransaction as e:
-                # Retry because Stripe webhooks order is not guaranteed,
-                # so we might not have been able to handle charge.succeeded yet!
-                if ctx["job_try"] <= MAX_RETRIES:
-                    raise Retry(compute_backoff(ctx["job_try"])) from e
-                else:
-                    raise
-
-            charge = await stripe_service.get_charge(dispute.charge)
-            if charge.metadata.get("type") == ProductType.pledge:
-                await pledge_service.mark_charge_disputed_by_payment_id(
-                    session=session,
-                    payment_id=dispute["payment_intent"],
-                    amount=dispute["amount"],
-                    transaction_id=dispute["id"],
-                )
+        try:
+            await dispute_transaction_service.create_dispute(session, dispute=dispute)
+        except DisputeUnknownPaymentTransaction as e:
+            # Retry because Stripe webhooks order is not guaranteed,
+            # so we might not have been able to handle charge.succeeded yet!
+            if ctx["job_try"] <= MAX_RETRIES:
+                raise Retry(compute_backoff(ctx["job_try"])) from e
+            else:
+                raise
+
+        charge = await stripe_service.get_charge(dispute.charge)
+        if charge.metadata.get("type") == ProductType.pledge:
+            await pledge_service.mark_charge_disputed_by_payment_id(
+                session=session,
+                payment_id=dispute["payment_intent"],
+                amount=dispute["amount"],
+                transaction_id=dispute["id"],
+            )
 
 
 @task("stripe.webhook.charge.dispute.funds_reinstated")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def charge_dispute_funds_reinstated(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            dispute = event["data"]["object"]
+        dispute = event["data"]["object"]
 
-            await dispute_transaction_service.create_dispute_reversal(
-                session, dispute=dispute
-            )
+        await dispute_transaction_service.create_dispute_reversal(
+            session, dispute=dispute
+        )
 
 
 @task("stripe.webhook.customer.subscription.created")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def customer_subscription_created(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            subscription = stripe.Subscription.construct_from(
-                event["data"]["object"], None
-            )
-            await subscription_service.create_subscription_from_stripe(
-                session, stripe_subscription=subscription
-            )
+        subscription = stripe.Subscription.construct_from(event["data"]["object"], None)
+        await subscription_service.create_subscription_from_stripe(
+            session, stripe_subscription=subscription
+        )
 
 
 @task("stripe.webhook.customer.subscription.updated")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def customer_subscription_updated(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            subscription = stripe.Subscription.construct_from(
-                event["data"]["object"], None
+        subscription = stripe.Subscription.construct_from(event["data"]["object"], None)
+        try:
+            await subscription_service.update_subscription_from_stripe(
+                session, stripe_subscription=subscription
             )
-            try:
-                await subscription_service.update_subscription_from_stripe(
-                    session, stripe_subscription=subscription
-                )
-            except SubscriptionDoesNotExist as e:
-                # Retry because Stripe webhooks order is not guaranteed,
-                # so we might not have been able to handle subscription.created yet!
-                if ctx["job_try"] <= MAX_RETRIES:
-                    raise Retry(compute_backoff(ctx["job_try"])) from e
-                else:
-                    raise
+        except SubscriptionDoesNotExist as e:
+            # Retry because Stripe webhooks order is not guaranteed,
+            # so we might not have been able to handle subscription.created yet!
+            if ctx["job_try"] <= MAX_RETRIES:
+                raise Retry(compute_backoff(ctx["job_try"])) from e
+            else:
+                raise
 
 
 @task("stripe.webhook.customer.subscription.deleted")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def customer_subscription_deleted(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            subscription = stripe.Subscription.construct_from(
-                event["data"]["object"], None
+        subscription = stripe.Subscription.construct_from(event["data"]["object"], None)
+        try:
+            await subscription_service.update_subscription_from_stripe(
+                session, stripe_subscription=subscription
             )
-            try:
-                await subscription_service.update_subscription_from_stripe(
-                    session, stripe_subscription=subscription
-                )
-            except SubscriptionDoesNotExist as e:
-                # Retry because Stripe webhooks order is not guaranteed,
-                # so we might not have been able to handle subscription.created yet!
-                if ctx["job_try"] <= MAX_RETRIES:
-                    raise Retry(compute_backoff(ctx["job_try"])) from e
-                else:
-                    raise
+        except SubscriptionDoesNotExist as e:
+            # Retry because Stripe webhooks order is not guaranteed,
+            # so we might not have been able to handle subscription.created yet!
+            if ctx["job_try"] <= MAX_RETRIES:
+                raise Retry(compute_backoff(ctx["job_try"])) from e
+            else:
+                raise
 
 
 @task("stripe.webhook.invoice.paid")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def invoice_paid(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            invoice = stripe.Invoice.construct_from(event["data"]["object"], None)
-            try:
-                await order_service.create_order_from_stripe(session, invoice=invoice)
-            except (
-                OrderSubscriptionDoesNotExist,
-                PaymentTransactionForChargeDoesNotExist,
-            ) as e:
-                # Retry because Stripe webhooks order is not guaranteed,
-                # so we might not have been able to handle subscription.created
-                # or charge.succeeded yet!
-                if ctx["job_try"] <= MAX_RETRIES:
-                    raise Retry(compute_backoff(ctx["job_try"])) from e
-                else:
-                    raise
-            except NotAnOrderInvoice:
-                # Ignore invoices that are not for orders (e.g. for pledges)
-                return
+        invoice = stripe.Invoice.construct_from(event["data"]["object"], None)
+        try:
+            await order_service.create_order_from_stripe(session, invoice=invoice)
+        except (
+            OrderSubscriptionDoesNotExist,
+            PaymentTransactionForChargeDoesNotExist,
+        ) as e:
+            # Retry because Stripe webhooks order is not guaranteed,
+            # so we might not have been able to handle subscription.created
+            # or charge.succeeded yet!
+            if ctx["job_try"] <= MAX_RETRIES:
+                raise Retry(compute_backoff(ctx["job_try"])) from e
+            else:
+                raise
+        except NotAnOrderInvoice:
+            # Ignore invoices that are not for orders (e.g. for pledges)
+            return
 
 
 @task("stripe.webhook.payout.paid")
 @stripe_api_connection_error_retry
+@stripe_event_task
 async def payout_paid(
-    ctx: JobContext, event: stripe.Event, polar_context: PolarWorkerContext
+    ctx: JobContext,
+    session: AsyncSession,
+    event: stripe.Event,
+    polar_context: PolarWorkerContext,
 ) -> None:
     if event.account is None:
         raise UnsetAccountOnPayoutEvent(event.id)
     with polar_context.to_execution_context():
-        async with AsyncSessionMaker(ctx) as session:
-            payout = event["data"]["object"]
-            await payout_transaction_service.create_payout_from_stripe(
-                session, payout=payout, stripe_account_id=event.account
-            )
+        payout = event["data"]["object"]
+        await payout_transaction_service.create_payout_from_stripe(
+            session, payout=payout, stripe_account_id=event.account
+        )
+
+
+@task("stripe.event.delete_processed", cron_trigger=CronTrigger(hour=3, minute=0))
+async def stripe_event_delete_processed(ctx: JobContext) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        deleted = await stripe_event_service.delete_processed(session)
+        log.info("stripe.event.deleted_processed", deleted=deleted)
@@ -202,10 +202,12 @@ async def for_you(
     )
 
     # get loaded
-    issues = [
-        i for i in [await issue_service.get_loaded(session, i.id) for i in issues] if i
+    loaded_issues = await issue_service.get_loaded_many(session, [i.id for i in issues])
+    items = [
+        IssueSchema.model_validate(loaded_issues[i.id])
+        for i in issues
+        if i.id in loaded_issues
     ]
-    items = [IssueSchema.model_validate(i) for i in issues]
 
     # sort
     items.sort(
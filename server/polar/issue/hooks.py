@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from dataclasses import dataclass
 
 from polar.kit.hook import Hook
@@ -7,10 +8,10 @@ from polar.redis import Redis
 
 
 @dataclass
-class IssueHook:
+class IssuesHook:
     session: AsyncSession
     redis: Redis
-    issue: Issue
+    issues: Sequence[Issue]
 
 
-issue_upserted: Hook[IssueHook] = Hook()
+issues_upserted: Hook[IssuesHook] = Hook()
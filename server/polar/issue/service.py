@@ -179,6 +179,24 @@ class IssueService(ResourceService[Issue, IssueCreate, IssueUpdate]):
         res = await session.execute(statement)
         return res.scalars().unique().one_or_none()
 
+    async def get_loaded_many(
+        self,
+        session: AsyncSession,
+        ids: Sequence[UUID],
+    ) -> dict[UUID, Issue]:
+        statement = (
+            sql.select(Issue)
+            .where(Issue.id.in_(ids))
+            .where(Issue.deleted_at.is_(None))
+            .options(
+                joinedload(Issue.repository)
+                .joinedload(Repository.organization)
+                .joinedload(ExternalOrganization.organization),
+            )
+        )
+        res = await session.execute(statement)
+        return {issue.id: issue for issue in res.scalars().unique().all()}
+
     async def get_by_platform(
         self, session: AsyncSession, platform: Platforms, external_id: int
     ) -> Issue | None:
@@ -521,6 +539,21 @@ class IssueService(ResourceService[Issue, IssueCreate, IssueUpdate]):
 
         return True
 
+    async def mark_not_needs_confirmation_many(
+        self, session: AsyncSession, issue_ids: Sequence[UUID]
+    ) -> None:
+        if not issue_ids:
+            return
+
+        stmt = (
+            sql.update(Issue)
+            .where(Issue.id.in_(issue_ids), Issue.confirmed_solved_at.is_(None))
+            .values(needs_confirmation_solved=False)
+        )
+
+        await session.execute(stmt)
+        await session.commit()
+
     async def transfer(
         self, session: AsyncSession, old_issue: Issue, new_issue: Issue
     ) -> Issue:
@@ -1,13 +1,22 @@
 import collections
 import csv
-from collections.abc import Iterable
+import zlib
+from collections.abc import AsyncIterable, AsyncIterator, Callable, Iterable, Sequence
 from typing import TYPE_CHECKING, Any, BinaryIO
 
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import Row, Select
+
 if TYPE_CHECKING:
     import _csv
 
+from .db.postgres import AsyncSessionMaker
 from .email import EmailNotValidError, validate_email
 
+EXPORT_BATCH_SIZE = 1000
+"""Number of rows fetched from the database cursor and sent in a single chunk."""
+
 
 def get_iterable_from_binary_io(file: BinaryIO) -> Iterable[str]:
     for line in file:
@@ -82,8 +91,80 @@ class IterableCSVWriter:
         self.writer.writerow(row)
         return self.read()
 
+    def getrows(self, rows: Iterable[Iterable[Any]]) -> str:
+        self.writer.writerows(rows)
+        return "".join(self._drain())
+
     def write(self, line: str) -> None:
         self._lines.append(line)
 
     def read(self) -> str:
         return self._lines.popleft()
+
+    def _drain(self) -> Iterable[str]:
+        while self._lines:
+            yield self._lines.popleft()
+
+
+async def stream_csv(
+    sessionmaker: AsyncSessionMaker,
+    statement: Select[Any],
+    header: Sequence[str],
+    get_row: Callable[[Row[Any]], Iterable[Any]],
+    *,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    compress: bool = False,
+) -> AsyncIterator[bytes]:
+    """
+    Generate a CSV export of a statement, without loading all its rows in memory.
+
+    Rows are read from a server-side cursor, `batch_size` at a time,
+    and each batch is sent as a single chunk.
+
+    StreamingResponse exhausts the iterator in its own task, after the session
+    of the FastAPI dependency is closed, so we open a new one from `sessionmaker`.
+
+    Args:
+        sessionmaker: The session maker to open the export session.
+        statement: The statement to export. Select only the columns you need,
+        so we don't build ORM objects for each row.
+        header: The CSV header.
+        get_row: A function transforming a result row into a CSV row.
+        batch_size: The number of rows fetched and written at once.
+        compress: Whether to compress the output with gzip.
+    """
+    csv_writer = IterableCSVWriter(dialect="excel")
+    # wbits=31 produces a gzip container instead of a raw zlib stream
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(content: str) -> bytes:
+        data = content.encode("utf-8")
+        return compressor.compress(data) if compressor is not None else data
+
+    yield encode(csv_writer.getrow(header))
+
+    async with sessionmaker() as session:
+        result = await session.stream(statement.execution_options(yield_per=batch_size))
+        async for rows in result.partitions():
+            if chunk := encode(csv_writer.getrows(get_row(row) for row in rows)):
+                yield chunk
+
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def accepts_gzip(request: Request) -> bool:
+    accept_encoding = request.headers.get("accept-encoding", "")
+    return "gzip" in accept_encoding.lower()
+
+
+class CSVStreamingResponse(StreamingResponse):
+    """Send a CSV file generated by `stream_csv` as an attachment."""
+
+    def __init__(
+        self, content: AsyncIterable[bytes], filename: str, *, compressed: bool = False
+    ) -> None:
+        headers = {"Content-Disposition": f"attachment; filename={filename}"}
+        if compressed:
+            headers["Content-Encoding"] = "gzip"
+        super().__init__(content, media_type="text/csv", headers=headers)
@@ -0,0 +1,61 @@
+from collections.abc import Awaitable, Callable, Hashable, Iterable, Mapping, Sequence
+from typing import Generic, TypeVar
+
+K = TypeVar("K", bound=Hashable)
+V = TypeVar("V")
+
+BatchLoadFunc = Callable[[Sequence[K]], Awaitable[Mapping[K, V]]]
+
+
+class Loader(Generic[K, V]):
+    """
+    Batch and memoize the loading of entities by key.
+
+    Keys are collected with `prime`, then loaded all at once with a single call
+    to the batch function the first time one of them is requested.
+    Results, including missing entities, are memoized for the lifetime
+    of the loader, which is meant to be a single request.
+
+    Since a database session can't run concurrent queries, batching is explicit:
+    prime the keys of a whole list before loading its items one by one.
+
+    Example:
+        loader = Loader(functools.partial(service.get_many, session))
+        loader.prime(item.parent_id for item in items)
+        for item in items:
+            parent = await loader.load(item.parent_id)
+    """
+
+    def __init__(self, batch_load: BatchLoadFunc[K, V]) -> None:
+        self._batch_load = batch_load
+        self._cache: dict[K, V | None] = {}
+        self._pending: dict[K, None] = {}
+
+    def prime(self, keys: Iterable[K]) -> None:
+        """Schedule keys to be loaded with the next batch."""
+        for key in keys:
+            if key not in self._cache:
+                self._pending[key] = None
+
+    async def load(self, key: K) -> V | None:
+        if key not in self._cache:
+            self._pending[key] = None
+            await self._dispatch()
+        return self._cache[key]
+
+    async def load_many(self, keys: Iterable[K]) -> list[V | None]:
+        keys = list(keys)
+        self.prime(keys)
+        if self._pending:
+            await self._dispatch()
+        return [self._cache[key] for key in keys]
+
+    async def _dispatch(self) -> None:
+        keys = list(self._pending)
+        self._pending.clear()
+        values = await self._batch_load(keys)
+        for key in keys:
+            self._cache[key] = values.get(key)
+
+
+__all__ = ["Loader"]
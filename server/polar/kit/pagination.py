@@ -1,15 +1,25 @@
+import base64
+import binascii
+import hashlib
+import json
 import math
+import uuid
 from collections.abc import Sequence
+from datetime import date, datetime
+from decimal import Decimal
 from typing import Annotated, Any, Generic, NamedTuple, Self, TypeVar, overload
 
 from fastapi import Depends, Query
 from pydantic import BaseModel, GetCoreSchemaHandler
 from pydantic._internal._repr import display_as_type
 from pydantic_core import CoreSchema
-from sqlalchemy import Select, func, over
+from sqlalchemy import ColumnElement, Select, and_, false, func, or_, over
+from sqlalchemy.sql import operators
 from sqlalchemy.sql._typing import _ColumnsClauseArgument
+from sqlalchemy.sql.elements import UnaryExpression
 
 from polar.config import settings
+from polar.exceptions import PolarRequestValidationError
 from polar.kit.db.models import RecordModel
 from polar.kit.db.models.base import Model
 from polar.kit.db.postgres import AsyncSession
@@ -20,9 +30,183 @@ RM = TypeVar("RM", bound=RecordModel)
 M = TypeVar("M", bound=Model)
 
 
+class PaginationCursor:
+    """
+    Keyset cursor of a paginated request.
+
+    `current` is the cursor sent by the client, if any. `next` is set by
+    `paginate` to the cursor pointing after the last returned item,
+    if there might be more items.
+    """
+
+    def __init__(self, current: str | None = None) -> None:
+        self.current = current
+        self.next: str | None = None
+
+
 class PaginationParams(NamedTuple):
     page: int
     limit: int
+    cursor: PaginationCursor | None = None
+
+
+class _KeysetKey(NamedTuple):
+    expression: ColumnElement[Any]
+    is_desc: bool
+
+
+def _get_keyset_keys(statement: Select[Any]) -> list[_KeysetKey] | None:
+    """
+    Return the sort keys of the statement, with the primary key as tie-breaker.
+
+    Returns `None` if the statement can't be paginated by keyset.
+    """
+    if statement._group_by_clauses or statement._distinct:
+        return None
+
+    entity = statement.column_descriptions[0]["entity"]
+    entity_id = getattr(entity, "id", None)
+    if entity_id is None:
+        return None
+
+    keys: list[_KeysetKey] = []
+    for clause in statement._order_by_clauses:
+        if isinstance(clause, UnaryExpression):
+            if clause.modifier not in {
+                operators.asc_op,
+                operators.desc_op,
+            } or not isinstance(clause.element, ColumnElement):
+                return None
+            keys.append(
+                _KeysetKey(clause.element, clause.modifier == operators.desc_op)
+            )
+        elif isinstance(clause, ColumnElement):
+            keys.append(_KeysetKey(clause, False))
+        else:
+            return None
+    keys.append(_KeysetKey(entity_id, False))
+
+    return keys
+
+
+def _get_keyset_fingerprint(keys: list[_KeysetKey]) -> str:
+    """
+    Return a fingerprint of the sort keys, including their bound parameters.
+
+    Expression keys like `search_rank(query, ...)` compile to the same SQL
+    whatever the query: a cursor must not be reused with another one.
+    """
+    parts: list[str] = []
+    for key in keys:
+        compiled = key.expression.compile()
+        params = sorted((name, repr(value)) for name, value in compiled.params.items())
+        parts.append(f"{compiled}:{params}:{key.is_desc}")
+    sort = "|".join(parts)
+    return hashlib.sha256(sort.encode("utf-8")).hexdigest()[:16]
+
+
+def _encode_keyset_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    if isinstance(value, date):
+        return {"d": value.isoformat()}
+    if isinstance(value, uuid.UUID):
+        return {"u": str(value)}
+    if isinstance(value, Decimal):
+        return {"n": str(value)}
+    return value
+
+
+def _decode_keyset_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        if "dt" in value:
+            return datetime.fromisoformat(value["dt"])
+        if "d" in value:
+            return date.fromisoformat(value["d"])
+        if "u" in value:
+            return uuid.UUID(value["u"])
+        if "n" in value:
+            return Decimal(value["n"])
+        raise ValueError("Unknown value type")
+    return value
+
+
+def _is_keyset_value_valid(expression: ColumnElement[Any], value: Any) -> bool:
+    if value is None:
+        return True
+    try:
+        python_type = expression.type.python_type
+    except NotImplementedError:
+        return True
+    if isinstance(value, bool):
+        return python_type is bool
+    if issubclass(python_type, str):
+        return isinstance(value, str)
+    if python_type is float:
+        return isinstance(value, int | float)
+    if python_type is date:
+        return isinstance(value, date) and not isinstance(value, datetime)
+    return isinstance(value, python_type)
+
+
+def _encode_cursor(fingerprint: str, values: Sequence[Any], count: int) -> str:
+    data = {
+        "s": fingerprint,
+        "k": [_encode_keyset_value(value) for value in values],
+        "c": count,
+    }
+    return base64.urlsafe_b64encode(json.dumps(data).encode("utf-8")).decode("utf-8")
+
+
+def _decode_cursor(
+    cursor: str, fingerprint: str, keys: list[_KeysetKey]
+) -> tuple[list[Any], int]:
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode("utf-8")))
+        if data["s"] != fingerprint or len(data["k"]) != len(keys):
+            raise ValueError("Cursor doesn't match the sorting")
+        values = [_decode_keyset_value(value) for value in data["k"]]
+        for key, value in zip(keys, values):
+            if not _is_keyset_value_valid(key.expression, value):
+                raise ValueError("Cursor value doesn't match the sorting")
+        return values, int(data["c"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+        raise PolarRequestValidationError(
+            [
+                {
+                    "loc": ("query", "cursor"),
+                    "input": cursor,
+                    "msg": "Invalid cursor.",
+                    "type": "value_error",
+                }
+            ]
+        ) from e
+
+
+def _get_keyset_clause(
+    keys: list[_KeysetKey], values: Sequence[Any]
+) -> ColumnElement[bool]:
+    """
+    Build the clause selecting the rows strictly after the given sort key values.
+
+    It follows PostgreSQL ordering of `NULL`:
+    last in ascending order, first in descending order.
+    """
+    clauses: list[ColumnElement[bool]] = []
+    equalities: list[ColumnElement[bool]] = []
+    for (expression, is_desc), value in zip(keys, values):
+        after: ColumnElement[bool]
+        if value is None:
+            after = expression.is_not(None) if is_desc else false()
+        elif is_desc:
+            after = expression < value
+        else:
+            after = or_(expression > value, expression.is_(None))
+        clauses.append(and_(*equalities, after))
+        equalities.append(
+            expression.is_(None) if value is None else expression == value
+        )
+    return or_(*clauses)
 
 
 @overload
@@ -62,27 +246,73 @@ async def paginate(
     pagination: PaginationParams,
     count_clause: _ColumnsClauseArgument[Any] | None = None,
 ) -> tuple[Sequence[Any], int]:
-    page, limit = pagination
-    offset = limit * (page - 1)
-    statement = statement.offset(offset).limit(limit)
+    """
+    Paginate the statement, by offset or by keyset.
+
+    Keyset pagination is used when the client sends a cursor. Instead of
+    skipping the previous rows, it selects the rows after the sort key values
+    of the last item of the previous page. The total count is not recomputed:
+    we return the one computed on the first page, saved in the cursor.
+
+    Keyset pagination only supports statements selecting a model with an `id`,
+    without `GROUP BY` nor `DISTINCT`.
+    """
+    page, limit, cursor = pagination
+
+    keys = _get_keyset_keys(statement) if cursor is not None else None
+    if keys is not None:
+        statement = statement.order_by(None).order_by(
+            *(
+                key.expression.desc() if key.is_desc else key.expression.asc()
+                for key in keys
+            )
+        )
+        statement = statement.add_columns(*(key.expression for key in keys))
+        fingerprint = _get_keyset_fingerprint(keys)
 
-    if count_clause is not None:
-        statement = statement.add_columns(count_clause)
+    cursor_count: int | None = None
+    if cursor is not None and cursor.current is not None:
+        if keys is None:
+            raise PolarRequestValidationError(
+                [
+                    {
+                        "loc": ("query", "cursor"),
+                        "input": cursor.current,
+                        "msg": "Cursor pagination is not supported on this resource.",
+                        "type": "value_error",
+                    }
+                ]
+            )
+        values, cursor_count = _decode_cursor(cursor.current, fingerprint, keys)
+        statement = statement.where(_get_keyset_clause(keys, values)).limit(limit)
     else:
-        statement = statement.add_columns(over(func.count()))
+        offset = limit * (page - 1)
+        statement = statement.offset(offset).limit(limit)
+        if count_clause is not None:
+            statement = statement.add_columns(count_clause)
+        else:
+            statement = statement.add_columns(over(func.count()))
 
     result = await session.execute(statement)
 
     results: list[Any] = []
-    count = 0
+    count = 0 if cursor_count is None else cursor_count
+    last_values: Sequence[Any] = []
     for row in result.unique().all():
-        (*queried_data, c) = row._tuple()
-        count = int(c)
+        queried_data = list(row._tuple())
+        if cursor_count is None:
+            count = int(queried_data.pop())
+        if keys is not None:
+            last_values = queried_data[-len(keys) :]
+            queried_data = queried_data[: -len(keys)]
         if len(queried_data) == 1:
             results.append(queried_data[0])
         else:
             results.append(queried_data)
 
+    if cursor is not None and keys is not None and len(results) == limit:
+        cursor.next = _encode_cursor(fingerprint, last_values, count)
+
     return results, count
 
 
@@ -96,8 +326,18 @@ async def get_pagination_params(
         ),
         gt=0,
     ),
+    cursor: str | None = Query(
+        None,
+        description=(
+            "Cursor returned in `pagination.next_cursor` by a previous request. "
+            "If set, `page` is ignored and the items after the cursor are returned. "
+            "Prefer it to iterate over large lists."
+        ),
+    ),
 ) -> PaginationParams:
-    return PaginationParams(page, min(settings.API_PAGINATION_MAX_LIMIT, limit))
+    return PaginationParams(
+        page, min(settings.API_PAGINATION_MAX_LIMIT, limit), PaginationCursor(cursor)
+    )
 
 
 PaginationParamsQuery = Annotated[PaginationParams, Depends(get_pagination_params)]
@@ -106,6 +346,7 @@ PaginationParamsQuery = Annotated[PaginationParams, Depends(get_pagination_param
 class Pagination(Schema):
     total_count: int
     max_page: int
+    next_cursor: str | None = None
 
 
 class ListResource(BaseModel, Generic[T]):
@@ -121,6 +362,9 @@ class ListResource(BaseModel, Generic[T]):
             pagination=Pagination(
                 total_count=total_count,
                 max_page=math.ceil(total_count / pagination_params.limit),
+                next_cursor=pagination_params.cursor.next
+                if pagination_params.cursor is not None
+                else None,
             ),
         )
 
@@ -0,0 +1,90 @@
+import asyncio
+import math
+import time
+
+from redis.exceptions import WatchError
+
+from polar.redis import Redis
+
+
+async def acquire(
+    redis: Redis, key: str, limit: int, period: float = 1.0, cost: int = 1
+) -> None:
+    """
+    Wait until `cost` units can be consumed from a shared rate limit.
+
+    The limit is enforced over fixed windows of `period` seconds,
+    counted in Redis so it's shared by every process using the same key.
+
+    Args:
+        redis: The Redis client.
+        key: The key identifying the rate limit.
+        limit: The maximum number of units per window.
+        period: The duration of a window, in seconds.
+        cost: The number of units to consume.
+    """
+    while True:
+        now = time.time()
+        window = math.floor(now / period)
+        window_key = f"rate_limit:{key}:{window}"
+
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.incrby(window_key, cost)
+            pipe.expire(window_key, math.ceil(period) + 1)
+            count, _ = await pipe.execute()
+
+        if count <= limit:
+            return
+
+        await asyncio.sleep((window + 1) * period - now)
+
+
+async def take_tokens(
+    redis: Redis, key: str, capacity: float, refill_rate: float, cost: float = 1
+) -> float:
+    """
+    Try to consume `cost` tokens from a shared token bucket, without waiting.
+
+    The bucket holds up to `capacity` tokens and gains `refill_rate` tokens
+    per second. Its state is stored in Redis, so it's shared by every process
+    using the same key. A negative `cost` gives tokens back.
+
+    Args:
+        redis: The Redis client.
+        key: The key identifying the bucket.
+        capacity: The maximum number of tokens in the bucket.
+        refill_rate: The number of tokens added per second.
+        cost: The number of tokens to consume.
+
+    Returns:
+        0 if the tokens were consumed, otherwise the number of seconds to wait
+        until enough tokens are available.
+    """
+    bucket_key = f"token_bucket:{key}"
+    async with redis.pipeline(transaction=True) as pipe:
+        while True:
+            try:
+                await pipe.watch(bucket_key)
+                state = await pipe.hmget(bucket_key, "tokens", "updated_at")
+                now = time.time()
+                tokens = capacity
+                if state[0] is not None and state[1] is not None:
+                    elapsed = max(now - float(state[1]), 0.0)
+                    tokens = min(capacity, float(state[0]) + elapsed * refill_rate)
+
+                wait = 0.0
+                if tokens >= cost:
+                    tokens = min(capacity, tokens - cost)
+                else:
+                    wait = (cost - tokens) / refill_rate
+
+                pipe.multi()
+                pipe.hset(bucket_key, mapping={"tokens": tokens, "updated_at": now})
+                pipe.expire(bucket_key, math.ceil(capacity / refill_rate) + 1)
+                await pipe.execute()
+                return wait
+            except WatchError:
+                continue
+
+
+__all__ = ["acquire", "take_tokens"]
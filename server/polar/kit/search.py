@@ -0,0 +1,83 @@
+from typing import Any
+
+from sqlalchemy import (
+    ColumnElement,
+    Index,
+    Text,
+    UnaryExpression,
+    case,
+    cast,
+    desc,
+    func,
+    or_,
+)
+from sqlalchemy.orm import InstrumentedAttribute
+
+SearchColumn = InstrumentedAttribute[str] | InstrumentedAttribute[str | None]
+
+
+def TrigramIndex(name: str, column: str) -> Index:
+    """
+    GIN index on a text column, using the `pg_trgm` operator class.
+
+    It lets Postgres answer `ILIKE '%query%'` and similarity lookups from the index
+    instead of scanning the whole table.
+    """
+    return Index(
+        name, column, postgresql_using="gin", postgresql_ops={column: "gin_trgm_ops"}
+    )
+
+
+def _escape_like(query: str) -> str:
+    return query.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def _as_text(column: SearchColumn) -> ColumnElement[str]:
+    # CITEXT columns have their own ILIKE operator, which can't use the
+    # `gin_trgm_ops` index. Casting to TEXT is free and picks the right operator.
+    return cast(column, Text)
+
+
+def search_filter(query: str, *columns: SearchColumn) -> ColumnElement[bool]:
+    """
+    Match rows where one of the columns contains the query, case-insensitively.
+
+    Wildcards in the query are matched literally.
+    Columns should have a `TrigramIndex`.
+    """
+    pattern = f"%{_escape_like(query)}%"
+    return or_(*(_as_text(column).ilike(pattern, escape="\\") for column in columns))
+
+
+def search_rank(query: str, *columns: SearchColumn) -> ColumnElement[float]:
+    """
+    Relevance of a row matched by `search_filter`, to sort results by descending order.
+
+    Values starting with the query rank first, then values are ranked by
+    their trigram similarity with the query.
+    """
+    prefix_pattern = f"{_escape_like(query)}%"
+    ranks = [
+        case((_as_text(column).ilike(prefix_pattern, escape="\\"), 1.0), else_=0.0)
+        + func.similarity(_as_text(column), query)
+        for column in columns
+    ]
+    return ranks[0] if len(ranks) == 1 else func.greatest(*ranks)
+
+
+def search_order_by(
+    query: str | None, *columns: SearchColumn
+) -> list[UnaryExpression[Any]]:
+    """
+    Leading `ORDER BY` clauses of a list endpoint supporting search.
+
+    When searching, the most relevant results come first: the requested sorting
+    is appended after them, so it only orders results of equal relevance.
+    Without a query, there's no leading clause and the requested sorting applies.
+    """
+    if query is None:
+        return []
+    return [desc(search_rank(query, *columns))]
+
+
+__all__ = ["TrigramIndex", "search_filter", "search_order_by", "search_rank"]
@@ -6,6 +6,7 @@ import structlog
 from logfire.integrations.structlog import LogfireProcessor
 
 from polar.config import settings
+from polar.query_stats import add_query_stats
 
 RendererType = TypeVar("RendererType")
 
@@ -30,6 +31,7 @@ class Logging(Generic[RendererType]):
     def get_processors(cls, *, logfire: bool) -> list[Any]:
         return [
             structlog.contextvars.merge_contextvars,
+            add_query_stats,
             structlog.stdlib.add_log_level,
             structlog.stdlib.add_logger_name,
             structlog.stdlib.PositionalArgumentsFormatter(),
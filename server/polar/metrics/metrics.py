@@ -1,13 +1,7 @@
-from datetime import datetime
 from enum import StrEnum
-from typing import ClassVar, Protocol, cast
+from typing import ClassVar, Protocol
 
-from sqlalchemy import ColumnElement, Integer, SQLColumnExpression, case, func
-
-from polar.enums import SubscriptionRecurringInterval
-from polar.models import Order, Subscription
-
-from .queries import Interval, MetricQuery
+from sqlalchemy import CTE, ColumnElement, Integer, Numeric, func
 
 
 class MetricType(StrEnum):
@@ -19,191 +13,127 @@ class Metric(Protocol):
     slug: ClassVar[str]
     display_name: ClassVar[str]
     type: ClassVar[MetricType]
-    query: ClassVar[MetricQuery]
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]: ...
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        """
+        Return the SQL expression computing the metric value for a period,
+        from the rollups CTE built by `get_rollups_cte`.
+        """
+        ...
 
 
 class OrdersMetric(Metric):
     slug = "orders"
     display_name = "Orders"
     type = MetricType.scalar
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.count(Order.id)
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.orders
 
 
 class RevenueMetric(Metric):
     slug = "revenue"
     display_name = "Revenue"
     type = MetricType.currency
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.sum(Order.amount)
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.revenue
 
 
 class AverageOrderValueMetric(Metric):
     slug = "average_order_value"
     display_name = "Average Order Value"
     type = MetricType.currency
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.cast(func.ceil(func.avg(Order.amount)), Integer)
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return func.cast(
+            func.ceil(func.cast(r.c.revenue, Numeric) / func.nullif(r.c.orders, 0)),
+            Integer,
+        )
 
 
 class OneTimeProductsMetric(Metric):
     slug = "one_time_products"
     display_name = "One-Time Products"
     type = MetricType.scalar
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.count(Order.id).filter(Order.subscription_id.is_(None))
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.one_time_products
 
 
 class OneTimeProductsRevenueMetric(Metric):
     slug = "one_time_products_revenue"
     display_name = "One-Time Products Revenue"
     type = MetricType.currency
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.sum(Order.amount).filter(Order.subscription_id.is_(None))
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.one_time_products_revenue
 
 
 class NewSubscriptionsMetric(Metric):
     slug = "new_subscriptions"
     display_name = "New Subscriptions"
     type = MetricType.scalar
-    query = MetricQuery.active_subscriptions
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.count(Subscription.id).filter(
-            i.sql_date_trunc(
-                cast(SQLColumnExpression[datetime], Subscription.started_at)
-            )
-            == i.sql_date_trunc(t)
-        )
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.new_subscriptions
 
 
 class NewSubscriptionsRevenueMetric(Metric):
     slug = "new_subscriptions_revenue"
     display_name = "New Subscriptions Revenue"
     type = MetricType.currency
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.sum(Order.amount).filter(
-            i.sql_date_trunc(
-                cast(SQLColumnExpression[datetime], Subscription.started_at)
-            )
-            == i.sql_date_trunc(t)
-        )
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.new_subscriptions_revenue
 
 
 class RenewedSubscriptionsMetric(Metric):
     slug = "renewed_subscriptions"
     display_name = "Renewed Subscriptions"
     type = MetricType.scalar
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.count(Subscription.id.distinct()).filter(
-            i.sql_date_trunc(
-                cast(SQLColumnExpression[datetime], Subscription.started_at)
-            )
-            != i.sql_date_trunc(t)
-        )
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.renewed_subscriptions
 
 
 class RenewedSubscriptionsRevenueMetric(Metric):
     slug = "renewed_subscriptions_revenue"
     display_name = "Renewed Subscriptions Revenue"
     type = MetricType.currency
-    query = MetricQuery.orders
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.sum(Order.amount).filter(
-            i.sql_date_trunc(
-                cast(SQLColumnExpression[datetime], Subscription.started_at)
-            )
-            != i.sql_date_trunc(t)
-        )
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.renewed_subscriptions_revenue
 
 
 class ActiveSubscriptionsMetric(Metric):
     slug = "active_subscriptions"
     display_name = "Active Subscriptions"
     type = MetricType.scalar
-    query = MetricQuery.active_subscriptions
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.count(Subscription.id)
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.active_subscriptions
 
 
 class MonthlyRecurringRevenueMetric(Metric):
     slug = "monthly_recurring_revenue"
     display_name = "Monthly Recurring Revenue"
     type = MetricType.currency
-    query = MetricQuery.active_subscriptions
 
     @classmethod
-    def get_sql_expression(
-        cls, t: ColumnElement[datetime], i: Interval
-    ) -> ColumnElement[int]:
-        return func.coalesce(
-            func.sum(
-                case(
-                    (
-                        Subscription.recurring_interval
-                        == SubscriptionRecurringInterval.year,
-                        func.round(Subscription.amount / 12),
-                    ),
-                    (
-                        Subscription.recurring_interval
-                        == SubscriptionRecurringInterval.month,
-                        Subscription.amount,
-                    ),
-                )
-            ),
-            0,
-        )
+    def get_sql_expression(cls, r: CTE) -> ColumnElement[int]:
+        return r.c.monthly_recurring_revenue
 
 
 METRICS: list[type[Metric]] = [
@@ -1,25 +1,37 @@
 import uuid
-from collections.abc import Generator, Sequence
-from datetime import datetime
+from collections.abc import Sequence
+from datetime import datetime, timedelta
 from enum import StrEnum
-from typing import TYPE_CHECKING, Protocol, cast
+from typing import Any, cast
 
 from sqlalchemy import (
     CTE,
+    BigInteger,
     ColumnElement,
     Function,
+    Insert,
+    Select,
     SQLColumnExpression,
     TextClause,
     and_,
+    case,
     cte,
+    exists,
     func,
+    insert,
+    literal_column,
     or_,
     select,
     text,
+    true,
+    union_all,
 )
+from sqlalchemy.orm import InstrumentedAttribute, aliased
 
 from polar.auth.models import AuthSubject, is_organization, is_user
+from polar.enums import SubscriptionRecurringInterval
 from polar.models import (
+    MetricsRollup,
     Order,
     Organization,
     Product,
@@ -30,9 +42,6 @@ from polar.models import (
 )
 from polar.models.product_price import ProductPriceType
 
-if TYPE_CHECKING:
-    from .metrics import Metric
-
 
 class Interval(StrEnum):
     year = "year"
@@ -45,14 +54,15 @@ class Interval(StrEnum):
         return text(f"'1 {self.value}'::interval")
 
     def sql_date_trunc(
-        self, column: SQLColumnExpression[datetime]
+        self, column: SQLColumnExpression[datetime] | datetime
     ) -> Function[datetime]:
         return func.date_trunc(self.value, column)
 
-
-class MetricQuery(StrEnum):
-    orders = "orders"
-    active_subscriptions = "active_subscriptions"
+    def rollup_column(self, name: str) -> InstrumentedAttribute[int]:
+        """
+        Return the `MetricsRollup` column of a metric computed for this interval.
+        """
+        return getattr(MetricsRollup, f"{name}_{self.value}")
 
 
 def get_timestamp_series_cte(
@@ -67,53 +77,18 @@ def get_timestamp_series_cte(
     )
 
 
-def _get_metrics_columns(
-    metric_cte: MetricQuery,
-    timestamp_column: ColumnElement[datetime],
-    interval: Interval,
-    metrics: list["type[Metric]"],
-) -> Generator[ColumnElement[int], None, None]:
-    return (
-        func.coalesce(metric.get_sql_expression(timestamp_column, interval), 0).label(
-            metric.slug
-        )
-        for metric in metrics
-        if metric.query == metric_cte
-    )
-
-
-class QueryCallable(Protocol):
-    def __call__(
-        self,
-        timestamp_series: CTE,
-        interval: Interval,
-        auth_subject: AuthSubject[User | Organization],
-        metrics: list["type[Metric]"],
-        *,
-        organization_id: Sequence[uuid.UUID] | None = None,
-        product_id: Sequence[uuid.UUID] | None = None,
-        product_price_type: Sequence[ProductPriceType] | None = None,
-    ) -> CTE: ...
-
-
-def get_orders_cte(
-    timestamp_series: CTE,
-    interval: Interval,
+def _get_readable_rollups_clause(
     auth_subject: AuthSubject[User | Organization],
-    metrics: list["type[Metric]"],
     *,
     organization_id: Sequence[uuid.UUID] | None = None,
     product_id: Sequence[uuid.UUID] | None = None,
     product_price_type: Sequence[ProductPriceType] | None = None,
-) -> CTE:
-    timestamp_column: ColumnElement[datetime] = timestamp_series.c.timestamp
+) -> ColumnElement[bool]:
+    clauses: list[ColumnElement[bool]] = []
 
-    readable_orders_statement = select(Order.id).join(
-        Product, onclause=Order.product_id == Product.id
-    )
     if is_user(auth_subject):
-        readable_orders_statement = readable_orders_statement.where(
-            Product.organization_id.in_(
+        clauses.append(
+            MetricsRollup.organization_id.in_(
                 select(UserOrganization.organization_id).where(
                     UserOrganization.user_id == auth_subject.subject.id,
                     UserOrganization.deleted_at.is_(None),
@@ -121,138 +96,336 @@ def get_orders_cte(
             )
         )
     elif is_organization(auth_subject):
-        readable_orders_statement = readable_orders_statement.where(
-            Product.organization_id == auth_subject.subject.id
-        )
+        clauses.append(MetricsRollup.organization_id == auth_subject.subject.id)
 
     if organization_id is not None:
-        readable_orders_statement = readable_orders_statement.where(
-            Product.organization_id.in_(organization_id)
-        )
+        clauses.append(MetricsRollup.organization_id.in_(organization_id))
 
     if product_id is not None:
-        readable_orders_statement = readable_orders_statement.where(
-            Order.product_id.in_(product_id)
-        )
+        clauses.append(MetricsRollup.product_id.in_(product_id))
 
     if product_price_type is not None:
-        readable_orders_statement = readable_orders_statement.join(
-            ProductPrice,
-            onclause=Order.product_price_id == ProductPrice.id,
-        ).where(ProductPrice.type.in_(product_price_type))
+        clauses.append(MetricsRollup.product_price_type.in_(product_price_type))
 
-    return cte(
-        select(
-            timestamp_column.label("timestamp"),
-            *_get_metrics_columns(
-                MetricQuery.orders, timestamp_column, interval, metrics
-            ),
-        )
-        .select_from(
-            timestamp_series.join(
-                Order,
-                isouter=True,
-                onclause=and_(
-                    interval.sql_date_trunc(Order.created_at)
-                    == interval.sql_date_trunc(timestamp_column),
-                    Order.id.in_(readable_orders_statement),
-                ),
-            ).join(
-                Subscription,
-                isouter=True,
-                onclause=Order.subscription_id == Subscription.id,
-            )
-        )
-        .group_by(timestamp_column)
-        .order_by(timestamp_column.asc())
-    )
+    return and_(true(), *clauses)
 
 
-def get_active_subscriptions_cte(
+def _sum(column: SQLColumnExpression[int]) -> ColumnElement[int]:
+    return func.cast(func.coalesce(func.sum(column), 0), BigInteger)
+
+
+def get_rollups_cte(
     timestamp_series: CTE,
+    start_timestamp: datetime,
+    end_timestamp: datetime,
     interval: Interval,
     auth_subject: AuthSubject[User | Organization],
-    metrics: list["type[Metric]"],
     *,
     organization_id: Sequence[uuid.UUID] | None = None,
     product_id: Sequence[uuid.UUID] | None = None,
     product_price_type: Sequence[ProductPriceType] | None = None,
 ) -> CTE:
+    """
+    Coarsen the hourly rollups to the requested interval.
+
+    Returns a CTE with one row per timestamp of the series,
+    and one column per aggregated figure.
+
+    Figures happening during the period, like orders, are summed over
+    the hourly rows belonging to it. Figures representing a state, like active
+    subscriptions, are computed with a running sum of the started and ended
+    subscriptions, on top of the balance accumulated before the series start.
+    """
     timestamp_column: ColumnElement[datetime] = timestamp_series.c.timestamp
+    readable_clause = _get_readable_rollups_clause(
+        auth_subject,
+        organization_id=organization_id,
+        product_id=product_id,
+        product_price_type=product_price_type,
+    )
+    series_start = interval.sql_date_trunc(start_timestamp)
+    series_end = interval.sql_date_trunc(end_timestamp) + interval.sql_interval()
 
-    readable_subscriptions_statement = select(Subscription.id).join(
-        Product, onclause=Subscription.product_id == Product.id
+    period_column = interval.sql_date_trunc(MetricsRollup.timestamp)
+    periods = cte(
+        select(
+            period_column.label("timestamp"),
+            _sum(MetricsRollup.orders).label("orders"),
+            _sum(MetricsRollup.revenue).label("revenue"),
+            _sum(MetricsRollup.one_time_products).label("one_time_products"),
+            _sum(MetricsRollup.one_time_products_revenue).label(
+                "one_time_products_revenue"
+            ),
+            _sum(MetricsRollup.new_subscriptions).label("new_subscriptions"),
+            _sum(MetricsRollup.ended_subscriptions).label("ended_subscriptions"),
+            _sum(MetricsRollup.new_monthly_recurring_revenue).label(
+                "new_monthly_recurring_revenue"
+            ),
+            _sum(MetricsRollup.ended_monthly_recurring_revenue).label(
+                "ended_monthly_recurring_revenue"
+            ),
+            _sum(interval.rollup_column("new_subscriptions_revenue")).label(
+                "new_subscriptions_revenue"
+            ),
+            _sum(interval.rollup_column("renewed_subscriptions")).label(
+                "renewed_subscriptions"
+            ),
+            _sum(interval.rollup_column("renewed_subscriptions_revenue")).label(
+                "renewed_subscriptions_revenue"
+            ),
+        )
+        .where(
+            readable_clause,
+            MetricsRollup.timestamp >= series_start,
+            MetricsRollup.timestamp < series_end,
+        )
+        .group_by(period_column)
     )
-    if is_user(auth_subject):
-        readable_subscriptions_statement = readable_subscriptions_statement.where(
-            Product.organization_id.in_(
-                select(UserOrganization.organization_id).where(
-                    UserOrganization.user_id == auth_subject.subject.id,
-                    UserOrganization.deleted_at.is_(None),
-                )
+
+    previous_statement = select(MetricsRollup).where(
+        readable_clause, MetricsRollup.timestamp < series_start
+    )
+    previous_active_subscriptions = (
+        previous_statement.with_only_columns(
+            _sum(MetricsRollup.new_subscriptions - MetricsRollup.ended_subscriptions)
+        )
+    ).scalar_subquery()
+    previous_monthly_recurring_revenue = (
+        previous_statement.with_only_columns(
+            _sum(
+                MetricsRollup.new_monthly_recurring_revenue
+                - MetricsRollup.ended_monthly_recurring_revenue
             )
         )
-    elif is_organization(auth_subject):
-        readable_subscriptions_statement = readable_subscriptions_statement.where(
-            Product.organization_id == auth_subject.subject.id
+    ).scalar_subquery()
+
+    def _column(name: str) -> ColumnElement[int]:
+        return func.coalesce(periods.c[name], 0)
+
+    def _running_sum(new: str, ended: str) -> ColumnElement[int]:
+        # A subscription ended during the period is still counted as active
+        # for this period, so we only subtract the ended ones from the next period.
+        return func.cast(
+            func.sum(_column(new) - _column(ended)).over(order_by=timestamp_column)
+            + _column(ended),
+            BigInteger,
         )
 
-    if organization_id is not None:
-        readable_subscriptions_statement = readable_subscriptions_statement.where(
-            Product.organization_id.in_(organization_id)
+    return cte(
+        select(
+            timestamp_column.label("timestamp"),
+            _column("orders").label("orders"),
+            _column("revenue").label("revenue"),
+            _column("one_time_products").label("one_time_products"),
+            _column("one_time_products_revenue").label("one_time_products_revenue"),
+            _column("new_subscriptions").label("new_subscriptions"),
+            _column("new_subscriptions_revenue").label("new_subscriptions_revenue"),
+            _column("renewed_subscriptions").label("renewed_subscriptions"),
+            _column("renewed_subscriptions_revenue").label(
+                "renewed_subscriptions_revenue"
+            ),
+            (
+                previous_active_subscriptions
+                + _running_sum("new_subscriptions", "ended_subscriptions")
+            ).label("active_subscriptions"),
+            (
+                previous_monthly_recurring_revenue
+                + _running_sum(
+                    "new_monthly_recurring_revenue", "ended_monthly_recurring_revenue"
+                )
+            ).label("monthly_recurring_revenue"),
+        ).select_from(
+            timestamp_series.join(
+                periods,
+                isouter=True,
+                onclause=periods.c.timestamp
+                == interval.sql_date_trunc(timestamp_column),
+            )
         )
+    )
 
-    if product_id is not None:
-        readable_subscriptions_statement = readable_subscriptions_statement.where(
-            Subscription.product_id.in_(product_id)
+
+def _get_hours_clause(
+    column: SQLColumnExpression[datetime], hours: Sequence[datetime] | None
+) -> ColumnElement[bool]:
+    if hours is None:
+        return true()
+    return or_(
+        *(and_(column >= hour, column < hour + timedelta(hours=1)) for hour in hours)
+    )
+
+
+def _get_order_rollups_statement(
+    organization_id: uuid.UUID, hours: Sequence[datetime] | None
+) -> Select[Any]:
+    started_at = cast(SQLColumnExpression[datetime], Subscription.started_at)
+    created_at = cast(SQLColumnExpression[datetime], Order.created_at)
+
+    interval_columns: list[ColumnElement[int]] = []
+    for interval in Interval:
+        is_new = interval.sql_date_trunc(started_at) == interval.sql_date_trunc(
+            created_at
+        )
+        is_renewed = interval.sql_date_trunc(started_at) != interval.sql_date_trunc(
+            created_at
+        )
+        # Count renewed subscriptions only once per interval bucket,
+        # on their first order of the bucket.
+        previous_order = aliased(Order)
+        is_first_order = ~exists().where(
+            previous_order.subscription_id == Order.subscription_id,
+            previous_order.created_at >= interval.sql_date_trunc(created_at),
+            previous_order.created_at < created_at,
         )
+        interval_columns += [
+            func.sum(Order.amount)
+            .filter(is_new)
+            .label(f"new_subscriptions_revenue_{interval.value}"),
+            func.count(Subscription.id.distinct())
+            .filter(is_renewed, is_first_order)
+            .label(f"renewed_subscriptions_{interval.value}"),
+            func.sum(Order.amount)
+            .filter(is_renewed)
+            .label(f"renewed_subscriptions_revenue_{interval.value}"),
+        ]
 
-    if product_price_type is not None:
-        readable_subscriptions_statement = readable_subscriptions_statement.join(
-            ProductPrice,
-            onclause=Subscription.price_id == ProductPrice.id,
-        ).where(ProductPrice.type.in_(product_price_type))
+    timestamp_column = Interval.hour.sql_date_trunc(created_at)
+    return (
+        select(
+            Product.organization_id.label("organization_id"),
+            Order.product_id.label("product_id"),
+            ProductPrice.type.label("product_price_type"),
+            timestamp_column.label("timestamp"),
+            func.count(Order.id).label("orders"),
+            func.sum(Order.amount).label("revenue"),
+            func.count(Order.id)
+            .filter(Order.subscription_id.is_(None))
+            .label("one_time_products"),
+            func.sum(Order.amount)
+            .filter(Order.subscription_id.is_(None))
+            .label("one_time_products_revenue"),
+            *interval_columns,
+        )
+        .join(Product, onclause=Order.product_id == Product.id)
+        .join(ProductPrice, onclause=Order.product_price_id == ProductPrice.id)
+        .join(
+            Subscription,
+            isouter=True,
+            onclause=Order.subscription_id == Subscription.id,
+        )
+        .where(
+            Product.organization_id == organization_id,
+            _get_hours_clause(created_at, hours),
+        )
+        .group_by(
+            Product.organization_id,
+            Order.product_id,
+            ProductPrice.type,
+            timestamp_column,
+        )
+    )
 
-    return cte(
+
+def _get_subscription_rollups_statement(
+    organization_id: uuid.UUID,
+    hours: Sequence[datetime] | None,
+    column: InstrumentedAttribute[datetime | None],
+    prefix: str,
+) -> Select[Any]:
+    timestamp = cast(SQLColumnExpression[datetime], column)
+    timestamp_column = Interval.hour.sql_date_trunc(timestamp)
+    monthly_recurring_revenue = case(
+        (
+            Subscription.recurring_interval == SubscriptionRecurringInterval.year,
+            func.round(Subscription.amount / 12),
+        ),
+        (
+            Subscription.recurring_interval == SubscriptionRecurringInterval.month,
+            Subscription.amount,
+        ),
+    )
+    return (
         select(
+            Product.organization_id.label("organization_id"),
+            Subscription.product_id.label("product_id"),
+            ProductPrice.type.label("product_price_type"),
             timestamp_column.label("timestamp"),
-            *_get_metrics_columns(
-                MetricQuery.active_subscriptions, timestamp_column, interval, metrics
+            func.count(Subscription.id).label(f"{prefix}_subscriptions"),
+            func.sum(monthly_recurring_revenue).label(
+                f"{prefix}_monthly_recurring_revenue"
             ),
         )
-        .select_from(
-            timestamp_series.join(
-                Subscription,
-                isouter=True,
-                onclause=and_(
-                    or_(
-                        Subscription.started_at.is_(None),
-                        interval.sql_date_trunc(
-                            cast(SQLColumnExpression[datetime], Subscription.started_at)
-                        )
-                        <= interval.sql_date_trunc(timestamp_column),
-                    ),
-                    or_(
-                        Subscription.ended_at.is_(None),
-                        interval.sql_date_trunc(
-                            cast(SQLColumnExpression[datetime], Subscription.ended_at)
-                        )
-                        >= interval.sql_date_trunc(timestamp_column),
-                    ),
-                    Subscription.id.in_(readable_subscriptions_statement),
+        .join(Product, onclause=Subscription.product_id == Product.id)
+        .join(ProductPrice, onclause=Subscription.price_id == ProductPrice.id)
+        .where(
+            Product.organization_id == organization_id,
+            Subscription.started_at.is_not(None),
+            column.is_not(None),
+            _get_hours_clause(timestamp, hours),
+        )
+        .group_by(
+            Product.organization_id,
+            Subscription.product_id,
+            ProductPrice.type,
+            timestamp_column,
+        )
+    )
+
+
+_ROLLUP_KEY_COLUMNS = (
+    "organization_id",
+    "product_id",
+    "product_price_type",
+    "timestamp",
+)
+
+
+def get_rollups_insert_statement(
+    organization_id: uuid.UUID, hours: Sequence[datetime] | None = None
+) -> Insert:
+    """
+    Build an `INSERT ... SELECT` statement computing the hourly rollups
+    of an organization from the orders and subscriptions tables.
+
+    Args:
+        organization_id: ID of the organization to compute.
+        hours: Restrict the computation to those hour buckets.
+        If `None`, the whole history is computed.
+    """
+    value_columns = [
+        column.key
+        for column in MetricsRollup.__table__.columns
+        if column.key not in _ROLLUP_KEY_COLUMNS
+    ]
+
+    parts: list[Select[tuple[int]]] = []
+    for statement in (
+        _get_order_rollups_statement(organization_id, hours),
+        _get_subscription_rollups_statement(
+            organization_id, hours, Subscription.started_at, "new"
+        ),
+        _get_subscription_rollups_statement(
+            organization_id, hours, Subscription.ended_at, "ended"
+        ),
+    ):
+        columns = statement.selected_columns
+        parts.append(
+            statement.with_only_columns(
+                *(columns[key] for key in _ROLLUP_KEY_COLUMNS),
+                *(
+                    columns[key] if key in columns else literal_column("0").label(key)
+                    for key in value_columns
                 ),
-            ).join(
-                ProductPrice,
-                isouter=True,
-                onclause=Subscription.price_id == ProductPrice.id,
+                maintain_column_froms=True,
             )
         )
-        .group_by(timestamp_column)
-        .order_by(timestamp_column.asc())
-    )
 
+    rows = union_all(*parts).subquery()
+    statement = select(
+        *(rows.c[key] for key in _ROLLUP_KEY_COLUMNS),
+        *(func.coalesce(func.sum(rows.c[key]), 0).label(key) for key in value_columns),
+    ).group_by(*(rows.c[key] for key in _ROLLUP_KEY_COLUMNS))
 
-QUERIES: list[QueryCallable] = [
-    get_orders_cte,
-    get_active_subscriptions_cte,
-]
+    return insert(MetricsRollup).from_select(
+        [*_ROLLUP_KEY_COLUMNS, *value_columns], statement
+    )
@@ -2,18 +2,28 @@ import uuid
 from collections.abc import Sequence
 from datetime import UTC, date, datetime
 
-from sqlalchemy import ColumnElement, FromClause, select
+from sqlalchemy import ColumnElement, delete, func, select
 
 from polar.auth.models import AuthSubject
-from polar.models import Organization, User
+from polar.models import MetricsRollup, Order, Organization, Subscription, User
 from polar.models.product_price import ProductPriceType
 from polar.postgres import AsyncSession
+from polar.worker import enqueue_job
 
 from .metrics import METRICS
-from .queries import QUERIES, Interval, get_timestamp_series_cte
+from .queries import (
+    Interval,
+    get_rollups_cte,
+    get_rollups_insert_statement,
+    get_timestamp_series_cte,
+)
 from .schemas import MetricsPeriod, MetricsResponse
 
 
+def _get_rollups_lock_key(organization_id: uuid.UUID) -> int:
+    return int.from_bytes(organization_id.bytes[:8], byteorder="big", signed=True)
+
+
 class MetricsService:
     async def get_metrics(
         self,
@@ -37,36 +47,25 @@ class MetricsService:
         timestamp_series = get_timestamp_series_cte(
             start_timestamp, end_timestamp, interval
         )
-        timestamp_column: ColumnElement[datetime] = timestamp_series.c.timestamp
-
-        queries = [
-            query(
-                timestamp_series,
-                interval,
-                auth_subject,
-                METRICS,
-                organization_id=organization_id,
-                product_id=product_id,
-                product_price_type=product_price_type,
-            )
-            for query in QUERIES
-        ]
-
-        from_query: FromClause = timestamp_series
-        for query in queries:
-            from_query = from_query.join(
-                query,
-                onclause=query.c.timestamp == timestamp_column,
-            )
-
-        statement = (
-            select(
-                timestamp_column.label("timestamp"),
-                *queries,
-            )
-            .select_from(from_query)
-            .order_by(timestamp_column.asc())
+        rollups = get_rollups_cte(
+            timestamp_series,
+            start_timestamp,
+            end_timestamp,
+            interval,
+            auth_subject,
+            organization_id=organization_id,
+            product_id=product_id,
+            product_price_type=product_price_type,
         )
+        timestamp_column: ColumnElement[datetime] = rollups.c.timestamp
+
+        statement = select(
+            timestamp_column.label("timestamp"),
+            *(
+                func.coalesce(metric.get_sql_expression(rollups), 0).label(metric.slug)
+                for metric in METRICS
+            ),
+        ).order_by(timestamp_column.asc())
 
         result = await session.stream(statement)
         periods: list[MetricsPeriod] = []
@@ -76,5 +75,102 @@ class MetricsService:
             {"periods": periods, "metrics": {m.slug: m for m in METRICS}}
         )
 
+    async def refresh_rollups(
+        self,
+        session: AsyncSession,
+        organization_id: uuid.UUID,
+        timestamps: Sequence[datetime] | None = None,
+    ) -> None:
+        """
+        Recompute the hourly rollups of an organization.
+
+        Args:
+            session: The database session.
+            organization_id: ID of the organization to recompute.
+            timestamps: Only recompute the hour buckets containing those timestamps.
+            If `None`, the whole history of the organization is rebuilt.
+        """
+        hours: list[datetime] | None = None
+        if timestamps is not None:
+            hours = sorted(
+                {t.replace(minute=0, second=0, microsecond=0) for t in timestamps}
+            )
+            if len(hours) == 0:
+                return
+
+        # Serialize refreshes of the same organization until the transaction ends,
+        # so concurrent jobs don't insert the same rows twice.
+        await session.execute(
+            select(func.pg_advisory_xact_lock(_get_rollups_lock_key(organization_id)))
+        )
+
+        delete_statement = delete(MetricsRollup).where(
+            MetricsRollup.organization_id == organization_id
+        )
+        if hours is not None:
+            delete_statement = delete_statement.where(
+                MetricsRollup.timestamp.in_(hours)
+            )
+        await session.execute(delete_statement)
+        await session.execute(get_rollups_insert_statement(organization_id, hours))
+
+    async def refresh_subscription_rollups(
+        self,
+        session: AsyncSession,
+        subscription: Subscription,
+        previous_timestamps: Sequence[datetime] = (),
+    ) -> None:
+        """
+        Recompute the hour buckets affected by a subscription.
+
+        Besides the start and end of the subscription, the buckets of its orders
+        are also recomputed, since they're classified as new or renewed
+        depending on the subscription start date.
+
+        Args:
+            session: The database session.
+            subscription: The subscription.
+            previous_timestamps: Start and end dates the subscription had
+            before the change, e.g. when it's reactivated, whose buckets still
+            count it.
+        """
+        timestamps = [
+            timestamp
+            for timestamp in (
+                subscription.started_at,
+                subscription.ended_at,
+                *previous_timestamps,
+            )
+            if timestamp is not None
+        ]
+        result = await session.execute(
+            select(Order.created_at).where(Order.subscription_id == subscription.id)
+        )
+        timestamps += result.scalars().all()
+
+        await self.refresh_rollups(
+            session, subscription.product.organization_id, timestamps
+        )
+
+    async def enqueue_rollups_rebuild(self, session: AsyncSession) -> None:
+        statement = select(Organization.id).where(Organization.deleted_at.is_(None))
+        organization_ids = await session.stream_scalars(statement)
+        async for organization_id in organization_ids:
+            enqueue_job("metrics.rebuild_rollups", organization_id=organization_id)
+
+    def enqueue_order_rollups_refresh(self, order: Order) -> None:
+        enqueue_job("metrics.refresh_order_rollups", order_id=order.id)
+
+    def enqueue_subscription_rollups_refresh(
+        self,
+        subscription: Subscription,
+        previous_timestamps: Sequence[datetime | None] = (),
+    ) -> None:
+        enqueue_job(
+            "metrics.refresh_subscription_rollups",
+            subscription_id=subscription.id,
+            previous_timestamps=[t for t in previous_timestamps if t is not None],
+        )
+
 
 metrics = MetricsService()
@@ -0,0 +1,80 @@
+import uuid
+from datetime import datetime
+
+from polar.exceptions import PolarTaskError
+from polar.order.service import order as order_service
+from polar.product.service.product import product as product_service
+from polar.subscription.service import subscription as subscription_service
+from polar.worker import AsyncSessionMaker, JobContext, PolarWorkerContext, task
+
+from .service import metrics as metrics_service
+
+
+class MetricsTaskError(PolarTaskError): ...
+
+
+class OrderDoesNotExist(MetricsTaskError):
+    def __init__(self, order_id: uuid.UUID) -> None:
+        self.order_id = order_id
+        message = f"The order with id {order_id} does not exist."
+        super().__init__(message)
+
+
+class SubscriptionDoesNotExist(MetricsTaskError):
+    def __init__(self, subscription_id: uuid.UUID) -> None:
+        self.subscription_id = subscription_id
+        message = f"The subscription with id {subscription_id} does not exist."
+        super().__init__(message)
+
+
+@task("metrics.refresh_order_rollups")
+async def metrics_refresh_order_rollups(
+    ctx: JobContext, order_id: uuid.UUID, polar_context: PolarWorkerContext
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        order = await order_service.get(session, order_id)
+        if order is None:
+            raise OrderDoesNotExist(order_id)
+
+        product = await product_service.get(session, order.product_id)
+        assert product is not None
+
+        await metrics_service.refresh_rollups(
+            session, product.organization_id, [order.created_at]
+        )
+
+
+@task("metrics.refresh_subscription_rollups")
+async def metrics_refresh_subscription_rollups(
+    ctx: JobContext,
+    subscription_id: uuid.UUID,
+    polar_context: PolarWorkerContext,
+    previous_timestamps: list[datetime] | None = None,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        subscription = await subscription_service.get(session, subscription_id)
+        if subscription is None:
+            raise SubscriptionDoesNotExist(subscription_id)
+
+        await metrics_service.refresh_subscription_rollups(
+            session, subscription, previous_timestamps or []
+        )
+
+
+@task("metrics.rebuild_rollups")
+async def metrics_rebuild_rollups(
+    ctx: JobContext,
+    polar_context: PolarWorkerContext,
+    organization_id: uuid.UUID | None = None,
+) -> None:
+    """
+    Rebuild the rollups of an organization from scratch.
+
+    If no organization is given, a rebuild job is enqueued for every organization.
+    Useful to backfill the rollups or recover from a drift.
+    """
+    async with AsyncSessionMaker(ctx) as session:
+        if organization_id is None:
+            await metrics_service.enqueue_rollups_rebuild(session)
+        else:
+            await metrics_service.refresh_rollups(session, organization_id)
@@ -7,6 +7,7 @@ from starlette.types import ASGIApp, Message, Receive, Scope, Send
 
 from polar.config import settings
 from polar.logging import Logger, generate_correlation_id
+from polar.query_stats import flush_query_stats, track_queries
 from polar.worker import flush_enqueued_jobs
 
 
@@ -29,6 +30,34 @@ class LogCorrelationIdMiddleware:
         structlog.contextvars.unbind_contextvars("correlation_id", "method", "path")
 
 
+class QueryStatsMiddleware:
+    """
+    Count the queries run by each request, by route.
+
+    The counters are added to the logs emitted while handling the request.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        # Group unmatched paths together, they're unbounded
+        with track_queries(f"{scope['method']} unmatched") as stats:
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                # Group by route template, not by actual path
+                route = scope.get("route")
+                if route is not None:
+                    stats.unit = f"{scope['method']} {route.path}"
+
+        if not settings.is_testing():
+            await flush_query_stats(scope["state"]["redis"])
+
+
 class FlushEnqueuedWorkerJobsMiddleware:
     def __init__(self, app: ASGIApp) -> None:
         self.app = app
@@ -1,6 +1,7 @@
 from polar.kit.db.models import Model, TimestampedModel
 
 from .account import Account
+from .account_balance import AccountBalance
 from .advertisement_campaign import AdvertisementCampaign
 from .article import Article
 from .articles_subscription import ArticlesSubscription
@@ -19,6 +20,7 @@ from .issue_reward import IssueReward
 from .license_key import LicenseKey
 from .license_key_activation import LicenseKeyActivation
 from .magic_link import MagicLink
+from .metrics_rollup import MetricsRollup
 from .notification import Notification
 from .oauth2_authorization_code import OAuth2AuthorizationCode
 from .oauth2_client import OAuth2Client
@@ -40,6 +42,7 @@ from .product_price import (
     ProductPriceFree,
 )
 from .repository import Repository
+from .stripe_event import StripeEvent
 from .subscription import Subscription
 from .transaction import Transaction
 from .user import OAuthAccount, User
@@ -53,6 +56,7 @@ __all__ = [
     "Model",
     "TimestampedModel",
     "Account",
+    "AccountBalance",
     "AdvertisementCampaign",
     "Article",
     "ArticlesSubscription",
@@ -71,6 +75,7 @@ __all__ = [
     "LicenseKey",
     "LicenseKeyActivation",
     "MagicLink",
+    "MetricsRollup",
     "Notification",
     "OAuth2AuthorizationCode",
     "OAuth2Client",
@@ -91,6 +96,7 @@ __all__ = [
     "ProductPriceFixed",
     "ProductPriceFree",
     "Repository",
+    "StripeEvent",
     "Subscription",
     "Transaction",
     "User",
@@ -0,0 +1,115 @@
+from typing import Any
+from uuid import UUID
+
+from sqlalchemy import BigInteger, Connection, ForeignKey, String, Uuid, event, inspect
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Mapped, Mapper, mapped_column
+
+from polar.kit.db.models import Model
+from polar.models.transaction import Transaction, TransactionType
+
+
+class AccountBalance(Model):
+    """
+    Running sums of the transactions of an account, by transaction type.
+
+    Rows are updated in the same flush as the transactions, through mapper events,
+    so they never diverge from the `transactions` table within a transaction.
+    The `transaction.reconcile_account_balances` task checks it anyway.
+    """
+
+    __tablename__ = "account_balances"
+
+    account_id: Mapped[UUID] = mapped_column(
+        Uuid, ForeignKey("accounts.id", ondelete="cascade"), primary_key=True
+    )
+    transaction_type: Mapped[TransactionType] = mapped_column(String, primary_key=True)
+    amount: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    account_amount: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+
+def _apply_balance_delta(
+    connection: Connection,
+    account_id: UUID | None,
+    transaction_type: TransactionType,
+    amount: int,
+    account_amount: int,
+) -> None:
+    if account_id is None or (amount == 0 and account_amount == 0):
+        return
+
+    statement = insert(AccountBalance).values(
+        account_id=account_id,
+        transaction_type=transaction_type,
+        amount=amount,
+        account_amount=account_amount,
+    )
+    statement = statement.on_conflict_do_update(
+        index_elements=[AccountBalance.account_id, AccountBalance.transaction_type],
+        set_={
+            "amount": AccountBalance.amount + statement.excluded.amount,
+            "account_amount": AccountBalance.account_amount
+            + statement.excluded.account_amount,
+        },
+    )
+    connection.execute(statement)
+
+
+def _get_previous_value(target: Transaction, key: str) -> Any:
+    history = inspect(target).attrs[key].history
+    if history.deleted:
+        return history.deleted[0]
+    return getattr(target, key)
+
+
+@event.listens_for(Transaction, "after_insert")
+def transaction_after_insert(
+    mapper: Mapper[Any], connection: Connection, target: Transaction
+) -> None:
+    _apply_balance_delta(
+        connection,
+        target.account_id,
+        target.type,
+        target.amount,
+        target.account_amount,
+    )
+
+
+@event.listens_for(Transaction, "after_update")
+def transaction_after_update(
+    mapper: Mapper[Any], connection: Connection, target: Transaction
+) -> None:
+    previous = {
+        key: _get_previous_value(target, key)
+        for key in ("account_id", "type", "amount", "account_amount")
+    }
+    if all(getattr(target, key) == value for key, value in previous.items()):
+        return
+
+    _apply_balance_delta(
+        connection,
+        previous["account_id"],
+        previous["type"],
+        -previous["amount"],
+        -previous["account_amount"],
+    )
+    _apply_balance_delta(
+        connection,
+        target.account_id,
+        target.type,
+        target.amount,
+        target.account_amount,
+    )
+
+
+@event.listens_for(Transaction, "after_delete")
+def transaction_after_delete(
+    mapper: Mapper[Any], connection: Connection, target: Transaction
+) -> None:
+    _apply_balance_delta(
+        connection,
+        _get_previous_value(target, "account_id"),
+        _get_previous_value(target, "type"),
+        -_get_previous_value(target, "amount"),
+        -_get_previous_value(target, "account_amount"),
+    )
@@ -11,6 +11,7 @@ from sqlalchemy.orm import Mapped, declared_attr, mapped_column, relationship
 
 from polar.kit.db.models import RecordModel
 from polar.kit.metadata import MetadataMixin
+from polar.kit.search import TrigramIndex
 
 if TYPE_CHECKING:
     from polar.models import Organization
@@ -77,7 +78,11 @@ class CustomFieldSelectProperties(CustomFieldProperties):
 
 class CustomField(MetadataMixin, RecordModel):
     __tablename__ = "custom_fields"
-    __table_args__ = (UniqueConstraint("slug", "organization_id"),)
+    __table_args__ = (
+        UniqueConstraint("slug", "organization_id"),
+        TrigramIndex("ix_custom_fields_slug_trgm", "slug"),
+        TrigramIndex("ix_custom_fields_name_trgm", "name"),
+    )
 
     type: Mapped[CustomFieldType] = mapped_column(String, nullable=False, index=True)
     slug: Mapped[str] = mapped_column(CITEXT, nullable=False, index=True)
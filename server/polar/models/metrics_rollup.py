@@ -0,0 +1,117 @@
+from datetime import datetime
+from uuid import UUID
+
+from sqlalchemy import TIMESTAMP, BigInteger, ForeignKey, String, Uuid
+from sqlalchemy.orm import Mapped, mapped_column
+
+from polar.kit.db.models import Model
+from polar.models.product_price import ProductPriceType
+
+
+class MetricsRollup(Model):
+    """
+    Pre-aggregated orders and subscriptions figures, bucketed by hour.
+
+    There is one row per organization, product, price type and hour.
+    Rows are computed from `Order` and `Subscription` and kept up-to-date
+    by the `metrics.refresh_*` tasks. They are coarsened to the requested
+    interval when reading metrics.
+
+    Some metrics can't be summed from hourly values, like the number of
+    distinct renewed subscriptions during a month. For those, we store one column
+    per interval, computed against the interval bucket the hour belongs to.
+    """
+
+    __tablename__ = "metrics_rollups"
+
+    organization_id: Mapped[UUID] = mapped_column(
+        Uuid,
+        ForeignKey("organizations.id", ondelete="cascade"),
+        primary_key=True,
+    )
+    timestamp: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), primary_key=True
+    )
+    product_id: Mapped[UUID] = mapped_column(
+        Uuid,
+        ForeignKey("products.id", ondelete="cascade"),
+        primary_key=True,
+        index=True,
+    )
+    product_price_type: Mapped[ProductPriceType] = mapped_column(
+        String, primary_key=True
+    )
+
+    orders: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    revenue: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+    one_time_products: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    one_time_products_revenue: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+
+    new_subscriptions: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    """Number of subscriptions started during this hour."""
+    ended_subscriptions: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    """Number of subscriptions ended during this hour."""
+    new_monthly_recurring_revenue: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    """Monthly recurring revenue of the subscriptions started during this hour."""
+    ended_monthly_recurring_revenue: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    """Monthly recurring revenue of the subscriptions ended during this hour."""
+
+    new_subscriptions_revenue_hour: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    new_subscriptions_revenue_day: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    new_subscriptions_revenue_week: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    new_subscriptions_revenue_month: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    new_subscriptions_revenue_year: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+
+    renewed_subscriptions_hour: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_day: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_week: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_month: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_year: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+
+    renewed_subscriptions_revenue_hour: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_revenue_day: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_revenue_week: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_revenue_month: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
+    renewed_subscriptions_revenue_year: Mapped[int] = mapped_column(
+        BigInteger, nullable=False, default=0
+    )
@@ -18,6 +18,7 @@ from sqlalchemy.orm import Mapped, declared_attr, mapped_column, relationship
 
 from polar.config import settings
 from polar.kit.db.models import RecordModel
+from polar.kit.search import TrigramIndex
 
 from .account import Account
 
@@ -27,7 +28,10 @@ if TYPE_CHECKING:
 
 class Organization(RecordModel):
     __tablename__ = "organizations"
-    __table_args__ = (UniqueConstraint("slug"),)
+    __table_args__ = (
+        UniqueConstraint("slug"),
+        TrigramIndex("ix_organizations_slug_trgm", "slug"),
+    )
 
     name: Mapped[str] = mapped_column(String, nullable=False, index=True)
     slug: Mapped[str] = mapped_column(CITEXT, nullable=False, unique=True)
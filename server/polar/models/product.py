@@ -18,6 +18,7 @@ from sqlalchemy.orm import Mapped, declared_attr, mapped_column, relationship
 
 from polar.kit.db.models import RecordModel
 from polar.kit.metadata import MetadataMixin
+from polar.kit.search import TrigramIndex
 from polar.models.product_price import ProductPriceType
 
 from .product_price import ProductPrice
@@ -35,6 +36,7 @@ if TYPE_CHECKING:
 
 class Product(MetadataMixin, RecordModel):
     __tablename__ = "products"
+    __table_args__ = (TrigramIndex("ix_products_name_trgm", "name"),)
 
     name: Mapped[str] = mapped_column(CITEXT(), nullable=False)
     description: Mapped[str | None] = mapped_column(Text, nullable=True)
@@ -0,0 +1,42 @@
+from datetime import datetime
+from typing import Any
+
+from sqlalchemy import TIMESTAMP, Index, String
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import Mapped, mapped_column
+
+from polar.kit.db.models import RecordModel
+
+
+class StripeEvent(RecordModel):
+    """
+    Log of the webhook events received from Stripe.
+
+    Events are stored once, keyed by their Stripe ID, so retried deliveries
+    are skipped. Jobs only reference the stored event.
+
+    Processed events are deleted after a retention period,
+    see `StripeEventService.delete_processed`.
+    """
+
+    __tablename__ = "stripe_events"
+    __table_args__ = (
+        Index(
+            "ix_stripe_events_object_id_stripe_created_at",
+            "object_id",
+            "stripe_created_at",
+        ),
+    )
+
+    stripe_id: Mapped[str] = mapped_column(String, nullable=False, unique=True)
+    type: Mapped[str] = mapped_column(String, nullable=False)
+    object_id: Mapped[str | None] = mapped_column(String, nullable=True)
+    """ID of the object the event is about, e.g. the subscription or the charge."""
+    stripe_created_at: Mapped[datetime] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=False
+    )
+    data: Mapped[dict[str, Any]] = mapped_column(JSONB, nullable=False)
+    """The full event, as sent by Stripe."""
+    processed_at: Mapped[datetime | None] = mapped_column(
+        TIMESTAMP(timezone=True), nullable=True, default=None, index=True
+    )
@@ -8,6 +8,9 @@ from polar.auth.scope import SCOPES_SUPPORTED
 from polar.exceptions import Unauthorized
 from polar.kit.db.postgres import SyncSessionMaker
 from polar.models import OAuth2Token
+from polar.personal_access_token.service import (
+    TOKEN_PREFIX as PERSONAL_ACCESS_TOKEN_PREFIX,
+)
 from polar.postgres import AsyncSession, get_db_session
 
 from .authorization_server import AuthorizationServer
@@ -29,6 +32,10 @@ async def get_optional_token(
     if not authorization or scheme.lower() != "bearer":
         return None, False
 
+    # Don't bother looking up personal access tokens, they're handled by their own scheme
+    if access_token.startswith(PERSONAL_ACCESS_TOKEN_PREFIX):
+        return None, True
+
     token = await oauth2_token_service.get_by_access_token(session, access_token)
     return token, True
 
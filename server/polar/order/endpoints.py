@@ -1,16 +1,19 @@
-from typing import Annotated
+from typing import Annotated, Any
 
-from fastapi import Depends, Path, Query
+from fastapi import Depends, Path, Query, Request, Response
 from pydantic import UUID4
+from sqlalchemy import Row
 
 from polar.exceptions import ResourceNotFound
+from polar.kit.csv import CSVStreamingResponse, accepts_gzip, stream_csv
+from polar.kit.db.postgres import AsyncSessionMaker
 from polar.kit.pagination import ListResource, PaginationParamsQuery
 from polar.kit.schemas import MultipleQueryFilter
 from polar.models import Order
 from polar.models.product_price import ProductPriceType
 from polar.openapi import APITag
 from polar.organization.schemas import OrganizationID
-from polar.postgres import AsyncSession, get_db_session
+from polar.postgres import AsyncSession, get_db_session, get_db_sessionmaker
 from polar.product.schemas import ProductID
 from polar.routing import APIRouter
 
@@ -71,6 +74,102 @@ async def list(
     )
 
 
+@router.get("/export", summary="Export Orders")
+async def export(
+    request: Request,
+    auth_subject: auth.OrdersRead,
+    organization_id: MultipleQueryFilter[OrganizationID] | None = Query(
+        None, title="OrganizationID Filter", description="Filter by organization ID."
+    ),
+    product_id: MultipleQueryFilter[ProductID] | None = Query(
+        None, title="ProductID Filter", description="Filter by product ID."
+    ),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
+) -> Response:
+    """Export orders as a CSV file."""
+    statement = order_service.get_export_statement(
+        auth_subject, organization_id=organization_id, product_id=product_id
+    )
+
+    def get_row(row: Row[Any]) -> tuple[Any, ...]:
+        (
+            created_at,
+            id,
+            email,
+            product_name,
+            billing_reason,
+            amount,
+            tax_amount,
+            currency,
+            subscription_id,
+        ) = row
+        return (
+            created_at.isoformat(),
+            str(id),
+            email,
+            product_name,
+            billing_reason,
+            amount / 100,
+            tax_amount / 100,
+            currency,
+            str(subscription_id) if subscription_id is not None else "",
+        )
+
+    compressed = accepts_gzip(request)
+    content = stream_csv(
+        sessionmaker,
+        statement,
+        (
+            "Date",
+            "Order ID",
+            "Email",
+            "Product",
+            "Billing Reason",
+            "Amount",
+            "Tax Amount",
+            "Currency",
+            "Subscription ID",
+        ),
+        get_row,
+        compress=compressed,
+    )
+    return CSVStreamingResponse(content, "polar-orders.csv", compressed=compressed)
+
+
+@router.get("/customers/export", summary="Export Customers")
+async def export_customers(
+    request: Request,
+    auth_subject: auth.OrdersRead,
+    organization_id: MultipleQueryFilter[OrganizationID] | None = Query(
+        None, title="OrganizationID Filter", description="Filter by organization ID."
+    ),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
+) -> Response:
+    """Export the customers who placed an order as a CSV file."""
+    statement = order_service.get_customers_export_statement(
+        auth_subject, organization_id=organization_id
+    )
+
+    def get_row(row: Row[Any]) -> tuple[Any, ...]:
+        email, orders, first_order_at, last_order_at = row
+        return (
+            email,
+            orders,
+            first_order_at.isoformat(),
+            last_order_at.isoformat(),
+        )
+
+    compressed = accepts_gzip(request)
+    content = stream_csv(
+        sessionmaker,
+        statement,
+        ("Email", "Orders", "First Order At", "Last Order At"),
+        get_row,
+        compress=compressed,
+    )
+    return CSVStreamingResponse(content, "polar-customers.csv", compressed=compressed)
+
+
 @router.get(
     "/{id}",
     summary="Get Order",
@@ -5,7 +5,7 @@ from typing import Any
 
 import stripe as stripe_lib
 import structlog
-from sqlalchemy import Select, UnaryExpression, asc, desc, select
+from sqlalchemy import Select, UnaryExpression, asc, desc, func, select
 from sqlalchemy.orm import aliased, contains_eager, joinedload
 
 from polar.account.service import account as account_service
@@ -24,6 +24,7 @@ from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.logging import Logger
+from polar.metrics.service import metrics as metrics_service
 from polar.models import (
     Checkout,
     HeldBalance,
@@ -196,6 +197,73 @@ class OrderService(ResourceServiceReader[Order]):
 
         return await paginate(session, statement, pagination=pagination)
 
+    def get_export_statement(
+        self,
+        auth_subject: AuthSubject[User | Organization],
+        *,
+        organization_id: Sequence[uuid.UUID] | None = None,
+        product_id: Sequence[uuid.UUID] | None = None,
+    ) -> Select[Any]:
+        """
+        Statement selecting the columns of the orders CSV export.
+
+        Use it with `polar.kit.csv.stream_csv`.
+        """
+        statement = (
+            self._get_readable_order_statement(auth_subject)
+            .join(Order.user)
+            .with_only_columns(
+                Order.created_at,
+                Order.id,
+                User.email,
+                Product.name,
+                Order.billing_reason,
+                Order.amount,
+                Order.tax_amount,
+                Order.currency,
+                Order.subscription_id,
+            )
+            .order_by(Order.created_at.desc(), Order.id)
+        )
+
+        if organization_id is not None:
+            statement = statement.where(Product.organization_id.in_(organization_id))
+
+        if product_id is not None:
+            statement = statement.where(Order.product_id.in_(product_id))
+
+        return statement
+
+    def get_customers_export_statement(
+        self,
+        auth_subject: AuthSubject[User | Organization],
+        *,
+        organization_id: Sequence[uuid.UUID] | None = None,
+    ) -> Select[Any]:
+        """
+        Statement selecting the columns of the customers CSV export,
+        i.e. the users who placed an order, with a summary of their orders.
+
+        Use it with `polar.kit.csv.stream_csv`.
+        """
+        statement = (
+            self._get_readable_order_statement(auth_subject)
+            .join(Order.user)
+            .with_only_columns(
+                User.email,
+                func.count(Order.id),
+                func.min(Order.created_at),
+                func.max(Order.created_at),
+            )
+            .group_by(User.id, User.email)
+            .order_by(func.min(Order.created_at).desc(), User.id)
+        )
+
+        if organization_id is not None:
+            statement = statement.where(Product.organization_id.in_(organization_id))
+
+        return statement
+
     async def get_by_id(
         self,
         session: AsyncSession,
@@ -420,6 +488,8 @@ class OrderService(ResourceServiceReader[Order]):
 
         await self._send_webhook(session, order)
 
+        metrics_service.enqueue_order_rollups_refresh(order)
+
         return order
 
     async def send_admin_notification(
@@ -0,0 +1,279 @@
+import itertools
+import json
+import time
+import uuid
+from collections import OrderedDict
+from collections.abc import Sequence
+from datetime import datetime
+from typing import Any, TypeVar
+
+from redis.exceptions import WatchError
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, UOWTransaction, make_transient_to_detached
+
+from polar.kit.utils import utc_now
+from polar.models import OAuthAccount, PersonalAccessToken, User
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from polar.worker import enqueue_job
+
+KEY_PREFIX = "personal_access_token:auth"
+CACHE_TTL = 60
+"""How long authenticated tokens are kept in Redis, in seconds."""
+LOCAL_CACHE_TTL = 5
+"""
+How long authenticated tokens are kept in the process memory, in seconds.
+
+Invalidations only reach Redis, so it bounds how long a revoked token
+or a blocked user can still authenticate on other processes.
+"""
+LOCAL_CACHE_SIZE = 1024
+OAUTH_ACCOUNT_COLUMNS = (
+    "id",
+    "created_at",
+    "modified_at",
+    "deleted_at",
+    "platform",
+    "account_id",
+    "account_email",
+    "account_username",
+    "user_id",
+)
+"""
+Columns of the user's OAuth accounts kept in the cache.
+
+Their tokens are left out: they're loaded from the database when accessed.
+"""
+
+M = TypeVar("M")
+
+
+def _token_key(token_hash: str) -> str:
+    return f"{KEY_PREFIX}:token:{token_hash}"
+
+
+def _user_key(user_id: uuid.UUID | str) -> str:
+    return f"{KEY_PREFIX}:user:{user_id}"
+
+
+def _tombstone_key(key: str) -> str:
+    return f"{key}:invalidated"
+
+
+class _LocalCache:
+    """A small LRU of raw entries, each expiring after `LOCAL_CACHE_TTL`."""
+
+    def __init__(self, maxsize: int, ttl: float) -> None:
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[float, str]] = OrderedDict()
+
+    def get(self, key: str) -> str | None:
+        item = self._entries.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key: str, value: str) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+
+_local_cache = _LocalCache(LOCAL_CACHE_SIZE, LOCAL_CACHE_TTL)
+
+
+def clear_local_cache() -> None:
+    _local_cache.clear()
+
+
+def _dump_columns(obj: Any, only: Sequence[str] | None = None) -> dict[str, Any]:
+    return {
+        attr.key: getattr(obj, attr.key)
+        for attr in inspect(obj).mapper.column_attrs
+        if only is None or attr.key in only
+    }
+
+
+def _load_columns(model: type[M], values: dict[str, Any]) -> M:
+    """
+    Build a model instance from dumped columns.
+
+    Columns missing from `values` are left unloaded, so they're expired
+    once the instance is attached to a session.
+    """
+    kwargs: dict[str, Any] = {}
+    for attr in inspect(model).column_attrs:
+        if attr.key not in values:
+            continue
+        value = values[attr.key]
+        if value is not None:
+            python_type = attr.columns[0].type.python_type
+            if python_type is datetime:
+                value = datetime.fromisoformat(value)
+            elif python_type is uuid.UUID:
+                value = uuid.UUID(value)
+        kwargs[attr.key] = value
+    return model(**kwargs)
+
+
+class PersonalAccessTokenCache:
+    """
+    Cache authenticated personal access tokens, with their user, by token hash.
+
+    Entries are kept in Redis, fronted by a short-lived in-process LRU.
+    They're invalidated after commit whenever the token, its user or one of
+    the user's OAuth accounts changes, e.g. when the token is deleted or revoked,
+    or when the user is blocked.
+
+    Hits are attached to the session without loading them,
+    so they authenticate the request without touching the database.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    async def get(
+        self, session: AsyncSession, token_hash: str
+    ) -> PersonalAccessToken | None:
+        key = _token_key(token_hash)
+        raw_entry = _local_cache.get(key)
+        if raw_entry is None:
+            raw_entry = await self.redis.get(key)
+            if raw_entry is None:
+                return None
+            _local_cache.set(key, raw_entry)
+
+        entry = json.loads(raw_entry)
+        user = _load_columns(User, entry["user"])
+        user.oauth_accounts = [
+            _load_columns(OAuthAccount, oauth_account)
+            for oauth_account in entry["oauth_accounts"]
+        ]
+        personal_access_token = _load_columns(PersonalAccessToken, entry["token"])
+        personal_access_token.user = user
+
+        expires_at = personal_access_token.expires_at
+        if expires_at is not None and expires_at <= utc_now():
+            return None
+
+        for obj in (personal_access_token, user, *user.oauth_accounts):
+            make_transient_to_detached(obj)
+        return await session.merge(personal_access_token, load=False)
+
+    async def set(self, personal_access_token: PersonalAccessToken) -> None:
+        """
+        Store a token loaded from the database.
+
+        It's skipped if the token or its user were invalidated recently: the token
+        might have been loaded before the invalidated changes were committed.
+        """
+        user = personal_access_token.user
+        entry = {
+            "token": _dump_columns(personal_access_token),
+            "user": _dump_columns(user),
+            "oauth_accounts": [
+                _dump_columns(oauth_account, OAUTH_ACCOUNT_COLUMNS)
+                for oauth_account in user.oauth_accounts
+            ],
+        }
+        raw_entry = json.dumps(entry, default=str)
+        key = _token_key(personal_access_token.token)
+        user_key = _user_key(user.id)
+        tombstone_keys = (
+            _tombstone_key(key),
+            _tombstone_key(user_key),
+        )
+        async with self.redis.pipeline(transaction=True) as pipe:
+            try:
+                await pipe.watch(*tombstone_keys)
+                if await pipe.exists(*tombstone_keys):
+                    return
+                pipe.multi()
+                pipe.set(key, raw_entry, ex=CACHE_TTL)
+                pipe.sadd(user_key, personal_access_token.token)
+                pipe.expire(user_key, CACHE_TTL)
+                await pipe.execute()
+            # Invalidated while we were storing it
+            except WatchError:
+                return
+        _local_cache.set(key, raw_entry)
+
+    async def invalidate(
+        self, token_hashes: set[str], user_ids: set[uuid.UUID]
+    ) -> None:
+        user_keys = [_user_key(user_id) for user_id in user_ids]
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for user_key in user_keys:
+                pipe.smembers(user_key)
+            results: list[set[str]] = await pipe.execute()
+        keys = [_token_key(token_hash) for token_hash in token_hashes.union(*results)]
+
+        for key in keys:
+            _local_cache.delete(key)
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for key in [*keys, *user_keys]:
+                pipe.set(_tombstone_key(key), 1, ex=CACHE_TTL)
+                pipe.delete(key)
+            await pipe.execute()
+
+
+_INVALIDATIONS_KEY = "personal_access_token_invalidations"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session: Session, flush_context: UOWTransaction) -> None:
+    token_hashes: set[str] = set()
+    user_ids: set[uuid.UUID] = set()
+    for obj in itertools.chain(session.dirty, session.deleted):
+        if isinstance(obj, PersonalAccessToken):
+            token_hashes.add(obj.token)
+        elif isinstance(obj, User):
+            user_ids.add(obj.id)
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, OAuthAccount):
+            user_ids.add(obj.user_id)
+
+    if token_hashes or user_ids:
+        invalidations: dict[str, set[Any]] = session.info.setdefault(
+            _INVALIDATIONS_KEY, {"token_hashes": set(), "user_ids": set()}
+        )
+        invalidations["token_hashes"] |= token_hashes
+        invalidations["user_ids"] |= user_ids
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_invalidations(session: Session) -> None:
+    invalidations: dict[str, set[Any]] | None = session.info.pop(
+        _INVALIDATIONS_KEY, None
+    )
+    if invalidations is None:
+        return
+
+    # Like every enqueued job, it's only sent once the request or job succeeds
+    enqueue_job(
+        "personal_access_token.invalidate_auth_cache",
+        token_hashes=list(invalidations["token_hashes"]),
+        user_ids=list(invalidations["user_ids"]),
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_INVALIDATIONS_KEY, None)
+
+
+__all__ = ["PersonalAccessTokenCache", "clear_local_cache"]
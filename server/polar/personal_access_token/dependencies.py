@@ -1,11 +1,15 @@
 from fastapi import Depends
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+from polar.config import settings
+from polar.kit.crypto import get_token_hash
 from polar.kit.utils import utc_now
 from polar.models import PersonalAccessToken
+from polar.oauth2.constants import ACCESS_TOKEN_PREFIX
 from polar.postgres import AsyncSession, get_db_session
-from polar.worker import enqueue_job
+from polar.redis import Redis, get_redis
 
+from .cache import PersonalAccessTokenCache
 from .service import personal_access_token as personal_access_token_service
 
 auth_header_scheme = HTTPBearer(
@@ -18,19 +22,26 @@ auth_header_scheme = HTTPBearer(
 async def get_optional_personal_access_token(
     auth_header: HTTPAuthorizationCredentials | None = Depends(auth_header_scheme),
     session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
 ) -> tuple[PersonalAccessToken | None, bool]:
     if auth_header is None:
         return None, False
 
-    token = await personal_access_token_service.get_by_token(
-        session, auth_header.credentials
-    )
+    # Don't bother looking up OAuth2 access tokens, they're handled by their own scheme
+    if auth_header.credentials.startswith(tuple(ACCESS_TOKEN_PREFIX.values())):
+        return None, True
 
-    if token is not None:
-        enqueue_job(
-            "personal_access_token.record_usage",
-            personal_access_token_id=token.id,
-            last_used_at=utc_now(),
+    cache = PersonalAccessTokenCache(redis)
+    token_hash = get_token_hash(auth_header.credentials, secret=settings.SECRET)
+    token = await cache.get(session, token_hash)
+    if token is None:
+        token = await personal_access_token_service.get_by_token(
+            session, auth_header.credentials
         )
+        if token is not None:
+            await cache.set(token)
+
+    if token is not None:
+        await personal_access_token_service.record_usage(redis, token.id, utc_now())
 
     return token, True
@@ -19,12 +19,14 @@ from polar.kit.utils import utc_now
 from polar.logging import Logger
 from polar.models import PersonalAccessToken, User
 from polar.postgres import AsyncSession
+from polar.redis import Redis
 
 from .schemas import PersonalAccessTokenCreate
 
 log: Logger = structlog.get_logger()
 
 TOKEN_PREFIX = "polar_pat_"
+USAGE_REDIS_KEY = "personal_access_token:usage"
 
 
 class PersonalAccessTokenService(ResourceServiceReader[PersonalAccessToken]):
@@ -104,14 +106,33 @@ class PersonalAccessTokenService(ResourceServiceReader[PersonalAccessToken]):
         session.add(personal_access_token)
 
     async def record_usage(
-        self, session: AsyncSession, id: UUID, last_used_at: datetime
+        self, redis: Redis, id: UUID, last_used_at: datetime
     ) -> None:
-        statement = (
-            update(PersonalAccessToken)
-            .where(PersonalAccessToken.id == id)
-            .values(last_used_at=last_used_at)
+        """
+        Record the last usage of a token in Redis.
+
+        Usages are coalesced by token and written in bulk
+        to the database by `flush_usage`.
+        """
+        await redis.hset(USAGE_REDIS_KEY, str(id), last_used_at.isoformat())
+
+    async def flush_usage(self, session: AsyncSession, redis: Redis) -> None:
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(USAGE_REDIS_KEY)
+            pipe.delete(USAGE_REDIS_KEY)
+            usages: dict[str, str]
+            usages, _ = await pipe.execute()
+
+        if len(usages) == 0:
+            return
+
+        await session.execute(
+            update(PersonalAccessToken),
+            [
+                {"id": UUID(id), "last_used_at": datetime.fromisoformat(last_used_at)}
+                for id, last_used_at in usages.items()
+            ],
         )
-        await session.execute(statement)
 
     async def revoke_leaked(
         self,
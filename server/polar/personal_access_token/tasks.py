@@ -1,11 +1,26 @@
 import uuid
 from datetime import datetime
 
-from polar.worker import AsyncSessionMaker, JobContext, PolarWorkerContext, task
+from polar.worker import (
+    AsyncSessionMaker,
+    CronTrigger,
+    JobContext,
+    PolarWorkerContext,
+    QueueName,
+    get_worker_redis,
+    task,
+)
 
+from .cache import PersonalAccessTokenCache
 from .service import personal_access_token as personal_access_token_service
 
 
+@task("personal_access_token.flush_usage", cron_trigger=CronTrigger(second=0))
+async def personal_access_token_flush_usage(ctx: JobContext) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        await personal_access_token_service.flush_usage(session, get_worker_redis(ctx))
+
+
 @task("personal_access_token.record_usage")
 async def record_usage(
     ctx: JobContext,
@@ -13,7 +28,20 @@ async def record_usage(
     last_used_at: datetime,
     polar_context: PolarWorkerContext,
 ) -> None:
-    async with AsyncSessionMaker(ctx) as session:
-        await personal_access_token_service.record_usage(
-            session, personal_access_token_id, last_used_at
-        )
+    # Jobs enqueued before usages were coalesced: hand them to `flush_usage`.
+    # Remove it in the release after the one that coalesced usages: by then,
+    # every job enqueued by the releases before has been processed.
+    await personal_access_token_service.record_usage(
+        get_worker_redis(ctx), personal_access_token_id, last_used_at
+    )
+
+
+@task("personal_access_token.invalidate_auth_cache", queue_name=QueueName.critical)
+async def personal_access_token_invalidate_auth_cache(
+    ctx: JobContext,
+    token_hashes: list[str],
+    user_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    cache = PersonalAccessTokenCache(get_worker_redis(ctx))
+    await cache.invalidate(set(token_hashes), set(user_ids))
@@ -1,3 +1,4 @@
+from collections.abc import Iterable
 from uuid import UUID
 
 from fastapi import Depends, HTTPException, Query
@@ -9,10 +10,12 @@ from polar.auth.models import Subject, is_user
 from polar.authz.service import AccessType, Authz
 from polar.exceptions import BadRequest, ResourceNotFound, Unauthorized
 from polar.issue.service import issue as issue_service
+from polar.kit.loader import Loader
 from polar.kit.pagination import ListResource, Pagination
 from polar.models.issue import Issue
 from polar.models.pledge import Pledge
 from polar.models.user import User
+from polar.models.user_organization import UserOrganization
 from polar.openapi import APITag
 from polar.organization.schemas import OrganizationID
 from polar.organization.service import organization as organization_service
@@ -41,8 +44,30 @@ from .service import pledge as pledge_service
 router = APIRouter(tags=["pledges", APITag.private])
 
 
+MembershipsLoader = Loader[tuple[UUID, UUID], UserOrganization]
+
+
+def prime_memberships(
+    memberships: MembershipsLoader, subject: Subject, pledges: Iterable[Pledge]
+) -> None:
+    """Schedule the memberships needed to serialize the pledges in a single query."""
+    if not isinstance(subject, User):
+        return
+
+    memberships.prime(
+        (subject.id, organization_id)
+        for pledge in pledges
+        for organization_id in (
+            pledge.organization_id,
+            pledge.by_organization_id,
+            pledge.on_behalf_of_organization_id,
+        )
+        if organization_id is not None
+    )
+
+
 async def include_receiver_admin_fields(
-    session: AsyncSession,
+    memberships: MembershipsLoader,
     subject: Subject,
     pledge: Pledge,
 ) -> bool:
@@ -54,9 +79,7 @@ async def include_receiver_admin_fields(
 
     # is member of receiver org
     if pledge.organization_id:
-        m = await user_organization_service.get_by_user_and_org(
-            session, subject.id, pledge.organization_id
-        )
+        m = await memberships.load((subject.id, pledge.organization_id))
         if m:
             return True
 
@@ -64,7 +87,7 @@ async def include_receiver_admin_fields(
 
 
 async def include_sender_admin_fields(
-    session: AsyncSession,
+    memberships: MembershipsLoader,
     subject: Subject,
     pledge: Pledge,
 ) -> bool:
@@ -80,16 +103,12 @@ async def include_sender_admin_fields(
 
     # is member of sending org
     if pledge.by_organization_id:
-        m = await user_organization_service.get_by_user_and_org(
-            session, subject.id, pledge.by_organization_id
-        )
+        m = await memberships.load((subject.id, pledge.by_organization_id))
         if m:
             return True
 
     if pledge.on_behalf_of_organization_id:
-        m = await user_organization_service.get_by_user_and_org(
-            session, subject.id, pledge.on_behalf_of_organization_id
-        )
+        m = await memberships.load((subject.id, pledge.on_behalf_of_organization_id))
         if m:
             return True
 
@@ -97,7 +116,7 @@ async def include_sender_admin_fields(
 
 
 async def include_sender_fields(
-    session: AsyncSession,
+    memberships: MembershipsLoader,
     subject: Subject,
     pledge: Pledge,
 ) -> bool:
@@ -113,30 +132,36 @@ async def include_sender_fields(
 
     # is member if sending org
     if pledge.by_organization_id:
-        if await user_organization_service.get_by_user_and_org(
-            session, subject.id, pledge.by_organization_id
-        ):
+        if await memberships.load((subject.id, pledge.by_organization_id)):
             return True
 
     if pledge.on_behalf_of_organization_id:
-        if await user_organization_service.get_by_user_and_org(
-            session, subject.id, pledge.on_behalf_of_organization_id
-        ):
+        if await memberships.load((subject.id, pledge.on_behalf_of_organization_id)):
             return True
 
     return False
 
 
-async def to_schema(session: AsyncSession, subject: Subject, p: Pledge) -> PledgeSchema:
+async def to_schema(
+    session: AsyncSession,
+    subject: Subject,
+    p: Pledge,
+    *,
+    memberships: MembershipsLoader | None = None,
+) -> PledgeSchema:
+    if memberships is None:
+        memberships = user_organization_service.get_loader(session)
+    prime_memberships(memberships, subject, [p])
+
     return PledgeSchema.from_db(
         p,
         include_receiver_admin_fields=await include_receiver_admin_fields(
-            session, subject, p
+            memberships, subject, p
         ),
         include_sender_admin_fields=await include_sender_admin_fields(
-            session, subject, p
+            memberships, subject, p
         ),
-        include_sender_fields=await include_sender_fields(session, subject, p),
+        include_sender_fields=await include_sender_fields(memberships, subject, p),
     )
 
 
@@ -236,10 +261,14 @@ async def search(
         load_pledger=True,
     )
 
+    readable_pledges = [
+        p for p in pledges if await authz.can(auth_subject.subject, AccessType.read, p)
+    ]
+    memberships = user_organization_service.get_loader(session)
+    prime_memberships(memberships, auth_subject.subject, readable_pledges)
     items = [
-        await to_schema(session, auth_subject.subject, p)
-        for p in pledges
-        if await authz.can(auth_subject.subject, AccessType.read, p)
+        await to_schema(session, auth_subject.subject, p, memberships=memberships)
+        for p in readable_pledges
     ]
 
     return ListResource(
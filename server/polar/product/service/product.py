@@ -16,6 +16,7 @@ from polar.integrations.loops.service import loops as loops_service
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.pagination import PaginationParams, paginate
+from polar.kit.search import search_filter, search_order_by
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.models import (
@@ -106,7 +107,7 @@ class ProductService(ResourceServiceReader[Product]):
             )
 
         if query is not None:
-            statement = statement.where(Product.name.ilike(f"%{query}%"))
+            statement = statement.where(search_filter(query, Product.name))
 
         if is_archived is not None:
             statement = statement.where(Product.is_archived.is_(is_archived))
@@ -121,7 +122,9 @@ class ProductService(ResourceServiceReader[Product]):
                 .options(contains_eager(Product.product_benefits))
             )
 
-        order_by_clauses: list[UnaryExpression[Any]] = []
+        order_by_clauses: list[UnaryExpression[Any]] = search_order_by(
+            query, Product.name
+        )
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
             if criterion == ProductSortProperty.created_at:
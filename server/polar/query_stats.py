@@ -0,0 +1,221 @@
+import contextlib
+import dataclasses
+import time
+from collections import Counter
+from collections.abc import Iterator
+from contextvars import ContextVar
+from typing import Any
+
+import structlog
+from sqlalchemy import Engine, event
+from sqlalchemy.engine import Connection, ExceptionContext
+from structlog.typing import EventDict, WrappedLogger
+
+from polar.config import settings
+from polar.redis import Redis
+
+# Not typed with `polar.logging.Logger`, which imports this module
+log: structlog.stdlib.BoundLogger = structlog.get_logger()
+
+REDIS_KEY_PREFIX = "query_stats"
+REDIS_UNITS_KEY = f"{REDIS_KEY_PREFIX}:active_units"
+FLUSH_INTERVAL = 10.0
+"""Minimum delay between two flushes of the aggregates to Redis, in seconds."""
+TTL = 7 * 24 * 3600
+"""Time in seconds before the aggregates of a unit without new data are discarded."""
+
+_START_TIMES_KEY = "query_stats_start_times"
+
+
+@dataclasses.dataclass
+class QueryStats:
+    """Queries run during a unit of work, i.e. an API request or a worker job."""
+
+    unit: str
+    queries: int = 0
+    duration: float = 0.0
+    repeated_statements: int = 0
+    statements: Counter[str] = dataclasses.field(default_factory=Counter)
+
+    @property
+    def duration_ms(self) -> float:
+        return self.duration * 1000
+
+
+@dataclasses.dataclass
+class QueryStatsAggregate:
+    units: int = 0
+    queries: int = 0
+    duration_ms: float = 0.0
+    repeated_statements: int = 0
+
+    def add(self, stats: QueryStats) -> None:
+        self.units += 1
+        self.queries += stats.queries
+        self.duration_ms += stats.duration_ms
+        self.repeated_statements += stats.repeated_statements
+
+
+_current_stats: ContextVar[QueryStats | None] = ContextVar(
+    "polar_query_stats", default=None
+)
+_aggregates: dict[str, QueryStatsAggregate] = {}
+_last_flush = time.monotonic()
+
+
+def _before_cursor_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    stats = _current_stats.get()
+    if stats is None:
+        return
+
+    conn.info.setdefault(_START_TIMES_KEY, []).append(time.perf_counter())
+    stats.queries += 1
+    stats.statements[statement] += 1
+
+    # Parameters are bound separately, so the statement is the same
+    # when a query runs in a loop, e.g. to lazy load a relationship.
+    if (
+        stats.statements[statement]
+        == settings.DATABASE_REPEATED_STATEMENT_THRESHOLD + 1
+    ):
+        stats.repeated_statements += 1
+        log.warning(
+            "polar.query_stats.repeated_statement",
+            unit=stats.unit,
+            threshold=settings.DATABASE_REPEATED_STATEMENT_THRESHOLD,
+            statement=statement,
+        )
+
+
+def _after_cursor_execute(
+    conn: Connection,
+    cursor: Any,
+    statement: str,
+    parameters: Any,
+    context: Any,
+    executemany: bool,
+) -> None:
+    stats = _current_stats.get()
+    start_times: list[float] = conn.info.get(_START_TIMES_KEY, [])
+    if stats is None or not start_times:
+        return
+    stats.duration += time.perf_counter() - start_times.pop()
+
+
+def _handle_error(context: ExceptionContext) -> None:
+    if context.connection is None:
+        return
+    start_times: list[float] = context.connection.info.get(_START_TIMES_KEY, [])
+    if start_times:
+        start_times.pop()
+
+
+def instrument_query_stats(engine: Engine) -> None:
+    """Count the queries run by the engine in the current unit of work."""
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+@contextlib.contextmanager
+def track_queries(unit: str) -> Iterator[QueryStats]:
+    """
+    Track the queries run in the block.
+
+    The unit name can be changed on the yielded stats until the block ends,
+    e.g. once the route of a request is known.
+    """
+    stats = QueryStats(unit)
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+        _aggregates.setdefault(stats.unit, QueryStatsAggregate()).add(stats)
+
+
+def add_query_stats(
+    logger: WrappedLogger, method_name: str, event_dict: EventDict
+) -> EventDict:
+    """structlog processor adding the counters of the current unit of work."""
+    stats = _current_stats.get()
+    if stats is not None:
+        event_dict["db_queries"] = stats.queries
+        event_dict["db_duration_ms"] = round(stats.duration_ms, 2)
+    return event_dict
+
+
+async def flush_query_stats(redis: Redis, *, force: bool = False) -> None:
+    """
+    Add the aggregates of this process to the ones stored in Redis.
+
+    Flushes happen at most every `FLUSH_INTERVAL` seconds, unless `force` is set,
+    so they're cheap enough to be attempted after each unit of work.
+    """
+    global _aggregates, _last_flush
+
+    now = time.monotonic()
+    if not force and now - _last_flush < FLUSH_INTERVAL:
+        return
+    _last_flush = now
+
+    if not _aggregates:
+        return
+    aggregates, _aggregates = _aggregates, {}
+
+    # Units are scored by their last flush, so the stale ones can be discarded
+    timestamp = time.time()
+    async with redis.pipeline(transaction=False) as pipe:
+        pipe.zadd(REDIS_UNITS_KEY, dict.fromkeys(aggregates.keys(), timestamp))
+        pipe.zremrangebyscore(REDIS_UNITS_KEY, "-inf", timestamp - TTL)
+        pipe.expire(REDIS_UNITS_KEY, TTL)
+        for unit, aggregate in aggregates.items():
+            key = f"{REDIS_KEY_PREFIX}:{unit}"
+            pipe.hincrby(key, "units", aggregate.units)
+            pipe.hincrby(key, "queries", aggregate.queries)
+            pipe.hincrbyfloat(key, "duration_ms", aggregate.duration_ms)
+            pipe.hincrby(key, "repeated_statements", aggregate.repeated_statements)
+            pipe.expire(key, TTL)
+        await pipe.execute()
+
+
+async def get_query_stats(redis: Redis) -> dict[str, QueryStatsAggregate]:
+    """Get the aggregates of every process, by unit of work."""
+    units = sorted(
+        await redis.zrangebyscore(REDIS_UNITS_KEY, time.time() - TTL, "+inf")
+    )
+    if not units:
+        return {}
+
+    async with redis.pipeline(transaction=False) as pipe:
+        for unit in units:
+            pipe.hgetall(f"{REDIS_KEY_PREFIX}:{unit}")
+        results: list[dict[str, str]] = await pipe.execute()
+
+    return {
+        unit: QueryStatsAggregate(
+            units=int(result.get("units", 0)),
+            queries=int(result.get("queries", 0)),
+            duration_ms=float(result.get("duration_ms", 0.0)),
+            repeated_statements=int(result.get("repeated_statements", 0)),
+        )
+        for unit, result in zip(units, results)
+    }
+
+
+__all__ = [
+    "QueryStats",
+    "QueryStatsAggregate",
+    "instrument_query_stats",
+    "track_queries",
+    "add_query_stats",
+    "flush_query_stats",
+    "get_query_stats",
+]
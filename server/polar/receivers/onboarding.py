@@ -1,30 +1,37 @@
+from uuid import UUID
+
 import structlog
 
 from polar.eventstream.service import publish
-from polar.issue.hooks import IssueHook, issue_upserted
+from polar.issue.hooks import IssuesHook, issues_upserted
 from polar.repository.hooks import (
     SyncCompletedHook,
     SyncedHook,
-    repository_issue_synced,
     repository_issues_sync_completed,
+    repository_issues_synced,
 )
 
 log = structlog.get_logger()
 
 
-async def on_issue_synced(hook: SyncedHook) -> None:
+async def on_issues_synced(hook: SyncedHook) -> None:
+    if not hook.records:
+        return
+
+    # Report progress once per batch, with its last issue
+    record = hook.records[-1]
     log.info(
         "issue.synced",
-        issue=hook.record.id,
-        title=hook.record.title,
+        issue=record.id,
+        title=record.title,
         synced=hook.synced,
     )
     await publish(
         "issue.synced",
         {
             "issue": {
-                "id": hook.record.id,
-                "title": hook.record.title,
+                "id": record.id,
+                "title": record.title,
             },
             "open_issues": hook.repository.open_issues or 0,
             "synced_issues": hook.synced,
@@ -36,7 +43,7 @@ async def on_issue_synced(hook: SyncedHook) -> None:
     )
 
 
-repository_issue_synced.add(on_issue_synced)
+repository_issues_synced.add(on_issues_synced)
 
 
 async def on_issue_sync_completed(
@@ -64,18 +71,25 @@ repository_issues_sync_completed.add(on_issue_sync_completed)
 ###############################################################################
 
 
-async def on_issue_updated(hook: IssueHook) -> None:
-    await publish(
-        "issue.updated",
-        {
-            "issue_id": hook.issue.id,
-            "organization_id": hook.issue.organization_id,
-            "repository_id": hook.issue.repository_id,
-        },
-        organization_id=hook.issue.organization_id,
-        run_in_worker=False,
-        redis=hook.redis,
-    )
+async def on_issues_updated(hook: IssuesHook) -> None:
+    # Publish once per repository of the batch, not once per issue
+    issue_ids: dict[tuple[UUID, UUID], list[UUID]] = {}
+    for issue in hook.issues:
+        key = (issue.organization_id, issue.repository_id)
+        issue_ids.setdefault(key, []).append(issue.id)
+
+    for (organization_id, repository_id), ids in issue_ids.items():
+        await publish(
+            "issue.updated",
+            {
+                "issue_ids": ids,
+                "organization_id": organization_id,
+                "repository_id": repository_id,
+            },
+            organization_id=organization_id,
+            run_in_worker=False,
+            redis=hook.redis,
+        )
 
 
-issue_upserted.add(on_issue_updated)
+issues_upserted.add(on_issues_updated)
@@ -6,7 +6,7 @@ from polar.config import settings
 from polar.external_organization.service import (
     external_organization as external_organization_service,
 )
-from polar.issue.hooks import IssueHook, issue_upserted
+from polar.issue.hooks import IssuesHook, issues_upserted
 from polar.issue.service import issue as issue_service
 from polar.kit.money import get_cents_in_dollar_string
 from polar.models import Issue
@@ -42,29 +42,46 @@ log = structlog.get_logger()
 
 
 async def mark_pledges_confirmation_pending_on_issue_close(
-    hook: IssueHook,
+    hook: IssuesHook,
 ) -> None:
-    if hook.issue.state == "closed":
+    closed_issues = [issue for issue in hook.issues if issue.state == "closed"]
+    if closed_issues:
         # Only do this if the issue has pledges
-        pledges = await pledge_service.get_by_issue_ids(hook.session, [hook.issue.id])
-        if len(pledges) == 0:
-            return
-
-        # Mark pledges in "created" as "confirmation_pending"
-        changed = await issue_service.mark_needs_confirmation(
-            hook.session, hook.issue.id
+        pledges = await pledge_service.get_by_issue_ids(
+            hook.session, [issue.id for issue in closed_issues]
         )
+        pledged_issue_ids = {pledge.issue_id for pledge in pledges}
+
+        for issue in closed_issues:
+            if issue.id not in pledged_issue_ids:
+                continue
 
-        # Send notifications
-        if changed:
-            await pledge_service.pledge_confirmation_pending_notifications(
-                hook.session, hook.issue.id
+            # Mark pledges in "created" as "confirmation_pending"
+            changed = await issue_service.mark_needs_confirmation(
+                hook.session, issue.id
             )
-    else:
-        await issue_service.mark_not_needs_confirmation(hook.session, hook.issue.id)
+
+            # Send notifications
+            if changed:
+                await pledge_service.pledge_confirmation_pending_notifications(
+                    hook.session, issue.id
+                )
+
+    # Issues were just upserted, so their state is fresh:
+    # only reset the ones actually marked as needing confirmation.
+    await issue_service.mark_not_needs_confirmation_many(
+        hook.session,
+        [
+            issue.id
+            for issue in hook.issues
+            if issue.state != "closed"
+            and issue.needs_confirmation_solved
+            and not issue.confirmed_solved_at
+        ],
+    )
 
 
-issue_upserted.add(mark_pledges_confirmation_pending_on_issue_close)
+issues_upserted.add(mark_pledges_confirmation_pending_on_issue_close)
 
 
 async def pledge_created_backoffice_discord_alert(hook: PledgeHook) -> None:
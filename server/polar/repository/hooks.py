@@ -1,3 +1,4 @@
+from collections.abc import Sequence
 from dataclasses import dataclass
 
 from polar.kit.hook import Hook
@@ -11,7 +12,7 @@ from polar.redis import Redis
 class SyncedHook:
     repository: Repository
     organization: ExternalOrganization
-    record: Issue
+    records: Sequence[Issue]
     synced: int
     redis: Redis
 
@@ -24,5 +25,5 @@ class SyncCompletedHook:
     redis: Redis
 
 
-repository_issue_synced: Hook[SyncedHook] = Hook()
+repository_issues_synced: Hook[SyncedHook] = Hook()
 repository_issues_sync_completed: Hook[SyncCompletedHook] = Hook()
@@ -0,0 +1,189 @@
+import hashlib
+import itertools
+import json
+import time
+import uuid
+from typing import NamedTuple
+
+from fastapi import Request, Response
+from sqlalchemy import event
+from sqlalchemy.orm import Session, UOWTransaction
+
+from polar.exceptions import ResourceNotModified
+from polar.models import (
+    Benefit,
+    Organization,
+    Product,
+    ProductBenefit,
+    ProductMedia,
+    ProductPrice,
+)
+from polar.redis import Redis
+from polar.worker import enqueue_job
+
+KEY_PREFIX = "storefront"
+CACHE_TTL = 300
+"""
+How long rendered payloads are kept, in seconds.
+
+It also bounds how long data not covered by the version, like the customers
+of a storefront, can be stale.
+"""
+
+
+class CachedPayload(NamedTuple):
+    etag: str
+    payload: str
+
+
+def _version_key(organization_id: uuid.UUID | str) -> str:
+    return f"{KEY_PREFIX}:organization:{organization_id}:version"
+
+
+def _payload_key(name: str) -> str:
+    return f"{KEY_PREFIX}:payload:{name}"
+
+
+def get_etag(name: str, version: str) -> str:
+    return hashlib.sha256(f"{name}:{version}".encode()).hexdigest()
+
+
+class StorefrontCache:
+    """
+    Cache rendered storefront and product embed payloads in Redis.
+
+    Each organization has a version, bumped whenever one of its products, prices,
+    medias or benefits changes. Payloads are stored with the version they were
+    rendered at, and are only served while it's still the current one.
+
+    The ETag of a payload is derived from its name and version,
+    so conditional requests are answered without touching the database.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    async def get_payload(self, name: str) -> CachedPayload | None:
+        raw_entry = await self.redis.get(_payload_key(name))
+        if raw_entry is None:
+            return None
+
+        entry = json.loads(raw_entry)
+        version = await self.get_version(entry["organization_id"])
+        if version != entry["version"]:
+            return None
+
+        return CachedPayload(get_etag(name, version), entry["payload"])
+
+    async def get_version(self, organization_id: uuid.UUID | str) -> str:
+        """
+        Get the current version of an organization.
+
+        A missing version is initialized to the current time rather than zero,
+        so an evicted version never matches payloads rendered before it was.
+        """
+        version_key = _version_key(organization_id)
+        version = await self.redis.get(version_key)
+        if version is not None:
+            return version
+        await self.redis.set(version_key, time.time_ns(), nx=True)
+        return await self.redis.get(version_key) or "0"
+
+    async def set_payload(
+        self, name: str, organization_id: uuid.UUID, version: str, payload: str
+    ) -> CachedPayload:
+        """
+        Store a payload rendered at the given version.
+
+        Get the version before loading the data to render: versions are bumped
+        by a job after changes are committed, so if a bump races with the render,
+        the payload is stored under the previous version and never served.
+        Getting it after would store stale data under the new version.
+        """
+        entry = {
+            "organization_id": str(organization_id),
+            "version": version,
+            "payload": payload,
+        }
+        await self.redis.set(_payload_key(name), json.dumps(entry), ex=CACHE_TTL)
+        return CachedPayload(get_etag(name, version), payload)
+
+    async def bump_versions(self, organization_ids: set[uuid.UUID]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for organization_id in organization_ids:
+                version_key = _version_key(organization_id)
+                pipe.set(version_key, time.time_ns(), nx=True)
+                pipe.incr(version_key)
+            await pipe.execute()
+
+
+def get_cached_response(request: Request, cached: CachedPayload) -> Response:
+    if request.headers.get("If-None-Match") == cached.etag:
+        raise ResourceNotModified()
+    return Response(
+        cached.payload, media_type="application/json", headers={"ETag": cached.etag}
+    )
+
+
+def get_storefront_cache_name(slug: str) -> str:
+    return f"storefront:{slug.lower()}"
+
+
+def get_product_embed_cache_name(
+    product_id: uuid.UUID, price_id: uuid.UUID | None
+) -> str:
+    return f"embed:{product_id}:{price_id or ''}"
+
+
+_INVALIDATIONS_KEY = "storefront_invalidations"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session: Session, flush_context: UOWTransaction) -> None:
+    organization_ids: set[uuid.UUID] = set()
+    product_ids: set[uuid.UUID] = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, Organization):
+            organization_ids.add(obj.id)
+        elif isinstance(obj, Product | Benefit):
+            organization_ids.add(obj.organization_id)
+        elif isinstance(obj, ProductPrice | ProductMedia | ProductBenefit):
+            product_ids.add(obj.product_id)
+
+    if organization_ids or product_ids:
+        invalidations: dict[str, set[uuid.UUID]] = session.info.setdefault(
+            _INVALIDATIONS_KEY, {"organization_ids": set(), "product_ids": set()}
+        )
+        invalidations["organization_ids"] |= organization_ids
+        invalidations["product_ids"] |= product_ids
+
+
+@event.listens_for(Session, "after_commit")
+def _enqueue_invalidations(session: Session) -> None:
+    invalidations: dict[str, set[uuid.UUID]] | None = session.info.pop(
+        _INVALIDATIONS_KEY, None
+    )
+    if invalidations is None:
+        return
+
+    # Like every enqueued job, it's only sent once the request or job succeeds
+    enqueue_job(
+        "storefront.invalidate",
+        organization_ids=list(invalidations["organization_ids"]),
+        product_ids=list(invalidations["product_ids"]),
+    )
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_INVALIDATIONS_KEY, None)
+
+
+__all__ = [
+    "CachedPayload",
+    "StorefrontCache",
+    "get_cached_response",
+    "get_etag",
+    "get_product_embed_cache_name",
+    "get_storefront_cache_name",
+]
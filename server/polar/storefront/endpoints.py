@@ -1,12 +1,14 @@
-from fastapi import Depends
+from fastapi import Depends, Request, Response
 
 from polar.exceptions import ResourceNotFound
 from polar.kit.pagination import PaginationParams
 from polar.models import Product
 from polar.openapi import APITag
 from polar.postgres import AsyncSession, get_db_session
+from polar.redis import Redis, get_redis
 from polar.routing import APIRouter
 
+from .cache import StorefrontCache, get_cached_response, get_storefront_cache_name
 from .schemas import Storefront
 from .service import storefront as storefront_service
 
@@ -24,8 +26,25 @@ OrganizationNotFound = {
     response_model=Storefront,
     responses={404: OrganizationNotFound},
 )
-async def get(slug: str, session: AsyncSession = Depends(get_db_session)) -> Storefront:
+async def get(
+    slug: str,
+    request: Request,
+    session: AsyncSession = Depends(get_db_session),
+    redis: Redis = Depends(get_redis),
+) -> Response:
     """Get an organization storefront by slug."""
+    cache = StorefrontCache(redis)
+    cache_name = get_storefront_cache_name(slug)
+    cached = await cache.get_payload(cache_name)
+    if cached is not None:
+        return get_cached_response(request, cached)
+
+    # Get the version before loading the data to render, see `set_payload`
+    organization_id = await storefront_service.get_organization_id(session, slug)
+    if organization_id is None:
+        raise ResourceNotFound()
+    version = await cache.get_version(organization_id)
+
     organization = await storefront_service.get(session, slug)
     if organization is None:
         raise ResourceNotFound()
@@ -40,7 +59,7 @@ async def get(slug: str, session: AsyncSession = Depends(get_db_session)) -> Sto
         session, organization, pagination=PaginationParams(1, 3)
     )
 
-    return Storefront.model_validate(
+    storefront = Storefront.model_validate(
         {
             "organization": organization,
             "products": organization.products,
@@ -51,3 +70,7 @@ async def get(slug: str, session: AsyncSession = Depends(get_db_session)) -> Sto
             },
         }
     )
+    cached = await cache.set_payload(
+        cache_name, organization.id, version, storefront.model_dump_json(by_alias=True)
+    )
+    return get_cached_response(request, cached)
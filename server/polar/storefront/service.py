@@ -1,3 +1,4 @@
+import uuid
 from collections.abc import Sequence
 
 from sqlalchemy import and_, select
@@ -28,6 +29,31 @@ class StorefrontService:
         result = await session.execute(statement)
         return result.unique().scalar_one_or_none()
 
+    async def get_organization_id(
+        self, session: AsyncSession, slug: str
+    ) -> uuid.UUID | None:
+        statement = select(Organization.id).where(
+            Organization.deleted_at.is_(None), Organization.slug == slug
+        )
+        result = await session.execute(statement)
+        return result.scalar_one_or_none()
+
+    async def get_product_organization_id(
+        self, session: AsyncSession, product_id: uuid.UUID
+    ) -> uuid.UUID | None:
+        statement = select(Product.organization_id).where(Product.id == product_id)
+        result = await session.execute(statement)
+        return result.scalar_one_or_none()
+
+    async def get_products_organization_ids(
+        self, session: AsyncSession, product_ids: Sequence[uuid.UUID]
+    ) -> set[uuid.UUID]:
+        if not product_ids:
+            return set()
+        statement = select(Product.organization_id).where(Product.id.in_(product_ids))
+        result = await session.execute(statement)
+        return set(result.scalars().all())
+
     async def list_customers(
         self,
         session: AsyncSession,
@@ -0,0 +1,29 @@
+import uuid
+
+from polar.worker import (
+    AsyncSessionMaker,
+    JobContext,
+    PolarWorkerContext,
+    QueueName,
+    get_worker_redis,
+    task,
+)
+
+from .cache import StorefrontCache
+from .service import storefront as storefront_service
+
+
+@task("storefront.invalidate", queue_name=QueueName.critical)
+async def storefront_invalidate(
+    ctx: JobContext,
+    organization_ids: list[uuid.UUID],
+    product_ids: list[uuid.UUID],
+    polar_context: PolarWorkerContext,
+) -> None:
+    async with AsyncSessionMaker(ctx) as session:
+        product_organization_ids = (
+            await storefront_service.get_products_organization_ids(session, product_ids)
+        )
+
+    cache = StorefrontCache(get_worker_redis(ctx))
+    await cache.bump_versions({*organization_ids, *product_organization_ids})
@@ -1,19 +1,17 @@
-from collections.abc import AsyncGenerator
-from typing import Annotated
+from typing import Annotated, Any
 
 import structlog
-from fastapi import Depends, Query, Response
-from fastapi.responses import StreamingResponse
+from fastapi import Depends, Query, Request, Response
+from sqlalchemy import Row
 
-from polar.kit.csv import (
-    IterableCSVWriter,
-)
-from polar.kit.pagination import ListResource, PaginationParams, PaginationParamsQuery
+from polar.kit.csv import CSVStreamingResponse, accepts_gzip, stream_csv
+from polar.kit.db.postgres import AsyncSessionMaker
+from polar.kit.pagination import ListResource, PaginationParamsQuery
 from polar.kit.schemas import MultipleQueryFilter
 from polar.kit.sorting import Sorting, SortingGetter
 from polar.openapi import APITag
 from polar.organization.schemas import OrganizationID
-from polar.postgres import AsyncSession, get_db_session
+from polar.postgres import AsyncSession, get_db_session, get_db_sessionmaker
 from polar.product.schemas import ProductID
 from polar.routing import APIRouter
 
@@ -71,52 +69,44 @@ async def list(
 
 @router.get("/export", summary="Export Subscriptions")
 async def export(
+    request: Request,
     auth_subject: auth.SubscriptionsRead,
     organization_id: MultipleQueryFilter[OrganizationID] | None = Query(
         None, description="Filter by organization ID."
     ),
-    session: AsyncSession = Depends(get_db_session),
+    sessionmaker: AsyncSessionMaker = Depends(get_db_sessionmaker),
 ) -> Response:
     """Export subscriptions as a CSV file."""
+    statement = subscription_service.get_export_statement(
+        auth_subject, organization_id=organization_id
+    )
 
-    async def create_csv() -> AsyncGenerator[str, None]:
-        csv_writer = IterableCSVWriter(dialect="excel")
-        # CSV header
-        yield csv_writer.getrow(
-            (
-                "Email",
-                "Created At",
-                "Active",
-                "Product",
-                "Price",
-                "Currency",
-                "Interval",
-            )
-        )
-
-        (subscribers, _) = await subscription_service.list(
-            session,
-            auth_subject,
-            organization_id=organization_id,
-            pagination=PaginationParams(limit=1000000, page=1),
+    def get_row(row: Row[Any]) -> tuple[Any, ...]:
+        email, created_at, active, product_name, amount, currency, interval = row
+        return (
+            email,
+            created_at.isoformat(),
+            "true" if active else "false",
+            product_name,
+            amount / 100 if amount is not None else "",
+            currency if currency is not None else "",
+            interval,
         )
 
-        for sub in subscribers:
-            yield csv_writer.getrow(
-                (
-                    sub.user.email,
-                    sub.created_at.isoformat(),
-                    "true" if sub.active else "false",
-                    sub.product.name,
-                    sub.amount / 100 if sub.amount is not None else "",
-                    sub.currency if sub.currency is not None else "",
-                    sub.recurring_interval,
-                )
-            )
-
-    filename = "polar-subscribers.csv"
-    return StreamingResponse(
-        create_csv(),
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
+    compressed = accepts_gzip(request)
+    content = stream_csv(
+        sessionmaker,
+        statement,
+        (
+            "Email",
+            "Created At",
+            "Active",
+            "Product",
+            "Price",
+            "Currency",
+            "Interval",
+        ),
+        get_row,
+        compress=compressed,
     )
+    return CSVStreamingResponse(content, "polar-subscribers.csv", compressed=compressed)
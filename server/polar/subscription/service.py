@@ -27,6 +27,7 @@ from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.kit.utils import utc_now
+from polar.metrics.service import metrics as metrics_service
 from polar.models import (
     Benefit,
     BenefitGrant,
@@ -267,6 +268,38 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
 
         return results, count
 
+    def get_export_statement(
+        self,
+        auth_subject: AuthSubject[User | Organization],
+        *,
+        organization_id: Sequence[uuid.UUID] | None = None,
+    ) -> Select[Any]:
+        """
+        Statement selecting the columns of the subscriptions CSV export.
+
+        Use it with `polar.kit.csv.stream_csv`.
+        """
+        statement = (
+            self._get_readable_subscriptions_statement(auth_subject)
+            .join(Subscription.user)
+            .where(Subscription.started_at.is_not(None))
+            .with_only_columns(
+                User.email,
+                Subscription.created_at,
+                Subscription.active,
+                Product.name,
+                Subscription.amount,
+                Subscription.currency,
+                Subscription.recurring_interval,
+            )
+            .order_by(Subscription.started_at.desc(), Subscription.id)
+        )
+
+        if organization_id is not None:
+            statement = statement.where(Product.organization_id.in_(organization_id))
+
+        return statement
+
     async def get_by_stripe_subscription_id(
         self, session: AsyncSession, stripe_subscription_id: str
     ) -> Subscription | None:
@@ -489,6 +522,7 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             await self._send_webhook(
                 session, subscription, WebhookEventType.subscription_active
             )
+        metrics_service.enqueue_subscription_rollups_refresh(subscription)
 
     async def update_subscription_from_stripe(
         self, session: AsyncSession, *, stripe_subscription: stripe_lib.Subscription
@@ -502,6 +536,7 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
 
         previous_status = subscription.status
         previous_cancel_at_period_end = subscription.cancel_at_period_end
+        previous_ended_at = subscription.ended_at
 
         subscription.status = SubscriptionStatus(stripe_subscription.status)
         subscription.current_period_start = _from_timestamp(
@@ -554,7 +589,11 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
         await self.enqueue_benefits_grants(session, subscription)
 
         await self._after_subscription_updated(
-            session, subscription, previous_status, previous_cancel_at_period_end
+            session,
+            subscription,
+            previous_status,
+            previous_cancel_at_period_end,
+            previous_ended_at,
         )
 
         if (
@@ -576,6 +615,7 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
         subscription: Subscription,
         previous_status: SubscriptionStatus,
         previous_cancel_at_period_end: bool,
+        previous_ended_at: datetime | None,
     ) -> None:
         await self._send_webhook(
             session, subscription, WebhookEventType.subscription_updated
@@ -592,6 +632,9 @@ class SubscriptionService(ResourceServiceReader[Subscription]):
             await self._send_webhook(
                 session, subscription, WebhookEventType.subscription_canceled
             )
+        metrics_service.enqueue_subscription_rollups_refresh(
+            subscription, [previous_ended_at]
+        )
 
     async def _send_webhook(
         self,
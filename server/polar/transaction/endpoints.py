@@ -1,6 +1,6 @@
 from typing import Annotated
 
-from fastapi import Depends, Query
+from fastapi import Depends, Query, Request
 from fastapi.responses import StreamingResponse
 from pydantic import UUID4
 
@@ -8,6 +8,7 @@ from polar.account.service import account as account_service
 from polar.auth.dependencies import WebUser
 from polar.authz.service import AccessType, Authz
 from polar.exceptions import NotPermitted, ResourceNotFound
+from polar.kit.csv import CSVStreamingResponse, accepts_gzip
 from polar.kit.db.postgres import AsyncSessionMaker
 from polar.kit.pagination import ListResource, PaginationParamsQuery
 from polar.kit.sorting import Sorting, SortingGetter
@@ -134,6 +135,7 @@ async def create_payout(
 
 @router.get("/payouts/{id}/csv")
 async def get_payout_csv(
+    request: Request,
     id: UUID4,
     auth_subject: WebUser,
     session: AsyncSession = Depends(get_db_session),
@@ -152,13 +154,10 @@ async def get_payout_csv(
     if not await authz.can(auth_subject.subject, AccessType.write, account):
         raise NotPermitted()
 
+    compressed = accepts_gzip(request)
     content = payout_transaction_service.get_payout_csv(
-        sessionmaker, account=account, payout=payout
+        sessionmaker, account=account, payout=payout, compress=compressed
     )
     filename = f"polar-payout-{payout.created_at.isoformat()}.csv"
 
-    return StreamingResponse(
-        content,
-        media_type="text/csv",
-        headers={"Content-Disposition": f"attachment; filename={filename}"},
-    )
+    return CSVStreamingResponse(content, filename, compressed=compressed)
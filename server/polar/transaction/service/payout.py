@@ -1,10 +1,10 @@
 from collections.abc import AsyncIterable, Sequence
 from datetime import timedelta
-from typing import cast
+from typing import Any, cast
 
 import stripe as stripe_lib
 import structlog
-from sqlalchemy import select
+from sqlalchemy import Row, select
 from sqlalchemy.orm import joinedload, selectinload
 
 from polar.account.service import account as account_service
@@ -12,11 +12,20 @@ from polar.config import settings
 from polar.enums import AccountType
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.integrations.stripe.utils import get_expandable_id
-from polar.kit.csv import IterableCSVWriter
+from polar.kit.csv import stream_csv
 from polar.kit.db.postgres import AsyncSessionMaker
 from polar.kit.utils import generate_uuid, utc_now
 from polar.logging import Logger
-from polar.models import Account, Issue, Order, Pledge, Transaction
+from polar.models import (
+    Account,
+    ExternalOrganization,
+    Issue,
+    Order,
+    Pledge,
+    Product,
+    Repository,
+    Transaction,
+)
 from polar.models.transaction import PaymentProcessor, TransactionType
 from polar.postgres import AsyncSession
 from polar.transaction.schemas import PayoutEstimate
@@ -315,31 +324,98 @@ class PayoutTransactionService(BaseTransactionService):
 
         return transaction
 
-    async def get_payout_csv(
-        self, sessionmaker: AsyncSessionMaker, *, account: Account, payout: Transaction
-    ) -> AsyncIterable[str]:
+    def get_payout_csv(
+        self,
+        sessionmaker: AsyncSessionMaker,
+        *,
+        account: Account,
+        payout: Transaction,
+        compress: bool = False,
+    ) -> AsyncIterable[bytes]:
         statement = (
-            select(Transaction)
+            select(
+                Transaction.created_at,
+                Transaction.id,
+                Transaction.incurred_by_transaction_id,
+                Transaction.platform_fee_type,
+                Transaction.currency,
+                Transaction.amount,
+                ExternalOrganization.name,
+                Repository.name,
+                Issue.number,
+                Product.name,
+                Order.subscription_id,
+            )
+            .join(Pledge, Pledge.id == Transaction.pledge_id, isouter=True)
+            .join(Issue, Issue.id == Pledge.issue_id, isouter=True)
+            .join(
+                ExternalOrganization,
+                ExternalOrganization.id == Issue.organization_id,
+                isouter=True,
+            )
+            .join(Repository, Repository.id == Issue.repository_id, isouter=True)
+            .join(Order, Order.id == Transaction.order_id, isouter=True)
+            .join(Product, Product.id == Order.product_id, isouter=True)
             .where(
                 Transaction.payout_transaction_id == payout.id,
                 Transaction.account_id == account.id,
             )
             .order_by(Transaction.created_at)
-            .options(
-                # Order
-                selectinload(Transaction.order).joinedload(Order.product),
-                # Pledge
-                selectinload(Transaction.pledge)
-                .joinedload(Pledge.issue)
-                .options(
-                    joinedload(Issue.organization),
-                    joinedload(Issue.repository),
-                ),
-            )
         )
 
-        csv_writer = IterableCSVWriter(dialect="excel")
-        yield csv_writer.getrow(
+        def get_row(row: Row[Any]) -> tuple[Any, ...]:
+            (
+                created_at,
+                id,
+                incurred_by_transaction_id,
+                platform_fee_type,
+                currency,
+                amount,
+                issue_organization_name,
+                issue_repository_name,
+                issue_number,
+                product_name,
+                order_subscription_id,
+            ) = row
+
+            description = ""
+            if platform_fee_type is not None:
+                if platform_fee_type == "platform":
+                    description = "Polar fee"
+                else:
+                    description = f"Payment processor fee ({platform_fee_type})"
+            elif issue_number is not None:
+                description = (
+                    f"Pledge to {issue_organization_name}/"
+                    f"{issue_repository_name}#{issue_number}"
+                )
+            elif product_name is not None:
+                if order_subscription_id is not None:
+                    description = f"Subscription to {product_name}"
+                else:
+                    description = f"Order of {product_name}"
+
+            transaction_id = (
+                str(id)
+                if incurred_by_transaction_id is None
+                else str(incurred_by_transaction_id)
+            )
+
+            return (
+                created_at.isoformat(),
+                str(payout.id),
+                transaction_id,
+                description,
+                currency,
+                amount / 100,
+                abs(payout.amount / 100),
+                account.currency,
+                abs(payout.account_amount / 100),
+            )
+
+        return stream_csv(
+            sessionmaker,
+            statement,
             (
                 "Date",
                 "Payout ID",
@@ -350,53 +426,11 @@ class PayoutTransactionService(BaseTransactionService):
                 "Payout Total",
                 "Account Currency",
                 "Account Payout Total",
-            )
+            ),
+            get_row,
+            compress=compress,
         )
 
-        # StreamingResponse is running its own async task to exhaust the iterator
-        # Thus, rely on the main session generated by the FastAPI dependency leads to
-        # garbage collection problems.
-        # We create a new session to avoid this.
-        async with sessionmaker() as session:
-            transactions = await session.stream_scalars(statement)
-            async for transaction in transactions:
-                description = ""
-                if transaction.platform_fee_type is not None:
-                    if transaction.platform_fee_type == "platform":
-                        description = "Polar fee"
-                    else:
-                        description = (
-                            f"Payment processor fee ({transaction.platform_fee_type})"
-                        )
-                elif transaction.pledge is not None:
-                    description = f"Pledge to {transaction.pledge.issue.reference_key}"
-                elif transaction.order is not None:
-                    product = transaction.order.product
-                    if transaction.order.subscription_id is not None:
-                        description = f"Subscription to {product.name}"
-                    else:
-                        description = f"Order of {product.name}"
-
-                transaction_id = (
-                    str(transaction.id)
-                    if transaction.incurred_by_transaction_id is None
-                    else str(transaction.incurred_by_transaction_id)
-                )
-
-                yield csv_writer.getrow(
-                    (
-                        transaction.created_at.isoformat(),
-                        str(payout.id),
-                        transaction_id,
-                        description,
-                        transaction.currency,
-                        transaction.amount / 100,
-                        abs(payout.amount / 100),
-                        account.currency,
-                        abs(payout.account_amount / 100),
-                    )
-                )
-
     async def _prepare_stripe_payout(
         self,
         session: AsyncSession,
@@ -3,7 +3,20 @@ from collections.abc import Sequence
 from enum import StrEnum
 from typing import Any, cast
 
-from sqlalchemy import Select, UnaryExpression, asc, desc, func, or_, select
+import structlog
+from sqlalchemy import (
+    BigInteger,
+    Select,
+    UnaryExpression,
+    and_,
+    asc,
+    desc,
+    func,
+    or_,
+    select,
+    update,
+)
+from sqlalchemy.dialects.postgresql import insert
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.orm import aliased, joinedload, subqueryload
 
@@ -11,8 +24,10 @@ from polar.authz.service import AccessType, Authz
 from polar.exceptions import NotPermitted, ResourceNotFound
 from polar.kit.pagination import PaginationParams, paginate
 from polar.kit.sorting import Sorting
+from polar.logging import Logger
 from polar.models import (
     Account,
+    AccountBalance,
     Issue,
     Order,
     Pledge,
@@ -31,6 +46,8 @@ from ..schemas import (
 )
 from .base import BaseTransactionService
 
+log: Logger = structlog.get_logger()
+
 
 class TransactionSortProperty(StrEnum):
     created_at = "created_at"
@@ -165,27 +182,35 @@ class TransactionService(BaseTransactionService):
             raise NotPermitted()
 
         statement = select(
-            cast(type[int], func.coalesce(func.sum(Transaction.amount), 0)),
-            cast(type[int], func.coalesce(func.sum(Transaction.account_amount), 0)),
+            cast(
+                type[int],
+                func.coalesce(func.sum(AccountBalance.amount), 0).cast(BigInteger),
+            ),
+            cast(
+                type[int],
+                func.coalesce(func.sum(AccountBalance.account_amount), 0).cast(
+                    BigInteger
+                ),
+            ),
             cast(
                 type[int],
                 func.coalesce(
-                    func.sum(Transaction.amount).filter(
-                        Transaction.type == TransactionType.payout
+                    func.sum(AccountBalance.amount).filter(
+                        AccountBalance.transaction_type == TransactionType.payout
                     ),
                     0,
-                ),
+                ).cast(BigInteger),
             ),
             cast(
                 type[int],
                 func.coalesce(
-                    func.sum(Transaction.account_amount).filter(
-                        Transaction.type == TransactionType.payout
+                    func.sum(AccountBalance.account_amount).filter(
+                        AccountBalance.transaction_type == TransactionType.payout
                     ),
                     0,
-                ),
+                ).cast(BigInteger),
             ),
-        ).where(Transaction.account_id == account.id)
+        ).where(AccountBalance.account_id == account.id)
 
         result = await session.execute(statement)
 
@@ -228,16 +253,162 @@ class TransactionService(BaseTransactionService):
         *,
         type: TransactionType | None = None,
     ) -> int:
-        statement = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
-            Transaction.account_id == account_id
-        )
-
-        if type is not None:
-            statement = statement.where(Transaction.type == type)
+        # Polar account: no running balance, sum the transactions
+        if account_id is None:
+            statement = select(func.coalesce(func.sum(Transaction.amount), 0)).where(
+                Transaction.account_id.is_(None)
+            )
+            if type is not None:
+                statement = statement.where(Transaction.type == type)
+        else:
+            statement = select(
+                func.coalesce(func.sum(AccountBalance.amount), 0).cast(BigInteger)
+            ).where(AccountBalance.account_id == account_id)
+            if type is not None:
+                statement = statement.where(AccountBalance.transaction_type == type)
 
         result = await session.execute(statement)
         return result.scalar_one()
 
+    async def reconcile_account_balances(self, session: AsyncSession) -> int:
+        """
+        Check the running balances of the accounts against their transactions,
+        and fix the diverging ones.
+
+        Returns:
+            The number of fixed balances.
+        """
+        transactions_sums = (
+            select(
+                Transaction.account_id,
+                Transaction.type.label("transaction_type"),
+                func.sum(Transaction.amount).label("amount"),
+                func.sum(Transaction.account_amount).label("account_amount"),
+            )
+            .where(Transaction.account_id.is_not(None))
+            .group_by(Transaction.account_id, Transaction.type)
+            .subquery()
+        )
+        statement = (
+            select(
+                func.coalesce(
+                    transactions_sums.c.account_id, AccountBalance.account_id
+                ).label("account_id"),
+                func.coalesce(
+                    transactions_sums.c.transaction_type,
+                    AccountBalance.transaction_type,
+                ).label("transaction_type"),
+                func.coalesce(transactions_sums.c.amount, 0).label("amount"),
+                func.coalesce(transactions_sums.c.account_amount, 0).label(
+                    "account_amount"
+                ),
+            )
+            .join_from(
+                transactions_sums,
+                AccountBalance,
+                onclause=and_(
+                    AccountBalance.account_id == transactions_sums.c.account_id,
+                    AccountBalance.transaction_type
+                    == transactions_sums.c.transaction_type,
+                ),
+                full=True,
+            )
+            .where(
+                or_(
+                    AccountBalance.account_id.is_(None),
+                    transactions_sums.c.account_id.is_(None),
+                    AccountBalance.amount != transactions_sums.c.amount,
+                    AccountBalance.account_amount != transactions_sums.c.account_amount,
+                )
+            )
+        )
+
+        diverging_account_ids = {
+            account_id for account_id, *_ in (await session.execute(statement)).all()
+        }
+        fixed = 0
+        for account_id in diverging_account_ids:
+            fixed += await self._reconcile_account_balance(session, account_id)
+        return fixed
+
+    async def _reconcile_account_balance(
+        self, session: AsyncSession, account_id: uuid.UUID
+    ) -> int:
+        # Lock the balance rows before summing the transactions: concurrent
+        # transactions updating them either committed before, and are summed,
+        # or wait for us and apply their increment on top of the fixed balance.
+        balances_statement = (
+            select(
+                AccountBalance.transaction_type,
+                AccountBalance.amount,
+                AccountBalance.account_amount,
+            )
+            .where(AccountBalance.account_id == account_id)
+            .with_for_update()
+        )
+        balances = {
+            transaction_type: (amount, account_amount)
+            for transaction_type, amount, account_amount in (
+                await session.execute(balances_statement)
+            ).all()
+        }
+
+        sums_statement = (
+            select(
+                Transaction.type,
+                func.sum(Transaction.amount).cast(BigInteger),
+                func.sum(Transaction.account_amount).cast(BigInteger),
+            )
+            .where(Transaction.account_id == account_id)
+            .group_by(Transaction.type)
+        )
+        sums = {
+            transaction_type: (amount, account_amount)
+            for transaction_type, amount, account_amount in (
+                await session.execute(sums_statement)
+            ).all()
+        }
+
+        fixed = 0
+        for transaction_type in balances.keys() | sums.keys():
+            amount, account_amount = sums.get(transaction_type, (0, 0))
+            balance = balances.get(transaction_type)
+            if balance == (amount, account_amount):
+                continue
+
+            log.warning(
+                "Diverging account balance",
+                account_id=str(account_id),
+                transaction_type=transaction_type,
+                amount=amount,
+                account_amount=account_amount,
+            )
+            fixed += 1
+            if balance is None:
+                # There was no row to lock: if a concurrent transaction creates it
+                # meanwhile, keep its value, the next run will check it again.
+                await session.execute(
+                    insert(AccountBalance)
+                    .values(
+                        account_id=account_id,
+                        transaction_type=transaction_type,
+                        amount=amount,
+                        account_amount=account_amount,
+                    )
+                    .on_conflict_do_nothing()
+                )
+            else:
+                await session.execute(
+                    update(AccountBalance)
+                    .where(
+                        AccountBalance.account_id == account_id,
+                        AccountBalance.transaction_type == transaction_type,
+                    )
+                    .values(amount=amount, account_amount=account_amount)
+                )
+
+        return fixed
+
     def _get_readable_transactions_statement(self, user: User) -> Select[Any]:
         PaymentUserOrganization = aliased(UserOrganization)
         statement = (
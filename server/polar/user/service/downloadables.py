@@ -135,6 +135,32 @@ class DownloadableService(
         )
         await session.execute(statement)
 
+    async def revoke_for_benefit_many(
+        self,
+        session: AsyncSession,
+        users: Sequence[User],
+        benefit_id: UUID,
+    ) -> None:
+        statement = (
+            sql.update(Downloadable)
+            .where(
+                Downloadable.user_id.in_([user.id for user in users]),
+                Downloadable.benefit_id == benefit_id,
+                Downloadable.status == DownloadableStatus.granted,
+                Downloadable.deleted_at.is_(None),
+            )
+            .values(
+                status=DownloadableStatus.revoked,
+                modified_at=utc_now(),
+            )
+        )
+        log.info(
+            "downloadables.revoked",
+            user_ids=[user.id for user in users],
+            benefit_id=benefit_id,
+        )
+        await session.execute(statement)
+
     async def increment_download_count(
         self,
         session: AsyncSession,
@@ -3,7 +3,7 @@ from collections.abc import Sequence
 from enum import StrEnum
 from typing import Any
 
-from sqlalchemy import Select, UnaryExpression, asc, desc, or_, select
+from sqlalchemy import Select, UnaryExpression, asc, desc, select
 from sqlalchemy.orm import aliased, contains_eager, joinedload, selectinload
 
 from polar.auth.models import AuthSubject
@@ -11,6 +11,7 @@ from polar.exceptions import PolarError
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.pagination import PaginationParams, paginate
+from polar.kit.search import search_filter, search_order_by
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.models import Order, Organization, Product, ProductPrice, User
@@ -82,13 +83,12 @@ class UserOrderService(ResourceServiceReader[Order]):
 
         if query is not None:
             statement = statement.where(
-                or_(
-                    Product.name.ilike(f"%{query}%"),
-                    Organization.slug.ilike(f"%{query}%"),
-                )
+                search_filter(query, Product.name, Organization.slug)
             )
 
-        order_by_clauses: list[UnaryExpression[Any]] = []
+        order_by_clauses: list[UnaryExpression[Any]] = search_order_by(
+            query, Product.name, Organization.slug
+        )
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
             if criterion == UserOrderSortProperty.created_at:
@@ -3,7 +3,7 @@ from collections.abc import Sequence
 from enum import StrEnum
 from typing import Any
 
-from sqlalchemy import Select, UnaryExpression, asc, desc, nulls_first, or_, select
+from sqlalchemy import Select, UnaryExpression, asc, desc, nulls_first, select
 from sqlalchemy.orm import aliased, contains_eager, joinedload, selectinload
 
 from polar.auth.models import AuthSubject
@@ -11,9 +11,11 @@ from polar.exceptions import PolarError, PolarRequestValidationError
 from polar.integrations.stripe.service import stripe as stripe_service
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.pagination import PaginationParams, paginate
+from polar.kit.search import search_filter, search_order_by
 from polar.kit.services import ResourceServiceReader
 from polar.kit.sorting import Sorting
 from polar.kit.utils import utc_now
+from polar.metrics.service import metrics as metrics_service
 from polar.models import (
     Organization,
     Product,
@@ -111,13 +113,12 @@ class UserSubscriptionService(ResourceServiceReader[Subscription]):
 
         if query is not None:
             statement = statement.where(
-                or_(
-                    Product.name.ilike(f"%{query}%"),
-                    Organization.slug.ilike(f"%{query}%"),
-                )
+                search_filter(query, Product.name, Organization.slug)
             )
 
-        order_by_clauses: list[UnaryExpression[Any]] = []
+        order_by_clauses: list[UnaryExpression[Any]] = search_order_by(
+            query, Product.name, Organization.slug
+        )
         for criterion, is_desc in sorting:
             clause_function = desc if is_desc else asc
             if criterion == UserSubscriptionSortProperty.started_at:
@@ -292,6 +293,7 @@ class UserSubscriptionService(ResourceServiceReader[Subscription]):
             # free subscriptions end immediately (vs at end of billing period)
             # queue removal of grants
             await subscription_service.enqueue_benefits_grants(session, subscription)
+            metrics_service.enqueue_subscription_rollups_refresh(subscription)
 
         session.add(subscription)
 
@@ -1,9 +1,11 @@
+import functools
 from collections.abc import Sequence
 from uuid import UUID
 
-from sqlalchemy import Select, func
+from sqlalchemy import Select, func, tuple_
 from sqlalchemy.orm import joinedload
 
+from polar.kit.loader import Loader
 from polar.kit.utils import utc_now
 from polar.models import UserOrganization
 from polar.postgres import AsyncSession, sql
@@ -69,6 +71,25 @@ class UserOrganizationService:
         res = await session.execute(stmt)
         return res.scalars().unique().one_or_none()
 
+    async def get_by_user_and_org_many(
+        self, session: AsyncSession, keys: Sequence[tuple[UUID, UUID]]
+    ) -> dict[tuple[UUID, UUID], UserOrganization]:
+        stmt = sql.select(UserOrganization).where(
+            tuple_(UserOrganization.user_id, UserOrganization.organization_id).in_(
+                keys
+            ),
+            UserOrganization.deleted_at.is_(None),
+        )
+
+        res = await session.execute(stmt)
+        return {(m.user_id, m.organization_id): m for m in res.scalars().all()}
+
+    def get_loader(
+        self, session: AsyncSession
+    ) -> Loader[tuple[UUID, UUID], UserOrganization]:
+        """Get a loader of memberships, keyed by `(user_id, organization_id)`."""
+        return Loader(functools.partial(self.get_by_user_and_org_many, session))
+
     async def remove_member(
         self,
         session: AsyncSession,
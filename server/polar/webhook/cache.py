@@ -0,0 +1,196 @@
+import asyncio
+import itertools
+import json
+import uuid
+from typing import NamedTuple, cast
+from uuid import UUID
+
+import redis.asyncio as _async_redis
+import structlog
+from sqlalchemy import event
+from sqlalchemy.orm import Session, UOWTransaction
+
+from polar.config import settings
+from polar.logging import Logger
+from polar.models.webhook_endpoint import (
+    WebhookEndpoint,
+    WebhookEventType,
+    WebhookFormat,
+)
+from polar.redis import REDIS_RETRY, REDIS_RETRY_ON_ERRROR, Redis
+
+log: Logger = structlog.get_logger()
+
+KEY_PREFIX = "webhook_endpoints"
+CACHE_TTL = 3600
+"""How long the endpoints of an idle target are kept, in seconds."""
+
+
+class TargetEndpoint(NamedTuple):
+    id: UUID
+    format: WebhookFormat
+
+
+def _target_key(target_id: UUID) -> str:
+    return f"{KEY_PREFIX}:{target_id}"
+
+
+class WebhookEndpointCache:
+    """
+    Cache the endpoints subscribed to each event of a target in Redis.
+
+    Each target has a version, bumped after one of its endpoints is created,
+    updated or deleted. Endpoints are stored with the version they were looked up
+    at, and are only served while it's still the current one.
+
+    The version and the endpoints of a target share a Redis hash, so a lookup
+    is a single round trip, and they're evicted together.
+
+    Endpoints are looked up deep in services that don't have a Redis client
+    at hand, so the cache has its own, created on first use.
+
+    Versions are bumped right after the changes are committed, so a new or updated
+    endpoint receives the next events.
+    """
+
+    def __init__(self) -> None:
+        self._redis: Redis | None = None
+        self._scheduled_bumps: set[asyncio.Task[None]] = set()
+
+    @property
+    def redis(self) -> Redis:
+        if self._redis is None:
+            self._redis = cast(
+                Redis,
+                _async_redis.Redis.from_url(
+                    settings.redis_url,
+                    decode_responses=True,
+                    retry_on_error=REDIS_RETRY_ON_ERRROR,
+                    retry=REDIS_RETRY,
+                ),
+            )
+        return self._redis
+
+    @redis.setter
+    def redis(self, redis: Redis | None) -> None:
+        self._redis = redis
+
+    async def get(
+        self, target_id: UUID, event: WebhookEventType
+    ) -> tuple[str, list[TargetEndpoint] | None]:
+        """
+        Get the current version of a target and its endpoints for an event.
+
+        Endpoints are `None` if they're not cached at the current version.
+        The version is read before endpoints are looked up in the database,
+        so if a bump races with the lookup, they're stored under the previous
+        version and never served.
+        """
+        version, raw_entry = await self.redis.hmget(
+            _target_key(target_id), ["version", event]
+        )
+        version = version or "0"
+        if raw_entry is None:
+            return version, None
+
+        entry = json.loads(raw_entry)
+        if entry["version"] != version:
+            return version, None
+
+        return version, [
+            TargetEndpoint(UUID(id), WebhookFormat(format))
+            for id, format in entry["endpoints"]
+        ]
+
+    async def set(
+        self,
+        target_id: UUID,
+        event: WebhookEventType,
+        version: str,
+        endpoints: list[TargetEndpoint],
+    ) -> None:
+        entry = {
+            "version": version,
+            "endpoints": [[str(id), format] for id, format in endpoints],
+        }
+        target_key = _target_key(target_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(target_key, event, json.dumps(entry))
+            pipe.expire(target_key, CACHE_TTL)
+            await pipe.execute()
+
+    async def bump_versions(self, target_ids: set[UUID]) -> None:
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for target_id in target_ids:
+                # A random version rather than an increment: a hash evicted and
+                # recreated by a concurrent `set` can't get back an old version
+                pipe.hset(_target_key(target_id), "version", uuid.uuid4().hex)
+                pipe.expire(_target_key(target_id), CACHE_TTL)
+            await pipe.execute()
+
+    def schedule_bump_versions(self, target_ids: set[UUID]) -> None:
+        """Bump versions in the background, from code that can't await them."""
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Outside of the API and the worker: entries expire after `CACHE_TTL`
+            log.warning(
+                "webhook.endpoints_cache.bump_skipped",
+                target_ids=[str(target_id) for target_id in target_ids],
+            )
+            return
+        task = loop.create_task(self.bump_versions(target_ids))
+        # Keep a reference, so the task isn't garbage collected while it runs
+        self._scheduled_bumps.add(task)
+        task.add_done_callback(self._on_bump_done)
+
+    async def wait_scheduled_bumps(self) -> None:
+        await asyncio.gather(*self._scheduled_bumps, return_exceptions=True)
+
+    def _on_bump_done(self, task: asyncio.Task[None]) -> None:
+        self._scheduled_bumps.discard(task)
+        if not task.cancelled() and (exception := task.exception()) is not None:
+            log.error("webhook.endpoints_cache.bump_failed", error=str(exception))
+
+    async def close(self) -> None:
+        await self.wait_scheduled_bumps()
+        if self._redis is not None:
+            await self._redis.close()
+            self._redis = None
+
+
+endpoints_cache = WebhookEndpointCache()
+
+_INVALIDATIONS_KEY = "webhook_endpoints_invalidations"
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_invalidations(session: Session, flush_context: UOWTransaction) -> None:
+    target_ids: set[UUID] = set()
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, WebhookEndpoint):
+            for target_id in (obj.organization_id, obj.user_id):
+                if target_id is not None:
+                    target_ids.add(target_id)
+
+    if target_ids:
+        invalidations: set[UUID] = session.info.setdefault(_INVALIDATIONS_KEY, set())
+        invalidations |= target_ids
+
+
+@event.listens_for(Session, "after_commit")
+def _bump_invalidated_versions(session: Session) -> None:
+    target_ids: set[UUID] | None = session.info.pop(_INVALIDATIONS_KEY, None)
+    if target_ids is None:
+        return
+
+    # Not through a job: a backed up queue would delay it without bound
+    endpoints_cache.schedule_bump_versions(target_ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_invalidations(session: Session) -> None:
+    session.info.pop(_INVALIDATIONS_KEY, None)
+
+
+__all__ = ["TargetEndpoint", "WebhookEndpointCache", "endpoints_cache"]
@@ -0,0 +1,126 @@
+import asyncio
+import contextlib
+import socket
+import time
+import weakref
+from collections.abc import AsyncIterator, Mapping
+from urllib.parse import urlparse
+from uuid import UUID
+
+import httpx
+from netaddr import IPAddress
+
+DELIVERY_TIMEOUT = 20.0
+MAX_CONNECTIONS = 200
+MAX_KEEPALIVE_CONNECTIONS = 50
+MAX_CONCURRENCY_PER_ENDPOINT = 5
+DNS_CACHE_TTL = 30.0
+DNS_CACHE_MAX_SIZE = 1024
+
+
+class WebhookDeliveryClient:
+    """
+    Deliver webhooks to customer endpoints without blocking the event loop.
+
+    A single `httpx.AsyncClient` is shared across deliveries, so connections
+    to the same host are kept alive and reused between jobs.
+
+    Hostnames are resolved asynchronously and cached for a short time,
+    so the SSRF check doesn't hit the resolver for every event.
+
+    Concurrent deliveries to the same endpoint are capped, so a slow endpoint
+    can't hog every slot of the worker.
+    """
+
+    def __init__(self) -> None:
+        self.client = httpx.AsyncClient(
+            timeout=DELIVERY_TIMEOUT,
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+            ),
+        )
+        self._dns_cache: dict[str, tuple[float, list[tuple[int, str]]]] = {}
+        self._endpoint_semaphores: weakref.WeakValueDictionary[
+            UUID, asyncio.Semaphore
+        ] = weakref.WeakValueDictionary()
+
+    async def allowed_url(self, url: str) -> bool:
+        """
+        Webhooks can only be sent over HTTPS, to global IPs.
+        Webhooks can not be sent to loopback or "internal" or "reserved" ranges
+        """
+        parsed = urlparse(url)
+
+        if parsed.scheme != "https" or parsed.hostname is None:
+            return False
+
+        try:
+            addresses = await self._resolve(parsed.hostname)
+        except:  # noqa: E722
+            return False
+
+        # must resolve to at least one address
+        if len(addresses) == 0:
+            return False
+
+        for family, ip in addresses:
+            if family != socket.AF_INET and family != socket.AF_INET6:
+                return False
+
+            if not IPAddress(ip).is_global():
+                return False
+
+        return True
+
+    async def post(
+        self,
+        endpoint_id: UUID,
+        url: str,
+        *,
+        content: str,
+        headers: Mapping[str, str],
+    ) -> httpx.Response:
+        async with self._endpoint_slot(endpoint_id):
+            return await self.client.post(url, content=content, headers=headers)
+
+    async def close(self) -> None:
+        await self.client.aclose()
+
+    async def _resolve(self, hostname: str) -> list[tuple[int, str]]:
+        now = time.monotonic()
+        cached = self._dns_cache.get(hostname)
+        if cached is not None and cached[0] > now:
+            return cached[1]
+
+        loop = asyncio.get_running_loop()
+        info = await loop.getaddrinfo(hostname, 0)
+        addresses: list[tuple[int, str]] = [
+            (family, str(sockaddr[0])) for family, _, _, _, sockaddr in info
+        ]
+
+        if len(self._dns_cache) >= DNS_CACHE_MAX_SIZE:
+            self._dns_cache = {
+                key: value for key, value in self._dns_cache.items() if value[0] > now
+            }
+            if len(self._dns_cache) >= DNS_CACHE_MAX_SIZE:
+                self._dns_cache.clear()
+        self._dns_cache[hostname] = (now + DNS_CACHE_TTL, addresses)
+
+        return addresses
+
+    @contextlib.asynccontextmanager
+    async def _endpoint_slot(self, endpoint_id: UUID) -> AsyncIterator[None]:
+        # Hold a strong reference while waiting or sending,
+        # so the semaphore is garbage-collected once the endpoint is idle.
+        semaphore = self._endpoint_semaphores.get(endpoint_id)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(MAX_CONCURRENCY_PER_ENDPOINT)
+            self._endpoint_semaphores[endpoint_id] = semaphore
+        async with semaphore:
+            yield
+
+
+client = WebhookDeliveryClient()
+
+__all__ = ["client", "WebhookDeliveryClient"]
@@ -0,0 +1,169 @@
+import statistics
+import time
+from typing import TYPE_CHECKING, NamedTuple, cast
+from uuid import UUID
+
+from polar.redis import Redis
+
+if TYPE_CHECKING:
+    from redis.asyncio.client import Pipeline
+
+KEY_PREFIX = "webhook:endpoint"
+WINDOW_SIZE = 100
+"""Number of recent deliveries the health of an endpoint is computed from."""
+FAILURE_THRESHOLD = 5
+"""Number of consecutive failures after which the circuit of an endpoint opens."""
+MIN_COOLDOWN = 60.0
+MAX_COOLDOWN = 3600.0
+CIRCUIT_TTL = int(2 * MAX_COOLDOWN)
+"""
+How long a circuit stays open, in seconds, if no probe closes or reopens it.
+
+Longer than any cooldown, so it only expires if its probe was lost.
+"""
+PARKED_TTL = 7 * 86400
+"""How long events are kept parked on an open circuit, in seconds."""
+
+
+class EndpointHealth(NamedTuple):
+    deliveries: int
+    success_rate: float | None
+    latency_p50: float | None
+    latency_p95: float | None
+
+
+def _key(endpoint_id: UUID, name: str) -> str:
+    return f"{KEY_PREFIX}:{endpoint_id}:{name}"
+
+
+class WebhookCircuitBreaker:
+    """
+    Track the health of webhook endpoints in Redis, and stop delivering to failing ones.
+
+    After `FAILURE_THRESHOLD` consecutive failures, the circuit of the endpoint opens:
+    its events are parked instead of being retried on their own.
+    After a cooldown, a single probe delivers one of them. If it succeeds,
+    the circuit closes and the parked events are released;
+    otherwise, it opens again for twice as long.
+    """
+
+    def __init__(self, redis: Redis) -> None:
+        self.redis = redis
+
+    async def is_open(self, endpoint_id: UUID) -> bool:
+        return await self.redis.exists(_key(endpoint_id, "circuit")) > 0
+
+    async def record_success(self, endpoint_id: UUID, latency: float) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._push_result(pipe, endpoint_id, True, latency)
+            pipe.delete(_key(endpoint_id, "failures"))
+            pipe.delete(_key(endpoint_id, "circuit"))
+            await pipe.execute()
+
+    async def record_failure(self, endpoint_id: UUID, latency: float) -> float | None:
+        """
+        Record a failed delivery.
+
+        Returns:
+            The cooldown of the circuit, in seconds, if this failure opened it.
+            The caller is then responsible for scheduling the probe.
+        """
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._push_result(pipe, endpoint_id, False, latency)
+            pipe.incr(_key(endpoint_id, "failures"))
+            *_, failures = await pipe.execute()
+
+        if failures < FAILURE_THRESHOLD:
+            return None
+
+        # Only one of the concurrent failures opens it
+        circuit_key = _key(endpoint_id, "circuit")
+        if not await self.redis.hsetnx(circuit_key, "opened_at", time.time()):
+            return None
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(circuit_key, "cooldown", MIN_COOLDOWN)
+            pipe.expire(circuit_key, CIRCUIT_TTL)
+            await pipe.execute()
+        return MIN_COOLDOWN
+
+    async def reopen(self, endpoint_id: UUID, latency: float) -> float:
+        """
+        Record a failed probe, and open the circuit again.
+
+        Returns:
+            The new cooldown of the circuit, in seconds.
+        """
+        circuit_key = _key(endpoint_id, "circuit")
+        previous_cooldown = await self.redis.hget(circuit_key, "cooldown")
+        cooldown = min(float(previous_cooldown or MIN_COOLDOWN) * 2, MAX_COOLDOWN)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            self._push_result(pipe, endpoint_id, False, latency)
+            pipe.incr(_key(endpoint_id, "failures"))
+            pipe.hset(
+                circuit_key, mapping={"opened_at": time.time(), "cooldown": cooldown}
+            )
+            pipe.expire(circuit_key, CIRCUIT_TTL)
+            await pipe.execute()
+        return cooldown
+
+    async def close(self, endpoint_id: UUID) -> None:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.delete(_key(endpoint_id, "failures"))
+            pipe.delete(_key(endpoint_id, "circuit"))
+            await pipe.execute()
+
+    async def park(self, endpoint_id: UUID, event_id: UUID, job_try: int) -> None:
+        """
+        Park an event until the circuit closes.
+
+        `job_try` is the try its delivery job resumes from when it's released,
+        so parked events don't get a fresh retry budget.
+        """
+        parked_key = _key(endpoint_id, "parked")
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(parked_key, f"{event_id}:{job_try}")
+            pipe.expire(parked_key, PARKED_TTL)
+            await pipe.execute()
+
+    async def pop_parked(self, endpoint_id: UUID, count: int) -> list[tuple[UUID, int]]:
+        """Pop up to `count` parked events, as `(event_id, job_try)` tuples."""
+        members = cast(
+            list[str] | None, await self.redis.spop(_key(endpoint_id, "parked"), count)
+        )
+        parked: list[tuple[UUID, int]] = []
+        for member in members or []:
+            event_id, _, job_try = member.partition(":")
+            parked.append((UUID(event_id), int(job_try or 1)))
+        return parked
+
+    async def get_health(self, endpoint_id: UUID) -> EndpointHealth:
+        results = await self.redis.lrange(_key(endpoint_id, "results"), 0, -1)
+        if not results:
+            return EndpointHealth(0, None, None, None)
+
+        successes = 0
+        latencies: list[float] = []
+        for result in results:
+            succeeded, latency = result.split(":")
+            successes += succeeded == "1"
+            latencies.append(float(latency))
+
+        latency_p50 = statistics.median(latencies)
+        latency_p95 = (
+            statistics.quantiles(latencies, n=20)[-1]
+            if len(latencies) > 1
+            else latencies[0]
+        )
+        return EndpointHealth(
+            len(results), successes / len(results), latency_p50, latency_p95
+        )
+
+    def _push_result(
+        self, pipe: "Pipeline[str]", endpoint_id: UUID, succeeded: bool, latency: float
+    ) -> None:
+        results_key = _key(endpoint_id, "results")
+        pipe.lpush(results_key, f"{int(succeeded)}:{latency:.3f}")
+        pipe.ltrim(results_key, 0, WINDOW_SIZE - 1)
+
+
+__all__ = ["EndpointHealth", "WebhookCircuitBreaker"]
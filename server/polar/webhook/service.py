@@ -2,7 +2,7 @@ from collections.abc import Sequence
 from uuid import UUID
 
 import structlog
-from sqlalchemy import Select, and_, desc, or_, select, text
+from sqlalchemy import Select, and_, desc, insert, or_, select, text
 from sqlalchemy.orm import contains_eager, joinedload
 
 from polar.auth.models import AuthSubject, is_organization, is_user
@@ -10,13 +10,17 @@ from polar.authz.service import AccessType, Authz
 from polar.exceptions import NotPermitted, PolarRequestValidationError, ResourceNotFound
 from polar.kit.db.postgres import AsyncSession
 from polar.kit.pagination import PaginationParams, paginate
-from polar.kit.utils import utc_now
+from polar.kit.utils import generate_uuid, utc_now
 from polar.logging import Logger
 from polar.models.organization import Organization
 from polar.models.user import User
 from polar.models.user_organization import UserOrganization
 from polar.models.webhook_delivery import WebhookDelivery
-from polar.models.webhook_endpoint import WebhookEndpoint, WebhookEventType
+from polar.models.webhook_endpoint import (
+    WebhookEndpoint,
+    WebhookEventType,
+    WebhookFormat,
+)
 from polar.models.webhook_event import WebhookEvent
 from polar.organization.resolver import get_payload_organization
 from polar.webhook.schemas import (
@@ -25,6 +29,7 @@ from polar.webhook.schemas import (
 )
 from polar.worker import enqueue_job
 
+from .cache import TargetEndpoint, endpoints_cache
 from .webhooks import (
     BaseWebhookPayload,
     SkipEvent,
@@ -238,23 +243,41 @@ class WebhookService:
         target: Organization | User,
         payload: BaseWebhookPayload,
     ) -> None:
-        for e in await self._get_event_target_endpoints(
+        endpoints = await self._get_event_target_endpoints(
             session, event=payload.type, target=target
-        ):
+        )
+        if not endpoints:
+            return
+
+        # Render the payload once per format
+        payloads: dict[WebhookFormat, str | None] = {}
+        for webhook_format in {endpoint.format for endpoint in endpoints}:
             try:
-                payload_data = payload.get_payload(e.format, target)
-                event_type = WebhookEvent(
-                    webhook_endpoint_id=e.id, payload=payload_data
-                )
-                session.add(event_type)
-                await session.flush()
-                enqueue_job("webhook_event.send", webhook_event_id=event_type.id)
+                payloads[webhook_format] = payload.get_payload(webhook_format, target)
             except UnsupportedTarget as e:
                 # Log the error but do not raise to not fail the whole request
                 log.error(e.message)
-                continue
+                payloads[webhook_format] = None
             except SkipEvent:
-                continue
+                payloads[webhook_format] = None
+
+        now = utc_now()
+        values = [
+            {
+                "id": generate_uuid(),
+                "created_at": now,
+                "webhook_endpoint_id": endpoint.id,
+                "payload": payload_data,
+            }
+            for endpoint in endpoints
+            if (payload_data := payloads[endpoint.format]) is not None
+        ]
+        if not values:
+            return
+
+        await session.execute(insert(WebhookEvent), values)
+        for value in values:
+            enqueue_job("webhook_event.send", webhook_event_id=value["id"])
 
     def _get_readable_endpoints_statement(
         self, auth_subject: AuthSubject[User | Organization]
@@ -290,8 +313,12 @@ class WebhookService:
         *,
         event: WebhookEventType,
         target: Organization | User,
-    ) -> Sequence[WebhookEndpoint]:
-        statement = select(WebhookEndpoint).where(
+    ) -> list[TargetEndpoint]:
+        version, endpoints = await endpoints_cache.get(target.id, event)
+        if endpoints is not None:
+            return endpoints
+
+        statement = select(WebhookEndpoint.id, WebhookEndpoint.format).where(
             WebhookEndpoint.deleted_at.is_(None),
             WebhookEndpoint.events.bool_op("@>")(text(f"'[\"{event}\"]'")),
         )
@@ -301,7 +328,11 @@ class WebhookService:
             statement = statement.where(WebhookEndpoint.user_id == target.id)
 
         res = await session.execute(statement)
-        return res.scalars().unique().all()
+        endpoints = [
+            TargetEndpoint(id, WebhookFormat(format)) for id, format in res.all()
+        ]
+        await endpoints_cache.set(target.id, event, version, endpoints)
+        return endpoints
 
     async def _can_write_endpoint(
         self,
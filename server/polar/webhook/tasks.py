@@ -1,13 +1,11 @@
 import base64
-import socket
+import time
 from collections.abc import Mapping
-from urllib.parse import urlparse
 from uuid import UUID
 
 import httpx
 import structlog
 from arq import Retry
-from netaddr import IPAddress
 from standardwebhooks.webhooks import Webhook as StandardWebhook
 
 from polar.kit.db.postgres import AsyncSession
@@ -18,67 +16,68 @@ from polar.worker import (
     AsyncSessionMaker,
     JobContext,
     PolarWorkerContext,
+    QueueName,
     compute_backoff,
+    enqueue_job,
+    get_worker_redis,
     task,
 )
 
+from .delivery import client as delivery_client
+from .health import WebhookCircuitBreaker
 from .service import webhook as webhook_service
 
 log: Logger = structlog.get_logger()
 
 MAX_RETRIES = 10
+RELEASE_BATCH_SIZE = 100
 
 
-@task("webhook_event.send")
+@task("webhook_event.send", queue_name=QueueName.bulk)
 async def webhook_event_send(
     ctx: JobContext,
     webhook_event_id: UUID,
     polar_context: PolarWorkerContext,
 ) -> None:
     async with AsyncSessionMaker(ctx) as session:
-        return await _webhook_event_send(
-            session, ctx=ctx, webhook_event_id=webhook_event_id
-        )
-
-
-def allowed_url(url: str) -> bool:
-    """
-    Webhooks can only be sent over HTTPS, to global IPs.
-    Webhooks can not be sent to loopback or "internal" or "reserved" ranges
-    """
-
-    parsed = urlparse(url)
+        await _webhook_event_send(session, ctx=ctx, webhook_event_id=webhook_event_id)
 
-    if parsed.scheme != "https":
-        return False
 
+@task("webhook_endpoint.probe", queue_name=QueueName.bulk)
+async def webhook_endpoint_probe(
+    ctx: JobContext,
+    webhook_endpoint_id: UUID,
+    polar_context: PolarWorkerContext,
+) -> None:
+    circuit_breaker = WebhookCircuitBreaker(get_worker_redis(ctx))
+    parked = await circuit_breaker.pop_parked(webhook_endpoint_id, 1)
+    # Nothing to probe with: let the next event try
+    if not parked:
+        await circuit_breaker.close(webhook_endpoint_id)
+        return
+
+    event_id, job_try = parked[0]
+    delivered = False
     try:
-        info = socket.getaddrinfo(
-            parsed.hostname,
-            0,
-            # 0  # port, required
-        )
-    except:  # noqa: E722
-        return False
-
-    # must resolve to at least one address
-    if len(info) == 0:
-        return False
+        async with AsyncSessionMaker(ctx) as session:
+            delivered = await _webhook_event_send(
+                session,
+                ctx=ctx,
+                webhook_event_id=event_id,
+                job_try=job_try,
+                probe=True,
+            )
+    finally:
+        # The probe didn't reach the endpoint, so nothing closed or reopened
+        # the circuit: close it and release the other parked events instead of
+        # leaving them stranded behind an open circuit without a probe
+        if not delivered:
+            await circuit_breaker.close(webhook_endpoint_id)
+            await _release_parked(circuit_breaker, webhook_endpoint_id)
 
-    for family, type, proto, canonname, sockaddr in info:
-        if (
-            family != socket.AddressFamily.AF_INET
-            and family != socket.AddressFamily.AF_INET6
-        ):
-            return False
 
-        ip = sockaddr[0]
-
-        ipp = IPAddress(ip)
-        if not ipp.is_global():
-            return False
-
-    return True
+async def allowed_url(url: str) -> bool:
+    return await delivery_client.allowed_url(url)
 
 
 async def _webhook_event_send(
@@ -86,12 +85,56 @@ async def _webhook_event_send(
     *,
     ctx: JobContext,
     webhook_event_id: UUID,
-) -> None:
+    job_try: int | None = None,
+    probe: bool = False,
+) -> bool:
+    """
+    Deliver a webhook event.
+
+    `job_try` is the try of this delivery, defaulting to the one of the current job.
+
+    Returns:
+        Whether the endpoint was reached.
+    """
+    if job_try is None:
+        job_try = ctx["job_try"]
+
     event = await webhook_service.get_event_by_id(session, webhook_event_id)
     if not event:
+        # A probe must not raise, otherwise the other parked events are stranded
+        if probe:
+            log.info("webhook_event.not_found", webhook_event_id=webhook_event_id)
+            return False
         raise Exception(f"webhook event not found id={webhook_event_id}")
 
-    if not allowed_url(event.webhook_endpoint.url):
+    # The endpoint might have been deleted since the event was created
+    if event.webhook_endpoint.deleted_at is not None:
+        log.info(
+            "webhook_event.endpoint_deleted",
+            webhook_event_id=webhook_event_id,
+            webhook_endpoint_id=event.webhook_endpoint_id,
+        )
+        return False
+
+    endpoint_id = event.webhook_endpoint_id
+    circuit_breaker = WebhookCircuitBreaker(get_worker_redis(ctx))
+    if not probe and await circuit_breaker.is_open(endpoint_id):
+        await circuit_breaker.park(endpoint_id, event.id, job_try)
+        log.info(
+            "webhook_event.parked",
+            webhook_event_id=webhook_event_id,
+            webhook_endpoint_id=endpoint_id,
+        )
+        return False
+
+    if not await allowed_url(event.webhook_endpoint.url):
+        if probe:
+            log.info(
+                "webhook_event.url_not_allowed",
+                webhook_event_id=webhook_event_id,
+                webhook_endpoint_id=endpoint_id,
+            )
+            return False
         raise Exception(
             f"invalid webhook url id={webhook_event_id} url={event.webhook_endpoint.url}"
         )
@@ -118,12 +161,13 @@ async def _webhook_event_send(
         webhook_event_id=webhook_event_id, webhook_endpoint_id=event.webhook_endpoint_id
     )
 
+    start = time.monotonic()
     try:
-        response = httpx.post(
+        response = await delivery_client.post(
+            event.webhook_endpoint_id,
             event.webhook_endpoint.url,
             content=event.payload,
             headers=headers,
-            timeout=20.0,
         )
         delivery.http_code = response.status_code
         event.last_http_code = response.status_code
@@ -131,19 +175,61 @@ async def _webhook_event_send(
     # Error
     except httpx.HTTPError as e:
         delivery.succeeded = False
+        latency = time.monotonic() - start
+        if probe:
+            cooldown: float | None = await circuit_breaker.reopen(endpoint_id, latency)
+        else:
+            cooldown = await circuit_breaker.record_failure(endpoint_id, latency)
+        if cooldown is not None:
+            await _log_circuit_opened(circuit_breaker, endpoint_id, cooldown)
+            enqueue_job(
+                "webhook_endpoint.probe",
+                webhook_endpoint_id=endpoint_id,
+                _defer_by=cooldown,
+            )
+
         # Permanent failure
-        if ctx["job_try"] >= MAX_RETRIES:
+        if job_try >= MAX_RETRIES:
             event.succeeded = False
+        # Wait for the endpoint to recover
+        elif await circuit_breaker.is_open(endpoint_id):
+            await circuit_breaker.park(endpoint_id, event.id, job_try + 1)
         # Retry
         else:
-            raise Retry(compute_backoff(ctx["job_try"])) from e
+            raise Retry(compute_backoff(job_try)) from e
     # Success
     else:
         delivery.succeeded = True
         event.succeeded = True
+        await circuit_breaker.record_success(endpoint_id, time.monotonic() - start)
+        await _release_parked(circuit_breaker, endpoint_id)
     # Either way, save the delivery
     finally:
         assert delivery.succeeded is not None
         session.add(delivery)
         session.add(event)
         await session.commit()
+
+    return True
+
+
+async def _log_circuit_opened(
+    circuit_breaker: WebhookCircuitBreaker, endpoint_id: UUID, cooldown: float
+) -> None:
+    health = await circuit_breaker.get_health(endpoint_id)
+    log.warning(
+        "webhook_endpoint.circuit_opened",
+        webhook_endpoint_id=endpoint_id,
+        cooldown=cooldown,
+        **health._asdict(),
+    )
+
+
+async def _release_parked(
+    circuit_breaker: WebhookCircuitBreaker, endpoint_id: UUID
+) -> None:
+    while parked := await circuit_breaker.pop_parked(endpoint_id, RELEASE_BATCH_SIZE):
+        for event_id, job_try in parked:
+            enqueue_job(
+                "webhook_event.send", webhook_event_id=event_id, _job_try=job_try
+            )
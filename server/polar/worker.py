@@ -3,11 +3,12 @@ import contextlib
 import contextvars
 import functools
 import random
+import time
 import uuid
-from collections.abc import AsyncIterator, Awaitable, Callable
+from collections.abc import AsyncIterator, Awaitable, Callable, Sequence
 from datetime import datetime
 from enum import Enum
-from typing import Any, ParamSpec, TypeAlias, TypedDict, TypeVar, cast
+from typing import Any, NamedTuple, ParamSpec, TypeAlias, TypedDict, TypeVar, cast
 
 import logfire
 import structlog
@@ -16,10 +17,14 @@ from apscheduler.triggers.cron import CronTrigger
 from arq import func
 from arq.connections import ArqRedis, RedisSettings
 from arq.connections import create_pool as arq_create_pool
+from arq.constants import job_key_prefix, result_key_prefix
 from arq.cron import CronJob
+from arq.jobs import serialize_job
 from arq.typing import SecondsTimedelta
+from arq.utils import timestamp_ms, to_ms, to_seconds, to_unix_ms
 from arq.worker import Function
 from pydantic import BaseModel
+from redis.exceptions import WatchError
 
 from polar.config import settings
 from polar.context import ExecutionContext
@@ -34,7 +39,10 @@ from polar.kit.db.postgres import (
 from polar.logfire import instrument_httpx, instrument_sqlalchemy
 from polar.logging import generate_correlation_id
 from polar.postgres import create_async_engine
+from polar.query_stats import flush_query_stats, instrument_query_stats, track_queries
 from polar.redis import REDIS_RETRY, REDIS_RETRY_ON_ERRROR, Redis
+from polar.webhook.cache import endpoints_cache as webhook_endpoints_cache
+from polar.webhook.delivery import client as webhook_delivery_client
 
 log = structlog.get_logger()
 
@@ -72,10 +80,18 @@ class PolarWorkerContext(BaseModel):
 
 
 class QueueName(Enum):
+    critical = "arq:queue:critical"
+    """Latency-sensitive tasks a customer is waiting for, e.g. benefit grants."""
     default = "arq:queue"
+    bulk = "arq:queue:bulk"
+    """Fan-out tasks that can wait, e.g. newsletter emails or webhook deliveries."""
     github_crawl = "arq:queue:github_crawl"
 
 
+_task_queues: dict[str, QueueName] = {}
+"""Queue each task is enqueued on by default, as declared in the `task` decorator."""
+
+
 def get_redis_settings() -> RedisSettings:
     redis_settings = RedisSettings.from_dsn(settings.redis_url)
     redis_settings.retry_on_error = REDIS_RETRY_ON_ERRROR  # type: ignore  # https://github.com/python-arq/arq/pull/446
@@ -97,6 +113,7 @@ class WorkerSettings:
         async_engine = create_async_engine("worker")
         async_sessionmaker = create_async_sessionmaker(async_engine)
         instrument_sqlalchemy(async_engine.sync_engine)
+        instrument_query_stats(async_engine.sync_engine)
         instrument_httpx()
 
         # Create a dedicated Redis instance instead of sharing the ARQ one,
@@ -119,6 +136,9 @@ class WorkerSettings:
         redis = ctx["raw_redis"]
         await redis.close()
 
+        await webhook_delivery_client.close()
+        await webhook_endpoints_cache.close()
+
         log.info("polar.worker.shutdown")
 
     @staticmethod
@@ -178,6 +198,54 @@ class WorkerSettingsGitHubCrawl(WorkerSettings):
         return await WorkerSettings.on_job_end(ctx)
 
 
+class WorkerSettingsCritical(WorkerSettings):
+    queue_name: str = QueueName.critical.value
+    functions: list[Function] = []
+    cron_jobs: list[CronJob] = []
+
+    redis_settings = get_redis_settings()
+
+    @staticmethod
+    async def on_startup(ctx: WorkerContext) -> None:
+        return await WorkerSettings.on_startup(ctx)
+
+    @staticmethod
+    async def on_shutdown(ctx: WorkerContext) -> None:
+        return await WorkerSettings.on_shutdown(ctx)
+
+    @staticmethod
+    async def on_job_start(ctx: JobContext) -> None:
+        return await WorkerSettings.on_job_start(ctx)
+
+    @staticmethod
+    async def on_job_end(ctx: JobContext) -> None:
+        return await WorkerSettings.on_job_end(ctx)
+
+
+class WorkerSettingsBulk(WorkerSettings):
+    queue_name: str = QueueName.bulk.value
+    functions: list[Function] = []
+    cron_jobs: list[CronJob] = []
+
+    redis_settings = get_redis_settings()
+
+    @staticmethod
+    async def on_startup(ctx: WorkerContext) -> None:
+        return await WorkerSettings.on_startup(ctx)
+
+    @staticmethod
+    async def on_shutdown(ctx: WorkerContext) -> None:
+        return await WorkerSettings.on_shutdown(ctx)
+
+    @staticmethod
+    async def on_job_start(ctx: JobContext) -> None:
+        return await WorkerSettings.on_job_start(ctx)
+
+    @staticmethod
+    async def on_job_end(ctx: JobContext) -> None:
+        return await WorkerSettings.on_job_end(ctx)
+
+
 class CronTasksScheduler:
     _cron_tasks: list[tuple[str, CronTrigger, QueueName]] = []
 
@@ -233,9 +301,17 @@ async def lifespan() -> AsyncIterator[ArqRedis]:
 def enqueue_job(
     name: str,
     *args: Any,
-    queue_name: QueueName = QueueName.default,
+    queue_name: QueueName | None = None,
     **kwargs: Any,
 ) -> None:
+    """
+    Enqueue a job, to be flushed at the end of the current request or job.
+
+    Unless `queue_name` is given, the job goes on the queue declared by its task.
+    """
+    if queue_name is None:
+        queue_name = _task_queues.get(name, QueueName.default)
+
     ctx = ExecutionContext.current()
     polar_context = PolarWorkerContext(
         is_during_installation=ctx.is_during_installation,
@@ -263,12 +339,110 @@ def enqueue_job(
     log.debug("polar.worker.job_enqueued", name=name, args=args, kwargs=kwargs)
 
 
+FLUSH_CHUNK_SIZE = 1000
+FLUSH_MAX_ATTEMPTS = 5
+"""Maximum number of attempts to enqueue a chunk whose jobs change concurrently."""
+
+
+async def _enqueue_jobs_chunk(arq_pool: ArqRedis, jobs: Sequence[JobToEnqueue]) -> None:
+    """
+    Enqueue several jobs with a fixed number of Redis round trips.
+
+    It mirrors `ArqRedis.enqueue_job`, but pipelines the commands of all jobs:
+
+    1. Watch the job and result keys of the chunk.
+    2. Check which jobs already exist or have a result.
+    3. Set the job keys of the others and add them to their queue,
+    in a single transaction.
+
+    Like arq, if one of the watched keys changes in the meantime, e.g. because
+    the same job ID is enqueued concurrently, the transaction is aborted and
+    the chunk is checked again, up to `FLUSH_MAX_ATTEMPTS` times. A job key is
+    thus never set without its job being queued.
+    """
+    enqueue_time_ms = timestamp_ms()
+    prepared: list[tuple[str, str, str, int, int, bytes]] = []
+    for name, args, kwargs in jobs:
+        kwargs = kwargs.copy()
+        job_id: str = kwargs.pop("_job_id", None) or uuid.uuid4().hex
+        queue_name: str = kwargs.pop("_queue_name", None) or arq_pool.default_queue_name
+        defer_until: datetime | None = kwargs.pop("_defer_until", None)
+        defer_by_ms = to_ms(kwargs.pop("_defer_by", None))
+        expires_ms = to_ms(kwargs.pop("_expires", None))
+        job_try: int | None = kwargs.pop("_job_try", None)
+
+        if defer_until is not None and defer_by_ms:
+            raise RuntimeError(
+                "use either 'defer_until' or 'defer_by' or neither, not both"
+            )
+        if defer_until is not None:
+            score = to_unix_ms(defer_until)
+        elif defer_by_ms:
+            score = enqueue_time_ms + defer_by_ms
+        else:
+            score = enqueue_time_ms
+        expires_ms = expires_ms or score - enqueue_time_ms + arq_pool.expires_extra_ms
+
+        job = serialize_job(
+            name,
+            args,
+            kwargs,
+            job_try,
+            enqueue_time_ms,
+            serializer=arq_pool.job_serializer,
+        )
+        prepared.append((name, job_id, queue_name, score, expires_ms, job))
+
+    # A job ID duplicated in the chunk is only enqueued once, like with arq
+    unique: dict[str, tuple[str, str, str, int, int, bytes]] = {}
+    for prepared_job in prepared:
+        unique.setdefault(prepared_job[1], prepared_job)
+    prepared = list(unique.values())
+
+    watched_keys = [
+        key
+        for _, job_id, _, _, _, _ in prepared
+        for key in (job_key_prefix + job_id, result_key_prefix + job_id)
+    ]
+    async with arq_pool.pipeline(transaction=True) as pipe:
+        for attempt in range(1, FLUSH_MAX_ATTEMPTS + 1):
+            try:
+                await pipe.watch(*watched_keys)
+
+                # Keys are watched on the transaction connection:
+                # check them on another one, so it takes a single round trip
+                async with arq_pool.pipeline(transaction=False) as check_pipe:
+                    for _, job_id, _, _, _, _ in prepared:
+                        check_pipe.exists(
+                            job_key_prefix + job_id, result_key_prefix + job_id
+                        )
+                    existing: list[int] = await check_pipe.execute()
+                to_enqueue = [
+                    job for job, exists in zip(prepared, existing) if not exists
+                ]
+
+                pipe.multi()
+                for _, job_id, queue_name, score, expires_ms, job in to_enqueue:
+                    pipe.psetex(job_key_prefix + job_id, expires_ms, job)
+                    pipe.zadd(queue_name, {job_id: score})
+                await pipe.execute()
+                break
+            except WatchError:
+                if attempt == FLUSH_MAX_ATTEMPTS:
+                    raise
+                continue
+
+    for name, job_id, _, _, _, _ in to_enqueue:
+        log.debug("polar.worker.job_flushed", name=name, job_id=job_id)
+
+
 async def flush_enqueued_jobs(arq_pool: ArqRedis) -> None:
     if _jobs_to_enqueue_list := _jobs_to_enqueue.get([]):
         log.debug("polar.worker.flush_enqueued_jobs")
-        for name, args, kwargs in _jobs_to_enqueue_list:
-            await arq_pool.enqueue_job(name, *args, **kwargs)
-            log.debug("polar.worker.job_flushed", name=name, args=args, kwargs=kwargs)
+        for i in range(0, len(_jobs_to_enqueue_list), FLUSH_CHUNK_SIZE):
+            await _enqueue_jobs_chunk(
+                arq_pool, _jobs_to_enqueue_list[i : i + FLUSH_CHUNK_SIZE]
+            )
         _jobs_to_enqueue.set([])
 
 
@@ -277,63 +451,170 @@ ReturnValue = TypeVar("ReturnValue")
 
 
 def task_hooks(
-    f: Callable[Params, Awaitable[ReturnValue]],
-) -> Callable[Params, Awaitable[ReturnValue]]:
-    @functools.wraps(f)
-    async def wrapper(*args: Params.args, **kwargs: Params.kwargs) -> ReturnValue:
-        job_context = cast(JobContext, args[0])
-        log_context: dict[str, Any] = {
-            "correlation_id": generate_correlation_id(),
-            "job_id": job_context["job_id"],
-            "job_try": job_context["job_try"],
-            "enqueue_time": job_context["enqueue_time"].isoformat(),
-            "score": job_context["score"],
-        }
-
-        request_correlation_id = kwargs.pop("request_correlation_id", None)
-        if request_correlation_id is not None:
-            log_context["request_correlation_id"] = request_correlation_id
-
-        structlog.contextvars.bind_contextvars(**log_context)
-        job_context["logfire_span"].set_attributes(log_context)
-
-        log.info("polar.worker.job_started")
-        r = await f(*args, **kwargs)
-
-        arq_pool = job_context["redis"]
-        await flush_enqueued_jobs(arq_pool)
-
-        log.info("polar.worker.job_ended")
-        structlog.contextvars.unbind_contextvars(
-            "correlation_id",
-            "request_correlation_id",
-            "job_id",
-            "job_try",
-            "enqueue_time",
-            "score",
-        )
+    name: str,
+) -> Callable[
+    [Callable[Params, Awaitable[ReturnValue]]], Callable[Params, Awaitable[ReturnValue]]
+]:
+    def decorator(
+        f: Callable[Params, Awaitable[ReturnValue]],
+    ) -> Callable[Params, Awaitable[ReturnValue]]:
+        @functools.wraps(f)
+        async def wrapper(*args: Params.args, **kwargs: Params.kwargs) -> ReturnValue:
+            job_context = cast(JobContext, args[0])
+            log_context: dict[str, Any] = {
+                "correlation_id": generate_correlation_id(),
+                "job_id": job_context["job_id"],
+                "job_try": job_context["job_try"],
+                "enqueue_time": job_context["enqueue_time"].isoformat(),
+                "score": job_context["score"],
+            }
+
+            request_correlation_id = kwargs.pop("request_correlation_id", None)
+            if request_correlation_id is not None:
+                log_context["request_correlation_id"] = request_correlation_id
+
+            structlog.contextvars.bind_contextvars(**log_context)
+            job_context["logfire_span"].set_attributes(log_context)
+
+            with track_queries(name):
+                log.info("polar.worker.job_started")
+                r = await f(*args, **kwargs)
+
+                arq_pool = job_context["redis"]
+                await flush_enqueued_jobs(arq_pool)
+
+                log.info("polar.worker.job_ended")
+
+            await flush_query_stats(get_worker_redis(job_context))
+            structlog.contextvars.unbind_contextvars(
+                "correlation_id",
+                "request_correlation_id",
+                "job_id",
+                "job_try",
+                "enqueue_time",
+                "score",
+            )
+
+            return r
+
+        return wrapper
+
+    return decorator
+
+
+CONCURRENCY_KEY_PREFIX = "worker:concurrency"
+CONCURRENCY_DEFER = 5.0
+"""Delay before a job that didn't get a concurrency slot runs again, in seconds."""
+DEFAULT_JOB_TIMEOUT = 300
+"""Default timeout of arq jobs, in seconds."""
+
+
+class TaskConcurrencyLimiter:
+    """
+    Limit the number of jobs of a task running at the same time, across all workers.
+
+    Running jobs hold a slot in a Redis sorted set, scored by the time their lease
+    expires, so slots of crashed workers are eventually reclaimed.
+    """
+
+    def __init__(self, redis: Redis, name: str, max_concurrency: int) -> None:
+        self.redis = redis
+        self.key = f"{CONCURRENCY_KEY_PREFIX}:{name}"
+        self.max_concurrency = max_concurrency
+
+    async def acquire(self, job_id: str, lease: float) -> bool:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
+                try:
+                    await pipe.watch(self.key)
+                    now = time.time()
+                    running = await pipe.zcount(self.key, now, "+inf")
+                    if running >= self.max_concurrency:
+                        return False
+                    pipe.multi()
+                    pipe.zremrangebyscore(self.key, "-inf", now)
+                    pipe.zadd(self.key, {job_id: now + lease})
+                    await pipe.execute()
+                    return True
+                except WatchError:
+                    # Another job took or released a slot in the meantime
+                    continue
+
+    async def release(self, job_id: str) -> None:
+        await self.redis.zrem(self.key, job_id)
+
+
+def concurrency_limit(
+    name: str, max_concurrency: int, timeout: SecondsTimedelta | None
+) -> Callable[
+    [Callable[Params, Awaitable[ReturnValue]]], Callable[Params, Awaitable[ReturnValue]]
+]:
+    """
+    Run at most `max_concurrency` jobs of the task at the same time.
+
+    Jobs that don't get a slot are enqueued again after `CONCURRENCY_DEFER`,
+    without consuming one of their tries.
+    """
+    lease = (to_seconds(timeout) or DEFAULT_JOB_TIMEOUT) + CONCURRENCY_DEFER
+
+    def decorator(
+        f: Callable[Params, Awaitable[ReturnValue]],
+    ) -> Callable[Params, Awaitable[ReturnValue]]:
+        @functools.wraps(f)
+        async def wrapper(*args: Params.args, **kwargs: Params.kwargs) -> ReturnValue:
+            job_context = cast(JobContext, args[0])
+            job_id = job_context["job_id"]
+            limiter = TaskConcurrencyLimiter(
+                get_worker_redis(job_context), name, max_concurrency
+            )
 
-        return r
+            if not await limiter.acquire(job_id, lease):
+                log.info("polar.worker.concurrency_limited", name=name)
+                job_kwargs: dict[str, Any] = {**kwargs, "_defer_by": CONCURRENCY_DEFER}
+                enqueue_job(name, *args[1:], **job_kwargs)
+                return cast(ReturnValue, None)
 
-    return wrapper
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                await limiter.release(job_id)
+
+        return wrapper
+
+    return decorator
 
 
 def task(
     name: str,
     *,
+    queue_name: QueueName = QueueName.default,
+    max_concurrency: int | None = None,
     keep_result: SecondsTimedelta | None = None,
     timeout: SecondsTimedelta | None = None,
     keep_result_forever: bool | None = None,
     max_tries: int | None = None,
     cron_trigger: CronTrigger | None = None,
-    cron_trigger_queue: QueueName = QueueName.default,
+    cron_trigger_queue: QueueName | None = None,
 ) -> Callable[
     [Callable[Params, Awaitable[ReturnValue]]], Callable[Params, Awaitable[ReturnValue]]
 ]:
+    """
+    Register a function as a worker task.
+
+    Args:
+        name: The name of the task, used to enqueue it.
+        queue_name: The queue the task is enqueued on, unless `enqueue_job`
+        is called with another one.
+        max_concurrency: The maximum number of jobs of the task running
+        at the same time, across all workers.
+    """
+
     def decorator(
         f: Callable[Params, Awaitable[ReturnValue]],
     ) -> Callable[Params, Awaitable[ReturnValue]]:
-        wrapped = task_hooks(f)
+        if max_concurrency is not None:
+            f = concurrency_limit(name, max_concurrency, timeout)(f)
+        wrapped = task_hooks(name)(f)
 
         new_task = func(
             wrapped,  # type: ignore
@@ -344,18 +625,52 @@ def task(
             max_tries=max_tries,
         )
 
-        # all tasks are registered on both workers
+        # all tasks are registered on all workers,
+        # so a job enqueued on another queue than its default one still runs
         WorkerSettings.functions.append(new_task)
+        WorkerSettingsCritical.functions.append(new_task)
+        WorkerSettingsBulk.functions.append(new_task)
         WorkerSettingsGitHubCrawl.functions.append(new_task)
+        _task_queues[name] = queue_name
 
         if cron_trigger is not None:
-            CronTasksScheduler.add_task(name, cron_trigger, cron_trigger_queue)
+            CronTasksScheduler.add_task(
+                name, cron_trigger, cron_trigger_queue or queue_name
+            )
 
         return wrapped
 
     return decorator
 
 
+class QueueStats(NamedTuple):
+    queue_name: str
+    ready: int
+    """Number of jobs waiting to run."""
+    deferred: int
+    """Number of jobs scheduled to run later."""
+    oldest_age: float | None
+    """Time the oldest ready job has been waiting, in seconds."""
+
+
+async def get_queue_stats(redis: Redis) -> list[QueueStats]:
+    """Depth and age of each queue, to check whether workers keep up with them."""
+    now_ms = timestamp_ms()
+    async with redis.pipeline(transaction=False) as pipe:
+        for queue_name in QueueName:
+            pipe.zcount(queue_name.value, "-inf", now_ms)
+            pipe.zcard(queue_name.value)
+            pipe.zrange(queue_name.value, 0, 0, withscores=True)
+        results = await pipe.execute()
+
+    stats: list[QueueStats] = []
+    for i, queue_name in enumerate(QueueName):
+        ready, total, oldest = results[i * 3 : i * 3 + 3]
+        oldest_age = (now_ms - oldest[0][1]) / 1000 if ready and oldest else None
+        stats.append(QueueStats(queue_name.value, ready, total - ready, oldest_age))
+    return stats
+
+
 @contextlib.asynccontextmanager
 async def AsyncSessionMaker(ctx: JobContext) -> AsyncIterator[AsyncSession]:
     """Helper to open an AsyncSession context manager from the job context."""
@@ -400,6 +715,8 @@ def compute_backoff(
 
 __all__ = [
     "WorkerSettings",
+    "WorkerSettingsCritical",
+    "WorkerSettingsBulk",
     "WorkerSettingsGitHubCrawl",
     "task",
     "lifespan",
@@ -408,5 +725,7 @@ __all__ = [
     "AsyncSessionMaker",
     "ArqRedis",
     "QueueName",
+    "QueueStats",
+    "get_queue_stats",
     "CronTrigger",
 ]
@@ -12,7 +12,13 @@ from polar.logfire import configure_logfire
 from polar.logging import Logger
 from polar.logging import configure as configure_logging
 from polar.sentry import configure_sentry
-from polar.worker import CronTasksScheduler, WorkerSettings, WorkerSettingsGitHubCrawl
+from polar.worker import (
+    CronTasksScheduler,
+    WorkerSettings,
+    WorkerSettingsBulk,
+    WorkerSettingsCritical,
+    WorkerSettingsGitHubCrawl,
+)
 
 configure_sentry()
 configure_logfire("worker")
@@ -42,7 +48,12 @@ def _run_worker(settings_cls: type[WorkerSettings]) -> None:
     arq_run_worker(settings_cls)  # type: ignore
 
 
-def _main(default_worker_num: int = 1, github_worker_num: int = 1) -> int:
+def _main(
+    default_worker_num: int = 1,
+    github_worker_num: int = 1,
+    critical_worker_num: int = 1,
+    bulk_worker_num: int = 1,
+) -> int:
     running = True
 
     logger: Logger = structlog.get_logger(pid=os.getpid())
@@ -55,21 +66,20 @@ def _main(default_worker_num: int = 1, github_worker_num: int = 1) -> int:
     processes.append(scheduler_process)
     logger.debug("Triggered scheduler process")
 
-    for _ in range(default_worker_num):
-        default_worker_process = multiprocessing.Process(
-            target=_run_worker, args=(WorkerSettings,)
-        )
-        default_worker_process.start()
-        processes.append(default_worker_process)
-    logger.debug(f"Triggered {default_worker_num} default worker processes")
-
-    for _ in range(github_worker_num):
-        github_worker_process = multiprocessing.Process(
-            target=_run_worker, args=(WorkerSettingsGitHubCrawl,)
-        )
-        github_worker_process.start()
-        processes.append(github_worker_process)
-    logger.debug(f"Triggered {github_worker_num} GitHub worker processes")
+    workers: list[tuple[str, type[WorkerSettings], int]] = [
+        ("critical", WorkerSettingsCritical, critical_worker_num),
+        ("default", WorkerSettings, default_worker_num),
+        ("bulk", WorkerSettingsBulk, bulk_worker_num),
+        ("GitHub", WorkerSettingsGitHubCrawl, github_worker_num),
+    ]
+    for worker_type, settings_cls, worker_num in workers:
+        for _ in range(worker_num):
+            worker_process = multiprocessing.Process(
+                target=_run_worker, args=(settings_cls,)
+            )
+            worker_process.start()
+            processes.append(worker_process)
+        logger.debug(f"Triggered {worker_num} {worker_type} worker processes")
 
     def stop_processes(signum: signal.Signals) -> None:
         logger.debug("Stopping worker processes")
@@ -135,6 +145,25 @@ if __name__ == "__main__":
         default=1,
         help="Number of GitHub worker processes to start (default: 1)",
     )
+    parser.add_argument(
+        "--critical-worker-num",
+        type=int,
+        default=1,
+        help="Number of critical worker processes to start (default: 1)",
+    )
+    parser.add_argument(
+        "--bulk-worker-num",
+        type=int,
+        default=1,
+        help="Number of bulk worker processes to start (default: 1)",
+    )
     args = parser.parse_args()
 
-    sys.exit(_main(args.default_worker_num, args.github_worker_num))
+    sys.exit(
+        _main(
+            args.default_worker_num,
+            args.github_worker_num,
+            args.critical_worker_num,
+            args.bulk_worker_num,
+        )
+    )
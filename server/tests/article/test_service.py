@@ -611,3 +611,72 @@ class TestListReceivers:
         receivers = await article_service.list_receivers(session, organization.id, True)
         assert len(receivers) == 1
         assert receivers[0] == (user.id, True, True)
+
+
+@pytest.mark.asyncio
+class TestStreamReceivers:
+    async def test_chunks(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        organization: Organization,
+    ) -> None:
+        users = [await create_user(save_fixture) for _ in range(5)]
+        for user in users:
+            await create_articles_subscription(
+                save_fixture,
+                user=user,
+                organization=organization,
+                paid_subscriber=False,
+            )
+
+        # then
+        session.expunge_all()
+
+        chunks = [
+            chunk
+            async for chunk in article_service.stream_receivers(
+                session, organization.id, False, chunk_size=2
+            )
+        ]
+        assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+        assert {receiver for chunk in chunks for receiver in chunk} == {
+            (user.id, False, False) for user in users
+        }
+
+
+@pytest.mark.asyncio
+class TestListBatchReceivers:
+    async def test_filtered(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        user: User,
+        user_second: User,
+        organization: Organization,
+        user_organization: UserOrganization,
+        article_public_free_published: Article,
+    ) -> None:
+        subscription = await create_articles_subscription(
+            save_fixture,
+            user=user_second,
+            organization=organization,
+            paid_subscriber=True,
+        )
+        other_user = await create_user(save_fixture)
+
+        # then
+        session.expunge_all()
+
+        receivers = await article_service.list_batch_receivers(
+            session,
+            article_public_free_published,
+            [user.id, user_second.id, other_user.id],
+        )
+        assert {
+            (receiver.id, subscription_id, paid_subscriber, organization_member)
+            for receiver, subscription_id, paid_subscriber, organization_member in receivers
+        } == {
+            (user.id, None, False, True),
+            (user_second.id, subscription.id, True, False),
+        }
@@ -0,0 +1,93 @@
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+import respx
+from pytest_mock import MockerFixture
+
+from polar.article.tasks import UNSUBSCRIBE_ID_PLACEHOLDER, articles_send_batch
+from polar.config import settings
+from polar.models import Organization, User, UserOrganization
+from polar.models.article import ArticleVisibility
+from polar.postgres import AsyncSession
+from polar.worker import JobContext, PolarWorkerContext
+from tests.article.test_service import create_article, create_articles_subscription
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import create_user
+
+
+@pytest.mark.asyncio
+class TestArticlesSendBatch:
+    async def test_render_once_per_variant(
+        self,
+        mocker: MockerFixture,
+        respx_mock: respx.MockRouter,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        user: User,
+        organization: Organization,
+        user_organization: UserOrganization,
+    ) -> None:
+        article = await create_article(
+            save_fixture,
+            user=user,
+            organization=organization,
+            visibility=ArticleVisibility.public,
+            paid_subscribers_only=False,
+        )
+        subscribers = [await create_user(save_fixture) for _ in range(3)]
+        subscriptions = [
+            await create_articles_subscription(
+                save_fixture,
+                user=subscriber,
+                organization=organization,
+                paid_subscriber=False,
+            )
+            for subscriber in subscribers
+        ]
+
+        render_route = respx_mock.post(
+            f"{settings.FRONTEND_BASE_URL}/email/article/{article.id}"
+        ).mock(
+            side_effect=lambda request: httpx.Response(
+                200,
+                text=f"<a href='{UNSUBSCRIBE_ID_PLACEHOLDER}'>unsubscribe</a>",
+            )
+        )
+        email_sender_mock = MagicMock()
+        mocker.patch(
+            "polar.article.tasks.get_email_sender", return_value=email_sender_mock
+        )
+
+        # then
+        session.expunge_all()
+
+        await articles_send_batch(
+            job_context,
+            article.id,
+            [user.id, *(subscriber.id for subscriber in subscribers)],
+            polar_worker_context,
+        )
+
+        # One render for the member, one for the free subscribers
+        assert render_route.call_count == 2
+
+        send_batch_mock: MagicMock = email_sender_mock.send_batch_to_users
+        send_batch_mock.assert_called_once()
+        messages = send_batch_mock.call_args[0][0]
+        assert len(messages) == 4
+
+        messages_by_email = {message["to_email_addr"]: message for message in messages}
+        assert "List-Unsubscribe" not in messages_by_email[user.email]["email_headers"]
+        for subscriber, subscription in zip(subscribers, subscriptions):
+            message = messages_by_email[subscriber.email]
+            assert str(subscription.id) in message["html_content"]
+            assert str(subscription.id) in message["email_headers"]["List-Unsubscribe"]
+
+        # Next batches reuse the rendered variants
+        await articles_send_batch(
+            job_context, article.id, [subscribers[0].id], polar_worker_context
+        )
+        assert render_route.call_count == 2
@@ -0,0 +1,65 @@
+import pytest
+import pytest_asyncio
+from _pytest.terminal import TerminalReporter
+
+from polar.models import Organization, UserOrganization
+from polar.postgres import AsyncSession
+from tests.fixtures.database import SaveFixture
+
+from . import harness
+from .dataset import BenchmarkScale, Dataset, generate_dataset, get_scale_factor
+
+
+def pytest_collection_modifyitems(
+    config: pytest.Config, items: list[pytest.Item]
+) -> None:
+    if harness.ENABLED:
+        return
+
+    skip = pytest.mark.skip(reason="Set POLAR_BENCHMARK=1 to run the benchmarks")
+    for item in items:
+        if item.get_closest_marker("benchmark") is not None:
+            item.add_marker(skip)
+
+
+@pytest.fixture
+def benchmark_scale() -> BenchmarkScale:
+    return BenchmarkScale.from_env()
+
+
+@pytest_asyncio.fixture
+async def dataset(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    benchmark_scale: BenchmarkScale,
+    organization: Organization,
+    user_organization: UserOrganization,
+) -> Dataset:
+    return await generate_dataset(
+        session, save_fixture, benchmark_scale, organization=organization
+    )
+
+
+@pytest.fixture
+def benchmark(session: AsyncSession) -> harness.Benchmark:
+    return harness.Benchmark(session, get_scale_factor())
+
+
+def pytest_terminal_summary(terminalreporter: TerminalReporter) -> None:
+    if not harness.results:
+        return
+
+    terminalreporter.section("benchmarks")
+    terminalreporter.write_line(
+        f"{'name':<40} {'rounds':>6} {'p50 (ms)':>10} {'p99 (ms)':>10} "
+        f"{'queries':>8} {'rows scanned':>13}"
+    )
+    for result in sorted(harness.results, key=lambda r: r.name):
+        terminalreporter.write_line(
+            f"{result.name:<40} {result.rounds:>6} {result.p50_ms:>10.2f} "
+            f"{result.p99_ms:>10.2f} {result.queries:>8} {result.rows_scanned:>13}"
+        )
+
+    if harness.SAVE_BASELINES:
+        harness.save_baselines(get_scale_factor())
+        terminalreporter.write_line(f"Baselines saved to {harness.BASELINES_PATH}")
@@ -0,0 +1,147 @@
+import dataclasses
+import os
+from datetime import timedelta
+
+from polar.enums import SubscriptionRecurringInterval
+from polar.kit.utils import utc_now
+from polar.metrics.service import metrics as metrics_service
+from polar.models import Organization, Product, User
+from polar.models.product_price import ProductPriceType
+from polar.postgres import AsyncSession
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import (
+    create_active_subscription,
+    create_external_organization,
+    create_issue,
+    create_order,
+    create_organization,
+    create_pledge,
+    create_product,
+    create_repository,
+    create_user,
+)
+
+
+@dataclasses.dataclass(frozen=True)
+class BenchmarkScale:
+    """
+    Size of the synthetic dataset.
+
+    Every count is multiplied by the `POLAR_BENCHMARK_SCALE` environment variable.
+    """
+
+    organizations: int = 2
+    products_per_organization: int = 5
+    orders_per_product: int = 10
+    subscriptions_per_product: int = 5
+    issues_per_organization: int = 10
+    pledges_per_issue: int = 2
+    customers: int = 20
+
+    @classmethod
+    def from_env(cls) -> "BenchmarkScale":
+        return cls.scaled(get_scale_factor())
+
+    @classmethod
+    def scaled(cls, factor: int) -> "BenchmarkScale":
+        default = cls()
+        return cls(
+            **{
+                field.name: getattr(default, field.name) * factor
+                for field in dataclasses.fields(cls)
+            }
+        )
+
+
+def get_scale_factor() -> int:
+    return int(os.environ.get("POLAR_BENCHMARK_SCALE", 1))
+
+
+@dataclasses.dataclass
+class Dataset:
+    organization: Organization
+    """The organization the benchmarks run against. Other ones are noise."""
+    products: list[Product]
+    customers: list[User]
+
+
+async def generate_dataset(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    scale: BenchmarkScale,
+    *,
+    organization: Organization,
+) -> Dataset:
+    """
+    Generate products, orders, subscriptions and pledges
+    for the given organization and a few others.
+
+    Orders are spread over the last year, so metrics cover a realistic range.
+    """
+    now = utc_now()
+    customers = [await create_user(save_fixture) for _ in range(scale.customers)]
+
+    organizations = [organization] + [
+        await create_organization(save_fixture) for _ in range(scale.organizations - 1)
+    ]
+
+    products: list[Product] = []
+    for org in organizations:
+        for i in range(scale.products_per_organization):
+            recurring = i % 2 == 0
+            product = await create_product(
+                save_fixture,
+                organization=org,
+                prices=[
+                    (
+                        1000 * (i + 1),
+                        ProductPriceType.recurring
+                        if recurring
+                        else ProductPriceType.one_time,
+                        SubscriptionRecurringInterval.month if recurring else None,
+                    )
+                ],
+            )
+            if org == organization:
+                products.append(product)
+
+            for j in range(scale.orders_per_product):
+                await create_order(
+                    save_fixture,
+                    product=product,
+                    user=customers[j % len(customers)],
+                    amount=product.prices[0].price_amount,  # type: ignore[attr-defined]
+                    stripe_invoice_id=None,
+                    created_at=now - timedelta(days=(j * 37) % 365),
+                )
+
+            if recurring:
+                for j in range(scale.subscriptions_per_product):
+                    await create_active_subscription(
+                        save_fixture,
+                        product=product,
+                        user=customers[j % len(customers)],
+                        started_at=now - timedelta(days=(j * 53) % 365),
+                        stripe_subscription_id=None,
+                    )
+
+        external_organization = await create_external_organization(
+            save_fixture, organization=org
+        )
+        repository = await create_repository(
+            save_fixture, external_organization, is_private=False
+        )
+        for _ in range(scale.issues_per_organization):
+            issue = await create_issue(save_fixture, external_organization, repository)
+            for j in range(scale.pledges_per_issue):
+                await create_pledge(
+                    save_fixture,
+                    external_organization,
+                    repository,
+                    issue,
+                    pledging_user=customers[j % len(customers)],
+                )
+
+        await metrics_service.refresh_rollups(session, org.id)
+
+    return Dataset(organization=organization, products=products, customers=customers)
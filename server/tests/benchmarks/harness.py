@@ -0,0 +1,202 @@
+import dataclasses
+import json
+import os
+import statistics
+import time
+from collections.abc import Awaitable, Callable
+from pathlib import Path
+from typing import Any
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import Connection
+
+from polar.postgres import AsyncSession
+
+BASELINES_PATH = Path(__file__).parent / "baselines.json"
+
+ENABLED = os.environ.get("POLAR_BENCHMARK") == "1"
+"""Run the benchmarks. They're skipped by default, since they're slow."""
+
+ROUNDS = int(os.environ.get("POLAR_BENCHMARK_ROUNDS", 20))
+"""Number of measured rounds per benchmark."""
+
+WARMUP_ROUNDS = 1
+"""Number of rounds run before measuring, to warm up caches."""
+
+SAVE_BASELINES = os.environ.get("POLAR_BENCHMARK_SAVE") == "1"
+"""Overwrite the stored baselines with the results of this run."""
+
+COMPARE_LATENCY = os.environ.get("POLAR_BENCHMARK_COMPARE_LATENCY") == "1"
+"""
+Also fail on latency regressions.
+
+Off by default, since latency depends on the machine running the suite,
+while query count and rows scanned don't.
+"""
+
+LATENCY_TOLERANCE = 1.5
+ROWS_SCANNED_TOLERANCE = 2.0
+"""
+Rows scanned vary a bit between runs with the query plans, so only
+catch order-of-magnitude regressions, like a lost index.
+"""
+
+_ROWS_SCANNED_STATEMENT = text(
+    "SELECT COALESCE(SUM(seq_tup_read + COALESCE(idx_tup_fetch, 0)), 0) "
+    "FROM pg_stat_xact_user_tables"
+)
+
+
+@dataclasses.dataclass
+class BenchmarkResult:
+    name: str
+    rounds: int
+    p50_ms: float
+    p99_ms: float
+    queries: int
+    rows_scanned: int
+
+    def to_baseline(self) -> dict[str, Any]:
+        return {
+            "p50_ms": round(self.p50_ms, 2),
+            "p99_ms": round(self.p99_ms, 2),
+            "queries": self.queries,
+            "rows_scanned": self.rows_scanned,
+        }
+
+
+class BenchmarkRegression(AssertionError):
+    pass
+
+
+results: list[BenchmarkResult] = []
+"""Results of the current run, reported at the end of the session."""
+
+
+def _percentile(durations: list[float], percentile: int) -> float:
+    if len(durations) == 1:
+        return durations[0]
+    return statistics.quantiles(durations, n=100, method="inclusive")[percentile - 1]
+
+
+def load_baselines(scale: int) -> dict[str, dict[str, Any]]:
+    """
+    Load the stored baselines.
+
+    Baselines are only comparable to a run with the same data scale,
+    so nothing is returned if the scale differs.
+    """
+    if not BASELINES_PATH.exists():
+        return {}
+    baselines = json.loads(BASELINES_PATH.read_text())
+    if baselines.get("scale") != scale:
+        return {}
+    return baselines.get("results", {})
+
+
+def save_baselines(scale: int) -> None:
+    """
+    Store the results of this run as baselines.
+
+    Baselines of the benchmarks which didn't run are kept,
+    so a subset of the benchmarks can be updated.
+    """
+    merged = {
+        **load_baselines(scale),
+        **{result.name: result.to_baseline() for result in results},
+    }
+    baselines = {
+        "scale": scale,
+        "results": {name: merged[name] for name in sorted(merged)},
+    }
+    BASELINES_PATH.write_text(json.dumps(baselines, indent=2) + "\n")
+
+
+class Benchmark:
+    """
+    Measure an async callable hitting the database.
+
+    Each round is timed, and the SQL statements and table rows it reads
+    are counted. Rows scanned are read from `pg_stat_xact_user_tables`,
+    which accounts for the current transaction only, i.e. the test.
+    """
+
+    def __init__(self, session: AsyncSession, scale: int) -> None:
+        self.session = session
+        self.scale = scale
+        self.rounds = ROUNDS
+        self.warmup_rounds = WARMUP_ROUNDS
+
+    async def __call__(
+        self, name: str, fn: Callable[[], Awaitable[Any]]
+    ) -> BenchmarkResult:
+        queries = 0
+
+        def _count_query(conn: Connection, *args: Any, **kwargs: Any) -> None:
+            nonlocal queries
+            queries += 1
+
+        for _ in range(self.warmup_rounds):
+            self.session.expunge_all()
+            await fn()
+
+        sync_engine = self.session.bind.engine.sync_engine
+        durations: list[float] = []
+        max_queries = 0
+        max_rows_scanned = 0
+        for _ in range(self.rounds):
+            self.session.expunge_all()
+            rows_scanned_before = await self._get_rows_scanned()
+
+            queries = 0
+            event.listen(sync_engine, "before_cursor_execute", _count_query)
+            start = time.perf_counter()
+            try:
+                await fn()
+            finally:
+                durations.append((time.perf_counter() - start) * 1000)
+                event.remove(sync_engine, "before_cursor_execute", _count_query)
+
+            rows_scanned = await self._get_rows_scanned() - rows_scanned_before
+            max_queries = max(max_queries, queries)
+            max_rows_scanned = max(max_rows_scanned, rows_scanned)
+
+        result = BenchmarkResult(
+            name=name,
+            rounds=self.rounds,
+            p50_ms=_percentile(durations, 50),
+            p99_ms=_percentile(durations, 99),
+            queries=max_queries,
+            rows_scanned=max_rows_scanned,
+        )
+        results.append(result)
+
+        if not SAVE_BASELINES:
+            self._compare(result)
+
+        return result
+
+    async def _get_rows_scanned(self) -> int:
+        result = await self.session.execute(_ROWS_SCANNED_STATEMENT)
+        return int(result.scalar_one())
+
+    def _compare(self, result: BenchmarkResult) -> None:
+        baseline = load_baselines(self.scale).get(result.name)
+        if baseline is None:
+            return
+
+        if result.queries > baseline["queries"]:
+            raise BenchmarkRegression(
+                f"{result.name}: {result.queries} queries, "
+                f"baseline is {baseline['queries']}"
+            )
+        if result.rows_scanned > baseline["rows_scanned"] * ROWS_SCANNED_TOLERANCE:
+            raise BenchmarkRegression(
+                f"{result.name}: {result.rows_scanned} rows scanned, "
+                f"baseline is {baseline['rows_scanned']}"
+            )
+        if COMPARE_LATENCY and result.p99_ms > baseline["p99_ms"] * LATENCY_TOLERANCE:
+            raise BenchmarkRegression(
+                f"{result.name}: p99 is {result.p99_ms:.2f}ms, "
+                f"baseline is {baseline['p99_ms']:.2f}ms"
+            )
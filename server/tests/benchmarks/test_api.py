@@ -0,0 +1,206 @@
+from datetime import timedelta
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, MagicMock
+from uuid import UUID
+
+import pytest
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+from sqlalchemy import select
+
+from polar.benefit.schemas import BenefitLicenseKeysCreateProperties
+from polar.checkout.tax import calculate_tax
+from polar.integrations.stripe.service import StripeService
+from polar.kit.pagination import PaginationParams, paginate
+from polar.kit.utils import utc_now
+from polar.license_key.service import license_key as license_key_service
+from polar.models import Order, Product, User
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.license_key import TestLicenseKey
+from tests.fixtures.random_objects import create_checkout
+
+from .dataset import Dataset
+from .harness import Benchmark
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.skip_db_asserts, pytest.mark.benchmark]
+
+
+@pytest.fixture(autouse=True)
+def stripe_service_mock(mocker: MockerFixture) -> MagicMock:
+    mock = MagicMock(spec=StripeService)
+    mocker.patch("polar.checkout.service.stripe_service", new=mock)
+    mock.create_customer.return_value = SimpleNamespace(id="STRIPE_CUSTOMER_ID")
+    mock.create_payment_intent.return_value = SimpleNamespace(
+        client_secret="CLIENT_SECRET", status="succeeded"
+    )
+    return mock
+
+
+@pytest.fixture(autouse=True)
+def calculate_tax_mock(mocker: MockerFixture) -> AsyncMock:
+    mock = AsyncMock(spec=calculate_tax)
+    mocker.patch("polar.checkout.service.calculate_tax", new=mock)
+    mock.return_value = 0
+    return mock
+
+
+def _one_time_product(dataset: Dataset) -> Product:
+    return next(p for p in dataset.products if not p.is_recurring)
+
+
+async def test_paginate(
+    session: AsyncSession, benchmark: Benchmark, dataset: Dataset
+) -> None:
+    statement = (
+        select(Order)
+        .join(Order.product)
+        .where(Product.organization_id == dataset.organization.id)
+        .order_by(Order.created_at.desc())
+    )
+
+    async def run() -> None:
+        results, count = await paginate(
+            session, statement, pagination=PaginationParams(2, 10)
+        )
+        assert len(results) == 10
+
+    await benchmark("kit.paginate", run)
+
+
+@pytest.mark.auth
+async def test_metrics_get(
+    client: AsyncClient, benchmark: Benchmark, dataset: Dataset
+) -> None:
+    end_date = utc_now().date()
+    start_date = end_date - timedelta(days=365)
+
+    async def run() -> None:
+        response = await client.get(
+            "/v1/metrics/",
+            params={
+                "start_date": start_date.isoformat(),
+                "end_date": end_date.isoformat(),
+                "interval": "day",
+                "organization_id": str(dataset.organization.id),
+            },
+        )
+        assert response.status_code == 200
+
+    await benchmark("metrics.get", run)
+
+
+async def test_funding_search(
+    client: AsyncClient, benchmark: Benchmark, dataset: Dataset
+) -> None:
+    async def run() -> None:
+        response = await client.get(
+            "/v1/funding/search",
+            params={"organization_id": str(dataset.organization.id)},
+        )
+        assert response.status_code == 200
+
+    await benchmark("funding.search", run)
+
+
+async def test_checkout_client_create(
+    client: AsyncClient, benchmark: Benchmark, dataset: Dataset
+) -> None:
+    price = _one_time_product(dataset).prices[0]
+
+    async def run() -> None:
+        response = await client.post(
+            "/v1/checkouts/custom/client/",
+            json={"product_price_id": str(price.id)},
+        )
+        assert response.status_code == 201
+
+    await benchmark("checkout.client_create", run)
+
+
+async def test_checkout_client_update(
+    save_fixture: SaveFixture,
+    client: AsyncClient,
+    benchmark: Benchmark,
+    dataset: Dataset,
+) -> None:
+    checkout = await create_checkout(
+        save_fixture, price=_one_time_product(dataset).prices[0]
+    )
+
+    async def run() -> None:
+        response = await client.patch(
+            f"/v1/checkouts/custom/client/{checkout.client_secret}",
+            json={"customer_name": "Customer Name"},
+        )
+        assert response.status_code == 200
+
+    await benchmark("checkout.client_update", run)
+
+
+async def test_checkout_client_confirm(
+    save_fixture: SaveFixture,
+    client: AsyncClient,
+    benchmark: Benchmark,
+    dataset: Dataset,
+) -> None:
+    # A checkout can only be confirmed once
+    price = _one_time_product(dataset).prices[0]
+    checkouts = iter(
+        [
+            await create_checkout(save_fixture, price=price)
+            for _ in range(benchmark.warmup_rounds + benchmark.rounds)
+        ]
+    )
+
+    async def run() -> None:
+        checkout = next(checkouts)
+        response = await client.post(
+            f"/v1/checkouts/custom/client/{checkout.client_secret}/confirm",
+            json={
+                "customer_name": "Customer Name",
+                "customer_email": "customer@example.com",
+                "customer_billing_address": {"country": "FR"},
+                "confirmation_token_id": "CONFIRMATION_TOKEN_ID",
+            },
+        )
+        assert response.status_code == 200
+
+    await benchmark("checkout.client_confirm", run)
+
+
+async def test_license_key_validate(
+    session: AsyncSession,
+    redis: Redis,
+    save_fixture: SaveFixture,
+    client: AsyncClient,
+    benchmark: Benchmark,
+    dataset: Dataset,
+    user: User,
+) -> None:
+    _, granted = await TestLicenseKey.create_benefit_and_grant(
+        session,
+        redis,
+        save_fixture,
+        user=user,
+        organization=dataset.organization,
+        product=dataset.products[0],
+        properties=BenefitLicenseKeysCreateProperties(prefix="benchmark"),
+    )
+    license_key = await license_key_service.get(
+        session, UUID(granted["license_key_id"])
+    )
+    assert license_key is not None
+
+    async def run() -> None:
+        response = await client.post(
+            "/v1/users/license-keys/validate",
+            json={
+                "key": license_key.key,
+                "organization_id": str(dataset.organization.id),
+            },
+        )
+        assert response.status_code == 200
+
+    await benchmark("license_key.validate", run)
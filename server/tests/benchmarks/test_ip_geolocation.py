@@ -0,0 +1,92 @@
+import ipaddress
+import random
+from collections.abc import Iterator
+from pathlib import Path
+
+import ipinfo_db
+import pytest
+
+from polar.checkout.ip_geolocation import (
+    DATABASE_PATH,
+    IPGeolocationIndex,
+    Network,
+    _get_database_networks,
+    build_index,
+)
+
+from .harness import Benchmark
+
+pytestmark = [pytest.mark.asyncio, pytest.mark.skip_db_asserts, pytest.mark.benchmark]
+
+LOOKUPS = 1000
+"""
+Number of IP addresses looked up per round.
+
+Rounds are timed as a whole, so the latencies of these benchmarks are for
+`LOOKUPS` lookups: divide them by 1000 to get the latency of a single lookup.
+"""
+
+SYNTHETIC_NETWORKS = 2**18
+"""Number of networks in the synthetic index, about as many as the real database."""
+
+COUNTRIES = ["US", "FR", "DE", "GB", "CN", "BR", "IN", "JP", None]
+
+
+def _get_synthetic_networks() -> Iterator[tuple[Network, str | None]]:
+    rng = random.Random(0)
+    prefix_length = SYNTHETIC_NETWORKS.bit_length() - 1
+    for i in range(SYNTHETIC_NETWORKS):
+        network = ipaddress.IPv4Network((i << (32 - prefix_length), prefix_length))
+        yield network, rng.choice(COUNTRIES)
+
+
+@pytest.fixture
+def ips() -> list[str]:
+    rng = random.Random(0)
+    return [str(ipaddress.IPv4Address(rng.getrandbits(32))) for _ in range(LOOKUPS)]
+
+
+async def test_index_get_country(
+    tmp_path: Path, benchmark: Benchmark, ips: list[str]
+) -> None:
+    path = tmp_path / "ip-geolocation.index"
+    build_index(_get_synthetic_networks(), path)
+    index = IPGeolocationIndex(path)
+
+    async def run() -> None:
+        for ip in ips:
+            index.get_country(ip)
+
+    try:
+        await benchmark("ip_geolocation.index", run)
+    finally:
+        index.close()
+
+
+@pytest.mark.skipif(
+    not DATABASE_PATH.exists(), reason="IP geolocation database not downloaded"
+)
+async def test_database_get_country(
+    tmp_path: Path, benchmark: Benchmark, ips: list[str]
+) -> None:
+    path = tmp_path / "ip-geolocation.index"
+    build_index(_get_database_networks(DATABASE_PATH), path)
+    index = IPGeolocationIndex(path)
+    client = ipinfo_db.Client(path=DATABASE_PATH)
+
+    async def run_index() -> None:
+        for ip in ips:
+            index.get_country(ip)
+
+    async def run_client() -> None:
+        for ip in ips:
+            client.getCountry(ip)
+
+    try:
+        index_result = await benchmark("ip_geolocation.database.index", run_index)
+        client_result = await benchmark("ip_geolocation.database.client", run_client)
+    finally:
+        index.close()
+        client.close()
+
+    assert index_result.p50_ms < client_result.p50_ms
@@ -4,7 +4,12 @@ from unittest.mock import MagicMock, call
 import pytest
 from pytest_mock import MockerFixture
 
-from polar.benefit.benefits import BenefitPreconditionError, BenefitServiceProtocol
+from polar.benefit.benefits import (
+    BenefitPreconditionError,
+    BenefitRetriableError,
+    BenefitServiceProtocol,
+)
+from polar.benefit.service.benefit import benefit as benefit_service
 from polar.benefit.service.benefit_grant import (
     benefit_grant as benefit_grant_service,
 )
@@ -469,8 +474,9 @@ class TestEnqueueBenefitGrantUpdates:
         )
 
         enqueue_job_mock.assert_called_once_with(
-            "benefit.update",
-            benefit_grant_id=granted_grant.id,
+            "benefit.update_batch",
+            benefit_id=benefit_organization.id,
+            benefit_grant_ids=[granted_grant.id],
         )
 
     async def test_required_update_revoked(
@@ -610,6 +616,116 @@ class TestUpdateBenefitGrant:
         assert not updated_grant.is_granted
 
 
+@pytest.mark.asyncio
+class TestUpdateBenefitGrants:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        save_fixture: SaveFixture,
+        product: Product,
+        user: User,
+        user_second: User,
+        benefit_organization: Benefit,
+        benefit_service_mock: MagicMock,
+    ) -> None:
+        grants: list[BenefitGrant] = []
+        for grant_user in (user, user_second):
+            subscription = await create_subscription(
+                save_fixture, product=product, user=grant_user
+            )
+            grant = BenefitGrant(
+                subscription=subscription,
+                user=grant_user,
+                benefit=benefit_organization,
+                properties={"external_id": "abc"},
+            )
+            grant.set_granted()
+            await save_fixture(grant)
+            grants.append(grant)
+
+        revoked_grant = await create_benefit_grant(
+            save_fixture,
+            user,
+            benefit_organization,
+            granted=False,
+            order=await create_order(save_fixture, product=product, user=user),
+        )
+
+        benefit_service_mock.grant_many.return_value = [
+            {"external_id": "xyz"},
+            BenefitPreconditionError("Error"),
+        ]
+
+        # then
+        session.expunge_all()
+
+        benefit = await benefit_service.get(
+            session, benefit_organization.id, loaded=True
+        )
+        assert benefit is not None
+
+        retriable_errors = await benefit_grant_service.update_benefit_grants(
+            session,
+            redis,
+            benefit,
+            sorted(grant.id for grant in [*grants, revoked_grant]),
+        )
+
+        assert retriable_errors == []
+        benefit_service_mock.grant_many.assert_called_once()
+        assert len(benefit_service_mock.grant_many.call_args[0][1]) == 2
+        assert benefit_service_mock.grant_many.call_args[1]["update"] is True
+
+        updated_grants = sorted(grants, key=lambda g: g.id)
+        first = await benefit_grant_service.get(session, updated_grants[0].id)
+        second = await benefit_grant_service.get(session, updated_grants[1].id)
+        assert first is not None and second is not None
+        assert first.is_granted
+        assert first.properties == {"external_id": "xyz"}
+        assert not second.is_granted
+
+    async def test_retriable_error(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        save_fixture: SaveFixture,
+        subscription: Subscription,
+        user: User,
+        benefit_organization: Benefit,
+        benefit_service_mock: MagicMock,
+    ) -> None:
+        grant = BenefitGrant(
+            subscription=subscription,
+            user=user,
+            benefit=benefit_organization,
+            properties={"external_id": "abc"},
+        )
+        grant.set_granted()
+        await save_fixture(grant)
+
+        error = BenefitRetriableError(10)
+        benefit_service_mock.grant_many.return_value = [error]
+
+        # then
+        session.expunge_all()
+
+        benefit = await benefit_service.get(
+            session, benefit_organization.id, loaded=True
+        )
+        assert benefit is not None
+
+        retriable_errors = await benefit_grant_service.update_benefit_grants(
+            session, redis, benefit, [grant.id]
+        )
+
+        assert len(retriable_errors) == 1
+        failed_grant, failed_error = retriable_errors[0]
+        assert failed_grant.id == grant.id
+        assert failed_error == error
+        assert failed_grant.properties == {"external_id": "abc"}
+
+
 @pytest.mark.asyncio
 class TestEnqueueBenefitGrantDeletions:
     async def test_valid(
@@ -646,9 +762,54 @@ class TestEnqueueBenefitGrantDeletions:
         )
 
         enqueue_job_mock.assert_called_once_with(
-            "benefit.delete", benefit_grant_id=granted_grant.id
+            "benefit.delete_batch",
+            benefit_id=benefit_organization.id,
+            benefit_grant_ids=[granted_grant.id],
+        )
+
+    async def test_batches(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        product: Product,
+        user: User,
+        user_second: User,
+        benefit_organization: Benefit,
+    ) -> None:
+        mocker.patch("polar.benefit.service.benefit_grant.BENEFIT_GRANT_BATCH_SIZE", 1)
+        grants: list[BenefitGrant] = []
+        for grant_user in (user, user_second):
+            subscription = await create_subscription(
+                save_fixture, product=product, user=grant_user
+            )
+            grant = BenefitGrant(
+                subscription=subscription,
+                user=grant_user,
+                benefit=benefit_organization,
+            )
+            grant.set_granted()
+            await save_fixture(grant)
+            grants.append(grant)
+
+        enqueue_job_mock = mocker.patch(
+            "polar.benefit.service.benefit_grant.enqueue_job"
         )
 
+        # then
+        session.expunge_all()
+
+        await benefit_grant_service.enqueue_benefit_grant_deletions(
+            session, benefit_organization
+        )
+
+        assert enqueue_job_mock.call_count == 2
+        assert {
+            grant_id
+            for c in enqueue_job_mock.call_args_list
+            for grant_id in c.kwargs["benefit_grant_ids"]
+        } == {grant.id for grant in grants}
+
 
 @pytest.mark.asyncio
 class TestDeleteBenefitGrant:
@@ -710,6 +871,58 @@ class TestDeleteBenefitGrant:
         benefit_service_mock.revoke.assert_called_once()
 
 
+@pytest.mark.asyncio
+class TestDeleteBenefitGrants:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        save_fixture: SaveFixture,
+        product: Product,
+        user: User,
+        user_second: User,
+        benefit_organization: Benefit,
+        benefit_service_mock: MagicMock,
+    ) -> None:
+        grants: list[BenefitGrant] = []
+        for grant_user in (user, user_second):
+            subscription = await create_subscription(
+                save_fixture, product=product, user=grant_user
+            )
+            grant = BenefitGrant(
+                subscription=subscription,
+                user=grant_user,
+                benefit=benefit_organization,
+            )
+            grant.set_granted()
+            await save_fixture(grant)
+            grants.append(grant)
+
+        benefit_service_mock.revoke_many.return_value = [{}, {}]
+
+        # then
+        session.expunge_all()
+
+        benefit = await benefit_service.get(
+            session, benefit_organization.id, loaded=True
+        )
+        assert benefit is not None
+
+        retriable_errors = await benefit_grant_service.delete_benefit_grants(
+            session, redis, benefit, [grant.id for grant in grants]
+        )
+
+        assert retriable_errors == []
+        benefit_service_mock.revoke_many.assert_called_once()
+        users = [u for u, _ in benefit_service_mock.revoke_many.call_args[0][1]]
+        assert {u.id for u in users} == {user.id, user_second.id}
+
+        for grant in grants:
+            updated_grant = await benefit_grant_service.get(session, grant.id)
+            assert updated_grant is not None
+            assert updated_grant.is_revoked
+
+
 @pytest.fixture
 def notification_send_to_user_mock(mocker: MockerFixture) -> MagicMock:
     return mocker.patch.object(
@@ -13,11 +13,13 @@ from polar.benefit.tasks import (  # type: ignore[attr-defined]
     BenefitGrantDoesNotExist,
     UserDoesNotExist,
     benefit_delete,
+    benefit_delete_batch,
     benefit_grant,
     benefit_grant_service,
     benefit_precondition_fulfilled,
     benefit_revoke,
     benefit_update,
+    benefit_update_batch,
 )
 from polar.models import Benefit, BenefitGrant, Subscription, User
 from polar.models.benefit import BenefitType
@@ -304,6 +306,60 @@ class TestBenefitUpdate:
             await benefit_update(job_context, grant.id, polar_worker_context)
 
 
+@pytest.mark.asyncio
+class TestBenefitUpdateBatch:
+    async def test_not_existing_benefit(
+        self,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        session: AsyncSession,
+    ) -> None:
+        # then
+        session.expunge_all()
+
+        with pytest.raises(BenefitDoesNotExist):
+            await benefit_update_batch(
+                job_context, uuid.uuid4(), [uuid.uuid4()], polar_worker_context
+            )
+
+    async def test_retriable_errors(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription: Subscription,
+        user: User,
+        benefit_organization: Benefit,
+    ) -> None:
+        grant = BenefitGrant(
+            subscription=subscription, user=user, benefit=benefit_organization
+        )
+        grant.set_granted()
+        await save_fixture(grant)
+
+        update_benefit_grants_mock = mocker.patch.object(
+            benefit_grant_service,
+            "update_benefit_grants",
+            spec=BenefitGrantService.update_benefit_grants,
+        )
+        update_benefit_grants_mock.return_value = [(grant, BenefitRetriableError(10))]
+        enqueue_job_mock = mocker.patch("polar.benefit.tasks.enqueue_job")
+
+        # then
+        session.expunge_all()
+
+        await benefit_update_batch(
+            job_context, benefit_organization.id, [grant.id], polar_worker_context
+        )
+
+        update_benefit_grants_mock.assert_called_once()
+        enqueue_job_mock.assert_called_once_with(
+            "benefit.update", benefit_grant_id=grant.id, _defer_by=10
+        )
+
+
 @pytest.mark.asyncio
 class TestBenefitDelete:
     async def test_not_existing_grant(
@@ -380,6 +436,44 @@ class TestBenefitDelete:
             await benefit_delete(job_context, grant.id, polar_worker_context)
 
 
+@pytest.mark.asyncio
+class TestBenefitDeleteBatch:
+    async def test_deleted_benefit(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        mocker: MockerFixture,
+        job_context: JobContext,
+        polar_worker_context: PolarWorkerContext,
+        subscription: Subscription,
+        user: User,
+        benefit_organization: Benefit,
+    ) -> None:
+        grant = BenefitGrant(
+            subscription=subscription, user=user, benefit=benefit_organization
+        )
+        grant.set_granted()
+        await save_fixture(grant)
+        benefit_organization.set_deleted_at()
+        await save_fixture(benefit_organization)
+
+        delete_benefit_grants_mock = mocker.patch.object(
+            benefit_grant_service,
+            "delete_benefit_grants",
+            spec=BenefitGrantService.delete_benefit_grants,
+        )
+        delete_benefit_grants_mock.return_value = []
+
+        # then
+        session.expunge_all()
+
+        await benefit_delete_batch(
+            job_context, benefit_organization.id, [grant.id], polar_worker_context
+        )
+
+        delete_benefit_grants_mock.assert_called_once()
+
+
 @pytest.mark.asyncio
 class TestBenefitPreconditionFulfilled:
     async def test_not_existing_user(
@@ -0,0 +1,98 @@
+import ipaddress
+from collections.abc import Iterator
+from pathlib import Path
+
+import ipinfo_db
+import pytest
+
+from polar.checkout.ip_geolocation import (
+    DATABASE_PATH,
+    IPGeolocationIndex,
+    Network,
+    _get_database_networks,
+    build_index,
+)
+
+NETWORKS: list[tuple[Network, str | None]] = [
+    (ipaddress.ip_network("1.0.0.0/24"), "AU"),
+    (ipaddress.ip_network("1.0.1.0/24"), "CN"),
+    (ipaddress.ip_network("1.0.2.0/23"), "CN"),
+    (ipaddress.ip_network("1.0.4.0/22"), None),
+    (ipaddress.ip_network("2.0.0.0/8"), "FR"),
+    (ipaddress.ip_network("2001:db8::/32"), "DE"),
+    (ipaddress.ip_network("2001:db9::/32"), "FR"),
+]
+
+
+@pytest.fixture
+def index(tmp_path: Path) -> Iterator[IPGeolocationIndex]:
+    path = tmp_path / "ip-geolocation.index"
+    build_index(NETWORKS, path)
+    index = IPGeolocationIndex(path)
+    yield index
+    index.close()
+
+
+@pytest.mark.parametrize(
+    "ip, expected",
+    [
+        ("0.255.255.255", None),
+        ("1.0.0.0", "AU"),
+        ("1.0.0.255", "AU"),
+        ("1.0.1.0", "CN"),
+        ("1.0.3.255", "CN"),
+        ("1.0.4.1", None),
+        ("1.0.8.0", None),
+        ("2.42.42.42", "FR"),
+        ("3.0.0.0", None),
+        ("255.255.255.255", None),
+        ("::ffff:1.0.0.1", "AU"),
+        ("::1", None),
+        ("2001:db8::1", "DE"),
+        ("2001:db9:ffff::1", "FR"),
+        ("2001:dba::", None),
+        ("ffff:ffff:ffff:ffff:ffff:ffff:ffff:ffff", None),
+    ],
+)
+def test_get_country(index: IPGeolocationIndex, ip: str, expected: str | None) -> None:
+    assert index.get_country(ip) == expected
+
+
+def test_get_country_invalid_ip(index: IPGeolocationIndex) -> None:
+    with pytest.raises(ValueError):
+        index.get_country("1.0.0")
+
+
+def test_merges_adjacent_ranges(index: IPGeolocationIndex) -> None:
+    # Before 1.0.0.0, AU, CN, no country from 1.0.4.0, FR, no country from 3.0.0.0
+    assert len(index._ipv4_starts) == 6
+
+
+def test_invalid_index(tmp_path: Path) -> None:
+    path = tmp_path / "ip-geolocation.index"
+    path.write_bytes(b"\0" * 64)
+
+    with pytest.raises(ValueError):
+        IPGeolocationIndex(path)
+
+
+@pytest.mark.skipif(
+    not DATABASE_PATH.exists(), reason="IP geolocation database not downloaded"
+)
+def test_matches_database(tmp_path: Path) -> None:
+    path = tmp_path / "ip-geolocation.index"
+    build_index(_get_database_networks(DATABASE_PATH), path)
+    index = IPGeolocationIndex(path)
+    client = ipinfo_db.Client(path=DATABASE_PATH)
+
+    try:
+        for i, (network, _) in enumerate(_get_database_networks(DATABASE_PATH)):
+            if i % 100 != 0:
+                continue
+            for address in (network.network_address, network.broadcast_address):
+                assert index.get_country(str(address)) == client.getCountry(
+                    str(address)
+                )
+    finally:
+        index.close()
+        client.close()
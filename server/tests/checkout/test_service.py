@@ -1,3 +1,4 @@
+import pickle
 import uuid
 from datetime import timedelta
 from types import SimpleNamespace
@@ -26,6 +27,7 @@ from polar.checkout.service import (
     NotConfirmedCheckout,
     NotOpenCheckout,
     PaymentIntentNotSucceeded,
+    WebhookOutOfSequence,
 )
 from polar.checkout.service import checkout as checkout_service
 from polar.checkout.tax import IncompleteTaxLocation, TaxIDFormat, calculate_tax
@@ -44,7 +46,9 @@ from polar.models.product_price import (
     ProductPriceFree,
     ProductPriceType,
 )
+from polar.models.webhook_endpoint import WebhookEventType
 from polar.postgres import AsyncSession
+from polar.redis import Redis
 from tests.fixtures.auth import AuthSubjectFixture
 from tests.fixtures.database import SaveFixture
 from tests.fixtures.random_objects import (
@@ -205,11 +209,12 @@ async def checkout_tax_not_applicable(
 class TestCreate:
     @pytest.mark.auth
     async def test_not_existing_price(
-        self, session: AsyncSession, auth_subject: AuthSubject[User]
+        self, session: AsyncSession, redis: Redis, auth_subject: AuthSubject[User]
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=uuid.uuid4(),
@@ -224,12 +229,14 @@ class TestCreate:
     async def test_not_writable_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         product_one_time: Product,
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=product_one_time.prices[0].id,
@@ -245,6 +252,7 @@ class TestCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -258,6 +266,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe, product_price_id=price.id
                 ),
@@ -272,6 +281,7 @@ class TestCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -281,6 +291,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=product_one_time.prices[0].id,
@@ -298,6 +309,7 @@ class TestCreate:
         amount: int,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time_custom_price: Product,
@@ -311,6 +323,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=product_one_time_custom_price.prices[0].id,
@@ -334,6 +347,7 @@ class TestCreate:
         self,
         payload: dict[str, Any],
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -344,6 +358,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate.model_validate(
                     {
                         "payment_processor": PaymentProcessor.stripe,
@@ -361,6 +376,7 @@ class TestCreate:
     async def test_invalid_not_existing_subscription(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product: Product,
@@ -371,6 +387,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=price.id,
@@ -388,6 +405,7 @@ class TestCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product: Product,
@@ -403,6 +421,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=price.id,
@@ -421,6 +440,7 @@ class TestCreate:
         self,
         amount: int | None,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -429,6 +449,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -453,6 +474,7 @@ class TestCreate:
         self,
         amount: int | None,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time_free_price: Product,
@@ -461,6 +483,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFree)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -486,6 +509,7 @@ class TestCreate:
         amount: int | None,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time_custom_price: Product,
@@ -496,6 +520,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -521,6 +546,7 @@ class TestCreate:
     async def test_valid_tax_id(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -529,6 +555,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -545,6 +572,7 @@ class TestCreate:
     async def test_valid_success_url_with_interpolation(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -553,6 +581,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -572,6 +601,7 @@ class TestCreate:
     async def test_valid_success_url_with_invalid_interpolation_variable(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -580,6 +610,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -598,6 +629,7 @@ class TestCreate:
     async def test_silent_calculate_tax_error(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         calculate_tax_mock: AsyncMock,
         user_organization: UserOrganization,
@@ -612,6 +644,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -627,6 +660,7 @@ class TestCreate:
     async def test_valid_calculate_tax(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         calculate_tax_mock: AsyncMock,
         user_organization: UserOrganization,
@@ -639,6 +673,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -659,6 +694,7 @@ class TestCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product: Product,
@@ -674,6 +710,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -698,6 +735,7 @@ class TestCreate:
         self,
         custom_field_data: dict[str, Any],
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_custom_fields: Product,
@@ -708,6 +746,7 @@ class TestCreate:
         with pytest.raises(PolarRequestValidationError) as e:
             await checkout_service.create(
                 session,
+                redis,
                 CheckoutCreate(
                     payment_processor=PaymentProcessor.stripe,
                     product_price_id=price.id,
@@ -722,6 +761,7 @@ class TestCreate:
     async def test_valid_custom_field_data(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_custom_fields: Product,
@@ -731,6 +771,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -750,6 +791,7 @@ class TestCreate:
         self,
         amount: int | None,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_one_time: Product,
@@ -758,6 +800,7 @@ class TestCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -772,6 +815,7 @@ class TestCreate:
     async def test_valid_tax_not_applicable(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User | Organization],
         user_organization: UserOrganization,
         product_tax_not_applicable: Product,
@@ -781,6 +825,7 @@ class TestCreate:
 
         checkout = await checkout_service.create(
             session,
+            redis,
             CheckoutCreate(
                 payment_processor=PaymentProcessor.stripe,
                 product_price_id=price.id,
@@ -798,11 +843,12 @@ class TestCreate:
 @pytest.mark.skip_db_asserts
 class TestClientCreate:
     async def test_not_existing_price(
-        self, session: AsyncSession, auth_subject: AuthSubject[Anonymous]
+        self, session: AsyncSession, redis: Redis, auth_subject: AuthSubject[Anonymous]
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.client_create(
                 session,
+                redis,
                 CheckoutCreatePublic(
                     product_price_id=uuid.uuid4(),
                 ),
@@ -813,6 +859,7 @@ class TestClientCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time: Product,
     ) -> None:
@@ -825,6 +872,7 @@ class TestClientCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.client_create(
                 session,
+                redis,
                 CheckoutCreatePublic(product_price_id=price.id),
                 auth_subject,
             )
@@ -833,6 +881,7 @@ class TestClientCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time: Product,
     ) -> None:
@@ -841,6 +890,7 @@ class TestClientCreate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.client_create(
                 session,
+                redis,
                 CheckoutCreatePublic(
                     product_price_id=product_one_time.prices[0].id,
                 ),
@@ -850,6 +900,7 @@ class TestClientCreate:
     async def test_valid_fixed_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time: Product,
     ) -> None:
@@ -857,6 +908,7 @@ class TestClientCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(product_price_id=price.id),
             auth_subject,
         )
@@ -869,6 +921,7 @@ class TestClientCreate:
     async def test_valid_free_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time_free_price: Product,
     ) -> None:
@@ -876,6 +929,7 @@ class TestClientCreate:
         assert isinstance(price, ProductPriceFree)
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(product_price_id=price.id),
             auth_subject,
         )
@@ -888,6 +942,7 @@ class TestClientCreate:
     async def test_valid_custom_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time_custom_price: Product,
     ) -> None:
@@ -897,6 +952,7 @@ class TestClientCreate:
 
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(product_price_id=price.id),
             auth_subject,
         )
@@ -913,6 +969,7 @@ class TestClientCreate:
     async def test_valid_direct_user(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User],
         product_one_time: Product,
     ) -> None:
@@ -920,6 +977,7 @@ class TestClientCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(product_price_id=price.id),
             auth_subject,
         )
@@ -932,6 +990,7 @@ class TestClientCreate:
     async def test_valid_indirect_user(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[User],
         product_one_time: Product,
     ) -> None:
@@ -939,6 +998,7 @@ class TestClientCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(product_price_id=price.id),
             auth_subject,
         )
@@ -948,6 +1008,7 @@ class TestClientCreate:
     async def test_valid_from_legacy_checkout_link(
         self,
         session: AsyncSession,
+        redis: Redis,
         auth_subject: AuthSubject[Anonymous],
         product_one_time: Product,
     ) -> None:
@@ -955,6 +1016,7 @@ class TestClientCreate:
         assert isinstance(price, ProductPriceFixed)
         checkout = await checkout_service.client_create(
             session,
+            redis,
             CheckoutCreatePublic(
                 product_price_id=price.id, from_legacy_checkout_link=True
             ),
@@ -974,6 +1036,7 @@ class TestCheckoutLinkCreate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         product_one_time: Product,
     ) -> None:
         price = await create_product_price_fixed(
@@ -984,12 +1047,13 @@ class TestCheckoutLinkCreate:
         )
         checkout_link = await create_checkout_link(save_fixture, price=price)
         with pytest.raises(PolarRequestValidationError):
-            await checkout_service.checkout_link_create(session, checkout_link)
+            await checkout_service.checkout_link_create(session, redis, checkout_link)
 
     async def test_archived_product(
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         product_one_time: Product,
     ) -> None:
         product_one_time.is_archived = True
@@ -998,12 +1062,13 @@ class TestCheckoutLinkCreate:
             save_fixture, price=product_one_time.prices[0]
         )
         with pytest.raises(PolarRequestValidationError):
-            await checkout_service.checkout_link_create(session, checkout_link)
+            await checkout_service.checkout_link_create(session, redis, checkout_link)
 
     async def test_valid(
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         product_one_time: Product,
     ) -> None:
         price = product_one_time.prices[0]
@@ -1013,7 +1078,9 @@ class TestCheckoutLinkCreate:
             success_url="https://example.com/success",
             user_metadata={"key": "value"},
         )
-        checkout = await checkout_service.checkout_link_create(session, checkout_link)
+        checkout = await checkout_service.checkout_link_create(
+            session, redis, checkout_link
+        )
 
         assert checkout.product_price == price
         assert checkout.product == product_one_time
@@ -1027,11 +1094,13 @@ class TestUpdate:
     async def test_not_existing_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_one_time_fixed,
                 CheckoutUpdate(
                     product_price_id=uuid.uuid4(),
@@ -1042,6 +1111,7 @@ class TestUpdate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         product_one_time: Product,
         checkout_one_time_fixed: Checkout,
     ) -> None:
@@ -1054,6 +1124,7 @@ class TestUpdate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_one_time_fixed,
                 CheckoutUpdate(
                     product_price_id=price.id,
@@ -1063,12 +1134,14 @@ class TestUpdate:
     async def test_price_from_different_product(
         self,
         session: AsyncSession,
+        redis: Redis,
         product_one_time_custom_price: Product,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_one_time_fixed,
                 CheckoutUpdate(
                     product_price_id=product_one_time_custom_price.prices[0].id,
@@ -1081,6 +1154,7 @@ class TestUpdate:
         amount: int,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_custom: Checkout,
     ) -> None:
         price = checkout_one_time_custom.product.prices[0]
@@ -1092,6 +1166,7 @@ class TestUpdate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_one_time_custom,
                 CheckoutUpdate(
                     amount=amount,
@@ -1101,11 +1176,13 @@ class TestUpdate:
     async def test_not_open(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_confirmed_one_time: Checkout,
     ) -> None:
         with pytest.raises(NotOpenCheckout):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_confirmed_one_time,
                 CheckoutUpdate(
                     customer_email="customer@example.com",
@@ -1138,6 +1215,7 @@ class TestUpdate:
         updated_values: dict[str, Any],
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         checkout_recurring_fixed: Checkout,
     ) -> None:
         for key, value in initial_values.items():
@@ -1147,6 +1225,7 @@ class TestUpdate:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.update(
                 session,
+                redis,
                 checkout_recurring_fixed,
                 CheckoutUpdate.model_validate(updated_values),
             )
@@ -1155,6 +1234,7 @@ class TestUpdate:
         self,
         save_fixture: SaveFixture,
         session: AsyncSession,
+        redis: Redis,
         product: Product,
         checkout_recurring_fixed: Checkout,
     ) -> None:
@@ -1163,6 +1243,7 @@ class TestUpdate:
         )
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_recurring_fixed,
             CheckoutUpdate(
                 product_price_id=new_price.id,
@@ -1177,10 +1258,12 @@ class TestUpdate:
     async def test_valid_fixed_price_amount_update(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutUpdate(
                 amount=4242,
@@ -1194,10 +1277,12 @@ class TestUpdate:
     async def test_valid_custom_price_amount_update(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_custom: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_custom,
             CheckoutUpdate(
                 amount=4242,
@@ -1208,10 +1293,12 @@ class TestUpdate:
     async def test_valid_free_price_amount_update(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_free: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_free,
             CheckoutUpdate(
                 amount=4242,
@@ -1225,10 +1312,12 @@ class TestUpdate:
     async def test_valid_tax_id(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_custom: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_custom,
             CheckoutUpdate(
                 customer_billing_address=Address.model_validate({"country": "FR"}),
@@ -1242,6 +1331,7 @@ class TestUpdate:
     async def test_valid_unset_tax_id(
         self,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         checkout_one_time_custom: Checkout,
     ) -> None:
@@ -1250,6 +1340,7 @@ class TestUpdate:
 
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_custom,
             CheckoutUpdate(
                 customer_billing_address=Address.model_validate({"country": "US"}),
@@ -1265,6 +1356,7 @@ class TestUpdate:
     async def test_silent_calculate_tax_error(
         self,
         session: AsyncSession,
+        redis: Redis,
         calculate_tax_mock: AsyncMock,
         checkout_one_time_fixed: Checkout,
     ) -> None:
@@ -1274,6 +1366,7 @@ class TestUpdate:
 
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutUpdate(
                 customer_billing_address=Address.model_validate({"country": "US"}),
@@ -1287,6 +1380,7 @@ class TestUpdate:
     async def test_valid_calculate_tax(
         self,
         session: AsyncSession,
+        redis: Redis,
         calculate_tax_mock: AsyncMock,
         checkout_one_time_fixed: Checkout,
     ) -> None:
@@ -1294,6 +1388,7 @@ class TestUpdate:
 
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutUpdate(
                 customer_billing_address=Address.model_validate({"country": "FR"}),
@@ -1307,6 +1402,7 @@ class TestUpdate:
     async def test_ignore_email_update_if_customer_set(
         self,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         user: User,
         checkout_one_time_fixed: Checkout,
@@ -1317,6 +1413,7 @@ class TestUpdate:
 
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutUpdate(customer_email="updatedemail@example.com"),
         )
@@ -1326,10 +1423,12 @@ class TestUpdate:
     async def test_valid_metadata(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_free: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_free,
             CheckoutUpdate(
                 metadata={"key": "value"},
@@ -1349,11 +1448,13 @@ class TestUpdate:
         self,
         custom_field_data: dict[str, Any],
         session: AsyncSession,
+        redis: Redis,
         checkout_custom_fields: Checkout,
     ) -> None:
         with pytest.raises(PolarRequestValidationError) as e:
             await checkout_service.update(
                 session,
+                redis,
                 checkout_custom_fields,
                 CheckoutUpdate(custom_field_data=custom_field_data),
             )
@@ -1362,10 +1463,11 @@ class TestUpdate:
             assert error["loc"][0:2] == ("body", "custom_field_data")
 
     async def test_valid_custom_field_data(
-        self, session: AsyncSession, checkout_custom_fields: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_custom_fields: Checkout
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_custom_fields,
             CheckoutUpdate(
                 custom_field_data={"text": "abc", "select": "a"},
@@ -1377,10 +1479,12 @@ class TestUpdate:
     async def test_valid_embed_origin(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_free: Checkout,
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_one_time_free,
             CheckoutUpdate(
                 embed_origin="https://example.com",
@@ -1390,10 +1494,11 @@ class TestUpdate:
         assert checkout.embed_origin == "https://example.com"
 
     async def test_valid_tax_not_applicable(
-        self, session: AsyncSession, checkout_tax_not_applicable: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_tax_not_applicable: Checkout
     ) -> None:
         checkout = await checkout_service.update(
             session,
+            redis,
             checkout_tax_not_applicable,
             CheckoutUpdate(
                 customer_billing_address=Address.model_validate({"country": "FR"}),
@@ -1411,11 +1516,13 @@ class TestConfirm:
     async def test_missing_amount_on_custom_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_custom: Checkout,
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.confirm(
                 session,
+                redis,
                 checkout_one_time_custom,
                 CheckoutConfirmStripe.model_validate(
                     {
@@ -1439,21 +1546,24 @@ class TestConfirm:
         self,
         payload: dict[str, str],
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.confirm(
                 session,
+                redis,
                 checkout_one_time_fixed,
                 CheckoutConfirmStripe.model_validate(payload),
             )
 
     async def test_not_open(
-        self, session: AsyncSession, checkout_confirmed_one_time: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_confirmed_one_time: Checkout
     ) -> None:
         with pytest.raises(NotOpenCheckout):
             await checkout_service.confirm(
                 session,
+                redis,
                 checkout_confirmed_one_time,
                 CheckoutConfirmStripe.model_validate(
                     {"confirmation_token_id": "CONFIRMATION_TOKEN_ID"}
@@ -1464,6 +1574,7 @@ class TestConfirm:
         self,
         calculate_tax_mock: AsyncMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         calculate_tax_mock.side_effect = IncompleteTaxLocation(
@@ -1473,6 +1584,7 @@ class TestConfirm:
         with pytest.raises(PolarRequestValidationError):
             await checkout_service.confirm(
                 session,
+                redis,
                 checkout_one_time_fixed,
                 CheckoutConfirmStripe.model_validate(
                     {
@@ -1500,6 +1612,7 @@ class TestConfirm:
         expected_tax_metadata: dict[str, str],
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         stripe_service_mock.create_customer.return_value = SimpleNamespace(
@@ -1510,6 +1623,7 @@ class TestConfirm:
         )
         checkout = await checkout_service.confirm(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutConfirmStripe.model_validate(
                 {
@@ -1542,6 +1656,7 @@ class TestConfirm:
         stripe_service_mock: MagicMock,
         mocker: MockerFixture,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_free: Checkout,
     ) -> None:
         enqueue_job_mock = mocker.patch("polar.checkout.service.enqueue_job")
@@ -1552,6 +1667,7 @@ class TestConfirm:
 
         checkout = await checkout_service.confirm(
             session,
+            redis,
             checkout_one_time_free,
             CheckoutConfirmStripe.model_validate(
                 {
@@ -1569,7 +1685,7 @@ class TestConfirm:
         stripe_service_mock.create_customer.assert_called_once()
         stripe_service_mock.create_payment_intent.assert_not_called()
 
-        enqueue_job_mock.assert_called_once_with(
+        enqueue_job_mock.assert_any_call(
             "checkout.handle_free_success", checkout_id=checkout.id
         )
 
@@ -1578,6 +1694,7 @@ class TestConfirm:
         save_fixture: SaveFixture,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_fixed: Checkout,
     ) -> None:
         user = await create_user(save_fixture, stripe_customer_id="STRIPE_CUSTOMER_ID")
@@ -1591,6 +1708,7 @@ class TestConfirm:
 
         checkout = await checkout_service.confirm(
             session,
+            redis,
             checkout_one_time_fixed,
             CheckoutConfirmStripe.model_validate(
                 {
@@ -1627,50 +1745,57 @@ def build_stripe_payment_intent(
 @pytest.mark.asyncio
 @pytest.mark.skip_db_asserts
 class TestHandleStripeSuccess:
-    async def test_not_existing_checkout(self, session: AsyncSession) -> None:
+    async def test_not_existing_checkout(
+        self, session: AsyncSession, redis: Redis
+    ) -> None:
         with pytest.raises(CheckoutDoesNotExist):
             await checkout_service.handle_stripe_success(
                 session,
+                redis,
                 uuid.uuid4(),
                 build_stripe_payment_intent(),
             )
 
     async def test_not_confirmed_checkout(
-        self, session: AsyncSession, checkout_one_time_fixed: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_one_time_fixed: Checkout
     ) -> None:
         with pytest.raises(NotConfirmedCheckout):
             await checkout_service.handle_stripe_success(
                 session,
+                redis,
                 checkout_one_time_fixed.id,
                 build_stripe_payment_intent(),
             )
 
     async def test_not_succeeded_payment_intent(
-        self, session: AsyncSession, checkout_confirmed_one_time: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_confirmed_one_time: Checkout
     ) -> None:
         with pytest.raises(PaymentIntentNotSucceeded):
             await checkout_service.handle_stripe_success(
                 session,
+                redis,
                 checkout_confirmed_one_time.id,
                 build_stripe_payment_intent(status="canceled"),
             )
 
     async def test_no_customer_on_payment_intent(
-        self, session: AsyncSession, checkout_confirmed_one_time: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_confirmed_one_time: Checkout
     ) -> None:
         with pytest.raises(NoCustomerOnPaymentIntent):
             await checkout_service.handle_stripe_success(
                 session,
+                redis,
                 checkout_confirmed_one_time.id,
                 build_stripe_payment_intent(customer=None),
             )
 
     async def test_no_payment_method_on_payment_intent(
-        self, session: AsyncSession, checkout_confirmed_one_time: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_confirmed_one_time: Checkout
     ) -> None:
         with pytest.raises(NoPaymentMethodOnPaymentIntent):
             await checkout_service.handle_stripe_success(
                 session,
+                redis,
                 checkout_confirmed_one_time.id,
                 build_stripe_payment_intent(payment_method=None),
             )
@@ -1679,6 +1804,7 @@ class TestHandleStripeSuccess:
         self,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_confirmed_one_time: Checkout,
     ) -> None:
         stripe_service_mock.create_out_of_band_invoice.return_value = SimpleNamespace(
@@ -1687,6 +1813,7 @@ class TestHandleStripeSuccess:
 
         checkout = await checkout_service.handle_stripe_success(
             session,
+            redis,
             checkout_confirmed_one_time.id,
             build_stripe_payment_intent(
                 amount=checkout_confirmed_one_time.total_amount or 0
@@ -1701,6 +1828,7 @@ class TestHandleStripeSuccess:
         self,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_confirmed_recurring: Checkout,
     ) -> None:
         stripe_service_mock.create_out_of_band_subscription.return_value = (
@@ -1712,6 +1840,7 @@ class TestHandleStripeSuccess:
 
         checkout = await checkout_service.handle_stripe_success(
             session,
+            redis,
             checkout_confirmed_recurring.id,
             build_stripe_payment_intent(
                 amount=checkout_confirmed_recurring.total_amount or 0
@@ -1728,6 +1857,7 @@ class TestHandleStripeSuccess:
         save_fixture: SaveFixture,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_one_time_custom: Checkout,
     ) -> None:
         checkout_one_time_custom.status = CheckoutStatus.confirmed
@@ -1742,6 +1872,7 @@ class TestHandleStripeSuccess:
         )
         checkout = await checkout_service.handle_stripe_success(
             session,
+            redis,
             checkout_one_time_custom.id,
             build_stripe_payment_intent(amount=4242),
         )
@@ -1760,6 +1891,7 @@ class TestHandleStripeSuccess:
         self,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         checkout_confirmed_recurring_upgrade: Checkout,
     ) -> None:
         stripe_service_mock.update_out_of_band_subscription.return_value = (
@@ -1772,6 +1904,7 @@ class TestHandleStripeSuccess:
 
         checkout = await checkout_service.handle_stripe_success(
             session,
+            redis,
             checkout_confirmed_recurring_upgrade.id,
             build_stripe_payment_intent(
                 amount=checkout_confirmed_recurring_upgrade.total_amount or 0
@@ -1787,19 +1920,23 @@ class TestHandleStripeSuccess:
 @pytest.mark.asyncio
 @pytest.mark.skip_db_asserts
 class TestHandleStripeFailure:
-    async def test_not_existing_checkout(self, session: AsyncSession) -> None:
+    async def test_not_existing_checkout(
+        self, session: AsyncSession, redis: Redis
+    ) -> None:
         with pytest.raises(CheckoutDoesNotExist):
             await checkout_service.handle_stripe_failure(
                 session,
+                redis,
                 uuid.uuid4(),
                 build_stripe_payment_intent(),
             )
 
     async def test_not_confirmed_checkout(
-        self, session: AsyncSession, checkout_one_time_fixed: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_one_time_fixed: Checkout
     ) -> None:
         checkout = await checkout_service.handle_stripe_failure(
             session,
+            redis,
             checkout_one_time_fixed.id,
             build_stripe_payment_intent(),
         )
@@ -1807,10 +1944,11 @@ class TestHandleStripeFailure:
         assert checkout.status == CheckoutStatus.open
 
     async def test_valid(
-        self, session: AsyncSession, checkout_confirmed_one_time: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_confirmed_one_time: Checkout
     ) -> None:
         checkout = await checkout_service.handle_stripe_failure(
             session,
+            redis,
             checkout_confirmed_one_time.id,
             build_stripe_payment_intent(),
         )
@@ -1821,21 +1959,24 @@ class TestHandleStripeFailure:
 @pytest.mark.asyncio
 @pytest.mark.skip_db_asserts
 class TestHandleFreeSuccess:
-    async def test_not_existing_checkout(self, session: AsyncSession) -> None:
+    async def test_not_existing_checkout(
+        self, session: AsyncSession, redis: Redis
+    ) -> None:
         with pytest.raises(CheckoutDoesNotExist):
-            await checkout_service.handle_free_success(session, uuid.uuid4())
+            await checkout_service.handle_free_success(session, redis, uuid.uuid4())
 
     async def test_not_confirmed_checkout(
-        self, session: AsyncSession, checkout_one_time_free: Checkout
+        self, session: AsyncSession, redis: Redis, checkout_one_time_free: Checkout
     ) -> None:
         with pytest.raises(NotConfirmedCheckout):
             await checkout_service.handle_free_success(
-                session, checkout_one_time_free.id
+                session, redis, checkout_one_time_free.id
             )
 
     async def test_no_customer_on_checkout(
         self,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         checkout_one_time_free: Checkout,
     ) -> None:
@@ -1844,12 +1985,13 @@ class TestHandleFreeSuccess:
 
         with pytest.raises(NoCustomerOnCheckout):
             await checkout_service.handle_free_success(
-                session, checkout_one_time_free.id
+                session, redis, checkout_one_time_free.id
             )
 
     async def test_not_a_free_price(
         self,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         checkout_confirmed_one_time: Checkout,
     ) -> None:
@@ -1860,13 +2002,14 @@ class TestHandleFreeSuccess:
 
         with pytest.raises(NotAFreePrice):
             await checkout_service.handle_free_success(
-                session, checkout_confirmed_one_time.id
+                session, redis, checkout_confirmed_one_time.id
             )
 
     async def test_valid_one_time(
         self,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         checkout_one_time_free: Checkout,
     ) -> None:
@@ -1877,7 +2020,7 @@ class TestHandleFreeSuccess:
         await save_fixture(checkout_one_time_free)
 
         checkout = await checkout_service.handle_free_success(
-            session, checkout_one_time_free.id
+            session, redis, checkout_one_time_free.id
         )
 
         assert checkout.status == CheckoutStatus.succeeded
@@ -1888,6 +2031,7 @@ class TestHandleFreeSuccess:
         self,
         stripe_service_mock: MagicMock,
         session: AsyncSession,
+        redis: Redis,
         save_fixture: SaveFixture,
         checkout_recurring_free: Checkout,
     ) -> None:
@@ -1903,7 +2047,7 @@ class TestHandleFreeSuccess:
         )
 
         checkout = await checkout_service.handle_free_success(
-            session, checkout_recurring_free.id
+            session, redis, checkout_recurring_free.id
         )
 
         assert checkout.status == CheckoutStatus.succeeded
@@ -1912,6 +2056,169 @@ class TestHandleFreeSuccess:
         stripe_service_mock.create_out_of_band_invoice.assert_not_called()
 
 
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestSendWebhook:
+    async def test_enqueued_payload(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        redis: Redis,
+        organization: Organization,
+        checkout_one_time_fixed: Checkout,
+    ) -> None:
+        enqueue_job_mock = mocker.patch("polar.checkout.service.enqueue_job")
+        send_payload_mock = mocker.patch(
+            "polar.checkout.service.webhook_service.send_payload",
+            new_callable=AsyncMock,
+        )
+
+        checkout = await checkout_service.update(
+            session,
+            redis,
+            checkout_one_time_fixed,
+            CheckoutUpdate(customer_name="Customer Name"),
+        )
+        send_payload_mock.assert_not_called()
+
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.args == ("checkout.send_webhook",)
+        job_kwargs = enqueue_job_mock.call_args.kwargs
+        assert job_kwargs["organization_id"] == organization.id
+        assert job_kwargs["sequence"] == 1
+
+        # Later changes don't leak into the enqueued payload
+        checkout.customer_name = "Updated Customer Name"
+
+        # Job arguments are pickled by arq
+        job_kwargs = pickle.loads(pickle.dumps(job_kwargs))
+        await checkout_service.send_webhook(session, redis, **job_kwargs)
+
+        send_payload_mock.assert_called_once()
+        target, payload = send_payload_mock.call_args.args[1:]
+        assert target.id == organization.id
+        assert payload.type == WebhookEventType.checkout_updated
+        assert payload.data.id == checkout.id
+        assert payload.data.customer_name == "Customer Name"
+
+    async def test_sequence(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        redis: Redis,
+        checkout_one_time_fixed: Checkout,
+    ) -> None:
+        enqueue_job_mock = mocker.patch("polar.checkout.service.enqueue_job")
+        send_payload_mock = mocker.patch(
+            "polar.checkout.service.webhook_service.send_payload",
+            new_callable=AsyncMock,
+        )
+
+        for customer_name in ("Customer Name", "Updated Customer Name"):
+            await checkout_service.update(
+                session,
+                redis,
+                checkout_one_time_fixed,
+                CheckoutUpdate(customer_name=customer_name),
+            )
+        first, second = (call.kwargs for call in enqueue_job_mock.call_args_list)
+        assert (first["sequence"], second["sequence"]) == (1, 2)
+
+        # The second webhook waits for the first one
+        with pytest.raises(WebhookOutOfSequence):
+            await checkout_service.send_webhook(session, redis, **second)
+        send_payload_mock.assert_not_called()
+
+        await checkout_service.send_webhook(session, redis, **first)
+        await checkout_service.mark_webhook_sent(
+            redis, first["checkout_id"], first["sequence"]
+        )
+        await checkout_service.send_webhook(session, redis, **second)
+
+        payloads = [call.args[2] for call in send_payload_mock.call_args_list]
+        assert [payload.data.customer_name for payload in payloads] == [
+            "Customer Name",
+            "Updated Customer Name",
+        ]
+
+    async def test_sequence_force(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        redis: Redis,
+        checkout_one_time_fixed: Checkout,
+    ) -> None:
+        enqueue_job_mock = mocker.patch("polar.checkout.service.enqueue_job")
+        send_payload_mock = mocker.patch(
+            "polar.checkout.service.webhook_service.send_payload",
+            new_callable=AsyncMock,
+        )
+
+        await checkout_service.update(
+            session,
+            redis,
+            checkout_one_time_fixed,
+            CheckoutUpdate(customer_name="Customer Name"),
+        )
+        job_kwargs = {**enqueue_job_mock.call_args.kwargs, "sequence": 3}
+
+        # The previous webhooks may have been lost
+        await checkout_service.send_webhook(session, redis, **job_kwargs, force=True)
+
+        send_payload_mock.assert_called_once()
+
+    async def test_mark_sent_concurrent(
+        self,
+        mocker: MockerFixture,
+        session: AsyncSession,
+        redis: Redis,
+        checkout_one_time_fixed: Checkout,
+    ) -> None:
+        enqueue_job_mock = mocker.patch("polar.checkout.service.enqueue_job")
+        mocker.patch(
+            "polar.checkout.service.webhook_service.send_payload",
+            new_callable=AsyncMock,
+        )
+
+        await checkout_service.update(
+            session,
+            redis,
+            checkout_one_time_fixed,
+            CheckoutUpdate(customer_name="Customer Name"),
+        )
+        job_kwargs = enqueue_job_mock.call_args.kwargs
+        checkout_id = job_kwargs["checkout_id"]
+
+        pipeline = redis.pipeline
+        concurrent_marks = 0
+
+        def pipeline_with_concurrent_mark(transaction: bool = True) -> Any:
+            pipe = pipeline(transaction=transaction)
+            get = pipe.get
+
+            async def get_and_mark(*args: Any, **kwargs: Any) -> Any:
+                nonlocal concurrent_marks
+                result = await get(*args, **kwargs)
+                # A job of a later webhook marks it right after our read
+                if concurrent_marks == 0:
+                    concurrent_marks += 1
+                    await checkout_service.mark_webhook_sent(redis, checkout_id, 3)
+                return result
+
+            pipe.get = get_and_mark  # type: ignore[method-assign]
+            return pipe
+
+        mocker.patch.object(
+            redis, "pipeline", side_effect=pipeline_with_concurrent_mark
+        )
+        await checkout_service.mark_webhook_sent(redis, checkout_id, 2)
+
+        # The later sequence wasn't overwritten
+        await checkout_service.send_webhook(
+            session, redis, **{**job_kwargs, "sequence": 4}
+        )
+
+
 @pytest.mark.asyncio
 @pytest.mark.skip_db_asserts
 class TestExpireOpenCheckouts:
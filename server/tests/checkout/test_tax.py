@@ -1,7 +1,19 @@
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
 import pytest
+import stripe as stripe_lib
 from pydantic_extra_types.country import CountryAlpha2
+from pytest_mock import MockerFixture
 
-from polar.checkout.tax import TaxID, TaxIDFormat, validate_tax_id
+from polar.checkout.tax import (
+    TaxID,
+    TaxIDFormat,
+    calculate_tax,
+    validate_tax_id,
+)
+from polar.kit.address import Address
+from polar.redis import Redis
 
 
 @pytest.mark.parametrize(
@@ -42,3 +54,41 @@ def test_validate_tax_id_valid(
 def test_validate_tax_id_invalid(number: str, country: CountryAlpha2) -> None:
     with pytest.raises(ValueError):
         validate_tax_id(number, country)
+
+
+@pytest.fixture
+def create_tax_calculation_mock(mocker: MockerFixture) -> AsyncMock:
+    return mocker.patch(
+        "polar.checkout.tax.stripe_service.create_tax_calculation",
+        new_callable=AsyncMock,
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestCalculateTax:
+    async def test_cached(
+        self, redis: Redis, create_tax_calculation_mock: AsyncMock
+    ) -> None:
+        create_tax_calculation_mock.return_value = SimpleNamespace(
+            tax_amount_exclusive=200
+        )
+        address = Address.model_validate({"country": "FR"})
+
+        assert await calculate_tax(redis, "eur", 1000, "PRODUCT_ID", address, []) == 200
+        assert await calculate_tax(redis, "eur", 1000, "PRODUCT_ID", address, []) == 200
+        create_tax_calculation_mock.assert_awaited_once()
+
+        assert await calculate_tax(redis, "eur", 2000, "PRODUCT_ID", address, []) == 200
+        assert create_tax_calculation_mock.await_count == 2
+
+    async def test_error_not_cached(
+        self, redis: Redis, create_tax_calculation_mock: AsyncMock
+    ) -> None:
+        create_tax_calculation_mock.side_effect = stripe_lib.APIConnectionError("ERROR")
+        address = Address.model_validate({"country": "US"})
+
+        for _ in range(2):
+            with pytest.raises(stripe_lib.APIConnectionError):
+                await calculate_tax(redis, "usd", 1000, "PRODUCT_ID", address, [])
+        assert create_tax_calculation_mock.await_count == 2
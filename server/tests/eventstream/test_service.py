@@ -0,0 +1,76 @@
+import asyncio
+import json
+from typing import Any
+
+import pytest
+from pytest_mock import MockerFixture
+
+from polar.eventstream.broker import EventStreamBroker
+from polar.eventstream.service import get_events_after, send_event
+from polar.redis import Redis
+
+
+@pytest.mark.asyncio
+async def test_get_events_after(redis: Redis) -> None:
+    await send_event(redis, json.dumps({"n": 1}), ["user:1", "org:1"])
+    await send_event(redis, json.dumps({"n": 2}), ["user:1"])
+    await send_event(redis, json.dumps({"n": 3}), ["org:1"])
+
+    events = await get_events_after(redis, ["user:1", "org:1"], "0")
+    assert [json.loads(data)["n"] for _, data in events] == [1, 2, 3]
+
+    # IDs are comparable across channels
+    events_after = await get_events_after(redis, ["user:1", "org:1"], events[1][0])
+    assert [json.loads(data)["n"] for _, data in events_after] == [3]
+    events_after = await get_events_after(redis, ["user:1"], events[1][0])
+    assert events_after == []
+
+    assert await get_events_after(redis, ["user:1"], "INVALID") == []
+
+
+@pytest.mark.asyncio
+async def test_broker(redis: Redis) -> None:
+    broker = EventStreamBroker(redis)
+    try:
+        async with broker.listen(["user:1"]) as queue_1:
+            async with broker.listen(["user:1", "org:1"]) as queue_2:
+                await send_event(redis, json.dumps({"n": 1}), ["user:1"])
+                await send_event(redis, json.dumps({"n": 2}), ["org:1"])
+
+                _, data = await asyncio.wait_for(queue_1.get(), 5)
+                assert json.loads(data) == {"n": 1}
+
+                received = [
+                    json.loads((await asyncio.wait_for(queue_2.get(), 5))[1])
+                    for _ in range(2)
+                ]
+                assert received == [{"n": 1}, {"n": 2}]
+                assert queue_1.empty()
+
+            await send_event(redis, json.dumps({"n": 3}), ["user:1"])
+            _, data = await asyncio.wait_for(queue_1.get(), 5)
+            assert json.loads(data) == {"n": 3}
+            assert queue_2.empty()
+    finally:
+        await broker.close()
+
+
+@pytest.mark.asyncio
+async def test_broker_read_error(redis: Redis, mocker: MockerFixture) -> None:
+    broker = EventStreamBroker(redis)
+    get_message = broker._pubsub.get_message
+    errors = [RuntimeError("Unexpected")]
+
+    async def _get_message(**kwargs: Any) -> Any:
+        if errors:
+            raise errors.pop()
+        return await get_message(**kwargs)
+
+    mocker.patch.object(broker._pubsub, "get_message", side_effect=_get_message)
+    try:
+        async with broker.listen(["user:1"]) as queue:
+            await send_event(redis, json.dumps({"n": 1}), ["user:1"])
+            _, data = await asyncio.wait_for(queue.get(), 5)
+            assert json.loads(data) == {"n": 1}
+    finally:
+        await broker.close()
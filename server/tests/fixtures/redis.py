@@ -3,9 +3,19 @@ from collections.abc import AsyncIterator
 import pytest_asyncio
 from fakeredis import FakeAsyncRedis
 
+from polar.personal_access_token.cache import clear_local_cache
 from polar.redis import Redis
+from polar.webhook.cache import endpoints_cache as webhook_endpoints_cache
 
 
 @pytest_asyncio.fixture(autouse=True)
 async def redis() -> AsyncIterator[Redis]:
-    yield FakeAsyncRedis()
+    # Like the API and worker Redis clients, decode responses
+    redis = FakeAsyncRedis(decode_responses=True)
+    # Fake clients share the same server: don't leak state between tests
+    await redis.flushall()
+    clear_local_cache()
+    # The webhook endpoints cache has its own client: point it to the fake server
+    webhook_endpoints_cache.redis = redis
+    yield redis
+    webhook_endpoints_cache.redis = None
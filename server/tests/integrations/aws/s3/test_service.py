@@ -0,0 +1,52 @@
+from datetime import timedelta
+
+from freezegun import freeze_time
+
+from polar.integrations.aws.s3 import S3Service
+from polar.kit.utils import utc_now
+
+
+class TestGeneratePresignedDownloadURL:
+    def test_reused_until_half_expired(self) -> None:
+        s3_service = S3Service(bucket="bucket", presign_ttl=600)
+        now = utc_now()
+
+        with freeze_time(now):
+            url, expires_at = s3_service.generate_presigned_download_url(
+                path="downloadable/file.zip",
+                filename="file.zip",
+                mime_type="application/zip",
+            )
+            assert expires_at == now + timedelta(seconds=600)
+
+        with freeze_time(now + timedelta(seconds=299)):
+            assert s3_service.generate_presigned_download_url(
+                path="downloadable/file.zip",
+                filename="file.zip",
+                mime_type="application/zip",
+            ) == (url, expires_at)
+
+        with freeze_time(now + timedelta(seconds=300)):
+            new_url, new_expires_at = s3_service.generate_presigned_download_url(
+                path="downloadable/file.zip",
+                filename="file.zip",
+                mime_type="application/zip",
+            )
+            assert new_url != url
+            assert new_expires_at == now + timedelta(seconds=900)
+
+    def test_different_filename(self) -> None:
+        s3_service = S3Service(bucket="bucket", presign_ttl=600)
+
+        url, _ = s3_service.generate_presigned_download_url(
+            path="downloadable/file.zip",
+            filename="file.zip",
+            mime_type="application/zip",
+        )
+        renamed_url, _ = s3_service.generate_presigned_download_url(
+            path="downloadable/file.zip",
+            filename="renamed.zip",
+            mime_type="application/zip",
+        )
+
+        assert renamed_url != url
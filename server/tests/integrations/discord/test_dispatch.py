@@ -0,0 +1,247 @@
+import json
+import uuid
+from typing import Any
+from unittest.mock import MagicMock
+
+import httpx
+import pytest
+import respx
+from pytest_mock import MockerFixture
+
+from polar.integrations.discord.client import BASE_URL
+from polar.integrations.discord.dispatch import MAX_ATTEMPTS, discord_dispatch
+from polar.models import BenefitGrant, Organization, User
+from polar.models.benefit import BenefitType
+from polar.models.user import OAuthPlatform
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import (
+    create_benefit,
+    create_benefit_grant,
+    create_oauth_account,
+)
+
+GUILD_ID = "GUILD_ID"
+ROLE_ID = "ROLE_ID"
+
+
+@pytest.fixture
+def enqueue_job_mock(mocker: MockerFixture) -> MagicMock:
+    return mocker.patch("polar.integrations.discord.dispatch.enqueue_job")
+
+
+async def _add_member_role(
+    redis: Redis, account_id: str, user_id: uuid.UUID, *, attempt: int = 0
+) -> None:
+    await discord_dispatch.enqueue(
+        redis,
+        GUILD_ID,
+        {
+            "action": "add",
+            "role_id": ROLE_ID,
+            "account_id": account_id,
+            "user_id": str(user_id),
+            "attempt": attempt,
+        },
+    )
+
+
+async def _remove_member_role(redis: Redis, account_id: str) -> None:
+    await discord_dispatch.enqueue(
+        redis,
+        GUILD_ID,
+        {
+            "action": "remove",
+            "role_id": ROLE_ID,
+            "account_id": account_id,
+            "user_id": None,
+            "attempt": 0,
+        },
+    )
+
+
+async def _get_operations(redis: Redis) -> dict[str, dict[str, Any]]:
+    operations = await redis.hgetall(f"discord:dispatch:{GUILD_ID}:operations")
+    return {key: json.loads(value) for key, value in operations.items()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestEnqueue:
+    async def test_add_member_role(
+        self, redis: Redis, user: User, enqueue_job_mock: MagicMock
+    ) -> None:
+        await discord_dispatch.add_member_role(GUILD_ID, ROLE_ID, "ACCOUNT_ID", user.id)
+
+        # Queued by a job, once the grant is committed
+        assert await _get_operations(redis) == {}
+        enqueue_job_mock.assert_called_once_with(
+            "discord.enqueue",
+            guild_id=GUILD_ID,
+            operation={
+                "action": "add",
+                "role_id": ROLE_ID,
+                "account_id": "ACCOUNT_ID",
+                "user_id": str(user.id),
+                "attempt": 0,
+            },
+        )
+
+    async def test_coalesce(
+        self, redis: Redis, user: User, enqueue_job_mock: MagicMock
+    ) -> None:
+        await _add_member_role(redis, "ACCOUNT_ID", user.id)
+        await _remove_member_role(redis, "ACCOUNT_ID")
+        await _add_member_role(redis, "OTHER_ACCOUNT_ID", user.id)
+
+        operations = await _get_operations(redis)
+        assert operations.keys() == {
+            f"ACCOUNT_ID:{ROLE_ID}",
+            f"OTHER_ACCOUNT_ID:{ROLE_ID}",
+        }
+        assert operations[f"ACCOUNT_ID:{ROLE_ID}"]["action"] == "remove"
+        assert await redis.zcard(f"discord:dispatch:{GUILD_ID}:queue") == 2
+
+        # Every operation gets its dispatch job, even if it's queued right after
+        # the previous dispatch of the guild ran
+        assert enqueue_job_mock.call_count == 3
+        for call in enqueue_job_mock.call_args_list:
+            assert call.args == ("discord.dispatch",)
+            assert "_job_id" not in call.kwargs
+
+
+@pytest.mark.asyncio
+class TestDispatch:
+    async def test_valid(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        redis: Redis,
+        user: User,
+        respx_mock: respx.MockRouter,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        oauth_account = await create_oauth_account(
+            save_fixture, user, OAuthPlatform.discord
+        )
+        rate_limit_headers = {
+            "x-ratelimit-bucket": "BUCKET",
+            "x-ratelimit-remaining": "5",
+            "x-ratelimit-reset-after": "1",
+        }
+        add_route = respx_mock.put(
+            f"{BASE_URL}/guilds/{GUILD_ID}/members/{oauth_account.account_id}"
+        ).mock(return_value=httpx.Response(201, headers=rate_limit_headers))
+        remove_route = respx_mock.delete(
+            f"{BASE_URL}/guilds/{GUILD_ID}/members/OTHER_ACCOUNT_ID/roles/{ROLE_ID}"
+        ).mock(return_value=httpx.Response(204, headers=rate_limit_headers))
+
+        await _add_member_role(redis, oauth_account.account_id, user.id)
+        await _remove_member_role(redis, "OTHER_ACCOUNT_ID")
+        enqueue_job_mock.reset_mock()
+
+        # then
+        session.expunge_all()
+
+        await discord_dispatch.dispatch(session, redis, GUILD_ID)
+
+        assert add_route.call_count == 1
+        assert json.loads(add_route.calls[0].request.content)["roles"] == [ROLE_ID]
+        assert remove_route.call_count == 1
+        assert await _get_operations(redis) == {}
+        assert await redis.zcard(f"discord:dispatch:{GUILD_ID}:queue") == 0
+        enqueue_job_mock.assert_not_called()
+
+    async def test_http_error(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        respx_mock: respx.MockRouter,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        remove_route = respx_mock.delete(
+            f"{BASE_URL}/guilds/{GUILD_ID}/members/ACCOUNT_ID/roles/{ROLE_ID}"
+        ).mock(return_value=httpx.Response(500))
+
+        await _remove_member_role(redis, "ACCOUNT_ID")
+        enqueue_job_mock.reset_mock()
+
+        # then
+        session.expunge_all()
+
+        await discord_dispatch.dispatch(session, redis, GUILD_ID)
+
+        assert remove_route.call_count == 1
+        operations = await _get_operations(redis)
+        assert operations[f"ACCOUNT_ID:{ROLE_ID}"]["attempt"] == 1
+
+        # The retry is scheduled
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.kwargs["_defer_by"] > 0
+
+    async def test_permanent_failure(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        redis: Redis,
+        user: User,
+        organization: Organization,
+        respx_mock: respx.MockRouter,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        oauth_account = await create_oauth_account(
+            save_fixture, user, OAuthPlatform.discord
+        )
+        benefit = await create_benefit(
+            save_fixture,
+            organization=organization,
+            type=BenefitType.discord,
+            properties={"guild_id": GUILD_ID, "role_id": ROLE_ID},
+        )
+        grant = await create_benefit_grant(
+            save_fixture,
+            user,
+            benefit,
+            granted=True,
+            properties={
+                "guild_id": GUILD_ID,
+                "role_id": ROLE_ID,
+                "account_id": oauth_account.account_id,
+            },
+        )
+        respx_mock.put(
+            f"{BASE_URL}/guilds/{GUILD_ID}/members/{oauth_account.account_id}"
+        ).mock(return_value=httpx.Response(500))
+
+        await _add_member_role(
+            redis, oauth_account.account_id, user.id, attempt=MAX_ATTEMPTS - 1
+        )
+
+        # then
+        session.expunge_all()
+
+        await discord_dispatch.dispatch(session, redis, GUILD_ID)
+
+        assert await _get_operations(redis) == {}
+        updated_grant = await session.get(BenefitGrant, grant.id)
+        assert updated_grant is not None
+        assert not updated_grant.is_granted
+        assert not updated_grant.is_revoked
+
+    async def test_locked(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        respx_mock: respx.MockRouter,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        await _remove_member_role(redis, "ACCOUNT_ID")
+        await redis.set(f"discord:dispatch:{GUILD_ID}:lock", "OTHER_DISPATCH")
+
+        # then
+        session.expunge_all()
+
+        await discord_dispatch.dispatch(session, redis, GUILD_ID)
+
+        assert len(await _get_operations(redis)) == 1
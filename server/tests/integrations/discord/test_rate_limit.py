@@ -0,0 +1,79 @@
+import time
+
+import httpx
+import pytest
+
+from polar.integrations.discord.rate_limit import GLOBAL_KEY, DiscordRateLimiter
+from polar.redis import Redis
+
+ROUTE = "PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}"
+
+
+def _response(status_code: int, headers: dict[str, str]) -> httpx.Response:
+    return httpx.Response(status_code, headers=headers)
+
+
+@pytest.mark.asyncio
+class TestDiscordRateLimiter:
+    async def test_unknown_bucket(self, redis: Redis) -> None:
+        rate_limiter = DiscordRateLimiter(redis)
+
+        start = time.monotonic()
+        await rate_limiter.wait(ROUTE, "GUILD_ID")
+        assert time.monotonic() - start < 0.1
+
+    async def test_bucket_exhausted(self, redis: Redis) -> None:
+        rate_limiter = DiscordRateLimiter(redis)
+        await rate_limiter.update(
+            ROUTE,
+            "GUILD_ID",
+            _response(
+                204,
+                {
+                    "x-ratelimit-bucket": "BUCKET",
+                    "x-ratelimit-remaining": "1",
+                    "x-ratelimit-reset-after": "0.3",
+                },
+            ),
+        )
+
+        start = time.monotonic()
+        await rate_limiter.wait(ROUTE, "GUILD_ID")
+        assert time.monotonic() - start < 0.1
+
+        # Other guilds have their own bucket
+        await rate_limiter.wait(ROUTE, "OTHER_GUILD_ID")
+        assert time.monotonic() - start < 0.1
+
+        await rate_limiter.wait(ROUTE, "GUILD_ID")
+        assert time.monotonic() - start >= 0.2
+
+    async def test_bucket_expiry(self, redis: Redis) -> None:
+        rate_limiter = DiscordRateLimiter(redis)
+        # A bucket recreated without expiry, e.g. after expiring during a wait
+        bucket_key = f"discord:rate_limit:bucket:{ROUTE}:GUILD_ID"
+        await redis.hset(bucket_key, "reset_at", time.time() + 10)
+
+        await rate_limiter.wait(ROUTE, "GUILD_ID")
+
+        assert 0 < await redis.pttl(bucket_key) <= 11_000
+
+    async def test_global_rate_limit(self, redis: Redis) -> None:
+        rate_limiter = DiscordRateLimiter(redis)
+        await rate_limiter.update(
+            ROUTE,
+            "GUILD_ID",
+            _response(
+                429,
+                {
+                    "retry-after": "0.3",
+                    "x-ratelimit-global": "true",
+                    "x-ratelimit-scope": "global",
+                },
+            ),
+        )
+        assert await redis.pttl(GLOBAL_KEY) > 0
+
+        start = time.monotonic()
+        await rate_limiter.wait("GET /guilds/{guild_id}", "OTHER_GUILD_ID")
+        assert time.monotonic() - start >= 0.2
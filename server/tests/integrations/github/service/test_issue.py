@@ -1,8 +1,19 @@
+from datetime import timedelta
+from unittest.mock import MagicMock
+
 import pytest
+from githubkit import Paginator
+from pytest_mock import MockerFixture
 
 from polar.integrations.github.client import get_client
+from polar.integrations.github.crawl_budget import CrawlBudgetExhausted
 from polar.integrations.github.service.issue import github_issue
+from polar.kit.utils import utc_now
+from polar.models import ExternalOrganization, Repository
 from polar.postgres import AsyncSession
+from polar.redis import Redis
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import create_issue, create_repository
 
 
 @pytest.mark.asyncio
@@ -35,3 +46,76 @@ async def test_sync_external_org_with_repo_and_issue(
     )
 
     assert issue is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+async def test_list_issues_to_crawl_issue(
+    mocker: MockerFixture,
+    save_fixture: SaveFixture,
+    session: AsyncSession,
+    external_organization: ExternalOrganization,
+) -> None:
+    mocker.patch("polar.integrations.github.service.issue.CRAWL_LIMIT", 2)
+    mocker.patch("polar.integrations.github.service.issue.CRAWL_STALEST_LIMIT", 1)
+    now = utc_now()
+
+    active_repository = await create_repository(save_fixture, external_organization)
+    active_repository.repository_pushed_at = now
+    await save_fixture(active_repository)
+    active_issues = [
+        await create_issue(save_fixture, external_organization, active_repository)
+        for _ in range(2)
+    ]
+    for active_issue in active_issues:
+        active_issue.github_issue_fetched_at = now - timedelta(days=1)
+        await save_fixture(active_issue)
+
+    inactive_repository = await create_repository(save_fixture, external_organization)
+    inactive_repository.repository_pushed_at = now - timedelta(days=365)
+    await save_fixture(inactive_repository)
+    inactive_issue = await create_issue(
+        save_fixture, external_organization, inactive_repository
+    )
+    inactive_issue.github_issue_fetched_at = now - timedelta(days=2)
+    await save_fixture(inactive_issue)
+
+    issues = await github_issue.list_issues_to_crawl_issue(
+        session, external_organization
+    )
+
+    # The stalest issue isn't starved by the active repository
+    assert [issue.id for issue in issues][0] == inactive_issue.id
+    assert len(issues) == 2
+    assert issues[1].id in {issue.id for issue in active_issues}
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+async def test_sync_issues_crawl_budget(
+    mocker: MockerFixture,
+    session: AsyncSession,
+    redis: Redis,
+    external_organization: ExternalOrganization,
+    repository: Repository,
+) -> None:
+    client = MagicMock()
+    client.paginate.side_effect = lambda request, **kwargs: Paginator(request, **kwargs)
+    mocker.patch(
+        "polar.integrations.github.service.issue.github.get_app_installation_client",
+        return_value=client,
+    )
+    mocker.patch(
+        "polar.integrations.github.service.issue.crawl_budget.acquire",
+        side_effect=CrawlBudgetExhausted(1, 60),
+    )
+
+    with pytest.raises(CrawlBudgetExhausted):
+        await github_issue.sync_issues(
+            session,
+            redis,
+            organization=external_organization,
+            repository=repository,
+        )
+
+    client.rest.issues.async_list_for_repo.assert_not_called()
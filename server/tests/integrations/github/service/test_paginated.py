@@ -0,0 +1,127 @@
+import asyncio
+from types import SimpleNamespace
+from typing import Any, cast
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from githubkit import Paginator
+
+from polar.integrations.github.service.paginated import (
+    github_paginated_service,
+    iter_batches,
+)
+from polar.redis import Redis
+from polar.repository.hooks import SyncedHook
+
+
+class FakeRequest:
+    def __init__(self, items: list[int], *, fail_on_page: int | None = None) -> None:
+        self.items = items
+        self.fail_on_page = fail_on_page
+        self.fetched_pages: list[int] = []
+
+    async def __call__(self, *, page: int, per_page: int) -> SimpleNamespace:
+        if page == self.fail_on_page:
+            raise ValueError("GitHub is down")
+        self.fetched_pages.append(page)
+        await asyncio.sleep(0)
+        start = (page - 1) * per_page
+        return SimpleNamespace(parsed_data=self.items[start : start + per_page])
+
+
+class FakeItem(SimpleNamespace):
+    def model_dump(self, mode: str) -> dict[str, Any]:
+        return vars(self)
+
+
+def get_paginator(request: FakeRequest, per_page: int) -> Paginator[Any]:
+    return Paginator(request, per_page=per_page)  # type: ignore[call-overload]
+
+
+@pytest.mark.asyncio
+class TestIterBatches:
+    async def test_batches(self) -> None:
+        request = FakeRequest(list(range(25)))
+
+        batches = [
+            batch async for batch in iter_batches(get_paginator(request, 10), 10)
+        ]
+
+        assert batches == [list(range(10)), list(range(10, 20)), list(range(20, 25))]
+
+    async def test_prefetch(self) -> None:
+        request = FakeRequest(list(range(30)))
+
+        async for batch in iter_batches(get_paginator(request, 10), 10):
+            if batch[0] == 0:
+                # Let the producer run while the first batch is processed
+                for _ in range(5):
+                    await asyncio.sleep(0)
+                assert 2 in request.fetched_pages
+                break
+
+    async def test_error(self) -> None:
+        request = FakeRequest(list(range(30)), fail_on_page=2)
+
+        batches: list[list[int]] = []
+        with pytest.raises(ValueError):
+            async for batch in iter_batches(get_paginator(request, 10), 10):
+                batches.append(batch)
+
+        assert batches == [list(range(10))]
+
+    async def test_close(self) -> None:
+        request = FakeRequest(list(range(30)))
+
+        batches = iter_batches(get_paginator(request, 10), 10)
+        assert await anext(batches) == list(range(10))
+        await batches.aclose()
+
+        # The producer is cancelled and awaited, not left pending
+        assert not [
+            task
+            for task in asyncio.all_tasks()
+            if not task.done() and task.get_coro().__name__ == "_produce"  # type: ignore[union-attr]
+        ]
+
+
+@pytest.mark.asyncio
+async def test_store_paginated_resource(redis: Redis) -> None:
+    request = FakeRequest([FakeItem(id=i) for i in range(25)])  # type: ignore[misc]
+
+    async def store_many(*args: Any, data: list[SimpleNamespace], **kwargs: Any) -> Any:
+        # Item 3 fails to be stored
+        return [SimpleNamespace(external_id=d.id) for d in data if d.id != 3]
+
+    store_many_mock = AsyncMock(side_effect=store_many)
+    on_sync_signal = MagicMock()
+    on_sync_signal.call = AsyncMock()
+    organization = SimpleNamespace(id="ORGANIZATION_ID")
+    repository = SimpleNamespace(id="REPOSITORY_ID")
+
+    synced, errors = await github_paginated_service.store_paginated_resource(
+        cast(Any, None),
+        redis,
+        paginator=get_paginator(request, 10),
+        store_resources_method=store_many_mock,
+        organization=cast(Any, organization),
+        repository=cast(Any, repository),
+        resource_type="issue",
+        skip_condition=lambda d: d.id % 5 == 0,
+        on_sync_signal=on_sync_signal,
+        batch_size=10,
+    )
+
+    assert synced == 25
+    assert errors == 1
+    assert store_many_mock.call_count == 3
+    assert [len(call.kwargs["data"]) for call in store_many_mock.call_args_list] == [
+        8,
+        8,
+        4,
+    ]
+
+    assert on_sync_signal.call.call_count == 3
+    hook: SyncedHook = on_sync_signal.call.call_args_list[0].args[0]
+    assert len(hook.records) == 7
+    assert hook.synced == 10
@@ -0,0 +1,65 @@
+import pytest
+from freezegun import freeze_time
+
+from polar.integrations.github import crawl_budget
+from polar.integrations.github.crawl_budget import (
+    CRAWL_BUDGET_PER_HOUR,
+    CrawlBudgetExhausted,
+)
+from polar.kit.utils import utc_now
+from polar.redis import Redis
+
+INSTALLATION_ID = 123
+
+
+@pytest.mark.asyncio
+@freeze_time("2024-11-12 12:00:00")
+class TestAcquire:
+    async def test_exhausted(self, redis: Redis) -> None:
+        for _ in range(CRAWL_BUDGET_PER_HOUR):
+            await crawl_budget.acquire(redis, INSTALLATION_ID)
+
+        with pytest.raises(CrawlBudgetExhausted) as e:
+            await crawl_budget.acquire(redis, INSTALLATION_ID)
+        assert 0 < e.value.retry_after <= 3600 / CRAWL_BUDGET_PER_HOUR
+
+        # Other installations have their own budget
+        await crawl_budget.acquire(redis, INSTALLATION_ID + 1)
+
+    async def test_refund(self, redis: Redis) -> None:
+        for _ in range(CRAWL_BUDGET_PER_HOUR):
+            await crawl_budget.acquire(redis, INSTALLATION_ID)
+
+        await crawl_budget.refund(redis, INSTALLATION_ID)
+
+        await crawl_budget.acquire(redis, INSTALLATION_ID)
+
+    async def test_paused(self, redis: Redis) -> None:
+        await crawl_budget.record_rate_limit(
+            redis,
+            INSTALLATION_ID,
+            {
+                "x-ratelimit-remaining": "999",
+                "x-ratelimit-reset": str(int(utc_now().timestamp()) + 600),
+            },
+        )
+
+        with pytest.raises(CrawlBudgetExhausted) as e:
+            await crawl_budget.acquire(redis, INSTALLATION_ID)
+        assert 500 < e.value.retry_after <= 600
+
+
+@pytest.mark.asyncio
+class TestRecordRateLimit:
+    @pytest.mark.parametrize(
+        "headers",
+        [
+            {},
+            {"x-ratelimit-remaining": "1000", "x-ratelimit-reset": "9999999999"},
+            {"x-ratelimit-remaining": "0", "x-ratelimit-reset": "1"},
+        ],
+    )
+    async def test_not_paused(self, headers: dict[str, str], redis: Redis) -> None:
+        await crawl_budget.record_rate_limit(redis, INSTALLATION_ID, headers)
+
+        assert await crawl_budget.get_paused_for(redis, INSTALLATION_ID) == 0
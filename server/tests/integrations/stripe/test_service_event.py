@@ -0,0 +1,232 @@
+import time
+import uuid
+from datetime import timedelta
+from typing import Any, cast
+
+import pytest
+import stripe as stripe_lib
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from polar.integrations.stripe.service_event import RETENTION_PERIOD
+from polar.integrations.stripe.service_event import stripe_event as stripe_event_service
+from polar.kit.utils import utc_now
+from polar.models import StripeEvent
+from polar.postgres import AsyncSession
+
+
+def build_event(
+    id: str, type: str, object: dict[str, Any], created: int | None = None
+) -> stripe_lib.Event:
+    return stripe_lib.Event.construct_from(
+        {
+            "id": id,
+            "object": "event",
+            "type": type,
+            "created": created or int(time.time()),
+            "data": {"object": object},
+        },
+        None,
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestCreate:
+    async def test_duplicate(self, session: AsyncSession) -> None:
+        event = build_event(
+            "evt_1", "charge.succeeded", {"id": "ch_1", "object": "charge"}
+        )
+
+        stripe_event = await stripe_event_service.create(session, event)
+        assert stripe_event is not None
+        assert stripe_event.stripe_id == "evt_1"
+        assert stripe_event.object_id == "ch_1"
+
+        assert await stripe_event_service.create(session, event) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestGetOrCreateId:
+    async def test_existing(self, session: AsyncSession) -> None:
+        event = build_event(
+            "evt_1", "charge.succeeded", {"id": "ch_1", "object": "charge"}
+        )
+
+        id = await stripe_event_service.get_or_create_id(session, event)
+        assert await stripe_event_service.get_or_create_id(session, event) == id
+
+
+def _get_engine(session: AsyncSession) -> AsyncEngine:
+    return cast(AsyncConnection, session.bind).engine
+
+
+async def _lock_for_processing(
+    session: AsyncSession, id: uuid.UUID
+) -> stripe_lib.Event | None:
+    async with stripe_event_service.lock_for_processing(
+        session, _get_engine(session), id
+    ) as event:
+        return event
+
+
+async def _try_lock(session: AsyncSession, object_id: str) -> bool:
+    async with _get_engine(session).connect() as connection:
+        lock_key = func.hashtext(f"stripe_event:{object_id}")
+        result = await connection.execute(select(func.pg_try_advisory_lock(lock_key)))
+        locked = result.scalar_one()
+        if locked:
+            await connection.execute(select(func.pg_advisory_unlock(lock_key)))
+        return locked
+
+
+@pytest.mark.asyncio
+class TestLockForProcessing:
+    async def test_not_existing(self, session: AsyncSession) -> None:
+        stripe_event = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_1", "charge.succeeded", {"id": "ch_1", "object": "charge"}
+            ),
+        )
+        assert stripe_event is not None
+        await session.delete(stripe_event)
+        await session.flush()
+
+        session.expunge_all()
+
+        assert await _lock_for_processing(session, stripe_event.id) is None
+
+    async def test_processed_once(self, session: AsyncSession) -> None:
+        stripe_event = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_1",
+                "charge.succeeded",
+                {"id": "ch_1", "object": "charge", "amount": 1000},
+            ),
+        )
+        assert stripe_event is not None
+
+        session.expunge_all()
+
+        event = await _lock_for_processing(session, stripe_event.id)
+        assert event is not None
+        assert event.id == "evt_1"
+        assert event["data"]["object"]["amount"] == 1000
+
+        await stripe_event_service.mark_processed(session, stripe_event.id)
+
+        assert await _lock_for_processing(session, stripe_event.id) is None
+
+    async def test_lock_held_across_commits(self, session: AsyncSession) -> None:
+        stripe_event = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_1", "charge.succeeded", {"id": "ch_1", "object": "charge"}
+            ),
+        )
+        assert stripe_event is not None
+
+        session.expunge_all()
+
+        async with stripe_event_service.lock_for_processing(
+            session, _get_engine(session), stripe_event.id
+        ) as event:
+            assert event is not None
+            # Handlers may commit along the way
+            await session.commit()
+            assert not await _try_lock(session, "ch_1")
+            await stripe_event_service.mark_processed(session, stripe_event.id)
+
+        assert await _try_lock(session, "ch_1")
+        assert await _lock_for_processing(session, stripe_event.id) is None
+
+    async def test_stale_snapshot(self, session: AsyncSession) -> None:
+        created = int(time.time())
+        older = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_1",
+                "customer.subscription.updated",
+                {"id": "sub_1", "object": "subscription", "status": "incomplete"},
+                created,
+            ),
+        )
+        newer = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_2",
+                "customer.subscription.updated",
+                {"id": "sub_1", "object": "subscription", "status": "active"},
+                created + 1,
+            ),
+        )
+        assert older is not None
+        assert newer is not None
+
+        session.expunge_all()
+
+        assert await _lock_for_processing(session, newer.id) is not None
+        await stripe_event_service.mark_processed(session, newer.id)
+
+        assert await _lock_for_processing(session, older.id) is None
+        stripe_event = await session.get(StripeEvent, older.id)
+        assert stripe_event is not None
+        assert stripe_event.processed_at is not None
+
+    async def test_older_non_snapshot(self, session: AsyncSession) -> None:
+        created = int(time.time())
+        older = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_1",
+                "customer.subscription.created",
+                {"id": "sub_1", "object": "subscription"},
+                created,
+            ),
+        )
+        newer = await stripe_event_service.create(
+            session,
+            build_event(
+                "evt_2",
+                "customer.subscription.updated",
+                {"id": "sub_1", "object": "subscription"},
+                created + 1,
+            ),
+        )
+        assert older is not None
+        assert newer is not None
+        await stripe_event_service.mark_processed(session, newer.id)
+
+        session.expunge_all()
+
+        assert await _lock_for_processing(session, older.id) is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestDeleteProcessed:
+    async def test_retention(self, session: AsyncSession) -> None:
+        stripe_events: list[StripeEvent] = []
+        for id in ("evt_1", "evt_2", "evt_3"):
+            stripe_event = await stripe_event_service.create(
+                session,
+                build_event(id, "charge.succeeded", {"id": "ch_1", "object": "charge"}),
+            )
+            assert stripe_event is not None
+            stripe_events.append(stripe_event)
+        expired, recent, unprocessed = stripe_events
+        expired.processed_at = utc_now() - RETENTION_PERIOD - timedelta(days=1)
+        recent.processed_at = utc_now()
+        session.add_all([expired, recent, unprocessed])
+        await session.flush()
+
+        deleted = await stripe_event_service.delete_processed(session)
+
+        assert deleted == 1
+        session.expunge_all()
+        assert await session.get(StripeEvent, expired.id) is None
+        assert await session.get(StripeEvent, recent.id) is not None
+        assert await session.get(StripeEvent, unprocessed.id) is not None
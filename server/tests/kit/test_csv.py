@@ -1,6 +1,13 @@
+import contextlib
+import gzip
+from collections.abc import AsyncIterator
+from typing import cast
+
 import pytest
+from sqlalchemy import func, select
 
-from polar.kit.csv import get_emails_from_csv
+from polar.kit.csv import get_emails_from_csv, stream_csv
+from polar.kit.db.postgres import AsyncSession, AsyncSessionMaker
 
 
 @pytest.mark.asyncio
@@ -47,3 +54,40 @@ async def test_get_emails_from_csv() -> None:
             "baz,bazexample.com",
         ]
     ) == {"foo@example.com", "bar@example.com"}
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+@pytest.mark.parametrize("compress", [False, True])
+async def test_stream_csv(session: AsyncSession, compress: bool) -> None:
+    @contextlib.asynccontextmanager
+    async def sessionmaker() -> AsyncIterator[AsyncSession]:
+        yield session
+
+    statement = select(func.generate_series(1, 5).label("value"))
+    chunks = [
+        chunk
+        async for chunk in stream_csv(
+            cast(AsyncSessionMaker, sessionmaker),
+            statement,
+            ("Value", "Double"),
+            lambda row: (row.value, row.value * 2),
+            batch_size=2,
+            compress=compress,
+        )
+    ]
+
+    content = b"".join(chunks)
+    if compress:
+        content = gzip.decompress(content)
+    else:
+        # Header, then one chunk per batch
+        assert len(chunks) == 4
+    assert content.decode("utf-8").splitlines() == [
+        "Value,Double",
+        "1,2",
+        "2,4",
+        "3,6",
+        "4,8",
+        "5,10",
+    ]
@@ -0,0 +1,49 @@
+from collections.abc import Sequence
+
+import pytest
+
+from polar.kit.loader import Loader
+
+
+class BatchLoad:
+    def __init__(self, values: dict[int, str]) -> None:
+        self.values = values
+        self.calls: list[list[int]] = []
+
+    async def __call__(self, keys: Sequence[int]) -> dict[int, str]:
+        self.calls.append(list(keys))
+        return {key: self.values[key] for key in keys if key in self.values}
+
+
+@pytest.mark.asyncio
+class TestLoader:
+    async def test_primed(self) -> None:
+        batch_load = BatchLoad({1: "a", 2: "b"})
+        loader = Loader(batch_load)
+
+        loader.prime([1, 2, 3])
+        assert await loader.load(1) == "a"
+        assert await loader.load(2) == "b"
+        assert await loader.load(3) is None
+
+        assert batch_load.calls == [[1, 2, 3]]
+
+    async def test_memoized(self) -> None:
+        batch_load = BatchLoad({1: "a", 2: "b"})
+        loader = Loader(batch_load)
+
+        assert await loader.load(1) == "a"
+        assert await loader.load(1) == "a"
+        loader.prime([1, 2])
+        assert await loader.load(2) == "b"
+
+        assert batch_load.calls == [[1], [2]]
+
+    async def test_load_many(self) -> None:
+        batch_load = BatchLoad({1: "a", 2: "b"})
+        loader = Loader(batch_load)
+
+        assert await loader.load(1) == "a"
+        assert await loader.load_many([2, 1, 3]) == ["b", "a", None]
+
+        assert batch_load.calls == [[1], [2, 3]]
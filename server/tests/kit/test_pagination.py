@@ -0,0 +1,56 @@
+import uuid
+
+import pytest
+from sqlalchemy import desc, select
+
+from polar.exceptions import PolarRequestValidationError
+from polar.kit.pagination import (
+    _decode_cursor,
+    _encode_cursor,
+    _get_keyset_fingerprint,
+    _get_keyset_keys,
+)
+from polar.kit.search import search_rank
+from polar.kit.utils import utc_now
+from polar.models import Product
+
+
+def test_fingerprint_bound_parameters() -> None:
+    keys_pro = _get_keyset_keys(
+        select(Product).order_by(desc(search_rank("pro", Product.name)))
+    )
+    keys_basic = _get_keyset_keys(
+        select(Product).order_by(desc(search_rank("basic", Product.name)))
+    )
+    assert keys_pro is not None
+    assert keys_basic is not None
+
+    assert _get_keyset_fingerprint(keys_pro) != _get_keyset_fingerprint(keys_basic)
+    assert _get_keyset_fingerprint(keys_pro) == _get_keyset_fingerprint(
+        _get_keyset_keys(
+            select(Product).order_by(desc(search_rank("pro", Product.name)))
+        )
+        or []
+    )
+
+
+class TestDecodeCursor:
+    def test_valid(self) -> None:
+        keys = _get_keyset_keys(select(Product).order_by(Product.created_at))
+        assert keys is not None
+        fingerprint = _get_keyset_fingerprint(keys)
+        values = [utc_now(), uuid.uuid4()]
+
+        cursor = _encode_cursor(fingerprint, values, 10)
+
+        assert _decode_cursor(cursor, fingerprint, keys) == (values, 10)
+
+    def test_value_type_mismatch(self) -> None:
+        keys = _get_keyset_keys(select(Product).order_by(Product.created_at))
+        assert keys is not None
+        fingerprint = _get_keyset_fingerprint(keys)
+
+        cursor = _encode_cursor(fingerprint, ["2024-01-01", uuid.uuid4()], 10)
+
+        with pytest.raises(PolarRequestValidationError):
+            _decode_cursor(cursor, fingerprint, keys)
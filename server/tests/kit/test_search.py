@@ -0,0 +1,76 @@
+import pytest
+from sqlalchemy import select, text
+
+from polar.kit.search import search_filter, search_order_by
+from polar.models import Organization, Product
+from polar.postgres import AsyncSession
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import create_product
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestSearch:
+    async def test_filter_and_rank(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        organization: Organization,
+    ) -> None:
+        for name in ("Pro Plan", "Basic", "Enterprise Pro", "100% Pro"):
+            await create_product(save_fixture, organization=organization, name=name)
+
+        statement = (
+            select(Product.name)
+            .where(
+                Product.organization_id == organization.id,
+                search_filter("pro", Product.name),
+            )
+            .order_by(*search_order_by("pro", Product.name), Product.name)
+        )
+        result = await session.execute(statement)
+        names = list(result.scalars().all())
+
+        assert set(names) == {"Pro Plan", "Enterprise Pro", "100% Pro"}
+        # Prefix matches first
+        assert names[0] == "Pro Plan"
+
+    async def test_order_by_without_query(self) -> None:
+        # The requested sorting applies as is
+        assert search_order_by(None, Product.name) == []
+
+    async def test_filter_wildcards(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        organization: Organization,
+    ) -> None:
+        for name in ("100% Pro", "1000 Pro"):
+            await create_product(save_fixture, organization=organization, name=name)
+
+        statement = select(Product.name).where(
+            Product.organization_id == organization.id,
+            search_filter("0%", Product.name),
+        )
+        result = await session.execute(statement)
+
+        assert result.scalars().all() == ["100% Pro"]
+
+    async def test_uses_trigram_index(self, session: AsyncSession) -> None:
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+
+        statement = select(Product.id).where(search_filter("pro", Product.name))
+        result = await session.execute(
+            text(
+                "EXPLAIN "
+                + str(
+                    statement.compile(
+                        dialect=session.bind.dialect,
+                        compile_kwargs={"literal_binds": True},
+                    )
+                )
+            )
+        )
+        plan = "\n".join(result.scalars().all())
+
+        assert "ix_products_name_trgm" in plan
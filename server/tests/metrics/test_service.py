@@ -120,6 +120,7 @@ ORDERS: dict[str, OrderFixture] = {
 
 
 async def _create_fixtures(
+    session: AsyncSession,
     save_fixture: SaveFixture,
     user: User,
     organization: Organization,
@@ -166,15 +167,20 @@ async def _create_fixtures(
         )
         orders[key] = order
 
+    await metrics_service.refresh_rollups(session, organization.id)
+
     return products, subscriptions, orders
 
 
 @pytest_asyncio.fixture
 async def fixtures(
-    save_fixture: SaveFixture, user: User, organization: Organization
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    user: User,
+    organization: Organization,
 ) -> tuple[dict[str, Product], dict[str, Subscription], dict[str, Order]]:
     return await _create_fixtures(
-        save_fixture, user, organization, PRODUCTS, SUBSCRIPTIONS, ORDERS
+        session, save_fixture, user, organization, PRODUCTS, SUBSCRIPTIONS, ORDERS
     )
 
 
@@ -504,7 +510,7 @@ class TestGetMetrics:
             },
         }
         await _create_fixtures(
-            save_fixture, user, organization, PRODUCTS, subscriptions, {}
+            session, save_fixture, user, organization, PRODUCTS, subscriptions, {}
         )
 
         metrics = await metrics_service.get_metrics(
@@ -597,7 +603,7 @@ class TestGetMetrics:
             }
         }
         await _create_fixtures(
-            save_fixture, user, organization, PRODUCTS, subscriptions, {}
+            session, save_fixture, user, organization, PRODUCTS, subscriptions, {}
         )
 
         metrics = await metrics_service.get_metrics(
@@ -635,3 +641,194 @@ class TestGetMetrics:
         assert feb.renewed_subscriptions_revenue == 0
         assert feb.active_subscriptions == 0
         assert feb.monthly_recurring_revenue == 0
+
+    @pytest.mark.auth
+    async def test_values_start_after_subscriptions(
+        self,
+        session: AsyncSession,
+        auth_subject: AuthSubject[User],
+        user_organization: UserOrganization,
+        fixtures: tuple[dict[str, Subscription], dict[str, Order]],
+    ) -> None:
+        metrics = await metrics_service.get_metrics(
+            session,
+            auth_subject,
+            start_date=date(2024, 7, 1),
+            end_date=date(2024, 7, 31),
+            interval=Interval.day,
+        )
+
+        assert len(metrics.periods) == 31
+        for period in metrics.periods:
+            assert period.orders == 0
+            assert period.new_subscriptions == 0
+            assert period.active_subscriptions == 3
+            assert period.monthly_recurring_revenue == 283_33
+
+    @pytest.mark.auth
+    async def test_values_renewed_subscriptions_year_interval(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        auth_subject: AuthSubject[User],
+        user_organization: UserOrganization,
+        user: User,
+        organization: Organization,
+    ) -> None:
+        subscriptions: dict[str, SubscriptionFixture] = {
+            "subscription_1": {
+                "started_at": date(2023, 12, 1),
+                "product": "monthly_subscription",
+            },
+        }
+        orders: dict[str, OrderFixture] = {
+            f"order_{month}": {
+                "created_at": date(2024, month, 1),
+                "amount": 100_00,
+                "product": "monthly_subscription",
+                "subscription": "subscription_1",
+            }
+            for month in range(1, 13)
+        }
+        await _create_fixtures(
+            session, save_fixture, user, organization, PRODUCTS, subscriptions, orders
+        )
+
+        metrics = await metrics_service.get_metrics(
+            session,
+            auth_subject,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 12, 31),
+            interval=Interval.year,
+        )
+
+        assert len(metrics.periods) == 1
+
+        period = metrics.periods[0]
+        assert period.orders == 12
+        assert period.revenue == 1200_00
+        assert period.new_subscriptions == 0
+        assert period.new_subscriptions_revenue == 0
+        assert period.renewed_subscriptions == 1
+        assert period.renewed_subscriptions_revenue == 1200_00
+        assert period.active_subscriptions == 1
+        assert period.monthly_recurring_revenue == 100_00
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestRefreshRollups:
+    @pytest.mark.auth
+    async def test_hours(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        auth_subject: AuthSubject[User],
+        user_organization: UserOrganization,
+        user: User,
+        fixtures: tuple[dict[str, Product], dict[str, Subscription], dict[str, Order]],
+    ) -> None:
+        products, subscriptions, _ = fixtures
+        order = await create_order(
+            save_fixture,
+            product=products["monthly_subscription"],
+            user=user,
+            amount=100_00,
+            created_at=datetime(2024, 3, 1, 12, 30, tzinfo=UTC),
+            subscription=subscriptions["subscription_1"],
+            stripe_invoice_id=None,
+        )
+
+        await metrics_service.refresh_rollups(
+            session,
+            products["monthly_subscription"].organization_id,
+            [order.created_at],
+        )
+        # Refreshing twice the same bucket doesn't count the order twice
+        await metrics_service.refresh_rollups(
+            session,
+            products["monthly_subscription"].organization_id,
+            [order.created_at],
+        )
+
+        metrics = await metrics_service.get_metrics(
+            session,
+            auth_subject,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 12, 31),
+            interval=Interval.day,
+        )
+
+        jan_1 = metrics.periods[0]
+        assert jan_1.orders == 3
+        assert jan_1.revenue == 1200_00
+
+        mar_1 = metrics.periods[60]
+        assert mar_1.orders == 1
+        assert mar_1.revenue == 100_00
+        assert mar_1.renewed_subscriptions == 1
+        assert mar_1.renewed_subscriptions_revenue == 100_00
+
+    @pytest.mark.auth
+    async def test_subscription(
+        self,
+        session: AsyncSession,
+        auth_subject: AuthSubject[User],
+        user_organization: UserOrganization,
+        fixtures: tuple[dict[str, Product], dict[str, Subscription], dict[str, Order]],
+    ) -> None:
+        _, subscriptions, _ = fixtures
+        subscription = subscriptions["subscription_2"]
+        subscription.ended_at = datetime(2024, 9, 1, tzinfo=UTC)
+        await session.flush()
+
+        await metrics_service.refresh_subscription_rollups(session, subscription)
+
+        metrics = await metrics_service.get_metrics(
+            session,
+            auth_subject,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 12, 31),
+            interval=Interval.month,
+        )
+
+        sep = metrics.periods[8]
+        assert sep.active_subscriptions == 3
+        assert sep.monthly_recurring_revenue == 283_33
+
+        oct = metrics.periods[9]
+        assert oct.active_subscriptions == 2
+        assert oct.monthly_recurring_revenue == 183_33
+
+    @pytest.mark.auth
+    async def test_subscription_reactivated(
+        self,
+        session: AsyncSession,
+        auth_subject: AuthSubject[User],
+        user_organization: UserOrganization,
+        fixtures: tuple[dict[str, Product], dict[str, Subscription], dict[str, Order]],
+    ) -> None:
+        _, subscriptions, _ = fixtures
+        subscription = subscriptions["subscription_2"]
+        previous_ended_at = datetime(2024, 9, 1, tzinfo=UTC)
+        subscription.ended_at = previous_ended_at
+        await session.flush()
+        await metrics_service.refresh_subscription_rollups(session, subscription)
+
+        subscription.ended_at = None
+        await session.flush()
+        await metrics_service.refresh_subscription_rollups(
+            session, subscription, [previous_ended_at]
+        )
+
+        metrics = await metrics_service.get_metrics(
+            session,
+            auth_subject,
+            start_date=date(2024, 1, 1),
+            end_date=date(2024, 12, 31),
+            interval=Interval.month,
+        )
+
+        oct = metrics.periods[9]
+        assert oct.active_subscriptions == 3
+        assert oct.monthly_recurring_revenue == 283_33
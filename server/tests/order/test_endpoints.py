@@ -1,10 +1,12 @@
 import uuid
+from datetime import timedelta
 
 import pytest
 import pytest_asyncio
 from httpx import AsyncClient
 
 from polar.auth.scope import Scope
+from polar.kit.utils import utc_now
 from polar.models import Order, Product, User, UserOrganization
 from tests.fixtures.auth import AuthSubjectFixture
 from tests.fixtures.database import SaveFixture
@@ -65,6 +67,71 @@ class TestListOrders:
         json = response.json()
         assert json["pagination"]["total_count"] == len(orders)
 
+    @pytest.mark.auth(
+        AuthSubjectFixture(subject="organization", scopes={Scope.orders_read}),
+    )
+    @pytest.mark.parametrize("sorting", ["-created_at", "amount", "-amount"])
+    async def test_cursor(
+        self,
+        sorting: str,
+        save_fixture: SaveFixture,
+        client: AsyncClient,
+        product: Product,
+        user_second: User,
+    ) -> None:
+        created_at = utc_now()
+        orders = [
+            await create_order(
+                save_fixture,
+                product=product,
+                user=user_second,
+                amount=amount,
+                stripe_invoice_id=None,
+                created_at=created_at + timedelta(seconds=seconds),
+            )
+            for amount, seconds in [
+                (1000, 0),
+                (2000, 0),
+                (2000, 1),
+                (3000, 2),
+                (2000, 2),
+            ]
+        ]
+
+        response = await client.get(
+            "/v1/orders/", params={"limit": 2, "sorting": sorting}
+        )
+        assert response.status_code == 200
+        json = response.json()
+        ids = [order["id"] for order in json["items"]]
+        offset_ids = [*ids]
+        for page in [2, 3]:
+            page_response = await client.get(
+                "/v1/orders/", params={"limit": 2, "sorting": sorting, "page": page}
+            )
+            offset_ids += [order["id"] for order in page_response.json()["items"]]
+
+        while (cursor := json["pagination"]["next_cursor"]) is not None:
+            response = await client.get(
+                "/v1/orders/",
+                params={"limit": 2, "sorting": sorting, "cursor": cursor},
+            )
+            assert response.status_code == 200
+            json = response.json()
+            assert json["pagination"]["total_count"] == len(orders)
+            ids += [order["id"] for order in json["items"]]
+
+        assert ids == offset_ids
+        assert sorted(ids) == sorted(str(order.id) for order in orders)
+
+    @pytest.mark.auth(
+        AuthSubjectFixture(subject="organization", scopes={Scope.orders_read}),
+    )
+    async def test_invalid_cursor(self, client: AsyncClient) -> None:
+        response = await client.get("/v1/orders/", params={"cursor": "INVALID"})
+
+        assert response.status_code == 422
+
 
 @pytest.mark.asyncio
 @pytest.mark.http_auto_expunge
@@ -149,3 +216,77 @@ class TesGetOrdersStatistics:
 
         json = response.json()
         assert len(json["periods"]) == 12
+
+
+@pytest.mark.asyncio
+@pytest.mark.http_auto_expunge
+class TestExportOrders:
+    async def test_anonymous(self, client: AsyncClient) -> None:
+        response = await client.get("/v1/orders/export")
+
+        assert response.status_code == 401
+
+    @pytest.mark.auth
+    async def test_user_not_organization_member(
+        self, client: AsyncClient, orders: list[Order]
+    ) -> None:
+        response = await client.get("/v1/orders/export")
+
+        assert response.status_code == 200
+        assert response.text.splitlines() == [
+            "Date,Order ID,Email,Product,Billing Reason,Amount,Tax Amount,"
+            "Currency,Subscription ID"
+        ]
+
+    @pytest.mark.auth
+    async def test_user_valid(
+        self,
+        client: AsyncClient,
+        user_organization: UserOrganization,
+        orders: list[Order],
+        user_second: User,
+    ) -> None:
+        response = await client.get(
+            "/v1/orders/export", headers={"Accept-Encoding": "gzip"}
+        )
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+        assert response.headers["content-encoding"] == "gzip"
+
+        lines = response.text.splitlines()
+        assert len(lines) == len(orders) + 1
+        assert str(orders[0].id) in lines[1]
+        assert user_second.email in lines[1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.http_auto_expunge
+class TestExportCustomers:
+    async def test_anonymous(self, client: AsyncClient) -> None:
+        response = await client.get("/v1/orders/customers/export")
+
+        assert response.status_code == 401
+
+    @pytest.mark.auth(
+        AuthSubjectFixture(subject="organization", scopes={Scope.orders_read}),
+    )
+    async def test_organization(
+        self,
+        save_fixture: SaveFixture,
+        client: AsyncClient,
+        product: Product,
+        orders: list[Order],
+        user_second: User,
+    ) -> None:
+        await create_order(
+            save_fixture, product=product, user=user_second, stripe_invoice_id=None
+        )
+
+        response = await client.get("/v1/orders/customers/export")
+
+        assert response.status_code == 200
+        lines = response.text.splitlines()
+        assert lines[0] == "Email,Orders,First Order At,Last Order At"
+        assert len(lines) == 2
+        assert lines[1].startswith(f"{user_second.email},2,")
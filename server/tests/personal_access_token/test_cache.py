@@ -0,0 +1,180 @@
+import json
+from datetime import timedelta
+from unittest.mock import MagicMock
+
+import pytest
+import pytest_asyncio
+from pytest_mock import MockerFixture
+from sqlalchemy import inspect
+
+from polar.config import settings
+from polar.kit.crypto import get_token_hash
+from polar.kit.utils import utc_now
+from polar.models import OAuthAccount, PersonalAccessToken, User
+from polar.personal_access_token.cache import PersonalAccessTokenCache
+from polar.personal_access_token.service import (
+    personal_access_token as personal_access_token_service,
+)
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from tests.fixtures.database import SaveFixture
+
+
+@pytest.fixture
+def cache(redis: Redis) -> PersonalAccessTokenCache:
+    return PersonalAccessTokenCache(redis)
+
+
+@pytest.fixture
+def enqueue_job_mock(mocker: MockerFixture) -> MagicMock:
+    return mocker.patch("polar.personal_access_token.cache.enqueue_job")
+
+
+@pytest_asyncio.fixture
+async def personal_access_token(
+    save_fixture: SaveFixture, user: User
+) -> PersonalAccessToken:
+    personal_access_token = PersonalAccessToken(
+        comment="Test",
+        token=get_token_hash("polar_pat_123", secret=settings.SECRET),
+        user_id=user.id,
+        expires_at=utc_now() + timedelta(days=1),
+        scope="openid metrics:read",
+    )
+    await save_fixture(personal_access_token)
+    return personal_access_token
+
+
+async def _load(session: AsyncSession) -> PersonalAccessToken:
+    token = await personal_access_token_service.get_by_token(session, "polar_pat_123")
+    assert token is not None
+    return token
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestPersonalAccessTokenCache:
+    async def test_roundtrip(
+        self,
+        session: AsyncSession,
+        cache: PersonalAccessTokenCache,
+        personal_access_token: PersonalAccessToken,
+        user: User,
+    ) -> None:
+        await cache.set(await _load(session))
+        session.expunge_all()
+
+        cached = await cache.get(session, personal_access_token.token)
+
+        assert cached is not None
+        assert cached in session
+        assert cached.id == personal_access_token.id
+        assert cached.scopes == personal_access_token.scopes
+        assert cached.expires_at == personal_access_token.expires_at
+        assert cached.user.id == user.id
+        assert cached.user.email == user.email
+        assert cached.user.blocked_at is None
+
+    async def test_oauth_account_tokens_not_cached(
+        self,
+        session: AsyncSession,
+        redis: Redis,
+        cache: PersonalAccessTokenCache,
+        personal_access_token: PersonalAccessToken,
+        user_github_oauth: OAuthAccount,
+    ) -> None:
+        await cache.set(await _load(session))
+        session.expunge_all()
+
+        raw_entry = await redis.get(
+            f"personal_access_token:auth:token:{personal_access_token.token}"
+        )
+        assert raw_entry is not None
+        (cached_oauth_account,) = json.loads(raw_entry)["oauth_accounts"]
+        assert "access_token" not in cached_oauth_account
+        assert "refresh_token" not in cached_oauth_account
+
+        cached = await cache.get(session, personal_access_token.token)
+
+        assert cached is not None
+        assert cached.user.github_username == user_github_oauth.account_username
+        (oauth_account,) = cached.user.oauth_accounts
+        assert {"access_token", "refresh_token"} <= inspect(oauth_account).unloaded
+
+    async def test_missing(
+        self,
+        session: AsyncSession,
+        cache: PersonalAccessTokenCache,
+        personal_access_token: PersonalAccessToken,
+    ) -> None:
+        assert await cache.get(session, personal_access_token.token) is None
+
+    async def test_expired(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        cache: PersonalAccessTokenCache,
+        personal_access_token: PersonalAccessToken,
+    ) -> None:
+        token = await _load(session)
+        token.expires_at = utc_now() - timedelta(seconds=1)
+        await cache.set(token)
+        session.expunge_all()
+
+        assert await cache.get(session, personal_access_token.token) is None
+
+    async def test_invalidate_user(
+        self,
+        session: AsyncSession,
+        cache: PersonalAccessTokenCache,
+        personal_access_token: PersonalAccessToken,
+        user: User,
+    ) -> None:
+        token = await _load(session)
+        await cache.set(token)
+
+        await cache.invalidate(set(), {user.id})
+
+        assert await cache.get(session, personal_access_token.token) is None
+
+        # A token loaded before the invalidation isn't stored back
+        await cache.set(token)
+        assert await cache.get(session, personal_access_token.token) is None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestInvalidationListeners:
+    async def test_token_deleted(
+        self,
+        session: AsyncSession,
+        personal_access_token: PersonalAccessToken,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        token = await _load(session)
+        await personal_access_token_service.delete(session, token)
+        await session.flush()
+        enqueue_job_mock.assert_not_called()
+
+        await session.commit()
+
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.args == (
+            "personal_access_token.invalidate_auth_cache",
+        )
+        assert enqueue_job_mock.call_args.kwargs["token_hashes"] == [
+            personal_access_token.token
+        ]
+
+    async def test_user_blocked(
+        self,
+        session: AsyncSession,
+        user: User,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        user = await session.merge(user)
+        user.blocked_at = utc_now()
+        await session.commit()
+
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.kwargs["user_ids"] == [user.id]
@@ -1,3 +1,4 @@
+import uuid
 from datetime import timedelta
 from unittest.mock import MagicMock
 
@@ -9,10 +10,14 @@ from polar.enums import TokenType
 from polar.kit.crypto import get_token_hash
 from polar.kit.utils import utc_now
 from polar.models import PersonalAccessToken, User
+from polar.personal_access_token.service import (
+    USAGE_REDIS_KEY,
+)
 from polar.personal_access_token.service import (
     personal_access_token as personal_access_token_service,
 )
 from polar.postgres import AsyncSession
+from polar.redis import Redis
 from tests.fixtures.database import SaveFixture
 
 
@@ -82,3 +87,47 @@ class TestRevokeLeaked:
 
         send_to_user_mock: MagicMock = email_sender_mock.send_to_user
         send_to_user_mock.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestFlushUsage:
+    async def test_empty(self, session: AsyncSession, redis: Redis) -> None:
+        await personal_access_token_service.flush_usage(session, redis)
+
+    async def test_coalesced(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        redis: Redis,
+        user: User,
+    ) -> None:
+        personal_access_token = PersonalAccessToken(
+            comment="Test",
+            token=get_token_hash("polar_pat_123", secret=settings.SECRET),
+            user_id=user.id,
+            expires_at=utc_now() + timedelta(days=1),
+            scope="openid",
+        )
+        await save_fixture(personal_access_token)
+
+        first_used_at = utc_now()
+        last_used_at = first_used_at + timedelta(seconds=10)
+        await personal_access_token_service.record_usage(
+            redis, personal_access_token.id, first_used_at
+        )
+        await personal_access_token_service.record_usage(
+            redis, personal_access_token.id, last_used_at
+        )
+        await personal_access_token_service.record_usage(
+            redis, uuid.uuid4(), last_used_at
+        )
+
+        await personal_access_token_service.flush_usage(session, redis)
+
+        updated_personal_access_token = await session.get(
+            PersonalAccessToken, personal_access_token.id
+        )
+        assert updated_personal_access_token is not None
+        assert updated_personal_access_token.last_used_at == last_used_at
+        assert await redis.exists(USAGE_REDIS_KEY) == 0
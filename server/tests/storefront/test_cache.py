@@ -0,0 +1,111 @@
+import uuid
+from unittest.mock import MagicMock
+
+import pytest
+from pytest_mock import MockerFixture
+
+from polar.models import Organization, Product
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from polar.storefront.cache import StorefrontCache
+from tests.fixtures.database import SaveFixture
+from tests.fixtures.random_objects import create_product
+
+
+@pytest.fixture
+def cache(redis: Redis) -> StorefrontCache:
+    return StorefrontCache(redis)
+
+
+@pytest.fixture
+def enqueue_job_mock(mocker: MockerFixture) -> MagicMock:
+    return mocker.patch("polar.storefront.cache.enqueue_job")
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestStorefrontCache:
+    async def test_get_version_stable(self, cache: StorefrontCache) -> None:
+        organization_id = uuid.uuid4()
+
+        version = await cache.get_version(organization_id)
+
+        assert await cache.get_version(organization_id) == version
+
+    async def test_payload_roundtrip(self, cache: StorefrontCache) -> None:
+        organization_id = uuid.uuid4()
+        version = await cache.get_version(organization_id)
+
+        stored = await cache.set_payload("name", organization_id, version, "{}")
+        cached = await cache.get_payload("name")
+
+        assert cached == stored
+        assert cached is not None
+        assert cached.payload == "{}"
+
+    async def test_bump_versions(self, cache: StorefrontCache) -> None:
+        organization_id = uuid.uuid4()
+        other_organization_id = uuid.uuid4()
+        version = await cache.get_version(organization_id)
+        other_version = await cache.get_version(other_organization_id)
+        stored = await cache.set_payload("name", organization_id, version, "{}")
+        await cache.set_payload("other", other_organization_id, other_version, "{}")
+
+        await cache.bump_versions({organization_id})
+
+        assert await cache.get_payload("name") is None
+        assert await cache.get_payload("other") is not None
+
+        new_version = await cache.get_version(organization_id)
+        assert new_version != version
+        restored = await cache.set_payload("name", organization_id, new_version, "{}")
+        assert restored.etag != stored.etag
+
+    async def test_bump_versions_missing(self, cache: StorefrontCache) -> None:
+        organization_id = uuid.uuid4()
+
+        await cache.bump_versions({organization_id})
+
+        assert await cache.get_version(organization_id) is not None
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestInvalidationListeners:
+    async def test_enqueued_after_commit(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        organization: Organization,
+        product: Product,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        product = await session.merge(product)
+        product.name = "Updated Product"
+        await session.flush()
+        enqueue_job_mock.assert_not_called()
+
+        await session.commit()
+
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.args == ("storefront.invalidate",)
+        assert enqueue_job_mock.call_args.kwargs["organization_ids"] == [
+            organization.id
+        ]
+
+    async def test_product_children(
+        self,
+        session: AsyncSession,
+        save_fixture: SaveFixture,
+        organization: Organization,
+        enqueue_job_mock: MagicMock,
+    ) -> None:
+        product = await create_product(save_fixture, organization=organization)
+
+        await session.commit()
+
+        enqueue_job_mock.assert_called_once()
+        assert enqueue_job_mock.call_args.kwargs["organization_ids"] == [
+            organization.id
+        ]
+        assert enqueue_job_mock.call_args.kwargs["product_ids"] == [product.id]
@@ -0,0 +1,142 @@
+import pytest
+import pytest_asyncio
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+
+from polar.models import Organization, Product
+from polar.postgres import AsyncSession
+from polar.redis import Redis
+from polar.storefront.cache import StorefrontCache
+from polar.storefront.service import storefront as storefront_service
+from tests.fixtures.database import SaveFixture
+
+
+@pytest_asyncio.fixture
+async def storefront_organization(
+    save_fixture: SaveFixture, organization: Organization, product: Product
+) -> Organization:
+    organization.profile_settings = {"enabled": True}
+    await save_fixture(organization)
+    return organization
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestGetStorefront:
+    async def test_not_existing(self, client: AsyncClient) -> None:
+        response = await client.get("/v1/storefronts/not-existing")
+
+        assert response.status_code == 404
+
+    async def test_valid(
+        self, client: AsyncClient, storefront_organization: Organization
+    ) -> None:
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+
+        assert response.status_code == 200
+        assert "ETag" in response.headers
+
+        json = response.json()
+        assert json["organization"]["id"] == str(storefront_organization.id)
+        assert len(json["products"]) == 1
+
+    async def test_not_modified(
+        self, client: AsyncClient, storefront_organization: Organization
+    ) -> None:
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+        etag = response.headers["ETag"]
+
+        response = await client.get(
+            f"/v1/storefronts/{storefront_organization.slug}",
+            headers={"If-None-Match": etag},
+        )
+
+        assert response.status_code == 304
+
+    async def test_cached(
+        self,
+        session: AsyncSession,
+        client: AsyncClient,
+        storefront_organization: Organization,
+    ) -> None:
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+        etag = response.headers["ETag"]
+
+        organization = await session.merge(storefront_organization)
+        organization.name = "Updated Name"
+        await session.flush()
+
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] == etag
+        assert response.json()["organization"]["name"] != "Updated Name"
+
+    async def test_invalidated(
+        self,
+        session: AsyncSession,
+        client: AsyncClient,
+        redis: Redis,
+        storefront_organization: Organization,
+    ) -> None:
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+        etag = response.headers["ETag"]
+
+        organization = await session.merge(storefront_organization)
+        organization.name = "Updated Name"
+        await session.flush()
+        await StorefrontCache(redis).bump_versions({organization.id})
+
+        response = await client.get(
+            f"/v1/storefronts/{storefront_organization.slug}",
+            headers={"If-None-Match": etag},
+        )
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+        assert response.json()["organization"]["name"] == "Updated Name"
+
+    async def test_invalidated_during_render(
+        self,
+        mocker: MockerFixture,
+        client: AsyncClient,
+        redis: Redis,
+        storefront_organization: Organization,
+    ) -> None:
+        get = storefront_service.get
+
+        async def get_and_bump(session: AsyncSession, slug: str) -> Organization | None:
+            organization = await get(session, slug)
+            await StorefrontCache(redis).bump_versions({storefront_organization.id})
+            return organization
+
+        mocker.patch(
+            "polar.storefront.endpoints.storefront_service.get",
+            side_effect=get_and_bump,
+        )
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+        etag = response.headers["ETag"]
+
+        # The payload was stored under the previous version, so it's not served
+        mocker.stopall()
+        response = await client.get(f"/v1/storefronts/{storefront_organization.slug}")
+
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestGetProductEmbed:
+    async def test_not_modified(self, client: AsyncClient, product: Product) -> None:
+        response = await client.get(f"/v1/embed/product/{product.id}")
+
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert response.json()["etag"] == etag
+
+        response = await client.get(
+            f"/v1/embed/product/{product.id}", headers={"If-None-Match": etag}
+        )
+
+        assert response.status_code == 304
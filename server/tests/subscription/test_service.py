@@ -129,6 +129,10 @@ class TestCreateArbitrarySubscription:
         enqueue_benefits_grants_mock = mocker.patch.object(
             subscription_service, "enqueue_benefits_grants"
         )
+        enqueue_rollups_refresh_mock = mocker.patch(
+            "polar.subscription.service.metrics_service"
+            ".enqueue_subscription_rollups_refresh"
+        )
 
         # then
         session.expunge_all()
@@ -138,6 +142,7 @@ class TestCreateArbitrarySubscription:
         subscription = await subscription_service.create_arbitrary_subscription(
             session, user=user, product=product, price=price
         )
+        enqueue_rollups_refresh_mock.assert_called_once_with(subscription)
 
         assert subscription.product_id == product.id
         assert subscription.user_id == user.id
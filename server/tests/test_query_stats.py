@@ -0,0 +1,102 @@
+import freezegun
+import pytest
+from httpx import AsyncClient
+from pytest_mock import MockerFixture
+from sqlalchemy import select, text
+
+from polar import query_stats
+from polar.config import settings
+from polar.kit.db.postgres import AsyncSession
+from polar.query_stats import (
+    REDIS_KEY_PREFIX,
+    TTL,
+    flush_query_stats,
+    get_query_stats,
+    instrument_query_stats,
+    track_queries,
+)
+from polar.redis import Redis
+
+
+@pytest.fixture
+def instrumented_session(session: AsyncSession) -> AsyncSession:
+    instrument_query_stats(session.bind.engine.sync_engine)
+    return session
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestTrackQueries:
+    async def test_count(self, instrumented_session: AsyncSession) -> None:
+        await instrumented_session.execute(select(1))
+
+        with track_queries("unit") as stats:
+            await instrumented_session.execute(select(1))
+            await instrumented_session.execute(text("SELECT 2"))
+
+        assert stats.queries == 2
+        assert stats.duration > 0
+        assert stats.repeated_statements == 0
+
+    async def test_repeated_statement(
+        self, mocker: MockerFixture, instrumented_session: AsyncSession
+    ) -> None:
+        mocker.patch.object(settings, "DATABASE_REPEATED_STATEMENT_THRESHOLD", 2)
+        log_mock = mocker.patch("polar.query_stats.log")
+
+        with track_queries("unit") as stats:
+            for i in range(5):
+                await instrumented_session.execute(select(1).where(text(f"{i} = {i}")))
+            for i in range(5):
+                await instrumented_session.execute(text("SELECT :i"), {"i": str(i)})
+
+        assert stats.queries == 10
+        assert stats.repeated_statements == 1
+        log_mock.warning.assert_called_once()
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+async def test_flush_query_stats(
+    redis: Redis, instrumented_session: AsyncSession
+) -> None:
+    for _ in range(2):
+        with track_queries("GET /v1/test"):
+            await instrumented_session.execute(select(1))
+    await flush_query_stats(redis, force=True)
+
+    with track_queries("GET /v1/test"):
+        await instrumented_session.execute(select(1))
+        await instrumented_session.execute(select(1))
+    await flush_query_stats(redis, force=True)
+
+    stats = await get_query_stats(redis)
+    assert stats["GET /v1/test"].units == 3
+    assert stats["GET /v1/test"].queries == 4
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+async def test_flush_query_stats_expire(
+    redis: Redis, instrumented_session: AsyncSession
+) -> None:
+    with freezegun.freeze_time("2024-01-01 00:00:00"):
+        with track_queries("GET /v1/test"):
+            await instrumented_session.execute(select(1))
+        await flush_query_stats(redis, force=True)
+
+        assert 0 < await redis.ttl(f"{REDIS_KEY_PREFIX}:GET /v1/test") <= TTL
+        assert "GET /v1/test" in await get_query_stats(redis)
+
+    with freezegun.freeze_time("2024-01-01 00:00:00") as frozen_time:
+        frozen_time.tick(TTL + 1)
+        assert "GET /v1/test" not in await get_query_stats(redis)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+async def test_middleware_unmatched_route(client: AsyncClient) -> None:
+    await client.get("/v1/unknown-path/123")
+
+    assert "GET unmatched" in query_stats._aggregates
+    assert "GET /v1/unknown-path/123" not in query_stats._aggregates
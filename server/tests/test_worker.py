@@ -0,0 +1,279 @@
+from typing import Any, cast
+from unittest.mock import AsyncMock
+
+import freezegun
+import pytest
+from arq import ArqRedis
+from arq.constants import job_key_prefix, result_key_prefix
+from arq.jobs import Job, serialize_job
+from fakeredis import FakeAsyncRedis
+from pytest_mock import MockerFixture
+from redis.exceptions import WatchError
+
+from polar.query_stats import track_queries
+from polar.redis import Redis
+from polar.worker import (
+    CONCURRENCY_DEFER,
+    FLUSH_MAX_ATTEMPTS,
+    JobContext,
+    QueueName,
+    TaskConcurrencyLimiter,
+    WorkerContext,
+    WorkerSettings,
+    concurrency_limit,
+    enqueue_job,
+    flush_enqueued_jobs,
+    get_queue_stats,
+    task_hooks,
+)
+
+
+@pytest.fixture
+def arq_pool(redis: Redis) -> ArqRedis:
+    # arq expects raw responses: connect to the same fake server without decoding
+    raw = FakeAsyncRedis(host=redis.connection_pool.connection_kwargs["host"])
+    return ArqRedis(raw.connection_pool)
+
+
+@pytest.mark.asyncio
+async def test_flush_enqueued_jobs(arq_pool: ArqRedis) -> None:
+    enqueue_job("task_a", 1, foo="bar", _job_id="job_a")
+    enqueue_job("task_a", 2, _job_id="job_a")
+    enqueue_job("task_b", _job_id="job_b", _defer_by=60)
+    enqueue_job("task_c", queue_name=QueueName.github_crawl, _job_id="job_c")
+
+    await flush_enqueued_jobs(arq_pool)
+
+    default_queue = await arq_pool.zrange(
+        QueueName.default.value, 0, -1, withscores=True
+    )
+    assert [job_id for job_id, _ in default_queue] == [b"job_a", b"job_b"]
+    assert default_queue[1][1] - default_queue[0][1] >= 60_000
+    assert await arq_pool.zrange(QueueName.github_crawl.value, 0, -1) == [b"job_c"]
+
+    job_a = Job("job_a", arq_pool)
+    job_a_info = await job_a.info()
+    assert job_a_info is not None
+    assert job_a_info.function == "task_a"
+    assert job_a_info.args == (1,)
+    assert job_a_info.kwargs["foo"] == "bar"
+
+
+@pytest.mark.asyncio
+async def test_flush_enqueued_jobs_existing(arq_pool: ArqRedis) -> None:
+    await arq_pool.enqueue_job("task_a", _job_id="job_a")
+
+    enqueue_job("task_a", 1, _job_id="job_a")
+    await flush_enqueued_jobs(arq_pool)
+
+    job_a_info = await Job("job_a", arq_pool).info()
+    assert job_a_info is not None
+    assert job_a_info.args == ()
+
+
+@pytest.mark.asyncio
+async def test_enqueue_job_task_queue(
+    arq_pool: ArqRedis, mocker: MockerFixture
+) -> None:
+    mocker.patch.dict(
+        "polar.worker._task_queues",
+        {"task_critical": QueueName.critical, "task_bulk": QueueName.bulk},
+    )
+    enqueue_job("task_critical", _job_id="job_critical")
+    enqueue_job("task_bulk", _job_id="job_bulk")
+    enqueue_job("task_bulk", queue_name=QueueName.default, _job_id="job_default")
+    enqueue_job("task_unknown", _job_id="job_unknown")
+
+    await flush_enqueued_jobs(arq_pool)
+
+    assert await arq_pool.zrange(QueueName.critical.value, 0, -1) == [b"job_critical"]
+    assert await arq_pool.zrange(QueueName.bulk.value, 0, -1) == [b"job_bulk"]
+    assert await arq_pool.zrange(QueueName.default.value, 0, -1) == [
+        b"job_default",
+        b"job_unknown",
+    ]
+
+
+class TestTaskConcurrencyLimiter:
+    @pytest.mark.asyncio
+    async def test_acquire_release(self, redis: Redis) -> None:
+        limiter = TaskConcurrencyLimiter(redis, "task_a", 2)
+
+        assert await limiter.acquire("job_1", 60)
+        assert await limiter.acquire("job_2", 60)
+        assert not await limiter.acquire("job_3", 60)
+
+        await limiter.release("job_1")
+        assert await limiter.acquire("job_3", 60)
+
+    @pytest.mark.asyncio
+    async def test_expired_lease(self, redis: Redis) -> None:
+        limiter = TaskConcurrencyLimiter(redis, "task_a", 1)
+
+        with freezegun.freeze_time("2024-01-01 00:00:00"):
+            assert await limiter.acquire("job_1", 60)
+        with freezegun.freeze_time("2024-01-01 00:00:30"):
+            assert not await limiter.acquire("job_2", 60)
+        with freezegun.freeze_time("2024-01-01 00:01:01"):
+            assert await limiter.acquire("job_2", 60)
+
+
+@pytest.mark.asyncio
+async def test_concurrency_limit(redis: Redis, mocker: MockerFixture) -> None:
+    enqueue_job_mock = mocker.patch("polar.worker.enqueue_job")
+    calls: list[int] = []
+
+    @concurrency_limit("task_a", 1, None)
+    async def task_a(ctx: JobContext, value: int) -> None:
+        calls.append(value)
+
+    await TaskConcurrencyLimiter(redis, "task_a", 1).acquire("running_job", 60)
+
+    ctx = cast(JobContext, {"job_id": "task_a:1", "raw_redis": redis})
+    await task_a(ctx, value=1)
+    assert calls == []
+    enqueue_job_mock.assert_called_once_with(
+        "task_a", value=1, _defer_by=CONCURRENCY_DEFER
+    )
+
+    await TaskConcurrencyLimiter(redis, "task_a", 1).release("running_job")
+    await task_a(ctx, value=2)
+    assert calls == [2]
+    # The slot is released once the job ends
+    assert await TaskConcurrencyLimiter(redis, "task_a", 1).acquire("job", 60)
+
+
+@pytest.mark.asyncio
+async def test_task_hooks_query_stats_unit(
+    job_context: JobContext, mocker: MockerFixture
+) -> None:
+    track_queries_mock = mocker.patch(
+        "polar.worker.track_queries", side_effect=track_queries
+    )
+
+    @task_hooks("discord.dispatch")
+    async def dispatch(ctx: JobContext) -> None:
+        pass
+
+    # A custom job ID doesn't start with the task name
+    job_context["job_id"] = "discord.dispatch:GUILD_ID:1"
+    await dispatch(job_context)
+
+    track_queries_mock.assert_called_once_with("discord.dispatch")
+
+
+@pytest.mark.asyncio
+async def test_get_queue_stats(redis: Redis, arq_pool: ArqRedis) -> None:
+    with freezegun.freeze_time("2024-01-01 00:00:00"):
+        enqueue_job("task_a", queue_name=QueueName.critical)
+        enqueue_job("task_b", queue_name=QueueName.critical, _defer_by=3600)
+        await flush_enqueued_jobs(arq_pool)
+
+    with freezegun.freeze_time("2024-01-01 00:00:10"):
+        stats = {s.queue_name: s for s in await get_queue_stats(redis)}
+
+    critical = stats[QueueName.critical.value]
+    assert critical.ready == 1
+    assert critical.deferred == 1
+    assert critical.oldest_age == pytest.approx(10)
+
+    default = stats[QueueName.default.value]
+    assert default.ready == 0
+    assert default.oldest_age is None
+
+
+@pytest.mark.asyncio
+async def test_on_shutdown_closes_webhook_delivery_client(
+    mocker: MockerFixture,
+) -> None:
+    close_mock = mocker.patch(
+        "polar.worker.webhook_delivery_client.close", new_callable=AsyncMock
+    )
+    ctx = cast(WorkerContext, {"async_engine": AsyncMock(), "raw_redis": AsyncMock()})
+
+    await WorkerSettings.on_shutdown(ctx)
+
+    close_mock.assert_awaited_once()
+
+
+@pytest.mark.asyncio
+async def test_flush_enqueued_jobs_concurrent(
+    arq_pool: ArqRedis, mocker: MockerFixture
+) -> None:
+    enqueue_job("task_a", 1, _job_id="job_a")
+    enqueue_job("task_b", _job_id="job_b")
+
+    pipeline = arq_pool.pipeline
+    checks = 0
+
+    def pipeline_with_concurrent_enqueue(transaction: bool = True) -> Any:
+        pipe = pipeline(transaction=transaction)
+        if transaction:
+            return pipe
+
+        execute = pipe.execute
+
+        async def execute_and_enqueue(*args: Any, **kwargs: Any) -> Any:
+            nonlocal checks
+            checks += 1
+            result = await execute(*args, **kwargs)
+            # The same job is enqueued by someone else right after the first check
+            if checks == 1:
+                job = serialize_job(
+                    "task_a", (), {}, None, 0, serializer=arq_pool.job_serializer
+                )
+                await arq_pool.psetex(job_key_prefix + "job_a", 60_000, job)
+                await arq_pool.zadd(QueueName.default.value, {"job_a": 0})
+            return result
+
+        pipe.execute = execute_and_enqueue  # type: ignore[method-assign]
+        return pipe
+
+    mocker.patch.object(
+        arq_pool, "pipeline", side_effect=pipeline_with_concurrent_enqueue
+    )
+    await flush_enqueued_jobs(arq_pool)
+
+    # The transaction was aborted, and the chunk checked again
+    assert checks == 2
+    default_queue = await arq_pool.zrange(QueueName.default.value, 0, -1)
+    assert sorted(default_queue) == [b"job_a", b"job_b"]
+    job_a_info = await Job("job_a", arq_pool).info()
+    assert job_a_info is not None
+    assert job_a_info.args == ()
+
+
+@pytest.mark.asyncio
+async def test_flush_enqueued_jobs_contention(
+    arq_pool: ArqRedis, mocker: MockerFixture
+) -> None:
+    enqueue_job("task_a", _job_id="job_a")
+
+    pipeline = arq_pool.pipeline
+    checks = 0
+
+    def pipeline_with_contention(transaction: bool = True) -> Any:
+        pipe = pipeline(transaction=transaction)
+        if transaction:
+            return pipe
+
+        execute = pipe.execute
+
+        async def execute_and_change(*args: Any, **kwargs: Any) -> Any:
+            nonlocal checks
+            checks += 1
+            result = await execute(*args, **kwargs)
+            # The job result changes after every check
+            await arq_pool.psetex(result_key_prefix + "job_a", 60_000, b"")
+            await arq_pool.delete(result_key_prefix + "job_a")
+            return result
+
+        pipe.execute = execute_and_change  # type: ignore[method-assign]
+        return pipe
+
+    mocker.patch.object(arq_pool, "pipeline", side_effect=pipeline_with_contention)
+    with pytest.raises(WatchError):
+        await flush_enqueued_jobs(arq_pool)
+
+    assert checks == FLUSH_MAX_ATTEMPTS
+    assert await arq_pool.zrange(QueueName.default.value, 0, -1) == []
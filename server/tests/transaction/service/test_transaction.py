@@ -1,14 +1,24 @@
 import uuid
 
 import pytest
+from sqlalchemy import delete, update
 
 from polar.authz.service import Authz
 from polar.exceptions import NotPermitted, ResourceNotFound
 from polar.kit.pagination import PaginationParams
-from polar.models import Account, Organization, Transaction, User, UserOrganization
+from polar.models import (
+    Account,
+    AccountBalance,
+    Organization,
+    Transaction,
+    User,
+    UserOrganization,
+)
 from polar.models.transaction import TransactionType
 from polar.postgres import AsyncSession
 from polar.transaction.service.transaction import transaction as transaction_service
+from tests.fixtures.database import SaveFixture
+from tests.transaction.conftest import create_transaction
 
 
 @pytest.fixture
@@ -280,3 +290,94 @@ class TestLookup:
         transaction.pledge
         transaction.issue_reward
         transaction.order
+
+
+@pytest.mark.asyncio
+class TestGetTransactionsSum:
+    async def test_updated_and_deleted(
+        self,
+        save_fixture: SaveFixture,
+        session: AsyncSession,
+        account: Account,
+        account_transactions: list[Transaction],
+    ) -> None:
+        session.expunge_all()
+
+        balance_sum = sum(
+            t.amount for t in account_transactions if t.type == TransactionType.balance
+        )
+        assert (
+            await transaction_service.get_transactions_sum(
+                session, account.id, type=TransactionType.balance
+            )
+            == balance_sum
+        )
+
+        transaction = await create_transaction(
+            save_fixture, account=account, type=TransactionType.balance, amount=500
+        )
+        assert (
+            await transaction_service.get_transactions_sum(
+                session, account.id, type=TransactionType.balance
+            )
+            == balance_sum + 500
+        )
+
+        transaction.amount = 200
+        await save_fixture(transaction)
+        assert (
+            await transaction_service.get_transactions_sum(
+                session, account.id, type=TransactionType.balance
+            )
+            == balance_sum + 200
+        )
+
+        await session.delete(transaction)
+        await session.flush()
+        assert await transaction_service.get_transactions_sum(
+            session, account.id
+        ) == sum(t.amount for t in account_transactions)
+
+
+@pytest.mark.asyncio
+class TestReconcileAccountBalances:
+    async def test_diverging(
+        self,
+        session: AsyncSession,
+        account: Account,
+        account_transactions: list[Transaction],
+    ) -> None:
+        session.expunge_all()
+
+        assert await transaction_service.reconcile_account_balances(session) == 0
+
+        await session.execute(
+            update(AccountBalance)
+            .where(AccountBalance.account_id == account.id)
+            .values(amount=AccountBalance.amount + 1)
+        )
+
+        diverging = await transaction_service.reconcile_account_balances(session)
+        assert diverging > 0
+        assert await transaction_service.get_transactions_sum(
+            session, account.id
+        ) == sum(t.amount for t in account_transactions)
+        assert await transaction_service.reconcile_account_balances(session) == 0
+
+    async def test_missing(
+        self,
+        session: AsyncSession,
+        account: Account,
+        account_transactions: list[Transaction],
+    ) -> None:
+        session.expunge_all()
+
+        await session.execute(
+            delete(AccountBalance).where(AccountBalance.account_id == account.id)
+        )
+
+        assert await transaction_service.reconcile_account_balances(session) > 0
+        assert await transaction_service.get_transactions_sum(
+            session, account.id
+        ) == sum(t.amount for t in account_transactions)
+        assert await transaction_service.reconcile_account_balances(session) == 0
@@ -6,8 +6,11 @@ from pytest_mock import MockerFixture
 
 from polar.models import (
     Account,
+    ExternalOrganization,
+    Issue,
     Organization,
     Pledge,
+    Repository,
     Transaction,
     User,
     UserOrganization,
@@ -209,3 +212,45 @@ class TestCreatePayout:
         )
 
         assert response.status_code == 201
+
+
+@pytest.mark.asyncio
+@pytest.mark.http_auto_expunge
+class TestGetPayoutCSV:
+    async def test_anonymous(self, client: AsyncClient) -> None:
+        response = await client.get(f"/v1/transactions/payouts/{uuid.uuid4()}/csv")
+
+        assert response.status_code == 401
+
+    @pytest.mark.auth
+    async def test_valid(
+        self,
+        save_fixture: SaveFixture,
+        account: Account,
+        user_organization: UserOrganization,
+        pledge: Pledge,
+        issue: Issue,
+        external_organization: ExternalOrganization,
+        repository: Repository,
+        client: AsyncClient,
+    ) -> None:
+        payout = await create_transaction(
+            save_fixture, type=TransactionType.payout, account=account, amount=-1000
+        )
+        paid_transaction = await create_transaction(
+            save_fixture, account=account, pledge=pledge, payout_transaction=payout
+        )
+
+        response = await client.get(f"/v1/transactions/payouts/{payout.id}/csv")
+
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/csv")
+
+        lines = response.text.splitlines()
+        assert len(lines) == 2
+        assert lines[0].startswith("Date,Payout ID,Transaction ID,Description")
+        assert f"{payout.id},{paid_transaction.id}" in lines[1]
+        assert (
+            f"Pledge to {external_organization.name}/{repository.name}#{issue.number}"
+            in lines[1]
+        )
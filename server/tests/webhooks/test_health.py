@@ -0,0 +1,96 @@
+import uuid
+
+import pytest
+
+from polar.redis import Redis
+from polar.webhook.health import (
+    CIRCUIT_TTL,
+    FAILURE_THRESHOLD,
+    MAX_COOLDOWN,
+    MIN_COOLDOWN,
+    WebhookCircuitBreaker,
+)
+
+
+@pytest.fixture
+def circuit_breaker(redis: Redis) -> WebhookCircuitBreaker:
+    return WebhookCircuitBreaker(redis)
+
+
+@pytest.mark.asyncio
+@pytest.mark.skip_db_asserts
+class TestWebhookCircuitBreaker:
+    async def test_opens_after_consecutive_failures(
+        self, circuit_breaker: WebhookCircuitBreaker
+    ) -> None:
+        endpoint_id = uuid.uuid4()
+
+        for _ in range(FAILURE_THRESHOLD - 1):
+            assert await circuit_breaker.record_failure(endpoint_id, 1.0) is None
+        await circuit_breaker.record_success(endpoint_id, 0.1)
+        for _ in range(FAILURE_THRESHOLD - 1):
+            assert await circuit_breaker.record_failure(endpoint_id, 1.0) is None
+        assert not await circuit_breaker.is_open(endpoint_id)
+
+        assert await circuit_breaker.record_failure(endpoint_id, 1.0) == MIN_COOLDOWN
+        assert await circuit_breaker.is_open(endpoint_id)
+
+        # Already open
+        assert await circuit_breaker.record_failure(endpoint_id, 1.0) is None
+
+    async def test_circuit_expiry(
+        self, circuit_breaker: WebhookCircuitBreaker, redis: Redis
+    ) -> None:
+        endpoint_id = uuid.uuid4()
+        for _ in range(FAILURE_THRESHOLD):
+            await circuit_breaker.record_failure(endpoint_id, 1.0)
+
+        circuit_key = f"webhook:endpoint:{endpoint_id}:circuit"
+        assert 0 < await redis.ttl(circuit_key) <= CIRCUIT_TTL
+
+        await redis.persist(circuit_key)
+        await circuit_breaker.reopen(endpoint_id, 1.0)
+        assert 0 < await redis.ttl(circuit_key) <= CIRCUIT_TTL
+
+    async def test_reopen_backoff(self, circuit_breaker: WebhookCircuitBreaker) -> None:
+        endpoint_id = uuid.uuid4()
+        for _ in range(FAILURE_THRESHOLD):
+            await circuit_breaker.record_failure(endpoint_id, 1.0)
+
+        assert await circuit_breaker.reopen(endpoint_id, 1.0) == MIN_COOLDOWN * 2
+        assert await circuit_breaker.reopen(endpoint_id, 1.0) == MIN_COOLDOWN * 4
+        for _ in range(10):
+            await circuit_breaker.reopen(endpoint_id, 1.0)
+        assert await circuit_breaker.reopen(endpoint_id, 1.0) == MAX_COOLDOWN
+
+        await circuit_breaker.record_success(endpoint_id, 0.1)
+        assert not await circuit_breaker.is_open(endpoint_id)
+
+    async def test_parked(self, circuit_breaker: WebhookCircuitBreaker) -> None:
+        endpoint_id = uuid.uuid4()
+        parked = {(uuid.uuid4(), job_try) for job_try in range(1, 4)}
+        for event_id, job_try in parked:
+            await circuit_breaker.park(endpoint_id, event_id, job_try)
+
+        popped = await circuit_breaker.pop_parked(endpoint_id, 2)
+        assert len(popped) == 2
+        popped += await circuit_breaker.pop_parked(endpoint_id, 2)
+        assert set(popped) == parked
+        assert await circuit_breaker.pop_parked(endpoint_id, 2) == []
+
+    async def test_get_health(self, circuit_breaker: WebhookCircuitBreaker) -> None:
+        endpoint_id = uuid.uuid4()
+        health = await circuit_breaker.get_health(endpoint_id)
+        assert health.deliveries == 0
+        assert health.success_rate is None
+
+        for latency in (0.1, 0.2, 0.3):
+            await circuit_breaker.record_success(endpoint_id, latency)
+        await circuit_breaker.record_failure(endpoint_id, 20.0)
+
+        health = await circuit_breaker.get_health(endpoint_id)
+        assert health.deliveries == 4
+        assert health.success_rate == 0.75
+        assert health.latency_p50 == pytest.approx(0.25)
+        assert health.latency_p95 is not None
+        assert health.latency_p95 > 0.3
@@ -16,8 +16,9 @@ from polar.models import (
     WebhookEndpoint,
     WebhookEvent,
 )
-from polar.models.webhook_endpoint import WebhookFormat
+from polar.models.webhook_endpoint import WebhookEventType, WebhookFormat
 from polar.postgres import AsyncSession
+from polar.webhook.cache import endpoints_cache
 from polar.webhook.schemas import HttpsUrl, WebhookEndpointCreate, WebhookEndpointUpdate
 from polar.webhook.service import webhook as webhook_service
 from tests.fixtures.auth import AuthSubjectFixture
@@ -259,11 +260,27 @@ class TestDeleteEndpoint:
         authz: Authz,
         webhook_endpoint_user: WebhookEndpoint,
     ) -> None:
+        assert webhook_endpoint_user.user_id is not None
+        event = WebhookEventType.subscription_created
+        version, _ = await endpoints_cache.get(webhook_endpoint_user.user_id, event)
+
         deleted_endpoint = await webhook_service.delete_endpoint(
             session, authz, auth_subject, webhook_endpoint_user
         )
         assert deleted_endpoint.deleted_at is not None
 
+        # The endpoints cache is invalidated once the deletion is committed
+        await endpoints_cache.wait_scheduled_bumps()
+        assert await endpoints_cache.get(webhook_endpoint_user.user_id, event) == (
+            version,
+            None,
+        )
+
+        await session.commit()
+        await endpoints_cache.wait_scheduled_bumps()
+        new_version, _ = await endpoints_cache.get(webhook_endpoint_user.user_id, event)
+        assert new_version != version
+
     @pytest.mark.auth(AuthSubjectFixture(scopes={Scope.webhooks_write}))
     async def test_user_organization_endpoint_not_admin(
         self,
@@ -1,13 +1,18 @@
+import asyncio
+import socket
 from typing import cast
+from uuid import UUID, uuid4
 
 import httpx
 import pytest
 import respx
 from arq import Retry
 from pytest_mock import MockerFixture
+from sqlalchemy import select
 from standardwebhooks.webhooks import Webhook as StandardWebhook
 
 from polar.kit.db.postgres import AsyncSession
+from polar.kit.utils import utc_now
 from polar.models.organization import Organization
 from polar.models.subscription import Subscription
 from polar.models.webhook_endpoint import (
@@ -16,14 +21,20 @@ from polar.models.webhook_endpoint import (
     WebhookFormat,
 )
 from polar.models.webhook_event import WebhookEvent
+from polar.redis import Redis
 from polar.subscription.service import subscription as subscription_service
+from polar.webhook.cache import endpoints_cache
+from polar.webhook.delivery import WebhookDeliveryClient
+from polar.webhook.health import FAILURE_THRESHOLD, WebhookCircuitBreaker
 from polar.webhook.service import webhook as webhook_service
 from polar.webhook.tasks import (
     MAX_RETRIES,
     _webhook_event_send,
     allowed_url,
+    webhook_endpoint_probe,
     webhook_event_send,
 )
+from polar.webhook.webhooks import BaseWebhookPayload
 from polar.worker import JobContext, PolarWorkerContext
 from tests.fixtures.database import SaveFixture
 
@@ -114,6 +125,157 @@ async def test_webhook_send_not_subscribed_to_event(
     assert called is False
 
 
+@pytest.mark.asyncio
+async def test_webhook_send_multiple_endpoints(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    mocker: MockerFixture,
+    organization: Organization,
+    subscription: Subscription,
+) -> None:
+    enqueued: list[UUID] = []
+
+    def in_process_enqueue_job(name, *args, **kwargs) -> None:  # type: ignore  # noqa: E501
+        if name == "webhook_event.send":
+            enqueued.append(kwargs["webhook_event_id"])
+            return
+        raise Exception(f"unexpected job: {name}")
+
+    mocker.patch("polar.webhook.service.enqueue_job", new=in_process_enqueue_job)
+
+    for url in ("https://example.com/hook-1", "https://example.com/hook-2"):
+        endpoint = WebhookEndpoint(
+            url=url,
+            format=WebhookFormat.raw,
+            organization_id=organization.id,
+            secret="mysecret",
+            events=[WebhookEventType.subscription_created],
+        )
+        await save_fixture(endpoint)
+
+    # then
+    session.expunge_all()
+
+    full_sub = await subscription_service.get(session, subscription.id)
+    assert full_sub
+
+    get_raw_payload_spy = mocker.spy(BaseWebhookPayload, "get_raw_payload")
+
+    await webhook_service.send(
+        session, organization, (WebhookEventType.subscription_created, full_sub)
+    )
+
+    get_raw_payload_spy.assert_called_once()
+    assert len(enqueued) == 2
+
+    result = await session.execute(
+        select(WebhookEvent).where(WebhookEvent.id.in_(enqueued))
+    )
+    events = result.scalars().all()
+    assert len(events) == 2
+    assert events[0].payload == events[1].payload
+
+
+@pytest.mark.asyncio
+async def test_webhook_send_endpoints_cached(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    mocker: MockerFixture,
+    organization: Organization,
+    subscription: Subscription,
+) -> None:
+    enqueued: list[UUID] = []
+
+    def in_process_enqueue_job(name, *args, **kwargs) -> None:  # type: ignore  # noqa: E501
+        if name == "webhook_event.send":
+            enqueued.append(kwargs["webhook_event_id"])
+            return
+        raise Exception(f"unexpected job: {name}")
+
+    mocker.patch("polar.webhook.service.enqueue_job", new=in_process_enqueue_job)
+
+    for url in ("https://example.com/hook-1", "https://example.com/hook-2"):
+        endpoint = WebhookEndpoint(
+            url=url,
+            format=WebhookFormat.raw,
+            organization_id=organization.id,
+            secret="mysecret",
+            events=[WebhookEventType.subscription_created],
+        )
+        await save_fixture(endpoint)
+        # The first endpoint is looked up and cached before the second one is saved
+        full_sub = await subscription_service.get(session, subscription.id)
+        assert full_sub
+        await webhook_service.send(
+            session, organization, (WebhookEventType.subscription_created, full_sub)
+        )
+
+    assert len(enqueued) == 2
+
+    # Once the endpoint changes are committed, both endpoints are looked up
+    await session.commit()
+    await endpoints_cache.wait_scheduled_bumps()
+    await webhook_service.send(
+        session, organization, (WebhookEventType.subscription_created, full_sub)
+    )
+
+    assert len(enqueued) == 4
+
+
+@pytest.mark.asyncio
+async def test_webhook_endpoints_cache_bumped_during_lookup() -> None:
+    target_id = uuid4()
+    event = WebhookEventType.subscription_created
+
+    version, endpoints = await endpoints_cache.get(target_id, event)
+    assert endpoints is None
+
+    # The endpoints are changed while the lookup runs: its result isn't served
+    await endpoints_cache.bump_versions({target_id})
+    await endpoints_cache.set(target_id, event, version, [])
+
+    new_version, endpoints = await endpoints_cache.get(target_id, event)
+    assert new_version != version
+    assert endpoints is None
+
+    await endpoints_cache.set(target_id, event, new_version, [])
+    assert await endpoints_cache.get(target_id, event) == (new_version, [])
+
+
+@pytest.mark.asyncio
+async def test_webhook_delivery_deleted_endpoint(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    respx_mock: respx.MockRouter,
+    organization: Organization,
+    job_context: JobContext,
+) -> None:
+    route = respx_mock.post("https://example.com/hook").mock(
+        return_value=httpx.Response(200)
+    )
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+        deleted_at=utc_now(),
+    )
+    await save_fixture(endpoint)
+
+    event = WebhookEvent(webhook_endpoint_id=endpoint.id, payload='{"foo":"bar"}')
+    await save_fixture(event)
+
+    # then
+    session.expunge_all()
+
+    await _webhook_event_send(
+        session=session, ctx=job_context, webhook_event_id=event.id
+    )
+
+    assert not route.called
+
+
 @pytest.mark.asyncio
 @pytest.mark.http_auto_expunge
 async def test_webhook_delivery(
@@ -171,8 +333,8 @@ async def test_webhook_delivery_500(
     # then
     session.expunge_all()
 
-    # failures
-    for job_try in range(MAX_RETRIES):
+    # failures, below the circuit breaker threshold
+    for job_try in range(FAILURE_THRESHOLD - 1):
         with pytest.raises(Retry):
             job_context["job_try"] = job_try
             await _webhook_event_send(
@@ -217,8 +379,8 @@ async def test_webhook_delivery_http_error(
     # then
     session.expunge_all()
 
-    # failures
-    for job_try in range(MAX_RETRIES):
+    # failures, below the circuit breaker threshold
+    for job_try in range(FAILURE_THRESHOLD - 1):
         with pytest.raises(Retry):
             job_context["job_try"] = job_try
             await _webhook_event_send(
@@ -278,9 +440,291 @@ async def test_webhook_standard_webhooks_compatible(
 
 @pytest.mark.asyncio
 async def test_allowed_url() -> None:
-    assert allowed_url("https://example.com/webhooks")
-    assert allowed_url("https://example.com:5000/webhooks")
-    assert allowed_url("http://example.com:5000/webhooks") is False  # http
-    assert allowed_url("https://127.0.0.1:5000/webhooks") is False  # loopback
-    assert allowed_url("https://::1/webhooks") is False  # loopback
-    assert allowed_url("https://foo.invalid:5000/webhooks") is False  # does not resolve
+    assert await allowed_url("https://example.com/webhooks")
+    assert await allowed_url("https://example.com:5000/webhooks")
+    assert await allowed_url("http://example.com:5000/webhooks") is False  # http
+    assert await allowed_url("https://127.0.0.1:5000/webhooks") is False  # loopback
+    assert await allowed_url("https://::1/webhooks") is False  # loopback
+    assert (
+        await allowed_url("https://foo.invalid:5000/webhooks") is False
+    )  # does not resolve
+
+
+@pytest.mark.asyncio
+async def test_allowed_url_dns_cache(mocker: MockerFixture) -> None:
+    client = WebhookDeliveryClient()
+    getaddrinfo_mock = mocker.patch.object(
+        asyncio.get_running_loop(),
+        "getaddrinfo",
+        return_value=[
+            (socket.AF_INET, socket.SOCK_STREAM, 6, "", ("93.184.215.14", 0)),
+        ],
+    )
+
+    assert await client.allowed_url("https://example.com/webhooks")
+    assert await client.allowed_url("https://example.com/other")
+    getaddrinfo_mock.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_webhook_delivery_circuit_breaker(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+    organization: Organization,
+    job_context: JobContext,
+    redis: Redis,
+) -> None:
+    mocker.patch("polar.webhook.tasks.allowed_url", return_value=True)
+    enqueue_job_mock = mocker.patch("polar.webhook.tasks.enqueue_job")
+    route = respx_mock.post("https://example.com/hook").mock(
+        return_value=httpx.Response(503)
+    )
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+    )
+    await save_fixture(endpoint)
+
+    events: list[WebhookEvent] = []
+    for _ in range(FAILURE_THRESHOLD + 1):
+        event = WebhookEvent(webhook_endpoint_id=endpoint.id, payload='{"foo":"bar"}')
+        await save_fixture(event)
+        events.append(event)
+
+    # then
+    session.expunge_all()
+
+    job_context["job_try"] = 1
+    for event in events[: FAILURE_THRESHOLD - 1]:
+        with pytest.raises(Retry):
+            await _webhook_event_send(
+                session=session, ctx=job_context, webhook_event_id=event.id
+            )
+
+    # The failure reaching the threshold opens the circuit and parks the event
+    await _webhook_event_send(
+        session=session,
+        ctx=job_context,
+        webhook_event_id=events[FAILURE_THRESHOLD - 1].id,
+    )
+    enqueue_job_mock.assert_called_once_with(
+        "webhook_endpoint.probe", webhook_endpoint_id=endpoint.id, _defer_by=60.0
+    )
+
+    # Next events are parked without being delivered
+    await _webhook_event_send(
+        session=session, ctx=job_context, webhook_event_id=events[-1].id
+    )
+    assert route.call_count == FAILURE_THRESHOLD
+
+    circuit_breaker = WebhookCircuitBreaker(redis)
+    assert await circuit_breaker.is_open(endpoint.id)
+
+    # The probe succeeds: the circuit closes and the other parked event is released
+    enqueue_job_mock.reset_mock()
+    route.mock(return_value=httpx.Response(200))
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+
+    assert route.call_count == FAILURE_THRESHOLD + 1
+    assert not await circuit_breaker.is_open(endpoint.id)
+    enqueue_job_mock.assert_called_once()
+    assert enqueue_job_mock.call_args[0][0] == "webhook_event.send"
+
+
+@pytest.mark.asyncio
+async def test_webhook_endpoint_probe_retry_budget(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+    organization: Organization,
+    job_context: JobContext,
+    redis: Redis,
+) -> None:
+    mocker.patch("polar.webhook.tasks.allowed_url", return_value=True)
+    enqueue_job_mock = mocker.patch("polar.webhook.tasks.enqueue_job")
+    respx_mock.post("https://example.com/hook").mock(return_value=httpx.Response(503))
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+    )
+    await save_fixture(endpoint)
+    event = WebhookEvent(webhook_endpoint_id=endpoint.id, payload='{"foo":"bar"}')
+    await save_fixture(event)
+
+    circuit_breaker = WebhookCircuitBreaker(redis)
+    for _ in range(FAILURE_THRESHOLD):
+        await circuit_breaker.record_failure(endpoint.id, 1.0)
+    await circuit_breaker.park(endpoint.id, event.id, MAX_RETRIES - 1)
+
+    # then
+    session.expunge_all()
+
+    # The probe job has its own try, but the event keeps its retry budget
+    job_context["job_try"] = 1
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+    enqueue_job_mock.assert_called_once_with(
+        "webhook_endpoint.probe", webhook_endpoint_id=endpoint.id, _defer_by=120.0
+    )
+    assert await circuit_breaker.pop_parked(endpoint.id, 10) == [
+        (event.id, MAX_RETRIES)
+    ]
+
+    await circuit_breaker.park(endpoint.id, event.id, MAX_RETRIES)
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+    assert await circuit_breaker.pop_parked(endpoint.id, 10) == []
+
+    session.expunge_all()
+    updated_event = await session.get(WebhookEvent, event.id)
+    assert updated_event is not None
+    assert updated_event.succeeded is False
+
+
+@pytest.mark.asyncio
+async def test_webhook_endpoint_probe_not_delivered(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    mocker: MockerFixture,
+    organization: Organization,
+    job_context: JobContext,
+    redis: Redis,
+) -> None:
+    enqueue_job_mock = mocker.patch("polar.webhook.tasks.enqueue_job")
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+        deleted_at=utc_now(),
+    )
+    await save_fixture(endpoint)
+    events: list[WebhookEvent] = []
+    for _ in range(2):
+        event = WebhookEvent(webhook_endpoint_id=endpoint.id, payload='{"foo":"bar"}')
+        await save_fixture(event)
+        events.append(event)
+
+    circuit_breaker = WebhookCircuitBreaker(redis)
+    for _ in range(FAILURE_THRESHOLD):
+        await circuit_breaker.record_failure(endpoint.id, 1.0)
+    for event in events:
+        await circuit_breaker.park(endpoint.id, event.id, 3)
+
+    # then
+    session.expunge_all()
+
+    # The probe doesn't reach the endpoint: the circuit closes anyway
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+
+    assert not await circuit_breaker.is_open(endpoint.id)
+    enqueue_job_mock.assert_called_once()
+    assert enqueue_job_mock.call_args[0][0] == "webhook_event.send"
+    assert enqueue_job_mock.call_args[1]["_job_try"] == 3
+
+
+@pytest.mark.asyncio
+async def test_webhook_endpoint_probe_event_not_found(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    mocker: MockerFixture,
+    organization: Organization,
+    job_context: JobContext,
+    redis: Redis,
+) -> None:
+    enqueue_job_mock = mocker.patch("polar.webhook.tasks.enqueue_job")
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+    )
+    await save_fixture(endpoint)
+
+    circuit_breaker = WebhookCircuitBreaker(redis)
+    for _ in range(FAILURE_THRESHOLD):
+        await circuit_breaker.record_failure(endpoint.id, 1.0)
+    for _ in range(2):
+        await circuit_breaker.park(endpoint.id, uuid4(), 3)
+
+    # then
+    session.expunge_all()
+
+    # The probe picks an event that doesn't exist: the circuit closes anyway
+    # and the other parked event is released
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+
+    assert not await circuit_breaker.is_open(endpoint.id)
+    enqueue_job_mock.assert_called_once()
+    assert enqueue_job_mock.call_args[0][0] == "webhook_event.send"
+    assert enqueue_job_mock.call_args[1]["_job_try"] == 3
+    assert await circuit_breaker.pop_parked(endpoint.id, 10) == []
+
+
+@pytest.mark.asyncio
+async def test_webhook_endpoint_probe_url_not_allowed(
+    session: AsyncSession,
+    save_fixture: SaveFixture,
+    respx_mock: respx.MockRouter,
+    mocker: MockerFixture,
+    organization: Organization,
+    job_context: JobContext,
+    redis: Redis,
+) -> None:
+    mocker.patch("polar.webhook.tasks.allowed_url", return_value=False)
+    enqueue_job_mock = mocker.patch("polar.webhook.tasks.enqueue_job")
+    route = respx_mock.post("https://example.com/hook").mock(
+        return_value=httpx.Response(200)
+    )
+
+    endpoint = WebhookEndpoint(
+        url="https://example.com/hook",
+        format=WebhookFormat.raw,
+        organization_id=organization.id,
+        secret="mysecret",
+    )
+    await save_fixture(endpoint)
+    events: list[WebhookEvent] = []
+    for _ in range(2):
+        event = WebhookEvent(webhook_endpoint_id=endpoint.id, payload='{"foo":"bar"}')
+        await save_fixture(event)
+        events.append(event)
+
+    circuit_breaker = WebhookCircuitBreaker(redis)
+    for _ in range(FAILURE_THRESHOLD):
+        await circuit_breaker.record_failure(endpoint.id, 1.0)
+    for event in events:
+        await circuit_breaker.park(endpoint.id, event.id, 3)
+
+    # then
+    session.expunge_all()
+
+    # The probe doesn't raise: the circuit closes and the other event is released
+    await webhook_endpoint_probe(
+        job_context, webhook_endpoint_id=endpoint.id, polar_context=PolarWorkerContext()
+    )
+
+    assert not route.called
+    assert not await circuit_breaker.is_open(endpoint.id)
+    enqueue_job_mock.assert_called_once()
+    assert enqueue_job_mock.call_args[0][0] == "webhook_event.send"
+    assert enqueue_job_mock.call_args[1]["_job_try"] == 3